@@ -17,10 +17,12 @@
 #  limitations under the License.
 ###############################################################################
 
+import collections
 import diskcache
 import errno
 import getpass
 import glob
+import hashlib
 import json
 import logging
 import mimetypes
@@ -30,8 +32,11 @@ import requests
 import shutil
 import six
 import tempfile
+import threading
+import time
 
 from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 from requests_toolbelt import MultipartEncoder
 
 __version__ = '2.4.0'
@@ -39,6 +44,7 @@ __license__ = 'Apache 2.0'
 
 DEFAULT_PAGE_LIMIT = 50  # Number of results to fetch per request
 REQ_BUFFER_SIZE = 65536  # Chunk size when iterating a download body
+PARTIAL_DOWNLOAD_SUFFIX = '.girder-partial'  # Suffix of files that are still being downloaded
 
 _safeNameRegex = re.compile(r'^[/\\]+')
 
@@ -55,6 +61,20 @@ def _compareDicts(x, y):
     return len(x) == len(y) == len(set(x.items()) & set(y.items()))
 
 
+def _sha512(path):
+    """
+    Compute the SHA-512 checksum of a local file.
+
+    :param path: The path of the file.
+    :returns: The hex digest of the checksum.
+    """
+    digest = hashlib.sha512()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(REQ_BUFFER_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 def _safeMakedirs(path):
     """
     Wraps os.makedirs in such a way that it will not raise exceptions if the
@@ -79,6 +99,13 @@ class IncorrectUploadLengthError(RuntimeError):
         self.upload = upload
 
 
+class IncorrectDownloadChecksumError(RuntimeError):
+    """
+    Raised if a downloaded file does not have the checksum listed for it.
+    """
+    pass
+
+
 class HttpError(requests.HTTPError):
     """
     Raised if the server returns an error status code from a request.
@@ -139,6 +166,118 @@ class _ProgressMultiPartEncoder(MultipartEncoder):
         return _chunk
 
 
+class _TransferReporter(object):
+    """
+    A progress reporter for one file of a :class:`_TransferPool`.  When files
+    are transferred one at a time, it also drives the progress reporter of the
+    client.
+    """
+    def __init__(self, transfer, label='', length=0):
+        self.transfer = transfer
+        if transfer.jobs > 1:
+            self._reporter = _NoopProgressReporter(label=label, length=length)
+        else:
+            self._reporter = transfer.client.progressReporterCls(label=label, length=length)
+
+    def update(self, chunkSize):
+        self.transfer.add(chunkSize)
+        self._bar.update(chunkSize)
+
+    def __enter__(self):
+        self._bar = self._reporter.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.transfer.add(0, files=1)
+        return self._reporter.__exit__(exc_type, exc_value, tb)
+
+
+class _TransferPool(object):
+    """
+    Runs the file transfers of a recursive upload or download, in a pool of
+    threads when more than one job is requested, and counts the files and bytes
+    that were transferred.  Only a bounded number of transfers are queued at once, and
+    the first error of a transfer is raised in the thread that queues or waits
+    for transfers.
+
+    :param client: The client performing the transfers.
+    :type client: GirderClient
+    :param jobs: The number of transfers to run at once.
+    :type jobs: int
+    """
+    def __init__(self, client, jobs=1):
+        self.client = client
+        self.jobs = max(int(jobs or 1), 1)
+        self.files = 0
+        self.bytes = 0
+        self.skipped = 0
+        self._started = time.time()
+        self._lock = threading.Lock()
+        self._pending = collections.deque()
+        self._pool = client._threadPool(self.jobs) if self.jobs > 1 else None
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Run a transfer, or queue it if there is a pool of threads.
+        """
+        if self._pool is None:
+            return func(*args, **kwargs)
+        while len(self._pending) >= self.jobs * 2:
+            self._pending.popleft().get()
+        self._pending.append(self._pool.apply_async(func, args, kwargs))
+
+    def wait(self):
+        """
+        Wait for the queued transfers to finish.
+        """
+        while self._pending:
+            self._pending.popleft().get()
+
+    def add(self, bytes, files=0, skipped=0):
+        with self._lock:
+            self.bytes += bytes
+            self.files += files
+            self.skipped += skipped
+
+    def reporter(self, label='', length=0):
+        return _TransferReporter(self, label=label, length=length)
+
+    def stats(self):
+        """
+        Return the number of files and bytes transferred, the number of files
+        that were already up to date, the elapsed time in seconds, and the
+        throughput in bytes per second.
+        """
+        seconds = time.time() - self._started
+        return {
+            'files': self.files,
+            'bytes': self.bytes,
+            'skipped': self.skipped,
+            'seconds': seconds,
+            'bytesPerSecond': self.bytes / seconds if seconds > 0 else 0
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self._pool is None:
+            return
+        try:
+            if exc_type is None:
+                self.wait()
+        except Exception:
+            exc_type = True
+            raise
+        finally:
+            if exc_type is None:
+                self._pool.close()
+            else:
+                self._pool.terminate()
+            self._pool.join()
+
+
 class GirderClient(object):
     """
     A class for interacting with the Girder RESTful API.
@@ -261,7 +400,45 @@ class GirderClient(object):
             progressReporterCls = _NoopProgressReporter
 
         self.progressReporterCls = progressReporterCls
+        self._sessionLocal = threading.local()
         self._session = None
+        self._transfer = None
+
+    @property
+    def _session(self):
+        # The session is kept per thread, so that a thread entering session()
+        # does not replace the session used by other threads. The worker
+        # threads of a transfer share the requests.Session of the thread that
+        # started it (see _threadPool); its connection pool is thread-safe.
+        return getattr(self._sessionLocal, 'session', None)
+
+    @_session.setter
+    def _session(self, session):
+        self._sessionLocal.session = session
+
+    def _threadPool(self, processes):
+        """
+        Create a pool of threads that use the session of the calling thread,
+        if it has one.
+
+        :param processes: The number of threads.
+        :type processes: int
+        """
+        session = self._session
+
+        def initializer():
+            self._session = session
+
+        return ThreadPool(processes, initializer=initializer)
+
+    def _progressReporter(self, label='', length=0):
+        """
+        Create a progress reporter for a file transfer.  During a recursive
+        upload, this also counts the bytes and files transferred.
+        """
+        if self._transfer is not None:
+            return self._transfer.reporter(label=label, length=length)
+        return self.progressReporterCls(label=label, length=length)
 
     @contextmanager
     def session(self, session=None):
@@ -273,7 +450,8 @@ class GirderClient(object):
         requests, such as headers.
 
         Note: `session` is closed when the context manager exits, regardless of who
-        created it.
+        created it.  The session is used by the thread that entered the context manager, and by
+        the worker threads of uploads started from that thread.
 
         .. code-block:: python
 
@@ -486,7 +664,7 @@ class GirderClient(object):
             **kwargs)
 
         # If success, return the json object. Otherwise throw an exception.
-        if result.status_code in (200, 201):
+        if result.status_code in (200, 201, 206):
             if jsonResp:
                 return result.json()
             else:
@@ -949,7 +1127,7 @@ class GirderClient(object):
             chunk = stream.read(size)
             if isinstance(chunk, six.text_type):
                 chunk = chunk.encode('utf8')
-            with self.progressReporterCls(label=filename, length=size) as reporter:
+            with self._progressReporter(label=filename, length=size) as reporter:
                 return self.post(
                     'file', params, data=_ProgressBytesIO(chunk, reporter=reporter))
 
@@ -1013,10 +1191,16 @@ class GirderClient(object):
             to the callable which is a dict of information about progress.
         :type progressCallback: callable
         """
+        if (uploadObj.get('behavior') == 's3' and uploadObj['s3'].get('chunked') and
+                self._transfer is not None and self._transfer.jobs > 1):
+            return self._uploadS3Parts(uploadObj, stream, size, progressCallback)
+
         offset = 0
         uploadId = uploadObj['_id']
+        # Prior to version 2.2 the server only supported multipart uploads
+        multipart = self.getServerVersion() < ['2', '2']
 
-        with self.progressReporterCls(label=uploadObj.get('name', ''), length=size) as reporter:
+        with self._progressReporter(label=uploadObj.get('name', ''), length=size) as reporter:
 
             while True:
                 chunk = stream.read(min(self.MAX_CHUNK_SIZE, (size - offset)))
@@ -1027,12 +1211,11 @@ class GirderClient(object):
                 if isinstance(chunk, six.text_type):
                     chunk = chunk.encode('utf8')
 
-                if self.getServerVersion() >= ['2', '2']:
+                if not multipart:
                     uploadObj = self.post(
                         'file/chunk?offset=%d&uploadId=%s' % (offset, uploadId),
                         data=_ProgressBytesIO(chunk, reporter=reporter))
                 else:
-                    # Prior to version 2.2 the server only supported multipart uploads
                     parameters = {
                         'offset': offset,
                         'uploadId': uploadId
@@ -1067,6 +1250,102 @@ class GirderClient(object):
 
         return uploadObj
 
+    def _uploadS3Parts(self, uploadObj, stream, size, progressCallback=None):
+        """
+        Uploads the contents of a file directly to an S3 assetstore as a
+        multipart upload, sending several parts at once.  Girder signs the
+        request for each part, and the parts are then sent to S3 without going
+        through Girder.  At most one part per job is held in memory.
+
+        :param uploadObj: The upload object, whose behavior is "s3".
+        :type uploadObj: dict
+        :param stream: Readable stream object.
+        :type stream: file-like
+        :param size: The length of the file.
+        :type size: int
+        :param progressCallback: If passed, will be called after each part
+            with progress information.
+        :type progressCallback: callable
+        :returns: the file that was created.
+        """
+        uploadId = uploadObj['_id']
+        s3 = uploadObj['s3']
+        resp = self._sendS3Request(s3['request'])
+        s3UploadId = re.search('<UploadId>(.*)</UploadId>', resp.text).group(1)
+
+        def sendPart(partNumber, data):
+            obj = self.post('file/chunk', parameters={
+                'offset': 0,
+                'uploadId': uploadId,
+                'chunk': json.dumps({
+                    'partNumber': partNumber,
+                    's3UploadId': s3UploadId,
+                    'contentLength': len(data)
+                })
+            })
+            resp = self._sendS3Request(obj['s3']['request'], data=data)
+            return partNumber, resp.headers['ETag'], len(data)
+
+        eTags = {}
+        offset = sent = partNumber = 0
+        pending = collections.deque()
+        pool = self._threadPool(self._transfer.jobs)
+        with self._progressReporter(label=uploadObj.get('name', ''), length=size) as reporter:
+            try:
+                while True:
+                    while pending and (len(pending) >= self._transfer.jobs or offset >= size):
+                        donePart, eTag, length = pending.popleft().get()
+                        eTags[donePart] = eTag
+                        sent += length
+                        reporter.update(length)
+                        if callable(progressCallback):
+                            progressCallback({'current': sent, 'total': size})
+                    if offset >= size:
+                        break
+                    chunk = stream.read(min(s3['chunkLength'], size - offset))
+                    if not chunk:
+                        break
+                    if isinstance(chunk, six.text_type):
+                        chunk = chunk.encode('utf8')
+                    partNumber += 1
+                    pending.append(pool.apply_async(sendPart, (partNumber, chunk)))
+                    offset += len(chunk)
+            finally:
+                pool.terminate()
+                pool.join()
+
+        if offset != size:
+            self.delete('file/upload/' + uploadId)
+            raise IncorrectUploadLengthError(
+                'Expected upload to be %d bytes, but received %d.' % (size, offset),
+                upload=uploadObj)
+
+        file = self.post('file/completion', parameters={'uploadId': uploadId})
+        parts = ''.join(
+            '<Part><PartNumber>%d</PartNumber><ETag>%s</ETag></Part>' % (partNumber, eTag)
+            for partNumber, eTag in sorted(six.viewitems(eTags)))
+        self._sendS3Request(
+            file.pop('s3FinalizeRequest'),
+            data='<CompleteMultipartUpload>%s</CompleteMultipartUpload>' % parts)
+        return file
+
+    def _sendS3Request(self, request, data=None):
+        """
+        Send a request that Girder signed for S3.
+
+        :param request: The method, url, and optional headers of the request.
+        :type request: dict
+        :param data: The body of the request.
+        :returns: The response.
+        """
+        resp = requests.request(
+            request['method'], request['url'], data=data, headers=request.get('headers'))
+        if resp.status_code not in (200, 201):
+            raise HttpError(
+                status=resp.status_code, url=resp.url, method=request['method'], text=resp.text,
+                response=resp)
+        return resp
+
     def uploadFile(self, parentId, stream, name, size, parentType='item',
                    progressCallback=None, reference=None, mimeType=None):
         """
@@ -1192,17 +1471,19 @@ class GirderClient(object):
             # assume `path` is a file-like object
             shutil.copyfileobj(fp, path)
 
-    def _streamingFileDownload(self, fileId):
+    def _streamingFileDownload(self, fileId, headers=None):
         """
         Download a file streaming the contents
 
         :param fileId: The ID of the Girder file to download.
+        :param headers: Additional headers to send, such as a Range header.
+        :type headers: dict
 
         :returns: The request
         """
 
         path = 'file/%s/download' % fileId
-        return self.sendRestRequest('get', path, stream=True, jsonResp=False)
+        return self.sendRestRequest('get', path, stream=True, jsonResp=False, headers=headers)
 
     def downloadFile(self, fileId, path, created=None):
         """
@@ -1229,7 +1510,7 @@ class GirderClient(object):
 
         req = self._streamingFileDownload(fileId)
         with tempfile.NamedTemporaryFile(delete=False) as tmp:
-            with self.progressReporterCls(
+            with self._progressReporter(
                     label=progressFileName,
                     length=int(req.headers.get('content-length', 0))) as reporter:
                 for chunk in req.iter_content(chunk_size=REQ_BUFFER_SIZE):
@@ -1313,7 +1594,130 @@ class GirderClient(object):
             if len(files) < DEFAULT_PAGE_LIMIT:
                 break
 
-    def downloadFolderRecursive(self, folderId, dest, sync=False):
+    def getFolderManifest(self, folderId):
+        """
+        List every file in a folder and its subfolders.  Each file has a
+        ``path`` relative to the folder, separated by "/", laid out the same
+        way as :meth:`downloadFolderRecursive` writes it.  Servers that list
+        the whole subtree in one request are asked to; the folders of older
+        servers are walked instead.
+
+        :param folderId: Id of the Girder folder.
+        :returns: The list of files.
+        """
+        try:
+            return self.get('folder/%s/manifest' % folderId)
+        except HttpError as e:
+            if e.status != 400 or 'No matching route' not in e.responseText:
+                raise
+        return list(self._walkFolderManifest(folderId, ''))
+
+    def _walkFolderManifest(self, folderId, path):
+        for folder in self.listFolder(folderId):
+            for file in self._walkFolderManifest(folder['_id'], path + folder['name'] + '/'):
+                yield file
+        for item in self.listItem(folderId):
+            files = list(self.listFile(item['_id']))
+            itemPath = path
+            if len(files) != 1 or files[0]['name'] != item['name']:
+                itemPath += item['name'] + '/'
+            for file in files:
+                file['path'] = itemPath + file['name']
+                yield file
+
+    def _downloadManifestFile(self, file, path):
+        """
+        Download a file of a folder manifest, unless the local copy has the
+        same size and SHA-512 checksum.  The file is written next to its
+        destination first, and a partial download left by an earlier attempt
+        is resumed with a Range request.  If the manifest lists the checksum
+        of the file, the download is verified against it, and a resumed
+        download that does not match is started over.
+
+        :param file: The file from the manifest.
+        :type file: dict
+        :param path: The local path to write the file to.
+        :type path: str
+        """
+        size = file['size']
+        if (file.get('sha512') and os.path.isfile(path) and os.path.getsize(path) == size and
+                _sha512(path) == file['sha512']):
+            self._transfer.add(0, skipped=1)
+            return
+        if self.cache is not None:
+            return self.downloadFile(file['_id'], path, created=file['created'])
+
+        _safeMakedirs(os.path.dirname(path))
+        partial = path + PARTIAL_DOWNLOAD_SUFFIX
+        offset = os.path.getsize(partial) if os.path.isfile(partial) else 0
+        if offset > size:
+            offset = 0
+        while True:
+            offset = self._downloadPartialFile(file, path, offset)
+            if not file.get('sha512') or _sha512(partial) == file['sha512']:
+                break
+            os.remove(partial)
+            if not offset:
+                raise IncorrectDownloadChecksumError(
+                    'Downloaded file %s does not match its SHA-512 checksum.' % path)
+            # The partial file was left by another version of the file
+            offset = 0
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(partial, path)
+
+    def _downloadPartialFile(self, file, path, offset):
+        """
+        Download the rest of a file into the partial file next to its
+        destination.
+
+        :param file: The file document.
+        :type file: dict
+        :param path: The local path the file is downloaded for.
+        :type path: str
+        :param offset: The size of the data already in the partial file.
+        :type offset: int
+        :returns: The offset the download actually resumed from, which is 0 if
+            the server sent the whole file.
+        """
+        size = file['size']
+        partial = path + PARTIAL_DOWNLOAD_SUFFIX
+        with self._progressReporter(label=os.path.basename(path), length=size) as reporter:
+            if offset < size or not size:
+                headers = {'Range': 'bytes=%d-' % offset} if offset else None
+                req = self._streamingFileDownload(file['_id'], headers=headers)
+                if req.status_code != 206:
+                    offset = 0
+                with open(partial, 'ab' if offset else 'wb') as fh:
+                    for chunk in req.iter_content(chunk_size=REQ_BUFFER_SIZE):
+                        reporter.update(len(chunk))
+                        fh.write(chunk)
+        return offset
+
+    def _downloadFolders(self, folders, jobs=1):
+        """
+        Download the files of several folders from their manifests, several
+        at a time.
+
+        :param folders: A list of tuples of the folder ID and its local
+            destination.
+        :param jobs: The number of files to download at once.
+        :type jobs: int
+        :returns: The statistics of the download; see :meth:`downloadResource`.
+        """
+        try:
+            with _TransferPool(self, jobs) as self._transfer:
+                for folderId, dest in folders:
+                    _safeMakedirs(dest)
+                    for file in self.getFolderManifest(folderId):
+                        path = os.path.join(dest, *[
+                            self.transformFilename(name) for name in file['path'].split('/')])
+                        self._transfer.submit(self._downloadManifestFile, file, path)
+        finally:
+            transfer, self._transfer = self._transfer, None
+        return transfer.stats()
+
+    def downloadFolderRecursive(self, folderId, dest, sync=False, jobs=None):
         """
         Download a folder recursively from Girder into a local directory.
 
@@ -1324,9 +1728,21 @@ class GirderClient(object):
         :param sync: If True, check if item exists in local metadata
             cache and skip download provided that metadata is identical.
         :type sync: bool
+        :param jobs: If set, list the whole folder in advance and download this
+            many files at once.  Local files with the same size and SHA-512
+            checksum as on the server are not downloaded again, and partial
+            downloads are resumed.  Folders without any files are not created.
+            The ``sync`` option and local metadata are not used.
+        :type jobs: int
+        :returns: If ``jobs`` is set, a dictionary with the number of ``files``
+            and ``bytes`` that were downloaded, the number of files that were
+            ``skipped`` because they were up to date, the elapsed time in
+            ``seconds``, and the throughput in ``bytesPerSecond``.
         """
-        offset = 0
         folderId = self._checkResourcePath(folderId)
+        if jobs is not None:
+            return self._downloadFolders([(folderId, dest)], jobs)
+        offset = 0
         while True:
             folders = self.get('folder', parameters={
                 'limit': DEFAULT_PAGE_LIMIT,
@@ -1366,7 +1782,7 @@ class GirderClient(object):
             if len(items) < DEFAULT_PAGE_LIMIT:
                 break
 
-    def downloadResource(self, resourceId, dest, resourceType='folder', sync=False):
+    def downloadResource(self, resourceId, dest, resourceType='folder', sync=False, jobs=None):
         """
         Download a collection, user, or folder recursively from Girder into a local directory.
 
@@ -1381,12 +1797,20 @@ class GirderClient(object):
         :param sync: If True, check if items exist in local metadata
             cache and skip download if the metadata is identical.
         :type sync: bool
+        :param jobs: If set, download this many files at once from manifests of
+            the folders.  See :meth:`downloadFolderRecursive`.
+        :type jobs: int
+        :returns: If ``jobs`` is set, the statistics of the download.
         """
         if resourceType == 'folder':
-            self.downloadFolderRecursive(resourceId, dest, sync)
+            return self.downloadFolderRecursive(resourceId, dest, sync, jobs=jobs)
         elif resourceType in ('collection', 'user'):
             offset = 0
             resourceId = self._checkResourcePath(resourceId)
+            if jobs is not None:
+                return self._downloadFolders([
+                    (folder['_id'], os.path.join(dest, self.transformFilename(folder['name'])))
+                    for folder in self.listFolder(resourceId, resourceType)], jobs)
             while True:
                 folders = self.get('folder', parameters={
                     'limit': DEFAULT_PAGE_LIMIT,
@@ -1603,9 +2027,12 @@ class GirderClient(object):
             print('Adding file %s, (%d of %d) to Item' % (currentFile, ind + 1, filecount))
 
             if not dryRun:
-                self.uploadFileToItem(item['_id'], filepath, filename=currentFile)
+                self._submitTransfer(
+                    self.uploadFileToItem, item['_id'], filepath, filename=currentFile)
 
         if not dryRun:
+            if self._itemUploadCallbacks:
+                self._waitForTransfers()
             for callback in self._itemUploadCallbacks:
                 callback(item, localFolder)
 
@@ -1663,16 +2090,34 @@ class GirderClient(object):
                         fullEntry, folder['_id'], 'folder', leafFoldersAsItems, reuseExisting,
                         dryRun=dryRun, reference=reference)
                 else:
-                    self._uploadAsItem(
-                        entry, folder['_id'], fullEntry, reuseExisting, dryRun=dryRun,
-                        reference=reference)
+                    self._submitTransfer(
+                        self._uploadAsItem, entry, folder['_id'], fullEntry, reuseExisting,
+                        dryRun=dryRun, reference=reference)
 
             if not dryRun:
+                if self._folderUploadCallbacks:
+                    self._waitForTransfers()
                 for callback in self._folderUploadCallbacks:
                     callback(folder, localFolder)
 
+    def _submitTransfer(self, func, *args, **kwargs):
+        """
+        Run a file transfer of a recursive upload, which may happen in another
+        thread.
+        """
+        if self._transfer is None:
+            return func(*args, **kwargs)
+        return self._transfer.submit(func, *args, **kwargs)
+
+    def _waitForTransfers(self):
+        """
+        Wait for the queued file transfers of a recursive upload to finish.
+        """
+        if self._transfer is not None:
+            self._transfer.wait()
+
     def upload(self, filePattern, parentId, parentType='folder', leafFoldersAsItems=False,
-               reuseExisting=False, blacklist=None, dryRun=False, reference=None):
+               reuseExisting=False, blacklist=None, dryRun=False, reference=None, jobs=1):
         """
         Upload a pattern of files.
 
@@ -1698,11 +2143,37 @@ class GirderClient(object):
         :type dryRun: bool
         :param reference: Option reference to send along with the upload.
         :type reference: str
+        :param jobs: The number of files to upload at once.  When uploading to
+            an S3 assetstore that supports direct multipart uploads, this is
+            also the number of parts of each file that are sent at once.
+        :type jobs: int
+        :returns: A dictionary with the number of ``files`` and ``bytes`` that
+            were uploaded, the elapsed time in ``seconds``, and the throughput
+            in ``bytesPerSecond``.
         """
         filePatternList = filePattern if isinstance(filePattern, (list, tuple)) else [filePattern]
         blacklist = blacklist or []
-        empty = True
         parentId = self._checkResourcePath(parentId)
+        try:
+            with _TransferPool(self, jobs) as self._transfer:
+                empty = self._uploadPatterns(
+                    filePatternList, parentId, parentType, leafFoldersAsItems, reuseExisting,
+                    blacklist, dryRun, reference)
+        finally:
+            transfer, self._transfer = self._transfer, None
+        if empty:
+            print('No matching files: ' + repr(filePattern))
+        return transfer.stats()
+
+    def _uploadPatterns(self, filePatternList, parentId, parentType, leafFoldersAsItems,
+                        reuseExisting, blacklist, dryRun, reference):
+        """
+        Upload each file and folder matching a list of patterns.  See
+        :meth:`upload` for the parameters.
+
+        :returns: True if no files matched the patterns.
+        """
+        empty = True
         for pattern in filePatternList:
             for currentFile in glob.iglob(pattern):
                 empty = False
@@ -1718,15 +2189,14 @@ class GirderClient(object):
                             'Attempting to upload an item under a %s. Items can only be added to '
                             'folders.' % parentType)
                     else:
-                        self._uploadAsItem(
-                            os.path.basename(currentFile), parentId, currentFile, reuseExisting,
-                            dryRun=dryRun, reference=reference)
+                        self._submitTransfer(
+                            self._uploadAsItem, os.path.basename(currentFile), parentId,
+                            currentFile, reuseExisting, dryRun=dryRun, reference=reference)
                 else:
                     self._uploadFolderRecursive(
                         currentFile, parentId, parentType, leafFoldersAsItems, reuseExisting,
                         blacklist=blacklist, dryRun=dryRun, reference=reference)
-        if empty:
-            print('No matching files: ' + repr(filePattern))
+        return empty
 
     def _checkResourcePath(self, objId):
         if isinstance(objId, six.string_types) and objId.startswith('/'):
@@ -28,6 +28,20 @@ from girder_client import GirderClient, __version__
 _logger = logging.getLogger('girder_client.cli')
 
 
+def _formatSize(length):
+    if length == 0:
+        return '%.2f' % length
+    unit = ''
+    # See https://en.wikipedia.org/wiki/Binary_prefix
+    units = ['k', 'M', 'G', 'T', 'P', 'E', 'Z', 'Y']
+    while True:
+        if length <= 1024 or len(units) == 0:
+            break
+        unit = units.pop(0)
+        length /= 1024.
+    return '%.2f%s' % (length, unit)
+
+
 class GirderCli(GirderClient):
     """
     A command line Python client for interacting with a Girder instance's
@@ -56,23 +70,10 @@ class GirderCli(GirderClient):
             bar.show_percent = True
             bar.show_pos = True
 
-            def formatSize(length):
-                if length == 0:
-                    return '%.2f' % length
-                unit = ''
-                # See https://en.wikipedia.org/wiki/Binary_prefix
-                units = ['k', 'M', 'G', 'T', 'P', 'E', 'Z', 'Y']
-                while True:
-                    if length <= 1024 or len(units) == 0:
-                        break
-                    unit = units.pop(0)
-                    length /= 1024.
-                return '%.2f%s' % (length, unit)
-
             def formatPos(_self):
-                pos = formatSize(_self.pos)
+                pos = _formatSize(_self.pos)
                 if _self.length_known:
-                    pos += '/%s' % formatSize(_self.length)
+                    pos += '/%s' % _formatSize(_self.length)
                 return pos
 
             bar.format_pos = types.MethodType(formatPos, bar)
@@ -311,8 +312,11 @@ _short_help = 'Download files from Girder'
     _short_help, _common_help.replace('LOCAL_FOLDER', 'LOCAL_FOLDER (default: ".")')))
 @_CommonParameters(additional_parent_types=[
     'collection', 'user', 'item', 'file'], path_default='.')
+@click.option('--jobs', default=None, type=click.IntRange(min=1),
+              help='list folders in advance and download this many files at once, resuming '
+              'partial downloads and skipping files that are already up to date')
 @click.pass_obj
-def _download(gc, parent_type, parent_id, local_folder):
+def _download(gc, parent_type, parent_id, local_folder, jobs):
     if parent_type == 'auto':
         parent_type = _lookup_parent_type(gc, parent_id)
     if parent_type == 'item':
@@ -320,7 +324,11 @@ def _download(gc, parent_type, parent_id, local_folder):
     elif parent_type == 'file':
         gc.downloadFile(parent_id, local_folder)
     else:
-        gc.downloadResource(parent_id, local_folder, parent_type)
+        stats = gc.downloadResource(parent_id, local_folder, parent_type, jobs=jobs)
+        if stats is not None:
+            click.echo('Downloaded %d files, %sB in %.1f seconds (%sB/s), %d up to date' % (
+                stats['files'], _formatSize(stats['bytes']), stats['seconds'],
+                _formatSize(stats['bytesPerSecond']), stats['skipped']))
 
 
 _short_help = 'Synchronize local folder with remote Girder folder'
@@ -355,15 +363,21 @@ _short_help = 'Upload files to Girder'
               help='comma-separated list of filenames to ignore')
 @click.option('--reference', default=None,
               help='optional reference to send along with the upload')
+@click.option('--jobs', default=1, show_default=True, type=click.IntRange(min=1),
+              help='number of files, or parts of files on S3 assetstores, to upload at once')
 @click.pass_obj
 def _upload(gc, parent_type, parent_id, local_folder,
-            leaf_folders_as_items, reuse, blacklist, dry_run, reference):
+            leaf_folders_as_items, reuse, blacklist, dry_run, reference, jobs):
     if parent_type == 'auto':
         parent_type = _lookup_parent_type(gc, parent_id)
-    gc.upload(
+    stats = gc.upload(
         local_folder, parent_id, parent_type,
         leafFoldersAsItems=leaf_folders_as_items, reuseExisting=reuse,
-        blacklist=blacklist.split(','), dryRun=dry_run, reference=reference)
+        blacklist=blacklist.split(','), dryRun=dry_run, reference=reference, jobs=jobs)
+    if not dry_run:
+        click.echo('Uploaded %d files, %sB in %.1f seconds (%sB/s)' % (
+            stats['files'], _formatSize(stats['bytes']), stats['seconds'],
+            _formatSize(stats['bytesPerSecond'])))
 
 
 if __name__ == '__main__':
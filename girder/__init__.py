@@ -28,7 +28,8 @@ import traceback
 
 from girder.constants import LOG_ROOT, MAX_LOG_SIZE, LOG_BACKUP_COUNT, TerminalColor, VERSION
 from girder.utility import config, mkdir
-from girder.utility._cache import cache, requestCache, rateLimitBuffer
+from girder.utility._cache import accessCache, blockCache, cache, pathCache, requestCache, \
+    rateLimitBuffer
 
 __version__ = '3.0.0a1'
 __license__ = 'Apache 2.0'
@@ -286,10 +287,19 @@ def _setupCache():
 
         cache.configure_from_config(curConfig['cache'], 'cache.global.')
         requestCache.configure_from_config(curConfig['cache'], 'cache.request.')
+        accessCache.configure(int(curConfig['cache'].get('cache.access.size', 0)))
+        pathCache.configure(int(curConfig['cache'].get('cache.path.size', 0)))
+        blockCache.configure(
+            int(curConfig['cache'].get('cache.block.size', 0)),
+            blockSize=int(curConfig['cache'].get('cache.block.block_size', 1024 * 1024)),
+            readAhead=int(curConfig['cache'].get('cache.block.read_ahead', 4)))
     else:
         # Reset caches back to null cache (in the case of server teardown)
         cache.configure(backend='dogpile.cache.null', replace_existing_backend=True)
         requestCache.configure(backend='dogpile.cache.null', replace_existing_backend=True)
+        accessCache.configure(0)
+        pathCache.configure(0)
+        blockCache.configure(0)
 
     # Although the rateLimitBuffer has no pre-existing backend, this method may be called multiple
     # times in testing (where caches were already configured)
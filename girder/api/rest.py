@@ -21,7 +21,10 @@ import cgi
 import cherrypy
 import collections
 import datetime
+import functools
+import hashlib
 import inspect
+import itertools
 import json
 import posixpath
 import pymongo
@@ -41,7 +44,7 @@ from girder.exceptions import AccessException, GirderException, ValidationExcept
 from girder.models.setting import Setting
 from girder.models.token import Token
 from girder.models.user import User
-from girder.utility import toBool, config, JsonEncoder, optionalArgumentDecorator
+from girder.utility import toBool, config, dumpJson, optionalArgumentDecorator
 from girder.utility._cache import requestCache
 from girder.utility.model_importer import ModelImporter
 from six.moves import range, urllib
@@ -50,6 +53,17 @@ from six.moves import range, urllib
 READ_BUFFER_LEN = 65536
 
 _MONGO_CURSOR_TYPES = (MongoProxy, pymongo.cursor.Cursor, pymongo.command_cursor.CommandCursor)
+_JSON_STREAM_CHUNK_SIZE = 65536
+# Zip timestamps cannot predate 1980.
+_SEEKABLE_ZIP_TIMESTAMP = (1980, 1, 1, 0, 0, 0)
+# Endpoint notes for routes that send archives with sendSeekableZip
+SEEKABLE_ZIP_NOTES = (
+    'A seekable archive needs the CRC32 of each file, which is stored once computed. A range '
+    'that starts after the data of a file whose CRC32 is not known yet reads that whole file '
+    'before anything is sent, and a range that includes the end of the archive reads every '
+    'such file.  The response has an ETag that changes when files are added, removed or '
+    'replaced; send it in an If-Range header along with the Range header so that ranges of '
+    'different versions of the archive are not combined.')
 
 
 def getUrlParts(url=None):
@@ -278,6 +292,96 @@ def setContentDisposition(filename, disposition='attachment', setHeader=True):
     return value
 
 
+def sendSeekableZip(fileList, filename, rootPath=''):
+    """
+    Respond with an uncompressed zip archive whose layout is computed from the
+    file documents before any data is sent. The response has a Content-Length
+    and honors the HTTP Range header, so downloads of the archive can be
+    resumed or split across several connections. The entries are sorted by
+    path, and the ETag of the response is computed from the entries, so a
+    Range sent with an If-Range header that does not match the current
+    version of the archive gets the whole archive instead.
+
+    :param fileList: Iterable of (path, file document or stream function)
+        tuples, as returned by the fileList methods of the models when called
+        with ``data=False``.
+    :param filename: The name of the archive for the Content-Disposition
+        header.
+    :type filename: str
+    :param rootPath: The root path for all files within the archive.
+    :type rootPath: str
+    :returns: A generator function that streams the requested range of the
+        archive.
+    """
+    from girder.models.file import File
+    from girder.utility import ziputil
+
+    fileModel = File()
+    zip = ziputil.SeekableZipGenerator(rootPath)
+    version = hashlib.sha1()
+    for path, file in sorted(fileList, key=lambda entry: entry[0]):
+        if callable(file):
+            # Generated entries, such as metadata files, are small and have no
+            # modification time of their own.
+            data = b''.join(
+                buf.encode('utf8') if isinstance(buf, six.text_type) else buf
+                for buf in file())
+            zip.addData(path, data, _SEEKABLE_ZIP_TIMESTAMP)
+            version.update(_seekableZipVersion(path, hashlib.sha1(data).hexdigest()))
+            continue
+        timestamp = max(file['created'].timetuple()[0:6], _SEEKABLE_ZIP_TIMESTAMP)
+        if not file.get('assetstoreId'):
+            zip.addData(path, file.get('linkUrl', ''), timestamp)
+            version.update(_seekableZipVersion(path, file['_id'], file.get('linkUrl', '')))
+            continue
+        version.update(_seekableZipVersion(
+            path, file['_id'], file['size'], file['created'].isoformat()))
+        zip.addEntry(
+            path, file['size'], functools.partial(_readFileRange, fileModel, file), timestamp,
+            crc=file.get('crc32'), onCrc=functools.partial(fileModel.setCrc32, file),
+            crcRead=functools.partial(_readFileRangeForCrc, fileModel, file))
+
+    size = zip.size
+    etag = '"%s"' % version.hexdigest()
+    setResponseHeader('ETag', etag)
+    rangeHeader = cherrypy.request.headers.get('Range')
+    ifRange = cherrypy.request.headers.get('If-Range')
+    if ifRange is not None and ifRange.strip() != etag:
+        # The archive changed since the client got its other ranges.  A date
+        # is not a usable validator, as removing a file does not change it.
+        rangeHeader = None
+    offset, endByte = 0, size
+    ranges = cherrypy.lib.httputil.get_ranges(rangeHeader, size)
+    if ranges == []:
+        setResponseHeader('Content-Range', 'bytes */%d' % size)
+        raise RestException('Requested range not satisfiable.', code=416)
+    if ranges:
+        # Only a single range is supported.
+        offset, endByte = ranges[0]
+        setResponseHeader('Content-Range', 'bytes %d-%d/%d' % (offset, endByte - 1, size))
+    setResponseHeader('Content-Type', 'application/zip')
+    setResponseHeader('Accept-Ranges', 'bytes')
+    setResponseHeader('Content-Length', endByte - offset)
+    setContentDisposition(filename)
+    return functools.partial(zip.generate, offset, endByte)
+
+
+def _seekableZipVersion(*fields):
+    # One entry of a seekable archive, as it contributes to the ETag
+    return (u'\0'.join(six.text_type(field) for field in fields) + u'\n').encode('utf8')
+
+
+def _readFileRange(fileModel, file, offset, endByte):
+    return fileModel.download(file, offset, headers=False, endByte=endByte)()
+
+
+def _readFileRangeForCrc(fileModel, file, offset, endByte):
+    # Data read only to compute a CRC is not sent to the user, so it is read
+    # from the assetstore directly rather than triggering download events.
+    return fileModel.getAssetstoreAdapter(file).downloadFile(
+        file, offset, headers=False, endByte=endByte)()
+
+
 def requireAdmin(user, message=None):
     """
     Calling this on a user will ensure that they have admin rights.  If not,
@@ -424,6 +528,10 @@ class filtermodel(object):  # noqa: class name
         ``filter`` method. Filters the results for the user making the current
         request (i.e. the value of ``getCurrentUser()``).
 
+        Mongo cursors and generators are filtered into a list, except when the
+        wrapped function is the route handler being dispatched, whose results
+        are filtered lazily so that the response can stream them.
+
         :param model: The model class, or the model name.
         :type model: class or str
         :param plugin: The plugin name if this is a plugin model. Only used if the
@@ -442,6 +550,11 @@ class filtermodel(object):  # noqa: class name
     def __call__(self, fun):
         @six.wraps(fun)
         def wrapped(*args, **kwargs):
+            # Only the route handler itself may stream; anything it calls gets
+            # a list as usual.
+            stream = getattr(cherrypy.request, 'girderStreamFiltered', False)
+            if stream:
+                cherrypy.request.girderStreamFiltered = False
             val = fun(*args, **kwargs)
             if val is None:
                 return None
@@ -454,15 +567,16 @@ class filtermodel(object):  # noqa: class name
             user = getCurrentUser()
 
             if isinstance(val, _MONGO_CURSOR_TYPES):
-                if callable(getattr(val, 'count', None)):
-                    cherrypy.response.headers['Girder-Total-Count'] = val.count()
-                return [model.filter(m, user, self.addFields) for m in val]
-            elif isinstance(val, (list, tuple, types.GeneratorType)):
-                return [model.filter(m, user, self.addFields) for m in val]
+                _setTotalCount(val)
             elif isinstance(val, dict):
                 return model.filter(val, user, self.addFields)
-            else:
+            elif not isinstance(val, (list, tuple, types.GeneratorType)):
                 raise Exception('Cannot call filtermodel on return type: %s.' % type(val))
+
+            if stream and not isinstance(val, (list, tuple)):
+                return (model.filter(m, user, self.addFields) for m in val)
+            return [model.filter(m, user, self.addFields) for m in val]
+        wrapped.streamsFiltered = True
         return wrapped
 
 
@@ -520,25 +634,86 @@ def _createResponse(val):
             return val.encode('utf8')
         return val
 
-    accepts = cherrypy.request.headers.elements('Accept')
-    for accept in accepts:
+    if _responseFormat() == 'html':
+        # Pretty-print and HTML-ify the response for the browser
+        setResponseHeader('Content-Type', 'text/html')
+        resp = cgi.escape(dumpJson(val, indent=4).decode('utf8'))
+        resp = resp.replace(' ', '&nbsp;').replace('\n', '<br />')
+        resp = '<div style="font-family:monospace;">%s</div>' % resp
+        return resp.encode('utf8')
+
+    setResponseHeader('Content-Type', 'application/json')
+    return dumpJson(val, sortKeys=_sortJsonKeys())
+
+
+def _responseFormat():
+    """
+    Determine whether the client asked for "json" or "html" output via the
+    "Accept" header. Defaults to "json".
+    """
+    for accept in cherrypy.request.headers.elements('Accept'):
         if accept.value == 'application/json':
             break
         elif accept.value == 'text/html':
-            # Pretty-print and HTML-ify the response for the browser
-            setResponseHeader('Content-Type', 'text/html')
-            resp = cgi.escape(json.dumps(
-                val, indent=4, sort_keys=True, allow_nan=False, separators=(',', ': '),
-                cls=JsonEncoder))
-            resp = resp.replace(' ', '&nbsp;').replace('\n', '<br />')
-            resp = '<div style="font-family:monospace;">%s</div>' % resp
-            return resp.encode('utf8')
-
-    # Default behavior will just be normal JSON output. Keep this
-    # outside of the loop body in case no Accept header is passed.
+            return 'html'
+    return 'json'
+
+
+def _sortJsonKeys():
+    """
+    Sorted keys make responses easier to read while developing, but sorting
+    every object of every response is costly, so it is skipped in production.
+    """
+    return config.getConfig()['server']['mode'] != 'production'
+
+
+def _generatorResponse(val):
+    """
+    Prepare a generator returned by an endpoint for the response. For JSON
+    responses, this returns a function that streams the generated values as a
+    JSON array; otherwise the values are collected into a list.
+
+    :param val: The generator returned by the endpoint.
+    :type val: generator
+    """
+    if (getattr(cherrypy.request, 'girderRawResponse', False) is True or
+            _responseFormat() != 'json'):
+        return list(val)
+    # Errors raised before the first value is produced are reported as usual;
+    # once the array is streaming, an error can only truncate the response.
+    try:
+        values = itertools.chain([next(val)], val)
+    except StopIteration:
+        values = ()
     setResponseHeader('Content-Type', 'application/json')
-    return json.dumps(val, sort_keys=True, allow_nan=False,
-                      cls=JsonEncoder).encode('utf8')
+    return functools.partial(_jsonArrayStream, values, _sortJsonKeys())
+
+
+def _jsonArrayStream(values, sortKeys):
+    """
+    Encode the values of an iterable as a JSON array, yielding it in chunks of
+    about ``_JSON_STREAM_CHUNK_SIZE`` bytes, so that neither the values nor
+    the whole encoded array are held in memory at once.
+
+    :param values: The values of the array.
+    :type values: iterable
+    :param sortKeys: Whether to sort the keys of objects.
+    :type sortKeys: bool
+    """
+    parts = [b'[']
+    size = 1
+    for i, value in enumerate(values):
+        if i:
+            parts.append(b',')
+        encoded = dumpJson(value, sortKeys=sortKeys)
+        parts.append(encoded)
+        size += len(encoded) + 1
+        if size >= _JSON_STREAM_CHUNK_SIZE:
+            yield b''.join(parts)
+            parts = []
+            size = 0
+    parts.append(b']')
+    yield b''.join(parts)
 
 
 def _handleRestException(e):
@@ -593,20 +768,33 @@ def _logRestRequest(resource, path, params):
     })
 
 
-def _mongoCursorToList(val):
+def _setTotalCount(cursor):
+    """
+    Set the ``Girder-Total-Count`` response header to the number of documents
+    matched by a Mongo cursor. Counting is a separate query, so clients that
+    do not need the total may skip it by passing ``totalCount=false``.
+
+    :param cursor: The Mongo cursor.
     """
-    If the specified value is a Mongo cursor, convert it to a list.
-    Otherwise, just return the passed values.
+    if (callable(getattr(cursor, 'count', None)) and
+            toBool(cherrypy.request.params.get('totalCount', True))):
+        cherrypy.response.headers['Girder-Total-Count'] = cursor.count()
+
+
+def _mongoCursorToGenerator(val):
+    """
+    If the specified value is a Mongo cursor, return a generator over its
+    documents, which the endpoint streams to the client without holding all
+    of them in memory. Otherwise, just return the passed value.
 
     :param val: a value that might be a Mongo cursor.
-    :returns: a list if val was a Mongo cursor, otherwise the original val.
+    :returns: a generator if val was a Mongo cursor, otherwise the original val.
     """
     # This needs to be before the callable check, as mongo cursors can
     # be callable.
     if isinstance(val, _MONGO_CURSOR_TYPES):
-        if callable(getattr(val, 'count', None)):
-            cherrypy.response.headers['Girder-Total-Count'] = val.count()
-        val = list(val)
+        _setTotalCount(val)
+        val = (doc for doc in val)
     return val
 
 
@@ -633,7 +821,10 @@ def endpoint(fun):
             if 'Content-Range' in cherrypy.response.headers:
                 cherrypy.response.status = 206
 
-            val = _mongoCursorToList(val)
+            val = _mongoCursorToGenerator(val)
+
+            if isinstance(val, types.GeneratorType):
+                val = _generatorResponse(val)
 
             if callable(val):
                 # If the endpoint returned anything callable (function,
@@ -647,9 +838,6 @@ def endpoint(fun):
                 # Don't do any post-processing of static files
                 return val
 
-            if isinstance(val, types.GeneratorType):
-                val = list(val)
-
         except RestException as e:
             val = _handleRestException(e)
         except AccessException as e:
@@ -734,6 +922,89 @@ def _setCommonCORSHeaders():
             setResponseHeader(key, origin)
 
 
+class _CompiledRoute(object):
+    """
+    A registered route along with the values derived from it that are needed
+    on every request, so that they are computed once at registration time.
+    """
+    __slots__ = ('method', 'route', 'handler', 'wildcards', 'resourceName', 'beforeEvent',
+                 'afterEvent')
+
+    def __init__(self, resource, method, route, handler):
+        self.method = method
+        self.route = route
+        self.handler = handler
+        self.wildcards = tuple(
+            (i, component[1:]) for i, component in enumerate(route) if component[0] == ':')
+        self.setEventNames(resource)
+
+    def setEventNames(self, resource):
+        if hasattr(resource, 'resourceName'):
+            self.resourceName = resource.resourceName
+        else:
+            self.resourceName = self.handler.__module__.rsplit('.', 1)[-1]
+        routeStr = '/'.join((self.resourceName, '/'.join(self.route))).rstrip('/')
+        eventPrefix = '.'.join(('rest', self.method, routeStr))
+        self.beforeEvent = eventPrefix + '.before'
+        self.afterEvent = eventPrefix + '.after'
+
+
+class _RouteNode(object):
+    """
+    A node of the per-method route trie. Literal path components are matched
+    through ``static``, and any component is matched through ``wildcard``.
+    Routes ending at this node are kept in registration order in ``routes``.
+    """
+    __slots__ = ('static', 'wildcard', 'routes')
+
+    def __init__(self):
+        self.static = {}
+        self.wildcard = None
+        self.routes = []
+
+    def insert(self, compiled):
+        node = self
+        for component in compiled.route:
+            if component[0] == ':':
+                if node.wildcard is None:
+                    node.wildcard = _RouteNode()
+                node = node.wildcard
+            else:
+                node = node.static.setdefault(component, _RouteNode())
+        node.routes.append(compiled)
+
+    def remove(self, route):
+        """
+        Remove the first route registered with exactly this specification,
+        returning it, or None if there is no such route.
+        """
+        node = self
+        for component in route:
+            node = node.wildcard if component[0] == ':' else node.static.get(component)
+            if node is None:
+                return None
+        for i, compiled in enumerate(node.routes):
+            if compiled.route == route:
+                return node.routes.pop(i)
+        return None
+
+    def match(self, path, depth=0):
+        """
+        Find the route matching ``path``, preferring literal components over
+        wildcards at each position from left to right.
+        """
+        if depth == len(path):
+            return self.routes[0] if self.routes else None
+        child = self.static.get(path[depth])
+        if child is not None:
+            compiled = child.match(path, depth + 1)
+            if compiled is not None:
+                return compiled
+        if self.wildcard is not None:
+            return self.wildcard.match(path, depth + 1)
+        return None
+
+
 class Resource(ModelImporter):
     """
     All REST resources should inherit from this class, which provides utilities
@@ -744,6 +1015,7 @@ class Resource(ModelImporter):
     def __init__(self):
         self._routes = collections.defaultdict(
             lambda: collections.defaultdict(list))
+        self._routeTrie = collections.defaultdict(_RouteNode)
 
     def _ensureInit(self):
         """
@@ -792,6 +1064,8 @@ class Resource(ModelImporter):
                 break
         else:
             nLengthRoutes.append((route, handler))
+        self._routeTrie[method.lower()].insert(
+            _CompiledRoute(self, method.lower(), route, handler))
 
         # Now handle the api doc if the handler has any attached
         if resource is None and hasattr(self, 'resourceName'):
@@ -851,6 +1125,7 @@ class Resource(ModelImporter):
             if registeredRoute == route:
                 handler = registeredHandler
                 del nLengthRoutes[i]
+                self._routeTrie[method.lower()].remove(route)
                 break
 
         # Remove the api doc
@@ -885,6 +1160,9 @@ class Resource(ModelImporter):
         Return bool representing whether route a should go before b. Checks by
         comparing each token in order and making sure routes with literals in
         forward positions come before routes with wildcards in those positions.
+
+        Requests are matched through a trie which applies the same rule, trying
+        literal components before wildcards from left to right.
         """
         for i in range(len(a)):
             if a[i][0] != ':' and b[i][0] == ':':
@@ -927,7 +1205,8 @@ class Resource(ModelImporter):
         """
         method = method.lower()
 
-        route, handler, kwargs = self._matchRoute(method, path)
+        compiled, kwargs = self._matchCompiledRoute(method, path)
+        handler = compiled.handler
 
         cherrypy.request.requiredScopes = getattr(
             handler, 'requiredScopes', None) or TokenScope.USER_AUTH
@@ -950,30 +1229,34 @@ class Resource(ModelImporter):
         # their own responses by calling preventDefault() and
         # adding a response on the event.
 
-        if hasattr(self, 'resourceName'):
-            resource = self.resourceName
-        else:
-            resource = handler.__module__.rsplit('.', 1)[-1]
-
-        routeStr = '/'.join((resource, '/'.join(route))).rstrip('/')
-        eventPrefix = '.'.join(('rest', method, routeStr))
+        if getattr(self, 'resourceName', compiled.resourceName) != compiled.resourceName:
+            # The resource was renamed after the route was registered
+            compiled.setEventNames(self)
 
-        event = events.trigger('.'.join((eventPrefix, 'before')),
-                               kwargs, pre=self._defaultAccess)
-        if event.defaultPrevented and len(event.responses) > 0:
+        # Most routes have no listeners, so skip creating their events entirely
+        event = None
+        if events.hasListeners(compiled.beforeEvent):
+            event = events.trigger(compiled.beforeEvent, kwargs, pre=self._defaultAccess)
+        if event is not None and event.defaultPrevented and len(event.responses) > 0:
             val = event.responses[0]
         else:
             self._defaultAccess(handler)
+            cherrypy.request.girderStreamFiltered = getattr(handler, 'streamsFiltered', False)
             val = handler(**kwargs)
+            cherrypy.request.girderStreamFiltered = False
 
         # Fire the after-call event that has a chance to augment the
         # return value of the API method that was called. You can
         # reassign the return value completely by adding a response to
         # the event and calling preventDefault() on it.
-        kwargs['returnVal'] = val
-        event = events.trigger('.'.join((eventPrefix, 'after')), kwargs)
-        if event.defaultPrevented and len(event.responses) > 0:
-            val = event.responses[0]
+        if events.hasListeners(compiled.afterEvent):
+            if isinstance(val, types.GeneratorType):
+                # Handlers expect to be able to inspect and modify the results
+                val = list(val)
+            kwargs['returnVal'] = val
+            event = events.trigger(compiled.afterEvent, kwargs)
+            if event.defaultPrevented and len(event.responses) > 0:
+                val = event.responses[0]
 
         return val
 
@@ -993,20 +1276,23 @@ class Resource(ModelImporter):
         :raises: `GirderException`, when no routes are defined on this resource.
         :raises: `RestException`, when no route can be matched.
         """
+        compiled, wildcards = self._matchCompiledRoute(method, path)
+        return compiled.route, compiled.handler, wildcards
+
+    def _matchCompiledRoute(self, method, path):
+        """
+        Like ``_matchRoute``, but returns a tuple of ``(compiled, wildcards)``,
+        where ``compiled`` is the ``_CompiledRoute`` registered for the route.
+        """
         if not self._routes:
             raise GirderException('No routes defined for resource')
 
-        for route, handler in self._routes[method][len(path)]:
-            wildcards = {}
-            for routeComponent, pathComponent in six.moves.zip(route, path):
-                if routeComponent[0] == ':':  # Wildcard token
-                    wildcards[routeComponent[1:]] = pathComponent
-                elif routeComponent != pathComponent:  # Exact match token
-                    break
-            else:
-                return route, handler, wildcards
-
-        raise RestException('No matching route for "%s %s"' % (method.upper(), '/'.join(path)))
+        root = self._routeTrie.get(method)
+        compiled = root.match(path) if root is not None else None
+        if compiled is None:
+            raise RestException(
+                'No matching route for "%s %s"' % (method.upper(), '/'.join(path)))
+        return compiled, {name: path[i] for i, name in compiled.wildcards}
 
     def requireParams(self, required, provided=None):
         """
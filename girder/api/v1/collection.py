@@ -18,7 +18,8 @@
 ###############################################################################
 
 from ..describe import Description, autoDescribeRoute
-from ..rest import Resource, filtermodel, setResponseHeader, setContentDisposition
+from ..rest import Resource, filtermodel, SEEKABLE_ZIP_NOTES, sendSeekableZip, \
+    setResponseHeader, setContentDisposition
 from girder.api import access
 from girder.constants import AccessType, TokenScope
 from girder.models.collection import Collection as CollectionModel
@@ -113,20 +114,27 @@ class Collection(Resource):
         .modelParam('id', model=CollectionModel, level=AccessType.READ)
         .jsonParam('mimeFilter', 'JSON list of MIME types to include.', requireArray=True,
                    required=False)
+        .param('seekable', 'Send an uncompressed archive whose length is known ahead of time and '
+               'which honors the HTTP Range header, so that the download can be resumed or '
+               'fetched in parallel.', required=False, dataType='boolean', default=False)
+        .notes(SEEKABLE_ZIP_NOTES)
         .produces('application/zip')
         .errorResponse('ID was invalid.')
         .errorResponse('Read access was denied for the collection.', 403)
     )
-    def downloadCollection(self, collection, mimeFilter):
+    def downloadCollection(self, collection, mimeFilter, seekable):
+        if seekable:
+            return sendSeekableZip(self._model.fileList(
+                collection, user=self.getCurrentUser(), subpath=False, mimeFilter=mimeFilter,
+                data=False), collection['name'] + '.zip', collection['name'])
         setResponseHeader('Content-Type', 'application/zip')
         setContentDisposition(collection['name'] + '.zip')
 
         def stream():
             zip = ziputil.ZipGenerator(collection['name'])
-            for (path, file) in self._model.fileList(
-                    collection, user=self.getCurrentUser(), subpath=False, mimeFilter=mimeFilter):
-                for data in zip.addFile(file, path):
-                    yield data
+            for data in zip.addFiles(self._model.fileList(
+                    collection, user=self.getCurrentUser(), subpath=False, mimeFilter=mimeFilter)):
+                yield data
             yield zip.footer()
         return stream
 
@@ -18,10 +18,12 @@
 ###############################################################################
 
 from ..describe import Description, autoDescribeRoute
-from ..rest import Resource, filtermodel, setResponseHeader, setContentDisposition
+from ..rest import Resource, filtermodel, SEEKABLE_ZIP_NOTES, sendSeekableZip, \
+    setResponseHeader, setContentDisposition
 from girder.api import access
 from girder.constants import AccessType, TokenScope
 from girder.exceptions import RestException
+from girder.models.file import File
 from girder.models.folder import Folder as FolderModel
 from girder.utility import ziputil
 from girder.utility.progress import ProgressContext
@@ -41,6 +43,7 @@ class Folder(Resource):
         self.route('GET', (':id', 'details'), self.getFolderDetails)
         self.route('GET', (':id', 'access'), self.getFolderAccess)
         self.route('GET', (':id', 'download'), self.downloadFolder)
+        self.route('GET', (':id', 'manifest'), self.getManifest)
         self.route('GET', (':id', 'rootpath'), self.rootpath)
         self.route('POST', (), self.createFolder)
         self.route('PUT', (':id',), self.updateFolder)
@@ -124,28 +127,61 @@ class Folder(Resource):
         .modelParam('id', model=FolderModel, level=AccessType.READ)
         .jsonParam('mimeFilter', 'JSON list of MIME types to include.', required=False,
                    requireArray=True)
+        .param('seekable', 'Send an uncompressed archive whose length is known ahead of time and '
+               'which honors the HTTP Range header, so that the download can be resumed or '
+               'fetched in parallel.', required=False, dataType='boolean', default=False)
+        .notes(SEEKABLE_ZIP_NOTES)
         .produces('application/zip')
         .errorResponse('ID was invalid.')
         .errorResponse('Read access was denied for the folder.', 403)
     )
-    def downloadFolder(self, folder, mimeFilter):
+    def downloadFolder(self, folder, mimeFilter, seekable):
         """
         Returns a generator function that will be used to stream out a zip
         file containing this folder's contents, filtered by permissions.
         """
+        user = self.getCurrentUser()
+        if seekable:
+            return sendSeekableZip(self._model.fileList(
+                folder, user=user, subpath=False, mimeFilter=mimeFilter, data=False),
+                folder['name'] + '.zip', folder['name'])
         setResponseHeader('Content-Type', 'application/zip')
         setContentDisposition(folder['name'] + '.zip')
-        user = self.getCurrentUser()
 
         def stream():
             zip = ziputil.ZipGenerator(folder['name'])
-            for (path, file) in self._model.fileList(
-                    folder, user=user, subpath=False, mimeFilter=mimeFilter):
-                for data in zip.addFile(file, path):
-                    yield data
+            for data in zip.addFiles(self._model.fileList(
+                    folder, user=user, subpath=False, mimeFilter=mimeFilter)):
+                yield data
             yield zip.footer()
         return stream
 
+    @access.public(scope=TokenScope.DATA_READ)
+    @autoDescribeRoute(
+        Description('List every file in a folder and its subfolders.')
+        .notes('Each file has a "path" relative to the folder, separated by "/", which is laid '
+               'out the same way as in a downloaded archive of the folder, and its "sha512" '
+               'checksum when it is known.  Folders that do not contain any files are not '
+               'listed.  The list is streamed as it is generated.')
+        .modelParam('id', model=FolderModel, level=AccessType.READ)
+        .jsonParam('mimeFilter', 'JSON list of MIME types to include.', required=False,
+                   requireArray=True)
+        .errorResponse('ID was invalid.')
+        .errorResponse('Read access was denied for the folder.', 403)
+    )
+    def getManifest(self, folder, mimeFilter):
+        user = self.getCurrentUser()
+        fileModel = File()
+        for path, file in self._model.fileList(
+                folder, user=user, subpath=False, mimeFilter=mimeFilter, data=False):
+            entry = fileModel.filter(file, user)
+            entry['path'] = path
+            # Clients compare checksums to skip or verify downloads, even
+            # though the field is not otherwise exposed.
+            if 'sha512' in file:
+                entry['sha512'] = file['sha512']
+            yield entry
+
     @access.user(scope=TokenScope.DATA_WRITE)
     @filtermodel(model=FolderModel)
     @autoDescribeRoute(
@@ -29,14 +29,13 @@ from girder.exceptions import RestException
 from girder.models.notification import Notification as NotificationModel
 from girder.models.setting import Setting
 from girder.utility import JsonEncoder
+from girder.utility.notification_broker import broker as notificationBroker
 from girder.api import access
 
 # If no timeout param is passed to stream, we default to this value
 DEFAULT_STREAM_TIMEOUT = 300
-# When new events are seen, we will poll at the minimum interval
-MIN_POLL_INTERVAL = 0.5
-# The interval increases when no new events are seen, capping at this value
-MAX_POLL_INTERVAL = 2
+# Streams wake up at least this often to check whether the server is stopping
+MAX_WAIT_INTERVAL = 2
 
 
 def sseMessage(event):
@@ -90,21 +89,23 @@ class Notification(Resource):
             since = datetime.utcfromtimestamp(since)
 
         def streamGen():
-            lastUpdate = since
-            start = time.time()
-            wait = MIN_POLL_INTERVAL
-            while cherrypy.engine.state == cherrypy.engine.states.STARTED:
-                wait = min(wait + MIN_POLL_INTERVAL, MAX_POLL_INTERVAL)
-                for event in NotificationModel().get(user, lastUpdate, token=token):
-                    if lastUpdate is None or event['updated'] > lastUpdate:
-                        lastUpdate = event['updated']
-                    wait = MIN_POLL_INTERVAL
-                    start = time.time()
-                    yield sseMessage(event)
-                if time.time() - start > timeout:
-                    break
-
-                time.sleep(wait)
+            subscription = notificationBroker.subscribe(user, token)
+            try:
+                # Notifications saved before the subscription started are
+                # looked up once; later ones are pushed by the broker.
+                events = subscription.filter(NotificationModel().get(
+                    user, since, token=token, sort=[('updated', SortDir.ASCENDING)]))
+                start = time.time()
+                while cherrypy.engine.state == cherrypy.engine.states.STARTED:
+                    for event in events:
+                        start = time.time()
+                        yield sseMessage(dict(event))
+                    remaining = timeout - (time.time() - start)
+                    if remaining <= 0:
+                        break
+                    events = subscription.wait(min(remaining, MAX_WAIT_INTERVAL))
+            finally:
+                subscription.close()
         return streamGen
 
     @access.cookie
@@ -20,7 +20,8 @@
 import six
 
 from ..describe import Description, autoDescribeRoute
-from ..rest import Resource as BaseResource, setResponseHeader, setContentDisposition
+from ..rest import Resource as BaseResource, SEEKABLE_ZIP_NOTES, sendSeekableZip, \
+    setResponseHeader, setContentDisposition
 from girder.constants import AccessType, TokenScope
 from girder.exceptions import RestException
 from girder.api import access
@@ -162,12 +163,15 @@ class Resource(BaseResource):
         .notes('This route is also exposed via the POST method because the '
                'request parameters can be quite long, and encoding them in the '
                'URL (as is standard when using the GET method) can cause the '
-               'URL to become too long, which causes errors.')
+               'URL to become too long, which causes errors. ' + SEEKABLE_ZIP_NOTES)
         .jsonParam('resources', 'A JSON-encoded set of resources to download. Each type is '
                    'a list of ids. For example: {"item": [(item id 1), (item id 2)], '
                    '"folder": [(folder id 1)]}.', requireObject=True)
         .param('includeMetadata', 'Include any metadata in JSON files in the '
                'archive.', required=False, dataType='boolean', default=False)
+        .param('seekable', 'Send an uncompressed archive whose length is known ahead of time and '
+               'which honors the HTTP Range header, so that the download can be resumed or '
+               'fetched in parallel.', required=False, dataType='boolean', default=False)
         .produces('application/zip')
         .errorResponse('Unsupported or unknown resource type.')
         .errorResponse('Invalid resources format.')
@@ -175,7 +179,7 @@ class Resource(BaseResource):
         .errorResponse('Resource not found.')
         .errorResponse('Read access was denied for a resource.', 403)
     )
-    def download(self, resources, includeMetadata):
+    def download(self, resources, includeMetadata, seekable):
         """
         Returns a generator function that will be used to stream out a zip
         file containing the listed resource's contents, filtered by
@@ -190,19 +194,26 @@ class Resource(BaseResource):
             for id in resources[kind]:
                 if not model.load(id=id, user=user, level=AccessType.READ):
                     raise RestException('Resource %s %s not found.' % (kind, id))
-        setResponseHeader('Content-Type', 'application/zip')
-        setContentDisposition('Resources.zip')
 
-        def stream():
-            zip = ziputil.ZipGenerator()
+        def fileList(**kwargs):
             for kind in resources:
                 model = self.model(kind)
                 for id in resources[kind]:
                     doc = model.load(id=id, user=user, level=AccessType.READ)
-                    for (path, file) in model.fileList(
-                            doc=doc, user=user, includeMetadata=includeMetadata, subpath=True):
-                        for data in zip.addFile(file, path):
-                            yield data
+                    for entry in model.fileList(
+                            doc=doc, user=user, includeMetadata=includeMetadata, subpath=True,
+                            **kwargs):
+                        yield entry
+
+        if seekable:
+            return sendSeekableZip(fileList(data=False), 'Resources.zip')
+        setResponseHeader('Content-Type', 'application/zip')
+        setContentDisposition('Resources.zip')
+
+        def stream():
+            zip = ziputil.ZipGenerator()
+            for data in zip.addFiles(fileList()):
+                yield data
             yield zip.footer()
         return stream
 
@@ -38,6 +38,7 @@ from girder.models.user import User
 from girder import plugin
 from girder.utility import config, system
 from girder.utility.progress import ProgressContext
+from girder.utility.size_propagation import recalculateSizes
 from ..describe import API_VERSION, Description, autoDescribeRoute
 from ..rest import Resource
 
@@ -393,7 +394,8 @@ class System(Resource):
         Description('Perform a variety of system checks to verify that all is '
                     'well.')
         .notes('Must be a system administrator to call this.  This verifies '
-               'and corrects some issues, such as incorrect folder sizes.')
+               'and corrects some issues, such as incorrect folder sizes and '
+               'missing or stale folder and item ancestor lists.')
         .param('progress', 'Whether to record progress on this task.',
                required=False, dataType='boolean', default=False)
         .errorResponse('You are not a system administrator.', 403)
@@ -403,11 +405,13 @@ class System(Resource):
         title = 'Running system consistency check'
         with ProgressContext(progress, user=user, title=title) as pc:
             results = {}
-            pc.update(title='Checking for orphaned records (Step 1 of 3)')
+            pc.update(title='Checking for orphaned records (Step 1 of 4)')
             results['orphansRemoved'] = self._pruneOrphans(pc)
-            pc.update(title='Checking for incorrect base parents (Step 2 of 3)')
+            pc.update(title='Checking for incorrect base parents (Step 2 of 4)')
             results['baseParentsFixed'] = self._fixBaseParents(pc)
-            pc.update(title='Checking for incorrect sizes (Step 3 of 3)')
+            pc.update(title='Checking for incorrect ancestors (Step 3 of 4)')
+            results['ancestorsFixed'] = self._fixAncestors(pc)
+            pc.update(title='Checking for incorrect sizes (Step 4 of 4)')
             results['sizesChanged'] = self._recalculateSizes(pc)
             return results
         # TODO:
@@ -554,6 +558,17 @@ class System(Resource):
                     fixes += 1
         return fixes
 
+    def _fixAncestors(self, progress):
+        fixes = 0
+        folderModel = self.model('folder')
+        folderModel.resetAncestorIdsCache()
+        query = {'parentCollection': {'$in': ['user', 'collection']}}
+        progress.update(total=folderModel.find(query).count(), current=0)
+        for doc in folderModel.find(query, fields=['ancestorIds']):
+            progress.update(increment=1)
+            fixes += folderModel.updateAncestors(doc, [])
+        return fixes
+
     def _pruneOrphans(self, progress):
         count = 0
         models = ['folder', 'item', 'file']
@@ -568,13 +583,4 @@ class System(Resource):
         return count
 
     def _recalculateSizes(self, progress):
-        fixes = 0
-        models = ['collection', 'user']
-        steps = sum(self.model(model).find().count() for model in models)
-        progress.update(total=steps, current=0)
-        for model in models:
-            for doc in self.model(model).find():
-                progress.update(increment=1)
-                _, f = self.model(model).updateSize(doc)
-                fixes += f
-        return fixes
+        return recalculateSizes(progress)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import click
+
+from girder.utility.server import configureServer
+from girder.utility.size_propagation import recalculateSizes
+
+
+@click.command('check-sizes', short_help='Recompute resource sizes.',
+               help='Recompute the sizes of all users, collections, folders, and items from '
+               'their files, and correct any recorded sizes that are wrong.')
+def main():
+    configureServer()
+    fixes = recalculateSizes()
+    click.echo('Corrected %d size%s.' % (fixes, '' if fixes == 1 else 's'))
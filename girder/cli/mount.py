@@ -19,6 +19,7 @@
 
 import cherrypy
 import click
+import collections
 import errno
 import fuse
 import os
@@ -42,6 +43,148 @@ from girder.utility import path as path_util
 from girder.utility.server import configureServer
 
 
+class MetadataCache(object):
+    """
+    Caches the resources found at paths of the mount and the listings of
+    directories for a limited time, so that repeated stats and directory walks
+    do not query the database for every call.  Entries are dropped as soon as
+    a resource they involve is saved or removed in this process; changes made
+    by other processes are seen once the entries expire.
+
+    :param ttl: the number of seconds an entry is used.  Zero disables the
+        cache.
+    :type ttl: float
+    :param maxSize: the maximum number of paths and listings kept.
+    :type maxSize: int
+    """
+    # The models whose changes affect the mount
+    models = ('collection', 'user', 'folder', 'item', 'file')
+
+    def __init__(self, ttl=60, maxSize=100000):
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self._lock = threading.Lock()
+        # Maps (kind, path) to a tuple of (expiry time, owner id, value)
+        self._entries = collections.OrderedDict()
+        # Maps the id of a resource to the keys of the entries that involve it
+        self._byId = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind, path):
+        """
+        Look up an entry.
+
+        :param kind: either 'resource' or 'listing'.
+        :param path: the path within the mount.
+        :returns: the cached value, or None.
+        """
+        if not self.ttl:
+            return None
+        key = (kind, path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                self._discard(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[2]
+
+    def set(self, kind, path, ownerId, value):
+        """
+        Record an entry.
+
+        :param kind: either 'resource' or 'listing'.
+        :param path: the path within the mount.
+        :param ownerId: the id of the resource the entry is dropped with.
+        :param value: the value to cache.
+        """
+        if not self.ttl:
+            return
+        key = (kind, path)
+        with self._lock:
+            self._discard(key)
+            while len(self._entries) >= self.maxSize:
+                self._discard(next(iter(self._entries)))
+            self._entries[key] = (time.time() + self.ttl, ownerId, value)
+            self._byId.setdefault(ownerId, set()).add(key)
+
+    def invalidate(self, *ids):
+        """
+        Drop the entries that involve resources.  The entries of paths below a
+        resource are dropped too, since the resource may have been renamed.
+
+        :param ids: the ids of the resources.  If none are given, all entries
+            are dropped.
+        """
+        with self._lock:
+            if not ids:
+                self._entries.clear()
+                self._byId.clear()
+                return
+            prefixes = set()
+            for id in ids:
+                for key in list(self._byId.get(id, ())):
+                    if key[0] == 'resource':
+                        prefixes.add(key[1] + '/')
+                    self._discard(key)
+            if prefixes:
+                prefixes = tuple(prefixes)
+                for key in [key for key in self._entries if key[1].startswith(prefixes)]:
+                    self._discard(key)
+
+    def invalidateEvent(self, event):
+        """
+        Event handler which drops the entries of a saved or removed resource
+        and the listing of its parent.
+        """
+        doc = event.info
+        if not isinstance(doc, dict) or '_id' not in doc:
+            return
+        model = event.name.split('.')[1]
+        parentId = {
+            'collection': 'collection',
+            'user': 'user',
+            'folder': doc.get('parentId'),
+            'item': doc.get('folderId'),
+            'file': doc.get('itemId')
+        }[model]
+        self.invalidate(doc['_id'], parentId)
+
+    def bind(self, handlerName):
+        for model in self.models:
+            for eventName in ('save.after', 'remove'):
+                events.bind('model.%s.%s' % (model, eventName), handlerName, self.invalidateEvent)
+
+    def unbind(self, handlerName):
+        for model in self.models:
+            for eventName in ('save.after', 'remove'):
+                events.unbind('model.%s.%s' % (model, eventName), handlerName)
+
+    def stats(self):
+        """
+        Return the hit and miss counters and the number of entries.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxSize': self.maxSize
+        }
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._byId.get(entry[1])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._byId[entry[1]]
+
+
 class ServerFuse(fuse.Operations):
     """
     This class handles FUSE operations that are non-default.  It exposes the
@@ -51,10 +194,11 @@ class ServerFuse(fuse.Operations):
     """
     use_ns = True
 
-    def __init__(self, stat=None):
+    def __init__(self, stat=None, cacheTTL=60):
         """
         Instantiate the operations class.  This sets up tracking for open
-        files and file descriptor numbers (handles).
+        files and file descriptor numbers (handles), and a cache of the
+        resources and directory listings of the mount.
 
         :param stat: the results of an os.stat call which should be used as
             default values for files in the FUSE.  Files in the FUSE will have
@@ -62,6 +206,8 @@ class ServerFuse(fuse.Operations):
             updated and a created time stamp, the ctime and mtime will also be
             taken from this.  If None, this defaults to the user of the Girder
             process's home directory,
+        :param cacheTTL: the number of seconds that resources and directory
+            listings are cached.  Zero disables the cache.
         """
         super(ServerFuse, self).__init__()
         if not stat:
@@ -73,6 +219,8 @@ class ServerFuse(fuse.Operations):
         self.nextFH = 1
         self.openFiles = {}
         self.openFilesLock = threading.Lock()
+        self.cache = MetadataCache(ttl=cacheTTL)
+        self._cacheHandlerName = 'girder.mount.%d' % id(self)
 
     def __call__(self, op, path, *args, **kwargs):
         """
@@ -110,13 +258,16 @@ class ServerFuse(fuse.Operations):
         # If asked about a file in top level directory or the top directory,
         # return that it doesn't exist.  Other methods should handle '',
         # '/user', and 'collection' before calling this method.
-        if '/' not in path.rstrip('/')[1:]:
+        path = path.rstrip('/')
+        if '/' not in path[1:]:
             raise fuse.FuseOSError(errno.ENOENT)
+        resource = self.cache.get('resource', path)
+        if resource is not None:
+            return resource
         try:
             # We can't filter the resource, since that removes files'
             # assetstore information and users' size information.
-            resource = path_util.lookUpPath(
-                path.rstrip('/'), filter=False, force=True)
+            resource = path_util.lookUpPath(path, filter=False, force=True)
         except (path_util.NotFoundException, AccessException):
             raise fuse.FuseOSError(errno.ENOENT)
         except ValidationException:
@@ -124,6 +275,7 @@ class ServerFuse(fuse.Operations):
         except Exception:
             logger.exception('ServerFuse server internal error')
             raise fuse.FuseOSError(errno.EROFS)
+        self.cache.set('resource', path, resource['document']['_id'], resource)
         return resource   # {model, document}
 
     def _stat(self, doc, model):
@@ -157,6 +309,9 @@ class ServerFuse(fuse.Operations):
             # of all of their children via doc.get('size', 0), but that isn't
             # how most directories are reported.
             attr['st_size'] = 0
+        if attr.get('st_blksize') and attr.get('st_size'):
+            attr['st_blocks'] = int(
+                (attr['st_size'] + attr['st_blksize'] - 1) / attr['st_blksize'])
         return attr
 
     def _name(self, doc, model):
@@ -181,21 +336,31 @@ class ServerFuse(fuse.Operations):
         :returns: a list of the names of resources within the specified
         document.
         """
-        entries = []
+        return [name for name, _, _ in self._children(doc, model)]
+
+    def _children(self, doc, model):
+        """
+        List the resources in a Girder user, collection, folder, or item, with
+        one query per type of child.
+
+        :param doc: the girder resource document.
+        :param model: the girder model.
+        :returns: a list of tuples of the name, document, and model of each
+            resource within the specified document.
+        """
+        children = []
         if model in ('collection', 'user', 'folder'):
             folderList = Folder().find({
                 'parentId': doc['_id'],
                 'parentCollection': model.lower()
             })
-            for folder in folderList:
-                entries.append(self._name(folder, 'folder'))
+            children.extend((folder, 'folder') for folder in folderList)
         if model == 'folder':
-            for item in Folder().childItems(doc):
-                entries.append(self._name(item, 'item'))
+            children.extend((item, 'item') for item in Folder().childItems(doc))
         elif model == 'item':
-            for file in Item().childFiles(doc):
-                entries.append(self._name(file, 'file'))
-        return entries
+            children.extend((file, 'file') for file in Item().childFiles(doc))
+        return [(self._name(child, childModel), child, childModel)
+                for child, childModel in children]
 
     # We don't handle extended attributes or ioctl.
     getxattr = None
@@ -250,9 +415,6 @@ class ServerFuse(fuse.Operations):
         else:
             resource = self._getPath(path)
             attr = self._stat(resource['document'], resource['model'])
-        if attr.get('st_blksize') and attr.get('st_size'):
-            attr['st_blocks'] = int(
-                (attr['st_size'] + attr['st_blksize'] - 1) / attr['st_blksize'])
         return attr
 
     def read(self, path, size, offset, fh):
@@ -283,20 +445,33 @@ class ServerFuse(fuse.Operations):
         :param path: path within the fuse.
         :param fh: an open file handle.  Ignored, since path is always
             specified.
-        :returns: a list of names.  This always includes . and ..
+        :returns: a list of names and tuples of the name, attributes, and
+            offset of each resource, so that the attributes of a whole
+            directory are known at once.  This always includes . and ..
         """
         path = path.rstrip('/')
         result = [u'.', u'..']
         if path == '':
             result.extend([u'collection', u'user'])
-        elif path in ('/user', '/collection'):
-            model = path[1:]
-            docList = ModelImporter.model(model).find({}, sort=None)
-            for doc in docList:
-                result.append(self._name(doc, model))
-        else:
-            resource = self._getPath(path)
-            result.extend(self._list(resource['document'], resource['model']))
+            return result
+        children = self.cache.get('listing', path)
+        if children is None:
+            if path in ('/user', '/collection'):
+                model = path[1:]
+                children = [
+                    (self._name(doc, model), doc, model)
+                    for doc in ModelImporter.model(model).find({}, sort=None)]
+                ownerId = model
+            else:
+                resource = self._getPath(path)
+                children = self._children(resource['document'], resource['model'])
+                ownerId = resource['document']['_id']
+            self.cache.set('listing', path, ownerId, children)
+            # The children are usually looked up next, so remember them too
+            for name, doc, model in children:
+                self.cache.set(
+                    'resource', path + '/' + name, doc['_id'], {'model': model, 'document': doc})
+        result.extend((name, self._stat(doc, model), 0) for name, doc, model in children)
         return result
 
     def open(self, path, flags):
@@ -344,6 +519,16 @@ class ServerFuse(fuse.Operations):
                 return super(ServerFuse, self).release(path, fh)
         return 0
 
+    def init(self, path):
+        """
+        Handle startup of the FUSE.  Model events invalidate the cache from
+        here on; they are unbound again in destroy.
+
+        :param path: always '/'.
+        """
+        self.cache.bind(self._cacheHandlerName)
+        return super(ServerFuse, self).init(path)
+
     def destroy(self, path):
         """
         Handle shutdown of the FUSE.
@@ -351,6 +536,7 @@ class ServerFuse(fuse.Operations):
         :param path: always '/'.
         """
         Setting().unset(SettingKey.GIRDER_MOUNT_INFORMATION)
+        self.cache.unbind(self._cacheHandlerName)
         events.trigger('server_fuse.destroy')
         return super(ServerFuse, self).destroy(path)
 
@@ -430,15 +616,20 @@ def unmountServer(path, lazy=False, quiet=False):
     '-l', '-z', '--lazy', 'lazy', is_flag=True, default=False,
     help='Lazy unmount.')
 @click.option('--plugins', default=None, help='Comma separated list of plugins to import.')
-def main(path, database, fuseOptions, quiet, unmount, lazy, plugins):
+@click.option(
+    '--cache-ttl', 'cacheTTL', default=60, show_default=True, type=click.FloatRange(min=0),
+    help='Seconds to cache resources and directory listings.  Changes made by other Girder '
+         'processes are seen after this time.  Zero disables the cache.')
+def main(path, database, fuseOptions, quiet, unmount, lazy, plugins, cacheTTL):
     if unmount or lazy:
         result = unmountServer(path, lazy, quiet)
         sys.exit(result)
     mountServer(path=path, database=database, fuseOptions=fuseOptions,
-                quiet=quiet, plugins=plugins)
+                quiet=quiet, plugins=plugins, cacheTTL=cacheTTL)
 
 
-def mountServer(path, database=None, fuseOptions=None, quiet=False, plugins=None):
+def mountServer(path, database=None, fuseOptions=None, quiet=False, plugins=None,
+                cacheTTL=60):
     """
     Perform the mount.
 
@@ -452,6 +643,8 @@ def mountServer(path, database=None, fuseOptions=None, quiet=False, plugins=None
     :param quiet: if True, suppress Girder logs.
     :param plugins: an optional list of plugins to enable.  If None, use the
         plugins that are configured.
+    :param cacheTTL: the number of seconds that resources and directory
+        listings are cached.  Zero disables the cache.
     """
     if quiet:
         curConfig = config.getConfig()
@@ -465,7 +658,7 @@ def mountServer(path, database=None, fuseOptions=None, quiet=False, plugins=None
     webroot, appconf = configureServer(plugins=plugins)
     girder._setupCache()
 
-    opClass = ServerFuse(stat=os.stat(path))
+    opClass = ServerFuse(stat=os.stat(path), cacheTTL=cacheTTL)
     options = {
         # By default, we run in the background so the mount command returns
         # immediately.  If we run in the foreground, a SIGTERM will shut it
@@ -344,6 +344,12 @@ class CoreEventHandler(object):
     # For removing deleted user/group references from AccessControlledModel
     ACCESS_CONTROL_CLEANUP = 'core.cleanupDeletedEntity'
 
+    # For dropping cached access decisions when a resource changes.
+    ACCESS_CACHE_INVALIDATE = 'core.invalidateAccessCache'
+
+    # For dropping cached path components when a resource changes.
+    PATH_CACHE_INVALIDATE = 'core.invalidatePathCache'
+
     # For updating an item's size to include a new file.
     FILE_PROPAGATE_SIZE = 'core.propagateSizeToItem'
 
@@ -39,16 +39,25 @@ For obvious reasons, the asynchronous method does not return a value to the
 caller. Instead, the caller may optionally pass the callback argument as a
 function to be called when the task is finished. That callback function will
 receive the Event object as its only argument.
+
+Listeners may also bind to every event whose name matches a pattern by using
+``*`` as a wildcard in the event name, for example:
+
+    ``girder.events.bind('rest.get.item/*.after', 'my.handler', handlerFunction)``
+
+Handlers bound to the exact event name are called before those bound through
+a wildcard pattern.
 """
 
 import contextlib
 import girder
+import re
 import six
 import threading
+import timeit
 
-from collections import OrderedDict
+from collections import deque, OrderedDict
 from girder.utility import config
-from six.moves import queue
 
 
 class Event(object):
@@ -125,6 +134,9 @@ class ForegroundEventsDaemon(object):
     def stop(self):
         pass
 
+    def stats(self):
+        return {'workers': 0}
+
     def trigger(self, eventName=None, info=None, callback=None):
         if eventName is None:
             event = Event(None, info, async=False)
@@ -140,14 +152,69 @@ class AsyncEventsThread(threading.Thread):
     This class is used to execute the pipeline for events asynchronously.
     This should not be invoked directly by callers; instead, they should use
     girder.events.daemon.trigger().
+
+    Events are dispatched by a pool of daemon threads, this thread being the
+    first of them.
+
+    :param workers: The number of threads dispatching events.
+    :type workers: int
+    :param maxQueueSize: The maximum number of events waiting to be dispatched,
+        including those held back by a concurrency limit, or 0 for no limit.
+    :type maxQueueSize: int
+    :param overflow: What to do when an event is triggered while the queue is
+        full: ``'block'`` waits for space, ``'drop'`` discards the event, and
+        ``'foreground'`` handles the event in the calling thread.
+    :type overflow: str
+    :param concurrency: A dict mapping event names to the maximum number of
+        those events that may be handled at once. Events beyond the limit wait
+        without occupying a worker.
+    :type concurrency: dict or None
     """
-    def __init__(self):
+    OVERFLOW_POLICIES = ('block', 'drop', 'foreground')
+
+    def __init__(self, workers=1, maxQueueSize=0, overflow='block', concurrency=None):
         threading.Thread.__init__(self)
 
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError('Invalid event queue overflow policy: %s' % overflow)
+
         self.daemon = True
         self.terminate = False
-        self.eventQueue = queue.Queue()
-        self.queueNotEmpty = threading.Condition()
+        self.workers = max(1, int(workers))
+        self.maxQueueSize = max(0, int(maxQueueSize))
+        self.overflow = overflow
+        self.concurrency = dict(concurrency or {})
+        self._workerThreads = []
+        self._lock = threading.Lock()
+        # Workers wait for events to be queued, and blocked producers for
+        # queued or deferred events to be dispatched.
+        self._notEmpty = threading.Condition(self._lock)
+        self._notFull = threading.Condition(self._lock)
+        self._queue = deque()
+        self._deferred = {}
+        self._waiting = 0
+        self._running = {}
+        self._stats = {
+            'triggered': 0,
+            'processed': 0,
+            'failed': 0,
+            'dropped': 0,
+            'foreground': 0,
+            'totalWaitTime': 0.0,
+            'maxWaitTime': 0.0
+        }
+
+    def start(self):
+        """
+        Start this thread and the other workers of the pool.
+        """
+        for i in range(1, self.workers):
+            worker = threading.Thread(
+                target=self.run, name='%s-worker-%d' % (self.name, i))
+            worker.daemon = True
+            self._workerThreads.append(worker)
+            worker.start()
+        super(AsyncEventsThread, self).start()
 
     def run(self):
         """
@@ -155,27 +222,85 @@ class AsyncEventsThread(threading.Thread):
         put to sleep until someone calls trigger() on it with a new event to
         dispatch.
         """
-        girder.logprint.info('Started asynchronous event manager thread.')
-
-        while not self.terminate:
-            try:
-                eventName, info, callback = self.eventQueue.get(block=False)
-                if eventName is None:
-                    event = Event(None, info, async=True)
-                else:
-                    event = trigger(eventName, info, async=True, daemon=True)
-
-                if callable(callback):
-                    callback(event)
-            except queue.Empty:
-                self.queueNotEmpty.acquire()
-                self.queueNotEmpty.wait()
-                self.queueNotEmpty.release()
-            except Exception:
-                # Must continue the event loop even if handler failed
-                girder.logger.exception('In handler for event "%s":' % eventName)
-
-        girder.logprint.info('Stopped asynchronous event manager thread.')
+        if threading.current_thread() is self:
+            girder.logprint.info('Started asynchronous event manager thread.')
+
+        while True:
+            with self._lock:
+                item = self._next()
+                while item is None and not self.terminate:
+                    self._notEmpty.wait()
+                    item = self._next()
+            if item is None:
+                break
+            # Handling an event may release a deferred event of the same name
+            while item is not None:
+                item = self._dispatch(item)
+
+        if threading.current_thread() is self:
+            girder.logprint.info('Stopped asynchronous event manager thread.')
+
+    def _next(self):
+        """
+        Take the next queued event that may be handled now, deferring those
+        whose name is at its concurrency limit. The lock must be held.
+
+        :returns: The event, or None if there is none or the daemon stopped.
+        """
+        while self._queue and not self.terminate:
+            item = self._queue.popleft()
+            limit = self.concurrency.get(item[0])
+            if limit and self._running.get(item[0], 0) >= limit:
+                self._deferred.setdefault(item[0], deque()).append(item)
+                continue
+            return self._start(item)
+        return None
+
+    def _start(self, item):
+        """
+        Record that an event is being handled, freeing its place in the queue.
+        The lock must be held.
+        """
+        eventName, info, callback, queuedTime = item
+        self._running[eventName] = self._running.get(eventName, 0) + 1
+        self._waiting -= 1
+        self._notFull.notify()
+        waitTime = timeit.default_timer() - queuedTime
+        self._stats['totalWaitTime'] += waitTime
+        self._stats['maxWaitTime'] = max(self._stats['maxWaitTime'], waitTime)
+        return item
+
+    def _dispatch(self, item):
+        """
+        Handle an event that was taken from the queue.
+
+        :returns: The next deferred event with the same name that may now be
+            handled, or None.
+        """
+        eventName, info, callback, queuedTime = item
+        failed = False
+        try:
+            if eventName is None:
+                event = Event(None, info, async=True)
+            else:
+                event = trigger(eventName, info, async=True, daemon=True)
+
+            if callable(callback):
+                callback(event)
+        except Exception:
+            # Must continue the event loop even if handler failed
+            failed = True
+            girder.logger.exception('In handler for event "%s":' % eventName)
+
+        with self._lock:
+            self._stats['processed'] += 1
+            if failed:
+                self._stats['failed'] += 1
+            self._running[eventName] -= 1
+            deferred = self._deferred.get(eventName)
+            if deferred and not self.terminate:
+                return self._start(deferred.popleft())
+        return None
 
     def trigger(self, eventName=None, info=None, callback=None):
         """
@@ -187,25 +312,74 @@ class AsyncEventsThread(threading.Thread):
             all bound event handlers. It takes one argument, which is the
             event object itself.
         """
-        self.queueNotEmpty.acquire()
-        self.eventQueue.put((eventName, info, callback))
-        self.queueNotEmpty.notify()
-        self.queueNotEmpty.release()
+        item = (eventName, info, callback, timeit.default_timer())
+        with self._lock:
+            self._stats['triggered'] += 1
+            if self.maxQueueSize and self.overflow == 'block':
+                while self._waiting >= self.maxQueueSize and not self.terminate:
+                    self._notFull.wait()
+            if self.terminate:
+                self._stats['dropped'] += 1
+                overflow = 'stopped'
+            elif not self.maxQueueSize or self._waiting < self.maxQueueSize:
+                self._queue.append(item)
+                self._waiting += 1
+                self._notEmpty.notify()
+                return
+            else:
+                overflow = self.overflow
+                self._stats['dropped' if overflow == 'drop' else 'foreground'] += 1
+
+        if overflow == 'stopped':
+            girder.logger.warning(
+                'Event daemon is stopped; dropped asynchronous event "%s".' % eventName)
+        elif overflow == 'drop':
+            girder.logger.warning(
+                'Event queue is full; dropped asynchronous event "%s".' % eventName)
+        else:
+            ForegroundEventsDaemon().trigger(eventName, info, callback)
+
+    def stats(self):
+        """
+        Return statistics about the queue and the events dispatched so far.
+        Wait times are measured from when an event is triggered until a worker
+        starts handling it, in seconds.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['running'] = {k: v for k, v in six.viewitems(self._running) if v}
+            stats['deferred'] = {k: len(v) for k, v in six.viewitems(self._deferred) if v}
+            stats['queueSize'] = len(self._queue)
+        stats['maxQueueSize'] = self.maxQueueSize
+        stats['workers'] = self.workers
+        stats['overflow'] = self.overflow
+        dispatched = stats['processed'] + sum(six.itervalues(stats['running']))
+        stats['meanWaitTime'] = stats['totalWaitTime'] / dispatched if dispatched else 0.0
+        return stats
 
     def stop(self):
         """
         Gracefully stops this thread. Will finish the currently processing
-        event before stopping.
+        events before stopping. Events that are still waiting are discarded
+        and logged.
         """
-        self.queueNotEmpty.acquire()
-        self.terminate = True
-        self.queueNotEmpty.notify()
-        self.queueNotEmpty.release()
-
-    def __del__(self):
-        # Make sure we stop this thread if it's getting GCed, i.e. daemon was reassigned
-        self.stop()
-        super(AsyncEventsThread, self).__del__()
+        with self._lock:
+            self.terminate = True
+            discarded = list(self._queue)
+            for deferred in six.itervalues(self._deferred):
+                discarded.extend(deferred)
+            self._queue.clear()
+            self._deferred.clear()
+            self._waiting = 0
+            self._stats['dropped'] += len(discarded)
+            self._notEmpty.notify_all()
+            self._notFull.notify_all()
+
+        if discarded:
+            names = sorted({str(item[0]) for item in discarded})
+            girder.logger.warning(
+                'Stopped the event daemon with %d asynchronous events not handled: %s' % (
+                    len(discarded), ', '.join(names)))
 
 
 def bind(eventName, handlerName, handler):
@@ -229,13 +403,20 @@ def bind(eventName, handlerName, handler):
     if eventName in _deprecated:
         girder.logger.warning('event "%s" is deprecated; %s' % (eventName, _deprecated[eventName]))
 
-    if eventName not in _mapping:
-        _mapping[eventName] = OrderedDict()
+    with _bindingsLock:
+        if eventName not in _mapping:
+            _mapping[eventName] = OrderedDict()
+
+        exists = handlerName in _mapping[eventName]
+        if not exists:
+            _mapping[eventName][handlerName] = handler
+            if '*' in eventName and eventName not in _wildcards:
+                _wildcards[eventName] = re.compile(
+                    '.*'.join(re.escape(part) for part in eventName.split('*')) + '$')
+            _resolved.clear()
 
-    if handlerName in _mapping[eventName]:
+    if exists:
         girder.logger.warning('Event binding already exists: %s -> %s' % (eventName, handlerName))
-    else:
-        _mapping[eventName][handlerName] = handler
 
 
 def unbind(eventName, handlerName):
@@ -247,7 +428,11 @@ def unbind(eventName, handlerName):
     :param handlerName: The name that identifies the handler calling bind().
     :type handlerName: str
     """
-    _mapping.get(eventName, {}).pop(handlerName, None)
+    with _bindingsLock:
+        _mapping.get(eventName, {}).pop(handlerName, None)
+        if eventName in _wildcards and not _mapping[eventName]:
+            del _wildcards[eventName]
+        _resolved.clear()
 
 
 def unbindAll():
@@ -258,7 +443,10 @@ def unbindAll():
        necessary for normal Girder functionality. This function should generally
        never be called outside of testing.
     """
-    _mapping.clear()
+    with _bindingsLock:
+        _mapping.clear()
+        _wildcards.clear()
+        _resolved.clear()
 
 
 @contextlib.contextmanager
@@ -275,6 +463,74 @@ def bound(eventName, handlerName, handler):
         unbind(eventName, handlerName)
 
 
+def _handlers(eventName):
+    """
+    Return the (handlerName, handler) pairs bound to an event, including those
+    bound through wildcard patterns. The result is cached until the next
+    change to the bindings.
+    """
+    handlers = _resolved.get(eventName)
+    if handlers is None:
+        # Resolve under the same lock as bind and unbind, so that a stale list
+        # is never cached after the bindings change.
+        with _bindingsLock:
+            handlers = list(six.viewitems(_mapping.get(eventName, {})))
+            for pattern, regex in six.viewitems(_wildcards):
+                if pattern != eventName and regex.match(eventName):
+                    handlers.extend(six.viewitems(_mapping[pattern]))
+            handlers = tuple(handlers)
+            if len(_resolved) >= _MAX_RESOLVED:
+                # Event names can be generated dynamically, so don't let this grow unbounded
+                _resolved.clear()
+            _resolved[eventName] = handlers
+    return handlers
+
+
+def hasListeners(eventName):
+    """
+    Test whether any handler is bound to an event, either by its exact name or
+    through a wildcard pattern. Callers that trigger events on hot paths may
+    use this to skip constructing the event's info when nothing would see it.
+
+    :param eventName: The name that identifies the event.
+    :type eventName: str
+    :rtype: bool
+    """
+    return bool(_handlers(eventName))
+
+
+def getHandlerTimes():
+    """
+    Return the time spent in handlers for each event that has been handled since
+    the server started or :py:func:`resetHandlerTimes` was called.
+
+    :returns: A dict mapping event names to dicts with ``calls``, the number of
+        handler invocations, and ``totalTime`` and ``maxTime``, in seconds.
+    """
+    with _handlerTimesLock:
+        return {
+            eventName: {'calls': calls, 'totalTime': totalTime, 'maxTime': maxTime}
+            for eventName, (calls, totalTime, maxTime) in six.viewitems(_handlerTimes)
+        }
+
+
+def resetHandlerTimes():
+    """
+    Discard the handler timing metrics.
+    """
+    with _handlerTimesLock:
+        _handlerTimes.clear()
+
+
+def _recordHandlerTime(eventName, elapsed):
+    with _handlerTimesLock:
+        if eventName not in _handlerTimes and len(_handlerTimes) >= _MAX_RESOLVED:
+            # Like the resolved handlers, don't let metrics for dynamic names grow unbounded
+            _handlerTimes.clear()
+        calls, totalTime, maxTime = _handlerTimes.get(eventName, (0, 0.0, 0.0))
+        _handlerTimes[eventName] = (calls + 1, totalTime + elapsed, max(maxTime, elapsed))
+
+
 def trigger(eventName, info=None, pre=None, async=False, daemon=False):
     """
     Fire an event with the given name. All listeners bound on that name will be
@@ -297,7 +553,7 @@ def trigger(eventName, info=None, pre=None, async=False, daemon=False):
     :type daemon: bool
     """
     e = Event(eventName, info, async=async)
-    for name, handler in six.viewitems(_mapping.get(eventName, {})):
+    for name, handler in _handlers(eventName):
         if daemon and not async:
             girder.logprint.warning(
                 'WARNING: Handler "%s" for event "%s" was triggered on the daemon, but is '
@@ -305,7 +561,11 @@ def trigger(eventName, info=None, pre=None, async=False, daemon=False):
         e.currentHandlerName = name
         if pre is not None:
             pre(info=info, handler=handler, eventName=eventName, handlerName=name)
-        handler(e)
+        start = timeit.default_timer()
+        try:
+            handler(e)
+        finally:
+            _recordHandlerTime(eventName, timeit.default_timer() - start)
 
         if e.propagate is False:
             break
@@ -315,12 +575,26 @@ def trigger(eventName, info=None, pre=None, async=False, daemon=False):
 
 _deprecated = {}
 _mapping = {}
+# Compiled regular expressions for the bound event names that contain wildcards
+_wildcards = OrderedDict()
+# Cache of the handlers for each triggered event name; cleared whenever bindings change
+_resolved = {}
+_MAX_RESOLVED = 10000
+# Guards the bindings and the cache of resolved handlers
+_bindingsLock = threading.Lock()
+_handlerTimes = {}
+_handlerTimesLock = threading.Lock()
 daemon = ForegroundEventsDaemon()
 
 
 def setupDaemon():
     global daemon
-    if config.getConfig()['server'].get('disable_event_daemon', False):
+    serverConfig = config.getConfig()['server']
+    if serverConfig.get('disable_event_daemon', False):
         daemon = ForegroundEventsDaemon()
     else:
-        daemon = AsyncEventsThread()
+        daemon = AsyncEventsThread(
+            workers=serverConfig.get('event_daemon_workers', 1),
+            maxQueueSize=serverConfig.get('event_daemon_queue_size', 0),
+            overflow=serverConfig.get('event_daemon_overflow', 'block'),
+            concurrency=serverConfig.get('event_daemon_concurrency'))
@@ -24,6 +24,7 @@ from girder.constants import AssetstoreType, SortDir
 from girder.exceptions import ValidationException, GirderException, NoAssetstoreAdapter
 from girder.utility import assetstore_utilities
 from girder.utility.abstract_assetstore_adapter import AbstractAssetstoreAdapter
+from girder.utility.size_propagation import batchSizeChanges
 
 
 class Assetstore(Model):
@@ -184,6 +185,7 @@ class Assetstore(Model):
         Calls the importData method of the underlying assetstore adapter.
         """
         adapter = assetstore_utilities.getAssetstoreAdapter(assetstore)
-        return adapter.importData(
-            parent=parent, parentType=parentType, params=params,
-            progress=progress, user=user, **kwargs)
+        with batchSizeChanges():
+            return adapter.importData(
+                parent=parent, parentType=parentType, params=params,
+                progress=progress, user=user, **kwargs)
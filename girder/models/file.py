@@ -29,6 +29,7 @@ from girder.exceptions import FilePathException, ValidationException
 from girder.models.setting import Setting
 from girder.utility import acl_mixin
 from girder.utility import path as path_util
+from girder.utility.size_propagation import incrementSize
 
 
 class File(acl_mixin.AccessControlMixin, Model):
@@ -100,6 +101,10 @@ class File(acl_mixin.AccessControlMixin, Model):
             disposition-type value.
         :type contentDisposition: str or None
         :type extraParameters: str or None
+
+        The ``model.file.download.complete`` event is triggered by whichever
+        thread reads the returned generator to its end, which is not always
+        the request thread; see :py:meth:`girder.utility.ziputil.ZipGenerator.addFiles`.
         """
         events.trigger('model.file.download.request', info={
             'file': file,
@@ -273,7 +278,9 @@ class File(acl_mixin.AccessControlMixin, Model):
         parents in the hierarchy. Internally, this records subtree size in
         the item, the parent folder, and the root node under which the item
         lives. Should be called anytime a new file is added, a file is
-        deleted, or a file size changes.
+        deleted, or a file size changes. The folder and root node increments
+        are coalesced within a
+        :py:func:`girder.utility.size_propagation.batchSizeChanges` block.
 
         :param item: The parent item of the file.
         :type item: dict
@@ -293,14 +300,10 @@ class File(acl_mixin.AccessControlMixin, Model):
             }, field='size', amount=sizeIncrement, multi=False)
 
         # Propagate size to direct parent folder
-        Folder().increment(query={
-            '_id': item['folderId']
-        }, field='size', amount=sizeIncrement, multi=False)
+        incrementSize(Folder(), item['folderId'], sizeIncrement)
 
         # Propagate size up to root data node
-        self.model(item['baseParentType']).increment(query={
-            '_id': item['baseParentId']
-        }, field='size', amount=sizeIncrement, multi=False)
+        incrementSize(self.model(item['baseParentType']), item['baseParentId'], sizeIncrement)
 
     def createFile(self, creator, item, name, size, assetstore, mimeType=None,
                    saveFile=True, reuseExisting=False, assetstoreType=None):
@@ -464,6 +467,20 @@ class File(acl_mixin.AccessControlMixin, Model):
         # TODO: check underlying assetstore for size?
         return file.get('size', 0), 0
 
+    def setCrc32(self, file, crc):
+        """
+        Record the CRC32 of the contents of a file, so that archives listing
+        the file can be laid out without reading it. The value is discarded
+        when the contents of the file change.
+
+        :param file: The file.
+        :type file: dict
+        :param crc: The CRC32 of the contents of the file.
+        :type crc: int
+        """
+        file['crc32'] = crc
+        self.update({'_id': file['_id']}, {'$set': {'crc32': crc}})
+
     def open(self, file):
         """
         Use this to expose a Girder file as a python file-like object. At the
@@ -29,6 +29,10 @@ from girder import events
 from girder.constants import AccessType
 from girder.exceptions import ValidationException, GirderException
 from girder.utility.progress import noProgress, setResponseTimeLimit
+from girder.utility.size_propagation import batchSizeChanges, incrementSize
+
+# The number of folders, and of items, whose contents fileList looks up together
+FILE_LIST_BATCH_SIZE = 1000
 
 
 class Folder(AccessControlledModel):
@@ -42,8 +46,9 @@ class Folder(AccessControlledModel):
 
     def initialize(self):
         self.name = 'folder'
-        self.ensureIndices(('parentId', 'name', 'lowerName',
-                            ([('parentId', 1), ('name', 1)], {})))
+        self.ensureIndices(('parentId', 'name', 'lowerName', 'ancestorIds',
+                            ([('parentId', 1), ('name', 1)], {}),
+                            ([('baseParentId', 1), ('name', 1)], {})))
         self.ensureTextIndex({
             'name': 10,
             'description': 1
@@ -53,6 +58,7 @@ class Folder(AccessControlledModel):
             '_id', 'name', 'public', 'publicFlags', 'description', 'created', 'updated',
             'size', 'meta', 'parentId', 'parentCollection', 'creatorId',
             'baseParentType', 'baseParentId'))
+        self._hasAncestorIds = False
 
     def validate(self, doc, allowRename=False):
         """
@@ -137,7 +143,7 @@ class Folder(AccessControlledModel):
         """
         # Ensure we include extra fields to do the migration below
         extraFields = {'baseParentId', 'baseParentType', 'parentId', 'parentCollection',
-                       'name', 'lowerName'}
+                       'name', 'lowerName', 'ancestorIds'}
         loadFields = self._supplementFields(fields, extraFields)
 
         doc = super(Folder, self).load(
@@ -159,27 +165,115 @@ class Folder(AccessControlledModel):
                 self.update({'_id': doc['_id']}, {'$set': {
                     'lowerName': doc['lowerName']
                 }})
+            if 'ancestorIds' not in doc:
+                doc['ancestorIds'] = self._computeAncestorIds(doc)
+                self.update({'_id': doc['_id']}, {'$set': {
+                    'ancestorIds': doc['ancestorIds']
+                }})
 
             self._removeSupplementalFields(doc, fields)
 
         return doc
 
-    def getSizeRecursive(self, folder):
+    def _computeAncestorIds(self, doc):
         """
-        Calculate the total size of the folder by recursing into all of its
-        descendant folders.
+        Compute the list of ancestor folder ids of a folder from its parent,
+        for documents that predate the ``ancestorIds`` field.
+
+        :param doc: The folder document.
+        :type doc: dict
+        :returns: a list of folder ids, ordered from the top-level folder down
+            to the direct parent of this folder.
         """
-        size = folder['size']
+        if doc['parentCollection'] != 'folder':
+            return []
+        parent = self.load(doc['parentId'], force=True, fields=['ancestorIds'])
+        if parent is None:
+            return []
+        return parent['ancestorIds'] + [parent['_id']]
 
-        q = {
-            'parentId': folder['_id'],
-            'parentCollection': 'folder'
-        }
+    def getChildAncestorIds(self, parent, parentType='folder'):
+        """
+        Return the ``ancestorIds`` value that a folder or item created directly
+        under the given parent should have.
+
+        :param parent: The parent document.
+        :type parent: dict
+        :param parentType: The type of the parent ('folder', 'user', or
+            'collection').
+        :type parentType: str
+        :returns: a list of folder ids ordered from the top-level folder down to
+            the parent itself.
+        """
+        if parentType != 'folder':
+            return []
+        return self._getAncestorIds(parent) + [parent['_id']]
+
+    def _getAncestorIds(self, folder):
+        """
+        Return the ancestor list of a folder document, reloading it if the
+        document was loaded without the ``ancestorIds`` field.
+        """
+        if 'ancestorIds' not in folder:
+            folder['ancestorIds'] = self.load(
+                folder['_id'], force=True, fields=['ancestorIds'])['ancestorIds']
+        return folder['ancestorIds']
+
+    def _subtreeQuery(self, folderId):
+        """
+        Return a query matching every folder or item that is a descendant of
+        the given folder, using the indexed ``ancestorIds`` field.
+        """
+        return {'ancestorIds': folderId}
+
+    def hasAncestorIds(self):
+        """
+        Whether every folder and item has the ``ancestorIds`` field, so that
+        subtrees can be found with :py:meth:`_subtreeQuery`. Databases created
+        before the field existed are backfilled by the system consistency
+        check (PUT /system/check); until then, subtree operations walk the
+        hierarchy one folder at a time.
+
+        New folders and items always get the field, so once this is true it is
+        remembered for the life of the process rather than queried again; see
+        :py:meth:`resetAncestorIdsCache`.
+        """
+        from .item import Item
+
+        if not self._hasAncestorIds:
+            missing = {'ancestorIds': {'$exists': False}}
+            self._hasAncestorIds = (self.findOne(missing, fields=['_id']) is None and
+                                    Item().findOne(missing, fields=['_id']) is None)
+        return self._hasAncestorIds
+
+    def resetAncestorIdsCache(self):
+        """
+        Forget that every folder and item has the ``ancestorIds`` field, so
+        that :py:meth:`hasAncestorIds` checks the database again. Call this if
+        documents without the field may have been added outside of Girder,
+        e.g. by restoring an old backup.
+        """
+        self._hasAncestorIds = False
 
-        for child in self.find(q):
-            size += self.getSizeRecursive(child)
+    def getSizeRecursive(self, folder):
+        """
+        Calculate the total size of the folder and all of its descendant
+        folders.
+        """
+        if not self.hasAncestorIds():
+            size = folder['size']
+            for child in self.find({
+                'parentId': folder['_id'],
+                'parentCollection': 'folder'
+            }, fields=['size']):
+                size += self.getSizeRecursive(child)
+            return size
 
-        return size
+        result = list(self.collection.aggregate([
+            {'$match': {'$or': [{'_id': folder['_id']}, self._subtreeQuery(folder['_id'])]}},
+            {'$group': {'_id': None, 'size': {'$sum': '$size'}}}
+        ]))
+        return result[0]['size'] if result else folder['size']
 
     def setMetadata(self, folder, metadata, allowNull=False):
         """
@@ -244,7 +338,9 @@ class Folder(AccessControlledModel):
     def _updateDescendants(self, folderId, updateQuery):
         """
         This helper is used to update all items and folders underneath a
-        folder. This is expensive, so think carefully before using it.
+        folder. Each collection is updated with a single query against the
+        ``ancestorIds`` index, unless some documents lack that field, in
+        which case the subtree is walked one folder at a time.
 
         :param folderId: The _id of the folder at the root of the subtree.
         :param updateQuery: The mongo query to apply to all of the children of
@@ -253,20 +349,25 @@ class Folder(AccessControlledModel):
         """
         from .item import Item
 
-        self.update(query={
-            'parentId': folderId,
-            'parentCollection': 'folder'
-        }, update=updateQuery, multi=True)
-        Item().update(query={
-            'folderId': folderId,
-        }, update=updateQuery, multi=True)
+        if self.hasAncestorIds():
+            query = self._subtreeQuery(folderId)
+            self.update(query=query, update=updateQuery, multi=True)
+            Item().update(query=query, update=updateQuery, multi=True)
+            return
 
-        q = {
-            'parentId': folderId,
-            'parentCollection': 'folder'
-        }
-        for child in self.find(q):
-            self._updateDescendants(child['_id'], updateQuery)
+        folderIds = [folderId]
+        while folderIds:
+            self.update(query={
+                'parentId': {'$in': folderIds},
+                'parentCollection': 'folder'
+            }, update=updateQuery, multi=True)
+            Item().update(query={
+                'folderId': {'$in': folderIds}
+            }, update=updateQuery, multi=True)
+            folderIds = [child['_id'] for child in self.find({
+                'parentId': {'$in': folderIds},
+                'parentCollection': 'folder'
+            }, fields=['_id'])]
 
     def _isAncestor(self, ancestor, descendant):
         """
@@ -284,12 +385,7 @@ class Folder(AccessControlledModel):
         if descendant['parentCollection'] != 'folder':
             return False
 
-        descendant = self.load(descendant['parentId'], force=True)
-
-        if descendant is None:
-            return False
-
-        return self._isAncestor(ancestor, descendant)
+        return ancestor['_id'] in self._getAncestorIds(descendant)
 
     def move(self, folder, parent, parentType):
         """
@@ -308,8 +404,25 @@ class Folder(AccessControlledModel):
             raise ValidationException(
                 'You may not move a folder underneath itself.')
 
+        oldAncestorIds = self._getAncestorIds(folder)
+        newAncestorIds = self.getChildAncestorIds(parent, parentType)
         folder['parentId'] = parent['_id']
         folder['parentCollection'] = parentType
+        folder['ancestorIds'] = newAncestorIds
+
+        if oldAncestorIds != newAncestorIds and not self.hasAncestorIds():
+            # Descendants may lack the field, so recompute all of them.
+            self.updateAncestors(folder, newAncestorIds)
+        elif oldAncestorIds != newAncestorIds:
+            # Replace the prefix of the ancestor list of every descendant.
+            if oldAncestorIds:
+                self._updateDescendants(folder['_id'], {
+                    '$pullAll': {'ancestorIds': oldAncestorIds}
+                })
+            if newAncestorIds:
+                self._updateDescendants(folder['_id'], {
+                    '$push': {'ancestorIds': {'$each': newAncestorIds, '$position': 0}}
+                })
 
         if parentType == 'folder':
             rootType, rootId = parent['baseParentType'], parent['baseParentId']
@@ -319,9 +432,8 @@ class Folder(AccessControlledModel):
         if (folder['baseParentType'], folder['baseParentId']) !=\
            (rootType, rootId):
             def propagateSizeChange(folder, inc):
-                self.model(folder['baseParentType']).increment(query={
-                    '_id': folder['baseParentId']
-                }, field='size', amount=inc, multi=False)
+                incrementSize(
+                    self.model(folder['baseParentType']), folder['baseParentId'], inc)
 
             totalSize = self.getSizeRecursive(folder)
             propagateSizeChange(folder, -totalSize)
@@ -350,27 +462,28 @@ class Folder(AccessControlledModel):
         from .item import Item
 
         setResponseTimeLimit()
-        # Delete all child items
-        itemModel = Item()
-        items = itemModel.find({
-            'folderId': folder['_id']
-        })
-        for item in items:
-            setResponseTimeLimit()
-            itemModel.remove(item, progress=progress, **kwargs)
-            if progress:
-                progress.update(increment=1, message='Deleted item %s' % item['name'])
-        # subsequent operations take a long time, so free the cursor's resources
-        items.close()
-
-        # Delete all child folders
-        folders = self.find({
-            'parentId': folder['_id'],
-            'parentCollection': 'folder'
-        })
-        for subfolder in folders:
-            self.remove(subfolder, progress=progress, **kwargs)
-        folders.close()
+        with batchSizeChanges():
+            # Delete all child items
+            itemModel = Item()
+            items = itemModel.find({
+                'folderId': folder['_id']
+            })
+            for item in items:
+                setResponseTimeLimit()
+                itemModel.remove(item, progress=progress, **kwargs)
+                if progress:
+                    progress.update(increment=1, message='Deleted item %s' % item['name'])
+            # subsequent operations take a long time, so free the cursor's resources
+            items.close()
+
+            # Delete all child folders
+            folders = self.find({
+                'parentId': folder['_id'],
+                'parentCollection': 'folder'
+            })
+            for subfolder in folders:
+                self.remove(subfolder, progress=progress, **kwargs)
+            folders.close()
 
     def remove(self, folder, progress=None, **kwargs):
         """
@@ -507,7 +620,9 @@ class Folder(AccessControlledModel):
                     parent, user=creator, force=True)
                 parent['baseParentId'] = pathFromRoot[0]['object']['_id']
                 parent['baseParentType'] = pathFromRoot[0]['type']
+            ancestorIds = self.getChildAncestorIds(parent)
         else:
+            ancestorIds = []
             parent['baseParentId'] = parent['_id']
             parent['baseParentType'] = parentType
 
@@ -525,6 +640,7 @@ class Folder(AccessControlledModel):
             'baseParentId': parent['baseParentId'],
             'baseParentType': parent['baseParentType'],
             'parentId': ObjectId(parent['_id']),
+            'ancestorIds': ancestorIds,
             'creatorId': creatorId,
             'created': now,
             'updated': now,
@@ -569,6 +685,11 @@ class Folder(AccessControlledModel):
         :type folder: dict
         :returns: an ordered list of dictionaries from root to the current folder
         """
+        if not curPath and folder.get('ancestorIds'):
+            path = self._ancestorsToRoot(folder, user=user, force=force, level=level)
+            if path is not None:
+                return path
+
         curPath = curPath or []
         curParentId = folder['parentId']
         curParentType = folder['parentCollection']
@@ -595,6 +716,41 @@ class Folder(AccessControlledModel):
 
             return self.parentsToRoot(curParentObject, curPath, user=user, force=force)
 
+    def _ancestorsToRoot(self, folder, user=None, force=False, level=AccessType.READ):
+        """
+        Helper for parentsToRoot that loads all ancestor folders with a single
+        query using the ``ancestorIds`` field. If the stored ancestors are not
+        consistent with the parent references, this returns None so that the
+        caller can fall back to walking the parents one at a time.
+        """
+        docs = {doc['_id']: doc for doc in self.find({'_id': {'$in': folder['ancestorIds']}})}
+        chain = []
+        curParentId, curParentType = folder['parentId'], folder['parentCollection']
+        while curParentType == 'folder':
+            doc = docs.get(curParentId)
+            if doc is None:
+                return None
+            chain.insert(0, doc)
+            curParentId, curParentType = doc['parentId'], doc['parentCollection']
+        if len(chain) != len(docs):
+            return None
+
+        rootModel = self.model(curParentType)
+        root = rootModel.load(curParentId, user=user, level=level, force=force)
+        path = [{
+            'type': curParentType,
+            'object': root if force else rootModel.filter(root, user)
+        }]
+        for doc in chain:
+            if not force:
+                self.requireAccess(doc, user, level)
+                doc = self.filter(doc, user)
+            path.append({
+                'type': 'folder',
+                'object': doc
+            })
+        return path
+
     def countItems(self, folder):
         """
         Returns the number of items within the given folder.
@@ -636,6 +792,38 @@ class Folder(AccessControlledModel):
         :param level: If filtering by permission, the required permission level.
         :type level: AccessLevel
         """
+        from .item import Item
+
+        if not self.hasAncestorIds():
+            return self._subtreeCountByWalk(folder, includeItems, user, level)
+
+        query = self._subtreeQuery(folder['_id'])
+        if level is None or (user and user['admin']):
+            count = 1 + self.find(query, fields=()).count()
+            if includeItems:
+                count += Item().find(query, fields=()).count()
+            return count
+
+        # A folder is only counted if it and every folder between it and the
+        # root of the subtree are accessible, so filter the whole subtree in
+        # one pass rather than descending level by level.
+        subfolders = self.find(query, fields=('ancestorIds', 'parentId', 'access', 'public'))
+        visible = {folder['_id']}
+        for subfolder in sorted(subfolders, key=lambda doc: len(doc['ancestorIds'])):
+            if (subfolder['parentId'] in visible and
+                    self.hasAccess(subfolder, user=user, level=level)):
+                visible.add(subfolder['_id'])
+
+        count = len(visible)
+        if includeItems:
+            count += Item().find({'folderId': {'$in': list(visible)}}, fields=()).count()
+        return count
+
+    def _subtreeCountByWalk(self, folder, includeItems=True, user=None, level=None):
+        """
+        Helper for subtreeCount that descends one folder at a time, for
+        databases in which some documents lack the ``ancestorIds`` field.
+        """
         count = 1
 
         if includeItems:
@@ -646,8 +834,8 @@ class Folder(AccessControlledModel):
             'parentCollection': 'folder'
         }, fields='access', user=user, level=level)
 
-        count += sum(self.subtreeCount(subfolder, includeItems=includeItems,
-                                       user=user, level=level)
+        count += sum(self._subtreeCountByWalk(subfolder, includeItems=includeItems,
+                                              user=user, level=level)
                      for subfolder in folders)
 
         return count
@@ -687,27 +875,186 @@ class Folder(AccessControlledModel):
         """
         from .item import Item
 
-        itemModel = Item()
         if subpath:
             path = os.path.join(path, doc['name'])
-        metadataFile = 'girder-folder-metadata.json'
-        for sub in self.childFolders(parentType='folder', parent=doc, user=user):
-            if sub['name'] == metadataFile:
-                metadataFile = None
-            for (filepath, file) in self.fileList(
-                    sub, user, path, includeMetadata, subpath=True,
-                    mimeFilter=mimeFilter, data=data):
-                yield (filepath, file)
-        for item in self.childItems(folder=doc):
-            if item['name'] == metadataFile:
-                metadataFile = None
-            for (filepath, file) in itemModel.fileList(
-                    item, user, path, includeMetadata, mimeFilter=mimeFilter, data=data):
-                yield (filepath, file)
-        if includeMetadata and metadataFile and doc.get('meta', {}):
-            def stream():
-                yield json.dumps(doc['meta'], default=str)
-            yield (os.path.join(path, metadataFile), stream)
+
+        # List the readable folders of the subtree up front, then walk them in
+        # the same order as a recursive listing would. The items of folders
+        # are looked up and streamed in batches of a bounded number of items,
+        # so that small folders share queries and large ones are not loaded
+        # into memory at once.
+        children = self._readableSubtree(doc, user)
+
+        itemModel = Item()
+        for folders in self._batches(self._fileListOrder(doc, path, children)):
+            counts = self._itemCounts([folder['_id'] for folder, _ in folders])
+            for group in self._groupByItemCount(folders, counts):
+                folderIds = [folder['_id'] for folder, _ in group]
+                if len(group) == 1:
+                    items = {folderIds[0]: self._itemsWithFiles(folderIds)}
+                else:
+                    items = {}
+                    for item, files in self._itemsWithFiles(folderIds):
+                        items.setdefault(item['folderId'], []).append((item, files))
+
+                for folder, folderPath in group:
+                    metadataFile = 'girder-folder-metadata.json'
+                    if any(sub['name'] == metadataFile for sub in children[folder['_id']]):
+                        metadataFile = None
+                    for item, files in items.get(folder['_id'], ()):
+                        if item['name'] == metadataFile:
+                            metadataFile = None
+                        for (filepath, file) in itemModel.fileList(
+                                item, user, folderPath, includeMetadata, mimeFilter=mimeFilter,
+                                data=data, files=files):
+                            yield (filepath, file)
+                    if includeMetadata and metadataFile and folder.get('meta', {}):
+                        yield (os.path.join(folderPath, metadataFile),
+                               self._metadataStream(folder['meta']))
+
+    def _readableSubtree(self, doc, user):
+        """
+        Find the folders of a subtree that a user can read, which are those
+        whose ancestors up to the root of the subtree are all readable too.
+        The whole subtree is found with one query if every folder has its
+        ``ancestorIds``, and otherwise with one query per level.
+
+        :param doc: The root folder of the subtree.
+        :param user: The user used for access.
+        :returns: A dictionary of the readable child folders of each readable
+            folder id, in order of their ids.
+        """
+        fields = ('name', 'meta', 'parentId', 'access', 'public')
+        children = {doc['_id']: []}
+
+        def add(subfolders):
+            added = []
+            for subfolder in subfolders:
+                if (subfolder['parentId'] in children and
+                        self.hasAccess(subfolder, user=user, level=AccessType.READ)):
+                    children[subfolder['parentId']].append(subfolder)
+                    children[subfolder['_id']] = []
+                    added.append(subfolder['_id'])
+            return added
+
+        if self.hasAncestorIds():
+            subfolders = self.find(self._subtreeQuery(doc['_id']),
+                                   fields=fields + ('ancestorIds', ), sort=[('_id', 1)])
+            add(sorted(subfolders, key=lambda sub: len(sub['ancestorIds'])))
+            return children
+
+        parentIds = [doc['_id']]
+        while parentIds:
+            parentIds = add(self.find({
+                'parentId': {'$in': parentIds},
+                'parentCollection': 'folder'
+            }, fields=fields, sort=[('_id', 1)]))
+        return children
+
+    def _itemCounts(self, folderIds):
+        """
+        Count the items of many folders with a single query.
+
+        :returns: A dictionary of the number of items of each folder id that
+            has any.
+        """
+        from .item import Item
+
+        return {result['_id']: result['count'] for result in Item().collection.aggregate([
+            {'$match': {'folderId': {'$in': folderIds}}},
+            {'$group': {'_id': '$folderId', 'count': {'$sum': 1}}}
+        ])}
+
+    def _groupByItemCount(self, folders, counts):
+        """
+        Split a list of folders into runs whose items are looked up together.
+        A run has at most ``FILE_LIST_BATCH_SIZE`` items in total, unless it
+        is a single folder with more items than that.
+
+        :param folders: A list of (folder, path) tuples.
+        :param counts: A dictionary of the number of items of each folder id.
+        :returns: Iterable of lists of (folder, path) tuples.
+        """
+        group, total = [], 0
+        for folder, folderPath in folders:
+            count = counts.get(folder['_id'], 0)
+            if group and total + count > FILE_LIST_BATCH_SIZE:
+                yield group
+                group, total = [], 0
+            group.append((folder, folderPath))
+            total += count
+        if group:
+            yield group
+
+    def _itemsWithFiles(self, folderIds):
+        """
+        Generate the items of some folders along with their files, reading
+        them ``FILE_LIST_BATCH_SIZE`` items at a time.
+
+        :param folderIds: The ids of the folders.
+        :returns: Iterable of (item, list of files) tuples.
+        """
+        from .file import File
+        from .item import Item
+
+        fileModel = File()
+        for items in self._batches(Item().find({'folderId': {'$in': folderIds}})):
+            files = self._groupBy(fileModel.find(
+                {'itemId': {'$in': [item['_id'] for item in items]}}, sort=[('_id', 1)]), 'itemId')
+            for item in items:
+                yield item, files.get(item['_id'], [])
+
+    def _fileListOrder(self, doc, path, children):
+        """
+        Generate the folders of a subtree in the order their own files are
+        listed by fileList, which is after the files of all of their
+        subfolders.
+
+        :param doc: The root folder of the subtree.
+        :param path: The path of the root folder.
+        :param children: A dictionary of the child folders of each folder id.
+        :returns: Iterable of (folder, path) tuples.
+        """
+        stack = [(doc, path, False)]
+        while stack:
+            folder, folderPath, expanded = stack.pop()
+            if expanded:
+                yield (folder, folderPath)
+                continue
+            stack.append((folder, folderPath, True))
+            for sub in reversed(children[folder['_id']]):
+                stack.append((sub, os.path.join(folderPath, sub['name']), False))
+
+    def _batches(self, values, size=None):
+        """
+        Split an iterable into lists of at most the given size, which
+        defaults to ``FILE_LIST_BATCH_SIZE``.
+        """
+        size = size or FILE_LIST_BATCH_SIZE
+        batch = []
+        for value in values:
+            batch.append(value)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _groupBy(self, docs, key):
+        """
+        Group documents by the value of a field, preserving their order.
+
+        :returns: A dictionary of lists of documents.
+        """
+        groups = {}
+        for doc in docs:
+            groups.setdefault(doc[key], []).append(doc)
+        return groups
+
+    def _metadataStream(self, meta):
+        def stream():
+            yield json.dumps(meta, default=str)
+        return stream
 
     def copyFolder(self, srcFolder, parent=None, name=None, description=None,
                    parentType=None, public=None, creator=None, progress=None,
@@ -764,8 +1111,9 @@ class Folder(AccessControlledModel):
             allowRename=True)
         if firstFolder is None:
             firstFolder = newFolder
-        return self.copyFolderComponents(
-            srcFolder, newFolder, creator, progress, firstFolder)
+        with batchSizeChanges():
+            return self.copyFolderComponents(
+                srcFolder, newFolder, creator, progress, firstFolder)
 
     def copyFolderComponents(self, srcFolder, newFolder, creator, progress,
                              firstFolder=None):
@@ -913,3 +1261,48 @@ class Folder(AccessControlledModel):
             self.update({'_id': doc['_id']}, update={'$set': {'size': size}})
             fixes += 1
         return size, fixes
+
+    def updateAncestors(self, doc, ancestorIds=None):
+        """
+        Recursively recomputes the ``ancestorIds`` field of this folder and
+        everything underneath it, fixing the stored values as needed.  This is
+        used to backfill databases created before the field existed.
+
+        :param doc: The folder.
+        :type doc: dict
+        :param ancestorIds: The correct ancestor list for this folder.  If None,
+            this is computed by walking up the parent references.
+        :type ancestorIds: list or None
+        :returns: the number of folders and items that were fixed.
+        """
+        from .item import Item
+
+        if ancestorIds is None:
+            ancestorIds = []
+            if doc['parentCollection'] == 'folder':
+                parent = doc
+                while parent is not None and parent['parentCollection'] == 'folder':
+                    parent = self.findOne({'_id': parent['parentId']},
+                                          fields=['parentId', 'parentCollection'])
+                    if parent is not None:
+                        ancestorIds.insert(0, parent['_id'])
+
+        fixes = 0
+        if doc.get('ancestorIds') != ancestorIds:
+            self.update({'_id': doc['_id']}, update={'$set': {'ancestorIds': ancestorIds}})
+            fixes += 1
+
+        childAncestorIds = ancestorIds + [doc['_id']]
+        result = Item().update({
+            'folderId': doc['_id'],
+            'ancestorIds': {'$ne': childAncestorIds}
+        }, update={'$set': {'ancestorIds': childAncestorIds}})
+        fixes += result.modified_count
+
+        children = self.find({
+            'parentId': doc['_id'],
+            'parentCollection': 'folder'
+        }, fields=['ancestorIds'])
+        for child in children:
+            fixes += self.updateAncestors(child, childAncestorIds)
+        return fixes
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import datetime
+import hashlib
+import json
+
+from .model_base import Model
+
+
+class ImportCheckpoint(Model):
+    """
+    This model records which directories of a filesystem import have been
+    completely imported, so that an import that fails part way through can
+    resume where it left off when it is run again. Each document holds the key
+    of the import it belongs to and the path of one completed directory. The
+    records of an import are removed once it succeeds, and stale records
+    expire after a while.
+    """
+    # How long the checkpoints of an import that is never retried are kept.
+    EXPIRATION = datetime.timedelta(days=30)
+
+    def initialize(self):
+        self.name = 'import_checkpoint'
+        self.ensureIndices([
+            ([('key', 1), ('path', 1)], {}),
+            ('created', {'expireAfterSeconds': int(self.EXPIRATION.total_seconds())})
+        ])
+
+    def validate(self, doc):
+        return doc
+
+    def importKey(self, assetstore, parent, parentType, params, leafFoldersAsItems):
+        """
+        Compute the key that identifies an import. Running the same import
+        again yields the same key, so it can find the checkpoints of the
+        earlier attempt.
+
+        :param assetstore: The assetstore being imported into.
+        :type assetstore: dict
+        :param parent: The destination of the import.
+        :type parent: dict
+        :param parentType: The type of the destination.
+        :type parentType: str
+        :param params: The import parameters, including ``importPath``.
+        :type params: dict
+        :param leafFoldersAsItems: Whether leaf folders are imported as items.
+        :type leafFoldersAsItems: bool
+        :returns: The key as a string.
+        """
+        key = json.dumps([
+            str(assetstore['_id']), parentType, str(parent['_id']), bool(leafFoldersAsItems),
+            {k: v for k, v in params.items() if k != 'importPath'}, params['importPath']
+        ], sort_keys=True, default=str)
+        return hashlib.sha256(key.encode('utf8')).hexdigest()
+
+    def completedPaths(self, key):
+        """
+        Get the directories that have been completely imported.
+
+        :param key: The key of the import.
+        :type key: str
+        :returns: A set of paths.
+        """
+        return {doc['path'] for doc in self.find({'key': key}, fields=['path'])}
+
+    def record(self, key, paths):
+        """
+        Record that directories have been completely imported.
+
+        :param key: The key of the import.
+        :type key: str
+        :param paths: The paths of the directories.
+        :type paths: list of str
+        """
+        if not paths:
+            return
+        now = datetime.datetime.utcnow()
+        self.collection.insert_many([{'key': key, 'path': path, 'created': now} for path in paths])
+
+    def clear(self, key):
+        """
+        Remove the checkpoints of an import.
+
+        :param key: The key of the import.
+        :type key: str
+        """
+        self.collection.delete_many({'key': key})
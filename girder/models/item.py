@@ -30,6 +30,7 @@ from girder import logger
 from girder.constants import AccessType
 from girder.exceptions import ValidationException, GirderException
 from girder.utility import acl_mixin
+from girder.utility.size_propagation import incrementSize
 
 
 class Item(acl_mixin.AccessControlMixin, Model):
@@ -40,7 +41,7 @@ class Item(acl_mixin.AccessControlMixin, Model):
 
     def initialize(self):
         self.name = 'item'
-        self.ensureIndices(('folderId', 'name', 'lowerName',
+        self.ensureIndices(('folderId', 'name', 'lowerName', 'ancestorIds',
                             ([('folderId', 1), ('name', 1)], {})))
         self.ensureTextIndex({
             'name': 10,
@@ -124,7 +125,7 @@ class Item(acl_mixin.AccessControlMixin, Model):
         """
         # Ensure we include extra fields to do the migration below
         extraFields = {'baseParentId', 'baseParentType', 'parentId', 'parentCollection',
-                       'name', 'lowerName'}
+                       'name', 'lowerName', 'folderId', 'ancestorIds'}
         loadFields = self._supplementFields(fields, extraFields)
 
         doc = super(Item, self).load(
@@ -146,6 +147,14 @@ class Item(acl_mixin.AccessControlMixin, Model):
                 self.update({'_id': doc['_id']}, {'$set': {
                     'lowerName': doc['lowerName']
                 }})
+            if 'ancestorIds' not in doc:
+                from .folder import Folder
+
+                folder = Folder().load(doc['folderId'], force=True, fields=['ancestorIds'])
+                doc['ancestorIds'] = Folder().getChildAncestorIds(folder) if folder else []
+                self.update({'_id': doc['_id']}, {'$set': {
+                    'ancestorIds': doc['ancestorIds']
+                }})
 
             self._removeSupplementalFields(doc, fields)
 
@@ -160,9 +169,12 @@ class Item(acl_mixin.AccessControlMixin, Model):
         :param folder: The folder to move the item into.
         :type folder: dict.
         """
+        from .folder import Folder
+
         self.propagateSizeChange(item, -item['size'])
 
         item['folderId'] = folder['_id']
+        item['ancestorIds'] = Folder().getChildAncestorIds(folder)
         item['baseParentType'] = folder['baseParentType']
         item['baseParentId'] = folder['baseParentId']
 
@@ -173,13 +185,8 @@ class Item(acl_mixin.AccessControlMixin, Model):
     def propagateSizeChange(self, item, inc):
         from .folder import Folder
 
-        Folder().increment(query={
-            '_id': item['folderId']
-        }, field='size', amount=inc, multi=False)
-
-        self.model(item['baseParentType']).increment(query={
-            '_id': item['baseParentId']
-        }, field='size', amount=inc, multi=False)
+        incrementSize(Folder(), item['folderId'], inc)
+        incrementSize(self.model(item['baseParentType']), item['baseParentId'], inc)
 
     def recalculateSize(self, item):
         """
@@ -270,6 +277,8 @@ class Item(acl_mixin.AccessControlMixin, Model):
         :type reuseExisting: bool
         :returns: The item document that was created.
         """
+        from .folder import Folder
+
         if reuseExisting:
             existing = self.findOne({
                 'folderId': folder['_id'],
@@ -295,6 +304,7 @@ class Item(acl_mixin.AccessControlMixin, Model):
             'name': self._validateString(name),
             'description': self._validateString(description),
             'folderId': ObjectId(folder['_id']),
+            'ancestorIds': Folder().getChildAncestorIds(folder),
             'creatorId': creator['_id'],
             'baseParentType': folder['baseParentType'],
             'baseParentId': folder['baseParentId'],
@@ -454,7 +464,7 @@ class Item(acl_mixin.AccessControlMixin, Model):
         return newItem
 
     def fileList(self, doc, user=None, path='', includeMetadata=False,
-                 subpath=True, mimeFilter=None, data=True):
+                 subpath=True, mimeFilter=None, data=True, files=None):
         """
         This function generates a list of 2-tuples whose first element is the
         relative path to the file from the item's root and whose second
@@ -485,6 +495,9 @@ class Item(acl_mixin.AccessControlMixin, Model):
         :param data: If True return raw content of each file as stored in the
             assetstore, otherwise return file document.
         :type data: bool
+        :param files: The file documents of this item, if they have already
+            been looked up. If None, they are queried.
+        :type files: list
         :returns: Iterable over files in this item, where each element is a
                   tuple of (path name of the file, stream function with file
                   data or file object).
@@ -493,14 +506,14 @@ class Item(acl_mixin.AccessControlMixin, Model):
         from .file import File
 
         if subpath:
-            files = list(self.childFiles(item=doc, limit=2))
-            if (len(files) != 1 or files[0]['name'] != doc['name'] or
+            first = files[:2] if files is not None else list(self.childFiles(item=doc, limit=2))
+            if (len(first) != 1 or first[0]['name'] != doc['name'] or
                     (includeMetadata and doc.get('meta', {}))):
                 path = os.path.join(path, doc['name'])
         metadataFile = 'girder-item-metadata.json'
 
         fileModel = File()
-        for file in self.childFiles(item=doc):
+        for file in files if files is not None else self.childFiles(item=doc):
             if not self._mimeFilter(file, mimeFilter):
                 continue
             if file['name'] == metadataFile:
@@ -26,12 +26,13 @@ import six
 
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
-from pymongo.errors import WriteError
+from pymongo.errors import BulkWriteError, WriteError
 from girder import events, logprint, logger, auditLogger
 from girder.constants import AccessType, CoreEventHandler, ACCESS_FLAGS, TEXT_SCORE_SORT_MAX
 from girder.external.mongodb_proxy import MongoProxy
 from girder.models import getDbConnection
 from girder.utility.model_importer import ModelImporter
+from girder.utility._cache import accessCache, pathCache
 from girder.exceptions import AccessException, ValidationException
 # Import the GirderException since it was historically defined here
 from girder.exceptions import GirderException  # noqa
@@ -531,6 +532,62 @@ class Model(ModelImporter):
 
         return document
 
+    def insertMany(self, documents, validate=True, triggerEvents=True):
+        """
+        Create several new documents in the collection with a single database
+        write. This validates the documents and triggers the same events for
+        each of them as :py:meth:`save` does when creating a document.
+
+        :param documents: The new documents, none of which may have an _id.
+        :type documents: list of dict
+        :param validate: Whether to call the model's validate() before saving.
+        :type validate: bool
+        :param triggerEvents: Whether to trigger events for validate and
+            pre- and post-save hooks.
+        :returns: The list of documents that were created. Documents whose
+            save was prevented by an event handler are omitted.
+        """
+        created = []
+        for document in documents:
+            if '_id' in document:
+                raise GirderException('insertMany may only be used to create documents.')
+            docValidate = validate
+            if docValidate and triggerEvents:
+                event = events.trigger('.'.join(('model', self.name, 'validate')),
+                                       document)
+                if event.defaultPrevented:
+                    docValidate = False
+
+            if docValidate:
+                document = self.validate(document)
+
+            if triggerEvents:
+                event = events.trigger('model.%s.save' % self.name, document)
+                if event.defaultPrevented:
+                    continue
+            created.append(document)
+
+        if not created:
+            return created
+        try:
+            ids = self.collection.insert_many(created).inserted_ids
+        except BulkWriteError as e:
+            raise ValidationException('Database save failed: %s' % e.details)
+
+        for document, id in zip(created, ids):
+            document['_id'] = id
+            if triggerEvents:
+                auditLogger.info('document.create', extra={
+                    'details': {
+                        'collection': self.name,
+                        'id': document['_id']
+                    }
+                })
+                events.trigger('model.%s.save.created' % self.name, document)
+                events.trigger('model.%s.save.after' % self.name, document)
+
+        return created
+
     def update(self, query, update, multi=True):
         """
         This method should be used for updating multiple documents in the
@@ -772,6 +829,19 @@ class Model(ModelImporter):
                     del doc[k]
 
 
+def _bindCacheInvalidation(model):
+    """
+    Drop cached access decisions and resolved paths involving a document of
+    the given model whenever such a document is saved or removed.
+    """
+    accessHandler = '.'.join((CoreEventHandler.ACCESS_CACHE_INVALIDATE, model.__class__.__name__))
+    pathHandler = '.'.join((CoreEventHandler.PATH_CACHE_INVALIDATE, model.__class__.__name__))
+    for eventName in ('save.after', 'remove'):
+        eventName = '.'.join(('model', model.name, eventName))
+        events.bind(eventName, accessHandler, accessCache.invalidateEvent)
+        events.bind(eventName, pathHandler, pathCache.invalidateEvent)
+
+
 class AccessControlledModel(Model):
     """
     Any model that has access control requirements should inherit from
@@ -791,6 +861,7 @@ class AccessControlledModel(Model):
                     '.'.join((CoreEventHandler.ACCESS_CONTROL_CLEANUP, self.__class__.__name__)),
                     self._cleanupDeletedEntity)
         super(AccessControlledModel, self).__init__()
+        _bindCacheInvalidation(self)
 
     def _cleanupDeletedEntity(self, event):
         """
@@ -831,6 +902,7 @@ class AccessControlledModel(Model):
             }
         }
         self.update(acQuery, acUpdate)
+        accessCache.invalidate()
 
     def filter(self, doc, user, additionalKeys=None):
         """
@@ -208,6 +208,7 @@ class Upload(Model):
             file['created'] = datetime.datetime.utcnow()
             file['assetstoreId'] = assetstore['_id']
             file['size'] = upload['size']
+            file.pop('crc32', None)
             # If the file was previously imported, it is no longer.
             if file.get('imported'):
                 file['imported'] = False
@@ -322,6 +323,7 @@ class Upload(Model):
         }
         if reference is not None:
             upload['reference'] = reference
+        events.trigger('model.upload.init', upload)
         upload = adapter.initUpload(upload)
         return self.save(upload)
 
@@ -395,6 +397,7 @@ class Upload(Model):
         else:
             upload['userId'] = None
 
+        events.trigger('model.upload.init', upload)
         upload = adapter.initUpload(upload)
         if save:
             upload = self.save(upload)
@@ -28,9 +28,19 @@ import re
 import string
 import six
 
+from bson.objectid import ObjectId
+
 import girder
 import girder.events
 
+try:
+    import orjson
+    # Older releases lack the options needed to match the standard encoder
+    if not hasattr(orjson, 'OPT_PASSTHROUGH_DATETIME'):
+        orjson = None
+except ImportError:
+    orjson = None
+
 try:
     from random import SystemRandom
     random = SystemRandom()
@@ -128,6 +138,35 @@ def toBool(val):
     return val.lower().strip() in ('true', 'on', '1', 'yes')
 
 
+def _encodeDatetime(obj):
+    return obj.replace(tzinfo=pytz.UTC).isoformat()
+
+
+# Encoders for the types that appear in almost every response, looked up by
+# exact type before falling back to isinstance checks.
+_jsonTypeEncoders = {
+    ObjectId: str,
+    datetime.datetime: _encodeDatetime,
+    set: tuple
+}
+
+
+def _jsonDefault(obj):
+    if girder.events.hasListeners('rest.json_encode'):
+        event = girder.events.trigger('rest.json_encode', obj)
+        if len(event.responses):
+            return event.responses[-1]
+
+    encoder = _jsonTypeEncoders.get(type(obj))
+    if encoder is not None:
+        return encoder(obj)
+    if isinstance(obj, set):
+        return tuple(obj)
+    elif isinstance(obj, datetime.datetime):
+        return _encodeDatetime(obj)
+    return str(obj)
+
+
 class JsonEncoder(json.JSONEncoder):
     """
     This extends the standard json.JSONEncoder to allow for more types to be
@@ -135,15 +174,44 @@ class JsonEncoder(json.JSONEncoder):
     route return values when JSON is requested.
     """
     def default(self, obj):
-        event = girder.events.trigger('rest.json_encode', obj)
-        if len(event.responses):
-            return event.responses[-1]
+        return _jsonDefault(obj)
+
 
-        if isinstance(obj, set):
-            return tuple(obj)
-        elif isinstance(obj, datetime.datetime):
-            return obj.replace(tzinfo=pytz.UTC).isoformat()
-        return str(obj)
+def dumpJson(obj, sortKeys=True, indent=None):
+    """
+    Serialize a value to JSON the way Girder's REST layer does, encoding types
+    such as ObjectId and datetime with :py:class:`JsonEncoder`.
+
+    If the ``json_encoder`` option in the ``[server]`` section of the
+    configuration is "orjson" and the optional ``orjson`` package is
+    installed, it is used to produce compact output; values that it cannot
+    encode, such as integers larger than 64 bits, fall back to the standard
+    library encoder. Unlike the standard library encoder, ``orjson`` encodes
+    non-finite floats as null rather than raising an error.
+
+    :param obj: The value to serialize.
+    :param sortKeys: Whether to sort the keys of objects.
+    :type sortKeys: bool
+    :param indent: If set, pretty-print with this many spaces of indentation.
+    :type indent: int or None
+    :returns: The UTF-8 encoded JSON.
+    :rtype: bytes
+    """
+    from . import config
+
+    if (orjson is not None and indent is None and
+            config.getConfig()['server'].get('json_encoder') == 'orjson'):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if sortKeys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=_jsonDefault, option=option)
+        except TypeError:
+            pass
+    separators = (',', ': ') if indent is not None else None
+    return json.dumps(
+        obj, sort_keys=sortKeys, allow_nan=False, indent=indent, separators=separators,
+        cls=JsonEncoder).encode('utf8')
 
 
 class RequestBodyStream(object):
@@ -1,4 +1,8 @@
+import collections
 import cherrypy
+import six
+import threading
+
 from dogpile.cache import make_region, register_backend
 from dogpile.cache.backends.memory import MemoryBackend
 
@@ -34,3 +38,480 @@ requestCache = make_region(name='girder.request').configure(backend='dogpile.cac
 # It holds data for rate limiting, which is ephemeral, but must be persisted (i.e. it's not optional
 # or best-effort).
 rateLimitBuffer = make_region(name='girder.rate_limit')
+
+
+class _DecisionStore(object):
+    """
+    A bounded, least-recently-used mapping of access decisions which also
+    indexes its keys by resource id so that a single resource can be evicted
+    without scanning the whole store. A decision is indexed by the resource
+    in its key and by every resource it was resolved through.
+    """
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self._entries = collections.OrderedDict()
+        self._byResource = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        :returns: a tuple of the decision and the ids of the resources it
+            depends on, or None.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            # Re-insert to mark as most recently used
+            self._entries[key] = entry
+        return entry
+
+    def set(self, key, value, dependsOn=()):
+        if key in self._entries:
+            self._discardIndex(key, self._entries.pop(key)[1])
+        elif len(self._entries) >= self.maxSize:
+            oldKey, (_, oldDepends) = self._entries.popitem(last=False)
+            self._discardIndex(oldKey, oldDepends)
+        dependsOn = tuple(dependsOn)
+        self._entries[key] = (value, dependsOn)
+        for resourceId in (key[2], ) + dependsOn:
+            self._byResource.setdefault(resourceId, set()).add(key)
+
+    def discardResource(self, resourceId):
+        for key in self._byResource.pop(resourceId, ()):
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._discardIndex(key, entry[1])
+
+    def clear(self):
+        self._entries.clear()
+        self._byResource.clear()
+
+    def _discardIndex(self, key, dependsOn):
+        for resourceId in (key[2], ) + dependsOn:
+            keys = self._byResource.get(resourceId)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._byResource[resourceId]
+
+
+class AccessDecisionCache(object):
+    """
+    Caches the outcome of access checks performed on the parents of resources
+    that use :py:class:`girder.utility.acl_mixin.AccessControlMixin`.
+
+    Decisions are always shared for the life of a single CherryPy request. If
+    a non-zero ``maxSize`` is configured, they are also kept in a bounded LRU
+    store that is shared across requests. Entries for a resource are dropped
+    whenever that resource, or any resource whose access controls the
+    decision was resolved through, is saved or removed.
+    """
+    def __init__(self, maxSize=0, requestMaxSize=10000):
+        self._lock = threading.Lock()
+        self._shared = _DecisionStore(maxSize)
+        self.requestMaxSize = requestMaxSize
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxSize(self):
+        return self._shared.maxSize
+
+    def configure(self, maxSize):
+        """
+        Set the size of the cross-request store, discarding its contents.
+
+        :param maxSize: The maximum number of decisions kept across requests.
+            Zero disables the cross-request store.
+        :type maxSize: int
+        """
+        with self._lock:
+            self._shared = _DecisionStore(maxSize)
+
+    @staticmethod
+    def key(user, modelType, resourceId, level, flags=None):
+        """
+        Build the key for a decision. The user's group membership and admin
+        status are part of the key so that changes to either never reuse a
+        stale decision.
+
+        :param user: The user the check is performed for.
+        :type user: dict or None
+        :param modelType: The model type of the resource checked.
+        :type modelType: str or list
+        :param resourceId: The id of the resource checked.
+        :param level: The access level required.
+        :param flags: Any access flags required.
+        """
+        userKey = None
+        if user is not None:
+            userKey = (user['_id'], frozenset(user.get('groups', ())), bool(user.get('admin')))
+        if isinstance(modelType, list):
+            modelType = tuple(modelType)
+        if flags and isinstance(flags, six.string_types):
+            flags = (flags, )
+        return (userKey, modelType, resourceId, level, frozenset(flags or ()))
+
+    def _requestStore(self):
+        request = cherrypy.request
+        if getattr(request, 'app', None) is None:
+            # Not serving a request, so there is no request lifetime to use
+            return None
+        store = getattr(request, '_girderAccessCache', None)
+        if store is None:
+            store = _DecisionStore(self.requestMaxSize)
+            request._girderAccessCache = store
+        return store
+
+    def get(self, key):
+        """
+        Look up a decision.
+
+        :param key: A key as returned by :py:meth:`key`.
+        :returns: True or False if the decision is cached, otherwise None.
+        """
+        store = self._requestStore()
+        entry = store.get(key) if store is not None else None
+        if entry is None and self._shared.maxSize:
+            with self._lock:
+                entry = self._shared.get(key)
+            if entry is not None and store is not None:
+                store.set(key, *entry)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value, dependsOn=()):
+        """
+        Record a decision.
+
+        :param key: A key as returned by :py:meth:`key`.
+        :param value: Whether access was granted.
+        :type value: bool
+        :param dependsOn: The ids of any other resources whose access
+            controls the decision was resolved through, such as the folder of
+            an item. The decision is dropped when any of them changes.
+        """
+        value = bool(value)
+        store = self._requestStore()
+        if store is not None:
+            store.set(key, value, dependsOn)
+        if self._shared.maxSize:
+            with self._lock:
+                self._shared.set(key, value, dependsOn)
+
+    def invalidate(self, resourceId=None):
+        """
+        Drop cached decisions.
+
+        :param resourceId: The id of the resource whose decisions should be
+            dropped. If None, all decisions are dropped.
+        """
+        store = self._requestStore()
+        with self._lock:
+            for target in (self._shared, store):
+                if target is None:
+                    continue
+                if resourceId is None:
+                    target.clear()
+                else:
+                    target.discardResource(resourceId)
+
+    def invalidateEvent(self, event):
+        """
+        Event handler which drops decisions for the saved or removed document.
+        """
+        doc = event.info
+        if isinstance(doc, dict) and '_id' in doc:
+            self.invalidate(doc['_id'])
+
+    def stats(self):
+        """
+        Return the hit and miss counters and the size of the shared store.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._shared),
+            'maxSize': self._shared.maxSize
+        }
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0
+
+
+# Access decisions for resources which inherit their access control from a parent. The
+# cross-request store is disabled until configured from the [cache] section.
+accessCache = AccessDecisionCache()
+
+
+class PathCache(object):
+    """
+    Caches the resolution of resource paths, one path component at a time. An
+    entry maps the type and id of a parent resource and the name of a child to
+    the type and id of that child. Users and collections are the children of
+    a parent of their own type with an id of None.
+
+    Entries only record ids; callers load the documents and must check that
+    they still have the expected name and parent before relying on an entry.
+    Entries for a resource are also dropped when it is saved or removed, and
+    when a resource is saved under a name which may shadow an entry.
+    """
+    def __init__(self, maxSize=0):
+        self._lock = threading.Lock()
+        self.maxSize = maxSize
+        self._entries = collections.OrderedDict()
+        self._byChild = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def configure(self, maxSize):
+        """
+        Set the size of the cache, discarding its contents.
+
+        :param maxSize: The maximum number of entries. Zero disables the cache.
+        :type maxSize: int
+        """
+        with self._lock:
+            self.maxSize = maxSize
+            self._entries.clear()
+            self._byChild.clear()
+
+    def get(self, parentType, parentId, name):
+        """
+        Look up a child resource.
+
+        :returns: A (type, id) tuple, or None if the child is not cached.
+        """
+        if not self.maxSize:
+            return None
+        key = (parentType, parentId, name)
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                self._entries[key] = value
+                self.hits += 1
+            else:
+                self.misses += 1
+        return value
+
+    def set(self, parentType, parentId, name, childType, childId):
+        """
+        Record the resolution of a child resource.
+        """
+        if not self.maxSize:
+            return
+        key = (parentType, parentId, name)
+        with self._lock:
+            self._discard(key)
+            if len(self._entries) >= self.maxSize:
+                self._discard(next(iter(self._entries)))
+            self._entries[key] = (childType, childId)
+            self._byChild.setdefault(childId, set()).add(key)
+
+    def invalidate(self, resourceId=None, parentType=None, parentId=None, name=None):
+        """
+        Drop cached entries.
+
+        :param resourceId: Drop the entries that resolve to this resource.
+        :param parentType: With ``parentId`` and ``name``, drop the entry for
+            this child name.
+        :param parentId: See ``parentType``.
+        :param name: See ``parentType``.
+        If no arguments are given, all entries are dropped.
+        """
+        with self._lock:
+            if resourceId is None and name is None:
+                self._entries.clear()
+                self._byChild.clear()
+                return
+            if resourceId is not None:
+                for key in list(self._byChild.get(resourceId, ())):
+                    self._discard(key)
+            if name is not None:
+                self._discard((parentType, parentId, name))
+
+    def invalidateEvent(self, event):
+        """
+        Event handler which drops the entries that a saved or removed document
+        may have made stale.
+        """
+        doc = event.info
+        if not isinstance(doc, dict) or '_id' not in doc or not self.maxSize:
+            return
+        modelType = event.name.split('.')[1]
+        parentType, parentId, name = modelType, None, doc.get('name')
+        if modelType == 'user':
+            name = doc.get('login')
+        elif modelType == 'folder':
+            parentType, parentId = doc.get('parentCollection'), doc.get('parentId')
+        elif modelType == 'item':
+            parentType, parentId = 'folder', doc.get('folderId')
+        elif modelType == 'file':
+            parentType, parentId = 'item', doc.get('itemId')
+        self.invalidate(doc['_id'], parentType, parentId, name)
+
+    def stats(self):
+        """
+        Return the hit and miss counters and the size of the cache.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxSize': self.maxSize
+        }
+
+    def _discard(self, key):
+        value = self._entries.pop(key, None)
+        if value is not None:
+            keys = self._byChild.get(value[1])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._byChild[value[1]]
+
+
+# Resolved path components for girder.utility.path. Disabled until configured from the
+# [cache] section.
+pathCache = PathCache()
+
+
+class BlockCache(object):
+    """
+    Caches the contents of files in fixed-size, block-aligned pieces, so that
+    random access through :py:class:`girder.utility.abstract_assetstore_adapter.FileHandle`
+    does not fetch the same data from the assetstore again. Blocks are shared
+    by every handle of a file and evicted least-recently-used first once
+    their total size exceeds ``maxSize`` bytes.
+
+    Blocks are keyed by the id, creation time, and size of the file. Replacing
+    the contents of a file changes its creation time, so stale blocks are never
+    returned, even when the contents are replaced by another process.
+    """
+    def __init__(self, maxSize=0, blockSize=1024 * 1024, readAhead=4):
+        self._lock = threading.Lock()
+        self.maxSize = maxSize
+        self.blockSize = blockSize
+        self.readAhead = readAhead
+        self._blocks = collections.OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, maxSize, blockSize=1024 * 1024, readAhead=4):
+        """
+        Set the size of the cache, discarding its contents.
+
+        :param maxSize: The maximum number of bytes kept. Zero disables the
+            cache.
+        :type maxSize: int
+        :param blockSize: The size of each block in bytes.
+        :type blockSize: int
+        :param readAhead: The number of blocks after the one requested that are
+            fetched with it when a file is being read sequentially.
+        :type readAhead: int
+        """
+        with self._lock:
+            self.maxSize = maxSize
+            self.blockSize = max(blockSize, 1)
+            self.readAhead = max(readAhead, 0)
+            self._blocks.clear()
+            self._size = 0
+
+    @staticmethod
+    def key(file):
+        """
+        Build the key identifying the contents of a file.
+
+        :param file: The file document.
+        :type file: dict
+        """
+        return (file['_id'], file.get('created'), file.get('size'))
+
+    def get(self, fileKey, index):
+        """
+        Look up a block.
+
+        :param fileKey: A key as returned by :py:meth:`key`.
+        :param index: The index of the block in the file.
+        :type index: int
+        :returns: The bytes of the block, or None if it is not cached.
+        """
+        key = (fileKey, index)
+        with self._lock:
+            block = self._blocks.pop(key, None)
+            if block is not None:
+                self._blocks[key] = block
+                self.hits += 1
+            else:
+                self.misses += 1
+        return block
+
+    def contains(self, fileKey, index):
+        """
+        Check whether a block is cached without counting a hit or miss.
+        """
+        return (fileKey, index) in self._blocks
+
+    def set(self, fileKey, index, block):
+        """
+        Record a block, evicting the least recently used blocks as needed.
+
+        :param fileKey: A key as returned by :py:meth:`key`.
+        :param index: The index of the block in the file.
+        :type index: int
+        :param block: The contents of the block.
+        :type block: bytes
+        """
+        if not self.maxSize or len(block) > self.maxSize:
+            return
+        key = (fileKey, index)
+        with self._lock:
+            old = self._blocks.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            while self._blocks and self._size + len(block) > self.maxSize:
+                self._size -= len(self._blocks.popitem(last=False)[1])
+            self._blocks[key] = block
+            self._size += len(block)
+
+    def invalidate(self):
+        """
+        Drop all cached blocks.
+        """
+        with self._lock:
+            self._blocks.clear()
+            self._size = 0
+
+    def stats(self):
+        """
+        Return the hit and miss counters, the hit rate, and the number and
+        total size of the cached blocks.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': float(self.hits) / lookups if lookups else 0.0,
+            'blocks': len(self._blocks),
+            'size': self._size,
+            'maxSize': self.maxSize,
+            'blockSize': self.blockSize
+        }
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0
+
+
+# Blocks of file contents read through the file-like API of assetstore adapters. Disabled
+# until configured from the [cache] section.
+blockCache = BlockCache()
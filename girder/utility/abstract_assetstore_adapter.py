@@ -24,6 +24,7 @@ from girder.constants import SettingKey
 from girder.exceptions import GirderException, ValidationException, FilePathException
 from girder.models.setting import Setting
 from girder.utility import progress, RequestBodyStream
+from ._cache import blockCache
 from .model_importer import ModelImporter
 
 
@@ -39,6 +40,12 @@ class FileHandle(object):
     These file handles are stateful, and therefore not safe for concurrent
     access. If used by multiple threads, mutexes should be used.
 
+    When the block cache is configured, reads are served from block-aligned
+    pieces of the file that are shared by all handles of the file, and a
+    sequential reader fetches the following blocks along with the one it
+    needs.  Otherwise, the file is streamed from the assetstore, and the
+    stream is restarted whenever the position changes.
+
     :param file: The file object to which this file-like object corresponds.
     :type file: dict
     :param adapter: The assetstore adapter corresponding to this file.
@@ -48,6 +55,9 @@ class FileHandle(object):
         self._file = file
         self._adapter = adapter
         self._pos = None
+        self._stream = None
+        # The index of the last block that was read, used to detect sequential reads
+        self._lastBlock = None
         # If a read is requested that is longer than the specified size, raise
         # an exception.  This prevents unbounded memory use.
         self._maximumReadSize = 16 * 1024 * 1024
@@ -76,6 +86,11 @@ class FileHandle(object):
             size = self._file['size'] - self._pos
         if size > self._maximumReadSize:
             raise GirderException('Read exceeds maximum allowed size.')
+        if blockCache.maxSize and '_id' in self._file:
+            return self._readBlocks(size)
+        if self._stream is None:
+            self._stream = self._adapter.downloadFile(
+                self._file, offset=self._pos, headers=False)()
         data = six.BytesIO()
         length = 0
         for chunk in itertools.chain(self._prev, self._stream):
@@ -101,6 +116,57 @@ class FileHandle(object):
         self._pos += length
         return data.getvalue()
 
+    def _readBlocks(self, size):
+        """
+        Read *size* bytes from the current position using the block cache.
+        """
+        end = min(self._pos + size, self._file['size'])
+        blockSize = blockCache.blockSize
+        data = []
+        while self._pos < end:
+            index = self._pos // blockSize
+            block = self._getBlock(index)
+            start = self._pos - index * blockSize
+            piece = block[start:start + end - self._pos]
+            if not piece:
+                break
+            data.append(piece)
+            self._pos += len(piece)
+        return b''.join(data)
+
+    def _getBlock(self, index):
+        """
+        Get a block of the file from the block cache, fetching it from the
+        assetstore if needed.  When the previous read ended in the preceding
+        block, the next blocks that are not cached are fetched in the same
+        request.
+
+        :param index: The index of the block.
+        :type index: int
+        :returns: The bytes of the block.
+        """
+        fileKey = blockCache.key(self._file)
+        sequential = self._lastBlock is not None and index - self._lastBlock in (0, 1)
+        self._lastBlock = index
+        block = blockCache.get(fileKey, index)
+        if block is not None:
+            return block
+
+        blockSize = blockCache.blockSize
+        lastIndex = (self._file['size'] - 1) // blockSize
+        count = 1
+        if sequential:
+            while (count <= blockCache.readAhead and index + count <= lastIndex and
+                    not blockCache.contains(fileKey, index + count)):
+                count += 1
+        offset = index * blockSize
+        endByte = min(offset + count * blockSize, self._file['size'])
+        data = b''.join(self._adapter.downloadFile(
+            self._file, offset=offset, endByte=endByte, headers=False)())
+        for i in range(count):
+            blockCache.set(fileKey, index + i, data[i * blockSize:(i + 1) * blockSize])
+        return data[:blockSize]
+
     def tell(self):
         return self._pos
 
@@ -116,7 +182,8 @@ class FileHandle(object):
 
         if self._pos != oldPos:
             self._prev = []
-            self._stream = self._adapter.downloadFile(self._file, offset=self._pos, headers=False)()
+            # The stream is restarted at the new position when it is next read
+            self._stream = None
 
     def close(self):
         pass
@@ -177,6 +244,11 @@ class AbstractAssetstoreAdapter(ModelImporter):
         """
         Call this method to process each chunk of an upload.
 
+        Adapters that read the uploaded bytes should also update the hash
+        objects serialized in the optional ``hashStates`` field of the upload,
+        which handlers of the ``model.upload.init`` event may set, and store
+        their digests in the file document from ``finalizeUpload``.
+
         :param upload: The upload document to update.
         :type upload: dict
         :param chunk: The file object representing the chunk that was uploaded.
@@ -22,11 +22,35 @@ import collections
 import itertools
 import six
 
-from ..models.model_base import Model, AccessControlledModel, _permissionClauses
+from ..models.model_base import (
+    Model, AccessControlledModel, _bindCacheInvalidation, _permissionClauses)
+from ._cache import accessCache
 from ..exceptions import AccessException
 from ..constants import AccessType, TEXT_SCORE_SORT_MAX
 
 
+def _aclSources(model, doc):
+    """
+    List the ids of the resources whose access controls a decision about a
+    document was resolved through. A decision about an item, for instance,
+    really depends on the access controls of its folder.
+
+    :param model: The model of the document.
+    :param doc: The document the decision was made about.
+    :returns: a list of resource ids, nearest first.
+    """
+    sources = []
+    while isinstance(model, AccessControlMixin) and doc is not None:
+        parentId = doc.get(model.resourceParent)
+        if not parentId:
+            break
+        sources.append(parentId)
+        model = model.model(model.resourceColl)
+        if isinstance(model, AccessControlMixin):
+            doc = model.load(parentId, force=True)
+    return sources
+
+
 class AccessControlMixin(object):
     """
     This mixin is intended to be used for resources which aren't access
@@ -43,6 +67,27 @@ class AccessControlMixin(object):
     resourceColl = None
     resourceParent = None
 
+    def __init__(self):
+        super(AccessControlMixin, self).__init__()
+        # Documents of this model may be the parent of other mixin models
+        _bindCacheInvalidation(self)
+
+    def _resourceAccess(self, resourceId, user, level, flags=None):
+        """
+        Determine whether a user has access to a resourceColl document,
+        consulting and populating the access decision cache.
+        """
+        key = accessCache.key(user, self.resourceColl, resourceId, level, flags)
+        val = accessCache.get(key)
+        if val is None:
+            resourceModel = self.model(self.resourceColl)
+            resource = resourceModel.load(resourceId, force=True)
+            val = resourceModel.hasAccess(resource, user=user, level=level)
+            if flags:
+                val = val and resourceModel.hasAccessFlags(resource, user=user, flags=flags)
+            accessCache.set(key, val, dependsOn=_aclSources(resourceModel, resource))
+        return val
+
     def load(self, id, level=AccessType.ADMIN, user=None, objectId=True,
              force=False, fields=None, exc=False):
         """
@@ -70,11 +115,18 @@ class AccessControlMixin(object):
                 loadType = doc.get('attachedToType')
                 loadId = doc.get('attachedToId')
             if isinstance(loadType, six.string_types):
-                self.model(loadType).load(loadId, level=level, user=user, exc=exc)
+                loadModel = self.model(loadType)
             elif isinstance(loadType, list) and len(loadType) == 2:
-                self.model(*loadType).load(loadId, level=level, user=user, exc=exc)
+                loadModel = self.model(*loadType)
             else:
                 raise Exception('Invalid model type: %s' % str(loadType))
+            # Only granted decisions are taken from the cache; a denial falls
+            # through so that the parent load raises the usual exception.
+            key = accessCache.key(user, loadType, loadId, level)
+            if not accessCache.get(key):
+                parent = loadModel.load(loadId, level=level, user=user, exc=exc)
+                if parent is not None:
+                    accessCache.set(key, True, dependsOn=_aclSources(loadModel, parent))
 
             self._removeSupplementalFields(doc, fields)
 
@@ -88,10 +140,7 @@ class AccessControlMixin(object):
         Takes the same parameters as
         :py:func:`girder.models.model_base.AccessControlledModel.hasAccess`.
         """
-        resource = self.model(self.resourceColl) \
-                       .load(resource[self.resourceParent], force=True)
-        return self.model(self.resourceColl).hasAccess(
-            resource, user=user, level=level)
+        return self._resourceAccess(resource[self.resourceParent], user, level)
 
     def hasAccessFlags(self, doc, user=None, flags=None):
         """
@@ -144,28 +193,16 @@ class AccessControlMixin(object):
         Takes the same parameters as
         :py:func:`girder.models.model_base.AccessControlledModel.filterResultsByPermission`.
         """
-        # Cache mapping resourceIds -> access granted (bool)
+        # Cache mapping resourceIds -> access granted (bool); this also
+        # applies outside of a request, when accessCache may be inactive
         resourceAccessCache = {}
 
         def hasAccess(_result):
             resourceId = _result[self.resourceParent]
-
-            # return cached check if it exists
-            if resourceId in resourceAccessCache:
-                return resourceAccessCache[resourceId]
-
-            # if the resourceId is not cached, check for permission "level"
-            # and set the cache
-            resource = self.model(self.resourceColl).load(resourceId, force=True)
-            val = self.model(self.resourceColl).hasAccess(
-                resource, user=user, level=level)
-
-            if flags:
-                val = val and self.model(self.resourceColl).hasAccessFlags(
-                    resource, user=user, flags=flags)
-
-            resourceAccessCache[resourceId] = val
-            return val
+            if resourceId not in resourceAccessCache:
+                resourceAccessCache[resourceId] = self._resourceAccess(
+                    resourceId, user, level, flags)
+            return resourceAccessCache[resourceId]
 
         endIndex = offset + limit if limit else None
         filteredCursor = six.moves.filter(hasAccess, cursor)
@@ -17,6 +17,7 @@
 #  limitations under the License.
 ###############################################################################
 
+import cherrypy
 import filelock
 from hashlib import sha512
 import os
@@ -28,13 +29,12 @@ import stat
 import tempfile
 
 from girder import events, logger
-from girder.api.rest import setResponseHeader
+from girder.api.rest import setContentDisposition, setResponseHeader
 from girder.exceptions import ValidationException, GirderException
 from girder.models.file import File
-from girder.models.folder import Folder
 from girder.models.item import Item
 from girder.models.upload import Upload
-from girder.utility import mkdir, progress
+from girder.utility import config, mkdir, progress
 from . import hash_state
 from .abstract_assetstore_adapter import AbstractAssetstoreAdapter
 
@@ -164,8 +164,12 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
         if isinstance(chunk, six.binary_type):
             chunk = BytesIO(chunk)
 
-        # Restore the internal state of the streaming SHA-512 checksum
-        checksum = hash_state.restoreHex(upload['sha512state'], 'sha512')
+        # Restore the internal state of the streaming SHA-512 checksum, and of
+        # any other requested digests
+        digests = {
+            name: hash_state.restoreHex(state, name)
+            for name, state in six.viewitems(upload.get('hashStates', {}))}
+        digests['sha512'] = hash_state.restoreHex(upload['sha512state'], 'sha512')
 
         if self.requestOffset(upload) > upload['received']:
             # This probably means the server died midway through writing last
@@ -177,7 +181,8 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
                     data = tempFile.read(BUF_SIZE)
                     if not data:
                         break
-                    checksum.update(data)
+                    for digest in six.viewvalues(digests):
+                        digest.update(data)
 
         with open(upload['tempFile'], 'a+b') as tempFile:
             size = 0
@@ -187,7 +192,8 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
                     break
                 size += len(data)
                 tempFile.write(data)
-                checksum.update(data)
+                for digest in six.viewvalues(digests):
+                    digest.update(data)
         chunk.close()
 
         try:
@@ -197,8 +203,11 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
                 tempFile.truncate(upload['received'])
             raise
 
-        # Persist the internal state of the checksum
-        upload['sha512state'] = hash_state.serializeHex(checksum)
+        # Persist the internal state of the checksums
+        upload['sha512state'] = hash_state.serializeHex(digests.pop('sha512'))
+        if digests:
+            upload['hashStates'] = {
+                name: hash_state.serializeHex(digest) for name, digest in six.viewitems(digests)}
         upload['received'] += size
         return upload
 
@@ -248,6 +257,8 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
 
         file['sha512'] = hash
         file['path'] = path
+        for name, state in six.viewitems(upload.get('hashStates', {})):
+            file[name] = hash_state.restoreHex(state, name).hexdigest()
 
         return file
 
@@ -280,6 +291,15 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
 
         if headers:
             setResponseHeader('Accept-Ranges', 'bytes')
+            offload = self._getDownloadOffload(file, path, offset, endByte)
+            if offload:
+                # A fronting web server sends the file, and handles any Range
+                # header itself, so only describe the content here.
+                setResponseHeader(
+                    'Content-Type', file.get('mimeType') or 'application/octet-stream')
+                setContentDisposition(file['name'], contentDisposition or 'attachment')
+                setResponseHeader(*offload)
+                return lambda: iter(())
             self.setContentHeaders(file, offset, endByte, contentDisposition)
 
         def stream():
@@ -302,6 +322,37 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
 
         return stream
 
+    def _getDownloadOffload(self, file, path, offset, endByte):
+        """
+        Determine whether sending a file should be delegated to a fronting web
+        server, based on the ``file_download_offload`` server configuration.
+
+        :param file: The file being downloaded.
+        :param path: The absolute path of the file.
+        :param offset: The start byte of the download.
+        :param endByte: The end byte of the download (non-inclusive).
+        :returns: A (header, value) tuple to set on the response, or None if
+            the file should be streamed by Girder.
+        """
+        serverConfig = config.getConfig()['server']
+        mode = serverConfig.get('file_download_offload')
+        if mode not in ('X-Sendfile', 'X-Accel-Redirect'):
+            return None
+        # The web server only knows about ranges requested through the Range
+        # header, not through query parameters.
+        if ((offset or endByte < file['size']) and
+                'Range' not in cherrypy.request.headers):
+            return None
+        if mode == 'X-Sendfile':
+            return mode, path
+        if file.get('imported'):
+            # Imported files are not beneath the location mapped to the assetstore root
+            return None
+        prefix = serverConfig.get('file_download_offload_prefix', '/girder_assetstore')
+        return mode, '/'.join((
+            prefix.rstrip('/'), str(self.assetstore['_id']),
+            six.moves.urllib.parse.quote(file['path'].replace(os.sep, '/'))))
+
     def deleteFile(self, file):
         """
         Deletes the file from disk if it is the only File in this assetstore
@@ -361,26 +412,12 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
         file['path'] = os.path.abspath(os.path.expanduser(path))
         file['mtime'] = stat.st_mtime
         file['imported'] = True
+        file.pop('crc32', None)
         file = File().save(file)
         logger.debug('Imported file %s to item %s on filesystem assetstore %s',
                      path, item['_id'], self.assetstore['_id'])
         return file
 
-    def _importDataAsItem(self, name, user, folder, path, files, reuseExisting=True, params=None):
-        params = params or {}
-        item = Item().createItem(
-            name=name, creator=user, folder=folder, reuseExisting=reuseExisting)
-        events.trigger('filesystem_assetstore_imported',
-                       {'id': item['_id'], 'type': 'item',
-                        'importPath': path})
-        for fname in files:
-            fpath = os.path.join(path, fname)
-            if self.shouldImportFile(fpath, params):
-                self.importFile(item, fpath, user, name=fname)
-
-    def _hasOnlyFiles(self, path, files):
-        return all(os.path.isfile(os.path.join(path, name)) for name in files)
-
     def _importFileToFolder(self, name, user, parent, parentType, path):
         if parentType != 'folder':
             raise ValidationException(
@@ -395,6 +432,14 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
         self.importFile(item, path, user, name=name)
 
     def importData(self, parent, parentType, params, progress, user, leafFoldersAsItems):
+        """
+        Import a file or a directory tree from the local filesystem. Directory
+        trees are imported with a
+        :py:class:`girder.utility.filesystem_import.FilesystemImporter`, which
+        scans directories concurrently and can resume a failed import.
+        """
+        from .filesystem_import import FilesystemImporter
+
         importPath = params['importPath']
 
         if not os.path.exists(importPath):
@@ -405,44 +450,10 @@ class FilesystemAssetstoreAdapter(AbstractAssetstoreAdapter):
             self._importFileToFolder(name, user, parent, parentType, importPath)
             return
 
-        listDir = os.listdir(importPath)
-
-        if parentType != 'folder' and any(
-                os.path.isfile(os.path.join(importPath, val)) for val in listDir):
-            raise ValidationException(
-                'Files cannot be imported directly underneath a %s.' % parentType)
-
-        if leafFoldersAsItems and self._hasOnlyFiles(importPath, listDir):
-            self._importDataAsItem(
-                os.path.basename(importPath.rstrip(os.sep)), user, parent, importPath,
-                listDir, params=params)
-            return
-
-        for name in listDir:
-            progress.update(message=name)
-            path = os.path.join(importPath, name)
-
-            if os.path.isdir(path):
-                localListDir = os.listdir(path)
-                if leafFoldersAsItems and self._hasOnlyFiles(path, localListDir):
-                    self._importDataAsItem(name, user, parent, path, localListDir, params=params)
-                else:
-                    folder = Folder().createFolder(
-                        parent=parent, name=name, parentType=parentType,
-                        creator=user, reuseExisting=True)
-                    events.trigger(
-                        'filesystem_assetstore_imported', {
-                            'id': folder['_id'],
-                            'type': 'folder',
-                            'importPath': path
-                        })
-                    nextPath = os.path.join(importPath, name)
-                    self.importData(
-                        folder, 'folder', params=dict(params, importPath=nextPath),
-                        progress=progress, user=user, leafFoldersAsItems=leafFoldersAsItems)
-            else:
-                if self.shouldImportFile(path, params):
-                    self._importFileToFolder(name, user, parent, parentType, path)
+        workers = config.getConfig()['server'].get('filesystem_import_workers', 8)
+        FilesystemImporter(
+            self, user, params, progress=progress, leafFoldersAsItems=leafFoldersAsItems,
+            workers=workers).run(parent, parentType)
 
     def findInvalidFiles(self, progress=progress.noProgress, filters=None,
                          checkSize=True, **kwargs):
@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+The engine behind importing a directory tree into a filesystem assetstore.
+
+Directories are listed and their entries are stat'ed by a pool of threads, so
+that the latency of a network filesystem is paid concurrently. The items and
+files of each directory are created with bulk inserts. As directories are
+completed they are recorded with the
+:py:class:`girder.models.import_checkpoint.ImportCheckpoint` model; if the
+import fails, running it again skips the directories that were completed.
+"""
+
+import collections
+import datetime
+import os
+import stat
+import time
+
+from multiprocessing.pool import ThreadPool
+
+from girder import events, logger
+from girder.exceptions import ValidationException
+from girder.models.file import File
+from girder.models.folder import Folder
+from girder.models.import_checkpoint import ImportCheckpoint
+from girder.models.item import Item
+from girder.utility.progress import noProgress
+
+_Entry = collections.namedtuple('_Entry', ('name', 'path', 'stat'))
+
+
+def _stat(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def _isDir(entry):
+    return entry.stat is not None and stat.S_ISDIR(entry.stat.st_mode)
+
+
+def _chunks(values, size):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+class FilesystemImporter(object):
+    """
+    Imports a directory tree from the local filesystem into a filesystem
+    assetstore.
+
+    :param adapter: The adapter of the assetstore to import into.
+    :type adapter: girder.utility.filesystem_assetstore_adapter.FilesystemAssetstoreAdapter
+    :param user: The user to list as the creator of the imported data.
+    :type user: dict
+    :param params: The import parameters; ``importPath`` is the directory to
+        import, and ``fileIncludeRegex`` and ``fileExcludeRegex`` are passed to
+        the adapter's ``shouldImportFile``.
+    :type params: dict
+    :param progress: A progress context to record progress on.
+    :type progress: girder.utility.progress.ProgressContext
+    :param leafFoldersAsItems: Whether directories that only contain files are
+        imported as items rather than folders.
+    :type leafFoldersAsItems: bool
+    :param workers: The number of threads that list and stat directories.
+    :type workers: int
+    :param batchSize: The maximum number of items or files created with one
+        insert.
+    :type batchSize: int
+    :param checkpointInterval: The number of completed directories that are
+        recorded with one insert.
+    :type checkpointInterval: int
+    """
+    def __init__(self, adapter, user, params, progress=noProgress, leafFoldersAsItems=False,
+                 workers=8, batchSize=1000, checkpointInterval=100):
+        self.adapter = adapter
+        self.user = user
+        self.params = params
+        self.progress = progress
+        self.leafFoldersAsItems = leafFoldersAsItems
+        self.workers = max(1, workers)
+        self.batchSize = batchSize
+        self.checkpointInterval = checkpointInterval
+        self.fileCount = 0
+        self.startTime = None
+
+        # Adapters that customize how a single file is imported keep doing so.
+        from .filesystem_assetstore_adapter import FilesystemAssetstoreAdapter
+        self._bulkFiles = getattr(type(adapter).importFile, '__func__', type(adapter).importFile) \
+            is getattr(FilesystemAssetstoreAdapter.importFile, '__func__',
+                       FilesystemAssetstoreAdapter.importFile)
+
+    def run(self, parent, parentType):
+        """
+        Import the directory into a folder, user, or collection.
+
+        :param parent: The destination of the import.
+        :type parent: dict
+        :param parentType: The type of the destination.
+        :type parentType: str
+        """
+        importPath = self.params['importPath']
+        checkpoints = ImportCheckpoint()
+        self._key = checkpoints.importKey(
+            self.adapter.assetstore, parent, parentType, self.params, self.leafFoldersAsItems)
+        self._completed = checkpoints.completedPaths(self._key)
+        if self._completed:
+            logger.info('Resuming import of %s; %d directories were already imported',
+                        importPath, len(self._completed))
+        self._newlyCompleted = []
+        # Maps each directory that is being imported to its parent directory and
+        # the number of its subdirectories that are not yet complete.
+        self._pending = {}
+        self.fileCount = 0
+        self.startTime = time.time()
+
+        self._pool = ThreadPool(self.workers)
+        try:
+            self._importTree(parent, parentType, importPath)
+        finally:
+            self._pool.close()
+            self._pool.join()
+            self._recordCompleted()
+        checkpoints.clear(self._key)
+
+    def filesPerSecond(self):
+        """
+        The rate at which files have been imported so far.
+        """
+        elapsed = time.time() - self.startTime if self.startTime else 0
+        return self.fileCount / elapsed if elapsed > 0 else 0.0
+
+    def _updateProgress(self, name):
+        self.progress.update(message='%s (%d files, %.1f files/s)' % (
+            name, self.fileCount, self.filesPerSecond()))
+
+    def _scan(self, paths):
+        """
+        List the entries of several directories and stat them, using the
+        thread pool.
+
+        :param paths: The directories to scan.
+        :type paths: list of str
+        :returns: A list with a list of entries for each directory.
+        """
+        if not paths:
+            return []
+        listings = self._pool.map(os.listdir, paths)
+        entries = [[_Entry(name, os.path.join(path, name), None) for name in names]
+                   for path, names in zip(paths, listings)]
+        flat = [entry.path for dirEntries in entries for entry in dirEntries]
+        stats = iter(self._pool.map(
+            _stat, flat, chunksize=max(1, len(flat) // (self.workers * 4))))
+        return [[entry._replace(stat=next(stats)) for entry in dirEntries]
+                for dirEntries in entries]
+
+    def _onlyFiles(self, entries):
+        return not any(_isDir(entry) for entry in entries)
+
+    def _importTree(self, parent, parentType, importPath):
+        if importPath in self._completed:
+            return
+        entries = self._scan([importPath])[0]
+
+        if parentType != 'folder' and any(not _isDir(entry) for entry in entries):
+            raise ValidationException(
+                'Files cannot be imported directly underneath a %s.' % parentType)
+
+        if self.leafFoldersAsItems and self._onlyFiles(entries):
+            self._importItem(
+                os.path.basename(importPath.rstrip(os.sep)), parent, importPath, entries)
+            return
+
+        self._pending[importPath] = [None, 0]
+        stack = [(parent, parentType, importPath, entries)]
+        while stack:
+            # Scan several directories at once so that the pool stays busy even
+            # when directories are small.
+            batch = [stack.pop() for _ in range(min(len(stack), self.workers))]
+            scans = iter(self._scan([path for _, _, path, entries in batch if entries is None]))
+            children = []
+            for parent, parentType, path, entries in batch:
+                if entries is None:
+                    entries = next(scans)
+                children.extend(self._importDirectory(parent, parentType, path, entries))
+            stack.extend(reversed(children))
+
+    def _importDirectory(self, parent, parentType, path, entries):
+        """
+        Import the files of a directory and create folders for its
+        subdirectories.
+
+        :returns: A list of (folder, 'folder', path, entries) tuples for the
+            subdirectories that still need to be imported. ``entries`` is None
+            if the subdirectory has not been scanned.
+        """
+        files = [entry for entry in entries if not _isDir(entry) and
+                 self.adapter.shouldImportFile(entry.path, self.params)]
+        dirs = [entry for entry in entries if _isDir(entry) and entry.path not in self._completed]
+
+        self._importFilesToFolder(parent, files)
+
+        children = []
+        # Only leaf detection needs the entries of subdirectories up front.
+        # Those of other subdirectories are dropped and rescanned when the
+        # subdirectory is imported, which keeps memory bounded on wide trees.
+        for chunk in _chunks(dirs, self.workers * 4):
+            if self.leafFoldersAsItems:
+                scans = self._scan([entry.path for entry in chunk])
+            else:
+                scans = [None] * len(chunk)
+            for entry, subEntries in zip(chunk, scans):
+                self._updateProgress(entry.name)
+                if subEntries is not None and self._onlyFiles(subEntries):
+                    self._importItem(entry.name, parent, entry.path, subEntries)
+                    self._markCompleted(entry.path)
+                    continue
+                folder = Folder().createFolder(
+                    parent=parent, name=entry.name, parentType=parentType,
+                    creator=self.user, reuseExisting=True)
+                events.trigger('filesystem_assetstore_imported', {
+                    'id': folder['_id'],
+                    'type': 'folder',
+                    'importPath': entry.path
+                })
+                children.append((folder, 'folder', entry.path, None))
+
+        self._pending[path][1] = len(children)
+        for _, _, childPath, _ in children:
+            self._pending[childPath] = [path, 0]
+        if not children:
+            self._finishDirectory(path)
+        return children
+
+    def _finishDirectory(self, path):
+        """
+        Called when a directory and all of its subdirectories are imported.
+        This completes any ancestors that were only waiting on it.
+        """
+        while path is not None:
+            parentPath, _ = self._pending.pop(path)
+            if parentPath is None:
+                break
+            self._markCompleted(path)
+            self._pending[parentPath][1] -= 1
+            if self._pending[parentPath][1]:
+                break
+            path = parentPath
+
+    def _markCompleted(self, path):
+        self._newlyCompleted.append(path)
+        if len(self._newlyCompleted) >= self.checkpointInterval:
+            self._recordCompleted()
+
+    def _recordCompleted(self):
+        paths, self._newlyCompleted = self._newlyCompleted, []
+        ImportCheckpoint().record(self._key, paths)
+
+    def _importItem(self, name, folder, path, entries):
+        """
+        Import a directory that only contains files as a single item.
+        """
+        item = Item().createItem(name=name, creator=self.user, folder=folder, reuseExisting=True)
+        events.trigger('filesystem_assetstore_imported', {
+            'id': item['_id'],
+            'type': 'item',
+            'importPath': path
+        })
+        files = [(item, entry, entry.name) for entry in entries
+                 if self.adapter.shouldImportFile(entry.path, self.params)]
+        for chunk in _chunks(files, self.batchSize):
+            self._importFiles(chunk)
+
+    def _importFilesToFolder(self, folder, entries):
+        """
+        Import files into a folder, each as an item of the same name.
+        """
+        for chunk in _chunks(entries, self.batchSize):
+            names = [entry.name for entry in chunk]
+            items = {item['name']: item for item in Item().find({
+                'folderId': folder['_id'],
+                'name': {'$in': names}
+            })}
+            # Names that would be changed by validation, or that collide with a
+            # folder, are left to Item.createItem so that they are handled the
+            # usual way.
+            irregular = {name for name in names if name != name.strip() or not name}
+            irregular.update(doc['name'] for doc in Folder().find({
+                'parentId': folder['_id'],
+                'parentCollection': 'folder',
+                'name': {'$in': [name for name in names if name not in items]}
+            }, fields=['name']))
+
+            newItems = []
+            for name in names:
+                if name in irregular and name not in items:
+                    items[name] = Item().createItem(
+                        name=name, creator=self.user, folder=folder, reuseExisting=True)
+                elif name not in items:
+                    items[name] = self._newItem(name, folder)
+                    newItems.append(items[name])
+            Item().insertMany(newItems, validate=False)
+
+            for entry in chunk:
+                events.trigger('filesystem_assetstore_imported', {
+                    'id': items[entry.name]['_id'],
+                    'type': 'item',
+                    'importPath': entry.path
+                })
+            self._importFiles([(items[entry.name], entry, entry.name) for entry in chunk])
+
+    def _newItem(self, name, folder):
+        """
+        Build the document that Item.createItem would save for a new item.
+        """
+        if 'baseParentType' not in folder:
+            pathFromRoot = Item().parentsToRoot(
+                {'folderId': folder['_id']}, self.user, force=True)
+            folder['baseParentType'] = pathFromRoot[0]['type']
+            folder['baseParentId'] = pathFromRoot[0]['object']['_id']
+        now = datetime.datetime.utcnow()
+        return {
+            'name': name,
+            'lowerName': name.lower(),
+            'description': '',
+            'folderId': folder['_id'],
+            'ancestorIds': Folder().getChildAncestorIds(folder),
+            'creatorId': self.user['_id'],
+            'baseParentType': folder['baseParentType'],
+            'baseParentId': folder['baseParentId'],
+            'created': now,
+            'updated': now,
+            'size': 0
+        }
+
+    def _importFiles(self, files):
+        """
+        Create the file documents of imported files.
+
+        :param files: (item, entry, name) tuples for each file.
+        :type files: list of tuple
+        """
+        if not files:
+            return
+        if not self._bulkFiles:
+            for item, entry, name in files:
+                self.adapter.importFile(item, entry.path, self.user, name=name)
+                self.fileCount += 1
+            self._updateProgress(files[-1][2])
+            return
+
+        existing = {(file['itemId'], file['name']): file for file in File().find({
+            'itemId': {'$in': list({item['_id'] for item, _, _ in files})},
+            'name': {'$in': list({name for _, _, name in files})}
+        })}
+        newFiles = []
+        for item, entry, name in files:
+            # The entry was not stat'ed if it vanished or is a broken link;
+            # stat it again to raise the error.
+            fileStat = entry.stat or os.stat(entry.path)
+            path = os.path.abspath(os.path.expanduser(entry.path))
+            file = existing.get((item['_id'], name))
+            if file is None:
+                file = File().createFile(
+                    name=name, creator=self.user, item=item, assetstore=self.adapter.assetstore,
+                    size=fileStat.st_size, saveFile=False)
+                newFiles.append(file)
+            elif (file.get('path') == path and file.get('mtime') == fileStat.st_mtime and
+                    file.get('imported')):
+                continue
+            file['path'] = path
+            file['mtime'] = fileStat.st_mtime
+            file['imported'] = True
+            file.pop('crc32', None)
+            if '_id' in file:
+                File().save(file)
+        File().insertMany(newFiles)
+        self.fileCount += len(files)
+        self._updateProgress(files[-1][2])
@@ -18,20 +18,24 @@
 ###############################################################################
 
 import bson
+import cherrypy
 from hashlib import sha512
 import pymongo
 import six
 from six import BytesIO
+import threading
 import time
 import uuid
 
+from multiprocessing.pool import ThreadPool
+
 from girder import logger
 from girder.api.rest import setResponseHeader
 from girder.external.mongodb_proxy import MongoProxy
 from girder.models import getDbConnection
 from girder.exceptions import ValidationException
 from girder.models.file import File
-from . import hash_state
+from . import config, hash_state
 from .abstract_assetstore_adapter import AbstractAssetstoreAdapter
 
 
@@ -44,6 +48,76 @@ RECENT_CONNECTION_CACHE_TIME = 600  # seconds
 RECENT_CONNECTION_CACHE_MAX_SIZE = 100
 _recentConnections = {}
 
+# Threads shared by all downloads to read the next batch of chunks of a file
+# while the current batch is sent, and a semaphore counting the idle threads
+_prefetchPool = None
+_prefetchSlots = None
+_prefetchPoolLock = threading.Lock()
+
+
+def _getPrefetchPool():
+    """
+    Get the pool of threads that read ahead while files are downloaded,
+    creating it on first use.
+
+    :returns: the pool and the semaphore of its idle threads, or None if
+        reading ahead is disabled.
+    """
+    global _prefetchPool, _prefetchSlots
+    workers = int(config.getConfig()['server'].get('gridfs_download_prefetch_workers', 4))
+    if not workers:
+        return None
+    with _prefetchPoolLock:
+        if _prefetchPool is None:
+            _prefetchPool = ThreadPool(workers)
+            _prefetchSlots = threading.BoundedSemaphore(workers)
+            cherrypy.engine.subscribe('stop', closePrefetchPool)
+        return _prefetchPool, _prefetchSlots
+
+
+def _prefetch(func, *args):
+    """
+    Call a function in the prefetch pool if one of its threads is idle.
+    Downloads never wait for a thread that is reading ahead for another
+    download; if they are all busy, the caller reads inline instead.
+
+    :param func: the function to call.
+    :returns: the pending result, or None if the function was not started.
+    """
+    prefetch = _getPrefetchPool()
+    if prefetch is None:
+        return None
+    pool, slots = prefetch
+    if not slots.acquire(False):
+        return None
+
+    def run():
+        try:
+            return func(*args)
+        finally:
+            slots.release()
+
+    try:
+        return pool.apply_async(run)
+    except ValueError:
+        # The pool was closed while the server stopped
+        slots.release()
+        return None
+
+
+def closePrefetchPool():
+    """
+    Stop the threads that read ahead while files are downloaded, after they
+    finish the reads already started. This is called when the server stops.
+    """
+    global _prefetchPool, _prefetchSlots
+    with _prefetchPoolLock:
+        pool = _prefetchPool
+        _prefetchPool = _prefetchSlots = None
+    if pool is not None:
+        pool.close()
+        pool.join()
+
 
 def _ensureChunkIndices(collection):
     """
@@ -91,6 +165,17 @@ def _setupSharding(collection, keyname='uuid'):
     return False
 
 
+def _updateDigests(digests, data):
+    """
+    Update several hash objects with the same data.
+
+    :param digests: A dict of hash objects.
+    :param data: The data to add to each hash.
+    """
+    for digest in six.viewvalues(digests):
+        digest.update(data)
+
+
 class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
     """
     This assetstore type stores files within MongoDB using the GridFS data
@@ -191,8 +276,12 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
         if isinstance(chunk, six.binary_type):
             chunk = BytesIO(chunk)
 
-        # Restore the internal state of the streaming SHA-512 checksum
-        checksum = hash_state.restoreHex(upload['sha512state'], 'sha512')
+        # Restore the internal state of the streaming SHA-512 checksum, and of
+        # any other requested digests
+        digests = {
+            name: hash_state.restoreHex(state, name)
+            for name, state in six.viewitems(upload.get('hashStates', {}))}
+        digests['sha512'] = hash_state.restoreHex(upload['sha512state'], 'sha512')
 
         # TODO: when saving uploads is optional, we can conditionally try to
         # fetch the last chunk.  Add these line before `lastChunk = ...`:
@@ -215,7 +304,7 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
                     'n': {'$gte': upload['received'] // CHUNK_SIZE}
                 }, projection=['data']).sort('n', pymongo.ASCENDING)
                 for result in cursor:
-                    checksum.update(result['data'])
+                    _updateDigests(digests, result['data'])
         n = lastChunk['n'] + 1 if lastChunk else 0
 
         size = 0
@@ -241,7 +330,7 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
                             '(chunk uuid %s part %d)', upload['chunkUuid'], n)
             n += 1
             size += len(data)
-            checksum.update(data)
+            _updateDigests(digests, data)
         chunk.close()
 
         try:
@@ -255,8 +344,11 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
             })
             raise
 
-        # Persist the internal state of the checksum
-        upload['sha512state'] = hash_state.serializeHex(checksum)
+        # Persist the internal state of the checksums
+        upload['sha512state'] = hash_state.serializeHex(digests.pop('sha512'))
+        if digests:
+            upload['hashStates'] = {
+                name: hash_state.serializeHex(digest) for name, digest in six.viewitems(digests)}
         upload['received'] += size
         return upload
 
@@ -286,6 +378,8 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
                                      'sha512').hexdigest()
 
         file['sha512'] = hash
+        for name, state in six.viewitems(upload.get('hashStates', {})):
+            file[name] = hash_state.restoreHex(state, name).hexdigest()
         file['chunkUuid'] = upload['chunkUuid']
         file['chunkSize'] = CHUNK_SIZE
 
@@ -308,43 +402,58 @@ class GridFsAssetstoreAdapter(AbstractAssetstoreAdapter):
         if endByte - offset <= 0:
             return lambda: ''
 
-        n = 0
-        chunkOffset = 0
-
-        # We must "seek" to the correct chunk index and local offset
-        if offset > 0:
-            n = offset // file['chunkSize']
-            chunkOffset = offset % file['chunkSize']
-
-        cursor = self.chunkColl.find({
-            'uuid': file['chunkUuid'],
-            'n': {'$gte': n}
-        }, projection=['data']).sort('n', pymongo.ASCENDING)
+        # Only the chunks that overlap the requested range are read, a batch
+        # at a time, and the next batch is read in the background while the
+        # current one is sent if a prefetch thread is idle.
+        chunkSize = file['chunkSize']
+        firstN = offset // chunkSize
+        lastN = (endByte - 1) // chunkSize
+        batchSize = max(int(config.getConfig()['server'].get(
+            'gridfs_download_batch_size', 4)), 1)
+        prefetch = lastN - firstN >= batchSize
 
         def stream():
-            co = chunkOffset  # Can't assign to outer scope without "nonlocal"
-            position = offset
-            shouldBreak = False
-
-            for chunk in cursor:
-                chunkLen = len(chunk['data'])
-
-                if position + chunkLen - co > endByte:
-                    chunkLen = endByte - position + co
-                    shouldBreak = True
-
-                yield chunk['data'][co:chunkLen]
-
-                if shouldBreak:
+            position = firstN * chunkSize
+            batchStart = firstN
+            batch = self._readChunks(file, batchStart, min(batchStart + batchSize, lastN + 1))
+            while batch:
+                nextStart = batchStart + batchSize
+                nextRange = (file, nextStart, min(nextStart + batchSize, lastN + 1))
+                pending = None
+                if prefetch and nextStart <= lastN:
+                    pending = _prefetch(self._readChunks, *nextRange)
+
+                for chunk in batch:
+                    data = chunk['data']
+                    start = max(offset - position, 0)
+                    end = min(endByte - position, len(data))
+                    # Whole chunks are sent as they are, without copying them
+                    yield data if start == 0 and end == len(data) else data[start:end]
+                    position += len(data)
+
+                if nextStart > lastN:
                     break
-
-                position += chunkLen - co
-
-                if co > 0:
-                    co = 0
+                batch = pending.get() if pending is not None else self._readChunks(*nextRange)
+                batchStart = nextStart
 
         return stream
 
+    def _readChunks(self, file, start, stop):
+        """
+        Read a range of the chunks of a file.
+
+        :param file: the file document.
+        :param start: the index of the first chunk to read.
+        :type start: int
+        :param stop: the index after the last chunk to read.
+        :type stop: int
+        :returns: a list of chunk documents with their data.
+        """
+        return list(self.chunkColl.find({
+            'uuid': file['chunkUuid'],
+            'n': {'$gte': start, '$lt': stop}
+        }, projection=['data'], sort=[('n', pymongo.ASCENDING)], batch_size=stop - start))
+
     def deleteFile(self, file):
         """
         Delete all of the chunks in the collection that correspond to the
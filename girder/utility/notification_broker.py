@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+This module fans out notifications to the open notification streams of this
+process. Rather than every stream querying the database for its own user, a
+single feed learns about new and updated notifications and pushes them to the
+streams that subscribed to them.
+
+The feed is chosen by the ``notification_source`` option of the ``[server]``
+configuration section:
+
+``poll``
+    One thread queries the database for recently updated notifications on
+    behalf of every stream of the process. Notifications saved by this process
+    are also pushed as soon as they are saved. This works with any number of
+    Girder processes.
+``change_stream``
+    One thread follows a MongoDB change stream of the notification
+    collection. This requires MongoDB to run as a replica set, and falls back
+    to ``poll`` otherwise.
+``local``
+    Only notifications saved by this process are pushed, without any database
+    queries. This is only suitable when a single Girder process serves all
+    requests.
+"""
+
+import copy
+import datetime
+import six
+import threading
+import time
+
+from girder import events, logger
+from girder.utility import config
+
+SOURCES = ('poll', 'change_stream', 'local')
+# Notifications whose update time is this much earlier than the latest one
+# already seen are still picked up by the poll feed, to tolerate clock skew
+# between processes and the delay between stamping a notification and saving
+# it.
+POLL_OVERLAP = datetime.timedelta(seconds=5)
+
+
+class Subscription(object):
+    """
+    The notifications waiting to be sent on one stream. Each notification is
+    delivered once for each of its updates, no matter how many feeds report
+    it.
+
+    :param broker: The broker this subscription belongs to.
+    :type broker: NotificationBroker
+    :param key: The ('userId', id) or ('tokenId', id) tuple of the stream.
+    :type key: tuple
+    """
+    # How many delivered updates are remembered to recognize duplicates.
+    MAX_DELIVERED = 10000
+
+    def __init__(self, broker, key):
+        self.broker = broker
+        self.key = key
+        self._condition = threading.Condition()
+        self._pending = []
+        self._delivered = {}
+
+    def push(self, doc):
+        with self._condition:
+            self._pending.append(doc)
+            self._condition.notify()
+
+    def filter(self, docs):
+        """
+        Drop the notifications that were already delivered on this stream, and
+        record the others as delivered.
+
+        :param docs: An iterable of notification documents.
+        :returns: A list of the documents that were not yet delivered.
+        """
+        result = []
+        for doc in docs:
+            last = self._delivered.get(doc['_id'])
+            if last is None or doc['updated'] > last:
+                self._delivered[doc['_id']] = doc['updated']
+                result.append(doc)
+        if len(self._delivered) > self.MAX_DELIVERED:
+            recent = sorted(self._delivered.items(), key=lambda entry: entry[1])
+            self._delivered = dict(recent[len(recent) // 2:])
+        return result
+
+    def wait(self, timeout):
+        """
+        Wait for new notifications.
+
+        :param timeout: The longest time to wait, in seconds.
+        :type timeout: float
+        :returns: A list of notification documents, which is empty if none
+            arrived before the timeout.
+        """
+        with self._condition:
+            if not self._pending:
+                self._condition.wait(timeout)
+            pending, self._pending = self._pending, []
+        docs = self.filter(pending)
+        self.broker._recordDelivery(docs)
+        return docs
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class NotificationBroker(object):
+    """
+    Dispatches notifications to the subscriptions of the open streams. The
+    feed only runs while there is at least one subscription.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self._thread = None
+        self._changeStream = None
+        self._stopped = False
+        # The update time of each notification the poll feed can still see
+        # that was already published
+        self._published = {}
+        self.source = None
+        self.pollInterval = 0.5
+        self._resetStats()
+
+    def _resetStats(self):
+        self._stats = {
+            'published': 0,
+            'delivered': 0,
+            'polls': 0,
+            'totalFanOutLatency': 0.0,
+            'maxFanOutLatency': 0.0
+        }
+
+    @staticmethod
+    def key(user=None, token=None, doc=None):
+        """
+        Compute the subscription key of a user or token, or the key that a
+        notification is addressed to.
+        """
+        if doc is not None:
+            if doc.get('userId'):
+                return ('userId', doc['userId'])
+            return ('tokenId', doc.get('tokenId'))
+        if user:
+            return ('userId', user['_id'])
+        return ('tokenId', token['_id'])
+
+    def subscribe(self, user=None, token=None):
+        """
+        Start receiving the notifications of a user, or of a token if there is
+        no user.
+
+        :returns: The subscription, which must be closed when the stream ends.
+        :rtype: Subscription
+        """
+        subscription = Subscription(self, self.key(user=user, token=token))
+        with self._lock:
+            self._subscriptions.setdefault(subscription.key, set()).add(subscription)
+            self._start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.key, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.key, None)
+
+    def publish(self, doc):
+        """
+        Push a new or updated notification to the streams it is addressed to.
+
+        :param doc: The notification document.
+        :type doc: dict
+        """
+        with self._lock:
+            if self.source == 'poll':
+                # The poll feed finds each update again until it is older than
+                # POLL_OVERLAP, and it may also have been pushed when it was
+                # saved.
+                last = self._published.get(doc['_id'])
+                if last is not None and doc['updated'] <= last:
+                    return
+                self._published[doc['_id']] = doc['updated']
+            subscriptions = list(self._subscriptions.get(self.key(doc=doc), ()))
+            self._stats['published'] += 1
+        if subscriptions:
+            # Streams serialize the document while its creator may still be
+            # changing it.
+            doc = copy.deepcopy(doc)
+        for subscription in subscriptions:
+            subscription.push(doc)
+
+    def _onSave(self, event):
+        self.publish(event.info)
+
+    def _start(self):
+        """
+        Start the feed if it is not running. This is called with the lock
+        held.
+        """
+        if self.source is None:
+            serverConfig = config.getConfig()['server']
+            self.source = serverConfig.get('notification_source', 'poll')
+            if self.source not in SOURCES:
+                logger.warning('Unknown notification_source %r, using "poll".', self.source)
+                self.source = 'poll'
+            self.pollInterval = serverConfig.get('notification_poll_interval', 0.5)
+            self._stopped = False
+            if self.source != 'change_stream':
+                events.bind('model.notification.save.after', 'notification_broker', self._onSave)
+        if self.source != 'local' and self._thread is None and not self._stopped:
+            target = self._follow if self.source == 'change_stream' else self._poll
+            self._thread = threading.Thread(target=target, name='NotificationBroker')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _poll(self):
+        from girder.models.notification import Notification
+
+        since = datetime.datetime.utcnow() - POLL_OVERLAP
+        while True:
+            with self._lock:
+                keys = list(self._subscriptions)
+                if not keys or self._stopped:
+                    self._thread = None
+                    return
+                self._stats['polls'] += 1
+            query = {'updated': {'$gt': since}, '$or': [
+                {'userId': {'$in': [value for field, value in keys if field == 'userId']}},
+                {'tokenId': {'$in': [value for field, value in keys if field == 'tokenId']}}
+            ]}
+            try:
+                for doc in Notification().find(query, sort=[('updated', 1)]):
+                    since = max(since, doc['updated'] - POLL_OVERLAP)
+                    self.publish(doc)
+            except Exception:
+                logger.exception('Failed to poll for notifications.')
+            with self._lock:
+                # Updates older than the next query can no longer repeat
+                self._published = {
+                    id: updated for id, updated in six.viewitems(self._published)
+                    if updated > since}
+            time.sleep(self.pollInterval)
+
+    def _follow(self):
+        from girder.models.notification import Notification
+
+        pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace']}}}]
+        while not self._stopped:
+            try:
+                with Notification().collection.watch(
+                        pipeline, full_document='updateLookup') as changeStream:
+                    self._changeStream = changeStream
+                    for change in changeStream:
+                        if change.get('fullDocument'):
+                            self.publish(change['fullDocument'])
+            except Exception:
+                if self._stopped:
+                    break
+                logger.exception(
+                    'Cannot follow the notification change stream, polling instead.')
+                with self._lock:
+                    self.source = 'poll'
+                    events.bind(
+                        'model.notification.save.after', 'notification_broker', self._onSave)
+                self._poll()
+                return
+        self._thread = None
+
+    def _recordDelivery(self, docs):
+        if not docs:
+            return
+        now = time.time()
+        with self._lock:
+            self._stats['delivered'] += len(docs)
+            for doc in docs:
+                latency = max(now - doc.get('updatedTime', now), 0)
+                self._stats['totalFanOutLatency'] += latency
+                self._stats['maxFanOutLatency'] = max(self._stats['maxFanOutLatency'], latency)
+
+    def stats(self):
+        """
+        Return the number of open streams and statistics about the
+        notifications dispatched so far. The fan-out latency of a delivered
+        notification is the time from when it was last updated until its
+        stream picked it up, in seconds.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['streams'] = sum(len(subs) for subs in self._subscriptions.values())
+            stats['source'] = self.source
+        totalLatency = stats.pop('totalFanOutLatency')
+        stats['meanFanOutLatency'] = (
+            totalLatency / stats['delivered'] if stats['delivered'] else 0.0)
+        return stats
+
+    def stop(self):
+        """
+        Stop the feed and forget the configuration and statistics. The
+        configuration is read again when the next stream subscribes.
+        """
+        with self._lock:
+            self._stopped = True
+            self.source = None
+            self._published = {}
+            events.unbind('model.notification.save.after', 'notification_broker')
+        if self._changeStream is not None:
+            try:
+                self._changeStream.close()
+            except Exception:
+                pass
+            self._changeStream = None
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self._thread = None
+        self._resetStats()
+
+
+broker = NotificationBroker()
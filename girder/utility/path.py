@@ -24,6 +24,7 @@ from ..constants import AccessType
 from ..exceptions import AccessException, GirderException, ValidationException
 from ..exceptions import ResourcePathNotFound
 from .model_importer import ModelImporter
+from ._cache import pathCache
 from girder.models.collection import Collection
 from girder.models.user import User
 
@@ -31,6 +32,10 @@ from girder.models.user import User
 # Expose the ResourcePathNotFound exception as its original name
 NotFoundException = ResourcePathNotFound
 
+# Resolving a run of folders with a single query considers at most this many
+# folders; if more share the names in a path, they are resolved one at a time.
+_FOLDER_CHAIN_CANDIDATE_LIMIT = 1000
+
 
 def encode(token):
     """Escape special characters in a token for path representation.
@@ -124,6 +129,133 @@ def lookUpToken(token, parentType, parent):
         parentType, parent.get('name', parent.get('_id')), token))
 
 
+def _parentOf(type, doc):
+    """
+    Return the type and id of the parent of a folder, item, or file.
+    """
+    if type == 'folder':
+        return doc.get('parentCollection'), doc.get('parentId')
+    elif type == 'item':
+        return 'folder', doc.get('folderId')
+    elif type == 'file':
+        return 'item', doc.get('itemId')
+    return None, None
+
+
+def _lookUpRoot(type, name):
+    """
+    Find a user by login or a collection by name, using the path cache.
+    """
+    model, field = (User(), 'login') if type == 'user' else (Collection(), 'name')
+    cached = pathCache.get(type, None, name)
+    if cached is not None:
+        doc = model.findOne({'_id': cached[1]})
+        if doc is not None and doc.get(field) == name:
+            return doc
+        pathCache.invalidate(cached[1])
+    doc = model.findOne({field: name})
+    if doc is not None:
+        pathCache.set(type, None, name, type, doc['_id'])
+    return doc
+
+
+def _cachedChain(parentType, parent, tokens):
+    """
+    Resolve the leading path components that are in the path cache, loading
+    their documents with one query per model. Entries whose document no longer
+    has the expected name and parent are dropped.
+
+    :returns: a list of (model, document) tuples, one for each resolved token.
+    """
+    ids = []
+    curType, curId = parentType, parent['_id']
+    for token in tokens:
+        cached = pathCache.get(curType, curId, token)
+        if cached is None:
+            break
+        ids.append(cached)
+        curType, curId = cached
+    if not ids:
+        return []
+
+    docs = {}
+    for childType in {childType for childType, _ in ids}:
+        docs.update((doc['_id'], doc) for doc in ModelImporter.model(childType).find({
+            '_id': {'$in': [childId for type, childId in ids if type == childType]}}))
+
+    chain = []
+    curType, curId = parentType, parent['_id']
+    for token, (childType, childId) in zip(tokens, ids):
+        doc = docs.get(childId)
+        if (doc is None or doc.get('name') != token or
+                _parentOf(childType, doc) != (curType, curId)):
+            pathCache.invalidate(childId)
+            break
+        chain.append((childType, doc))
+        curType, curId = childType, childId
+    return chain
+
+
+def _lookUpFolderChain(tokens, parentType, parent):
+    """
+    Resolve the leading path components that name folders with a single query
+    for all of the folders with those names under the same user or collection.
+
+    :returns: a list of ('folder', document) tuples, one for each resolved
+        token. This is empty if too many folders have those names.
+    """
+    if parentType == 'folder':
+        if 'baseParentId' not in parent:
+            return []
+        query = {'baseParentId': parent['baseParentId']}
+    else:
+        query = {'baseParentId': parent['_id']}
+    query['name'] = {'$in': list(set(tokens))}
+    candidates = list(ModelImporter.model('folder').find(
+        query, limit=_FOLDER_CHAIN_CANDIDATE_LIMIT + 1))
+    if len(candidates) > _FOLDER_CHAIN_CANDIDATE_LIMIT:
+        return []
+
+    children = {}
+    for doc in candidates:
+        children.setdefault((doc['parentCollection'], doc['parentId'], doc['name']), doc)
+    chain = []
+    curType, curId = parentType, parent['_id']
+    for token in tokens:
+        doc = children.get((curType, curId, token))
+        if doc is None:
+            break
+        chain.append(('folder', doc))
+        curType, curId = 'folder', doc['_id']
+    return chain
+
+
+def _resolveTokens(parentType, parent, tokens):
+    """
+    Resolve the components of a path below a user or collection. Components
+    are taken from the path cache where possible; runs of folders are then
+    resolved with a single query, and anything left one component at a time
+    with :py:func:`lookUpToken`.
+
+    :returns: a list of (model, document) tuples, one for each token.
+    """
+    resolved = _cachedChain(parentType, parent, tokens)
+    while len(resolved) < len(tokens):
+        curType, cur = resolved[-1] if resolved else (parentType, parent)
+        remaining = tokens[len(resolved):]
+        chain = []
+        if len(remaining) > 1 and curType in ('user', 'collection', 'folder'):
+            chain = _lookUpFolderChain(remaining, curType, cur)
+        if not chain:
+            document, model = lookUpToken(remaining[0], curType, cur)
+            chain = [(model, document)]
+        for token, (model, document) in zip(remaining, chain):
+            pathCache.set(curType, cur['_id'], token, model, document['_id'])
+            curType, cur = model, document
+        resolved.extend(chain)
+    return resolved
+
+
 def lookUpPath(path, user=None, test=False, filter=True, force=False):
     """
     Look up a resource in the data hierarchy by path.
@@ -145,7 +277,7 @@ def lookUpPath(path, user=None, test=False, filter=True, force=False):
 
     if model == 'user':
         username = pathArray[1]
-        parent = User().findOne({'login': username})
+        parent = _lookUpRoot(model, username)
 
         if parent is None:
             if test:
@@ -158,7 +290,7 @@ def lookUpPath(path, user=None, test=False, filter=True, force=False):
 
     elif model == 'collection':
         collectionName = pathArray[1]
-        parent = Collection().findOne({'name': collectionName})
+        parent = _lookUpRoot(model, collectionName)
 
         if parent is None:
             if test:
@@ -176,8 +308,7 @@ def lookUpPath(path, user=None, test=False, filter=True, force=False):
         document = parent
         if not force:
             ModelImporter.model(model).requireAccess(document, user)
-        for token in pathArray[2:]:
-            document, model = lookUpToken(token, model, document)
+        for model, document in _resolveTokens(model, parent, pathArray[2:]):
             if not force:
                 ModelImporter.model(model).requireAccess(document, user)
     except (ValidationException, AccessException):
@@ -235,22 +366,70 @@ def getResourcePath(type, doc, user=None, force=False):
     :return: the path to the resource.
     :rtype: str
     """
-    path = []
-    while True:
-        path.insert(0, getResourceName(type, doc))
-        if type == 'file':
-            parentModel = 'item'
-            parentId = doc['itemId']
-        elif type == 'item':
-            parentModel = 'folder'
-            parentId = doc['folderId']
-        elif type == 'folder':
-            parentModel = doc['parentCollection']
-            parentId = doc['parentId']
-        else:
-            break
-        doc = ModelImporter.model(parentModel).load(
-            id=parentId, user=user, level=AccessType.READ, force=force)
-        type = parentModel
-    path.insert(0, type)
-    return '/' + join(path)
+    return getResourcePaths(type, [doc], user=user, force=force)[0]
+
+
+def getResourcePaths(type, docs, user=None, force=False):
+    """
+    Get the paths for several resources of the same type. The ancestors of all
+    of the resources are loaded together, using the ``ancestorIds`` of items
+    and folders, so this takes a handful of queries no matter how many
+    resources there are or how deeply they are nested.
+
+    :param type: the resource model type.
+    :type type: str
+    :param docs: the resource documents.
+    :type docs: list of dict
+    :param user: user with correct privileges to access path
+    :type user: dict or None
+    :param force: if True, don't validate the access.
+    :type force: bool
+    :return: the paths to the resources, in the same order as ``docs``.
+    :rtype: list of str
+    """
+    loaded = {}
+
+    def preload(model, ids):
+        ids = {id for id in ids if id is not None and (model, id) not in loaded}
+        if ids:
+            for parent in ModelImporter.model(model).find({'_id': {'$in': list(ids)}}):
+                loaded[(model, parent['_id'])] = parent
+
+    items = docs
+    if type == 'file':
+        preload('item', (doc.get('itemId') for doc in docs))
+        items = [loaded[('item', doc['itemId'])] for doc in docs
+                 if ('item', doc.get('itemId')) in loaded]
+    if type in ('file', 'item', 'folder'):
+        preload('folder', (id for doc in items for id in doc.get('ancestorIds', ())))
+        for rootType in ('user', 'collection'):
+            preload(rootType, (doc.get('baseParentId') for doc in items
+                               if doc.get('baseParentType') == rootType))
+
+    checked = set()
+
+    def loadParent(model, id):
+        parent = loaded.get((model, id))
+        if parent is None:
+            # Not found through the ancestor lists, so load it on its own
+            return ModelImporter.model(model).load(
+                id=id, user=user, level=AccessType.READ, force=force)
+        if not force and (model, id) not in checked:
+            ModelImporter.model(model).requireAccess(parent, user, AccessType.READ)
+            checked.add((model, id))
+        return parent
+
+    paths = []
+    for doc in docs:
+        docType = type
+        path = []
+        while True:
+            path.insert(0, getResourceName(docType, doc))
+            parentModel, parentId = _parentOf(docType, doc)
+            if parentModel is None:
+                break
+            doc = loadParent(parentModel, parentId)
+            docType = parentModel
+        path.insert(0, docType)
+        paths.append('/' + join(path))
+    return paths
@@ -28,7 +28,7 @@ import girder.events
 from girder import constants, logprint, __version__, logStdoutStderr, _setupCache
 from girder.models.setting import Setting
 from girder import plugin
-from girder.utility import config
+from girder.utility import config, notification_broker
 from . import webroot
 
 with open(os.path.join(os.path.dirname(__file__), 'error.mako')) as f:
@@ -144,6 +144,7 @@ def configureServer(test=False, plugins=None, curConfig=None):
     girder.events.setupDaemon()
     cherrypy.engine.subscribe('start', girder.events.daemon.start)
     cherrypy.engine.subscribe('stop', girder.events.daemon.stop)
+    cherrypy.engine.subscribe('stop', notification_broker.broker.stop)
 
     if plugins is None:
         plugins = getPlugins()
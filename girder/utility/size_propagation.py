@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+Utilities for keeping the recorded sizes of folders, users, and collections up
+to date.
+
+Adding or removing a file increments the size of its folder and of the user or
+collection at the root of its hierarchy. When many files are added or removed
+at once, such as during an import, those increments all contend for the same
+few documents. Within a :py:func:`batchSizeChanges` block, increments are
+instead summed per document and written together when the block exits::
+
+    with batchSizeChanges():
+        for path in paths:
+            Upload().uploadFromFile(...)
+
+Sizes recorded in the database lag behind while a batch is open.
+"""
+
+import contextlib
+import six
+import threading
+
+from collections import OrderedDict
+from pymongo import UpdateOne
+
+from girder.utility.progress import noProgress
+
+_local = threading.local()
+
+
+class SizeDeltaAccumulator(object):
+    """
+    Collects size increments for documents and writes them with one bulk
+    write per collection.
+
+    :param maxTargets: Flush automatically once increments are pending for
+        this many documents.
+    :type maxTargets: int
+    """
+    def __init__(self, maxTargets=1000):
+        self.maxTargets = maxTargets
+        self._deltas = OrderedDict()
+        self._count = 0
+
+    def add(self, model, id, amount, field='size'):
+        """
+        Record an increment of a field of a document.
+
+        :param model: The model of the document.
+        :type model: girder.models.model_base.Model
+        :param id: The _id of the document.
+        :param amount: The amount to increment the field by.
+        :param field: The field to increment.
+        """
+        deltas = self._deltas.setdefault((model, field), OrderedDict())
+        if id not in deltas:
+            deltas[id] = 0
+            self._count += 1
+        deltas[id] += amount
+        if self._count >= self.maxTargets:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all pending increments.
+        """
+        pending, self._deltas, self._count = self._deltas, OrderedDict(), 0
+        for (model, field), deltas in six.viewitems(pending):
+            requests = [
+                UpdateOne({'_id': id}, {'$inc': {field: amount}})
+                for id, amount in six.viewitems(deltas) if amount]
+            if requests:
+                model.collection.bulk_write(requests)
+
+
+@contextlib.contextmanager
+def batchSizeChanges(maxTargets=1000):
+    """
+    A context manager within which size increments made through
+    :py:func:`incrementSize` on the current thread are coalesced. Nested blocks
+    join the outermost one, which writes the increments when it exits, even if
+    it exits due to an exception.
+
+    :param maxTargets: See :py:class:`SizeDeltaAccumulator`.
+    """
+    accumulator = getattr(_local, 'accumulator', None)
+    if accumulator is not None:
+        yield accumulator
+        return
+    accumulator = _local.accumulator = SizeDeltaAccumulator(maxTargets)
+    try:
+        yield accumulator
+    finally:
+        _local.accumulator = None
+        accumulator.flush()
+
+
+def incrementSize(model, id, amount):
+    """
+    Increment the size of a document, or record the increment if a
+    :py:func:`batchSizeChanges` block is active.
+
+    :param model: The model of the document.
+    :type model: girder.models.model_base.Model
+    :param id: The _id of the document.
+    :param amount: The amount to increment the size by.
+    """
+    accumulator = getattr(_local, 'accumulator', None)
+    if accumulator is not None:
+        accumulator.add(model, id, amount)
+    else:
+        model.increment(query={'_id': id}, field='size', amount=amount, multi=False)
+
+
+def recalculateSizes(progress=noProgress):
+    """
+    Recompute the size of every user and collection, and of everything
+    beneath them, correcting any recorded sizes that are wrong.
+
+    :param progress: A progress context to record progress on.
+    :type progress: girder.utility.progress.ProgressContext
+    :returns: The number of corrected documents.
+    """
+    from girder.models.collection import Collection
+    from girder.models.user import User
+
+    fixes = 0
+    models = [Collection(), User()]
+    steps = sum(model.find().count() for model in models)
+    progress.update(total=steps, current=0)
+    for model in models:
+        for doc in model.find():
+            progress.update(increment=1)
+            _, f = model.updateSize(doc)
+            fixes += f
+    return fixes
@@ -26,8 +26,10 @@ import threading
 import time
 
 import girder
-from girder import logger
+from girder import events, logger
 from girder.models import getDbConnection
+from girder.utility import notification_broker
+from girder.utility._cache import blockCache
 
 
 def _objectToDict(obj):
@@ -152,6 +154,10 @@ def getStatus(mode='basic', user=None):
             True for threadId in cherrypy.tools.status.seenThreads
             if 'end' not in cherrypy.tools.status.seenThreads[threadId]])
         status['cherrypyThreadPoolSize'] = cherrypy.server.thread_pool
+        status['eventHandlerTimes'] = events.getHandlerTimes()
+        status['eventDaemon'] = events.daemon.stats()
+        status['notificationBroker'] = notification_broker.broker.stats()
+        status['blockCache'] = blockCache.stats()
 
     if mode == 'slow' and isAdmin:
         _computeSlowStatus(process, status, db)
@@ -30,21 +30,32 @@ Example of creating and consuming a streaming zip:
         yield data
 
     yield zip.footer()
+
+Many files can be added with addFiles, which reads and compresses upcoming
+files in worker threads while the archive is streamed in order:
+
+    for data in zip.addFiles(fileList, workers=4):
+        yield data
 """
 
 import binascii
+import bisect
+import collections
+import functools
 import os
 import six
 import struct
 import sys
 import time
 
+from multiprocessing.pool import ThreadPool
+
 try:
     import zlib
 except ImportError:
     zlib = None
 
-__all__ = ('STORE', 'DEFLATE', 'ZipGenerator')
+__all__ = ('STORE', 'DEFLATE', 'SeekableZipGenerator', 'ZipGenerator')
 
 
 Z64_LIMIT = (1 << 31) - 1
@@ -99,18 +110,31 @@ class ZipInfo(object):
         return struct.pack(
             fmt, b'PK\x07\x08', self.crc, self.compressSize, self.fileSize)
 
-    def fileHeader(self):
+    def fileHeader(self, zip64=False):
         """
         Return the per-file header as a string.
+
+        :param zip64: Whether to include a zip64 extra field, which is needed
+            when the sizes in the data descriptor are 8 bytes long.
+        :type zip64: bool
         """
         dt = self.timestamp
         dosdate = (dt[0] - 1980) << 9 | dt[1] << 5 | dt[2]
         dostime = dt[3] << 11 | dt[4] << 5 | (dt[5] // 2)
 
+        if zip64:
+            extraData = struct.pack(b'<hhqq', 1, 16, 0, 0)
+            extractVersion = max(45, self.extractVersion)
+            size = 0xffffffff
+        else:
+            extraData = b''
+            extractVersion = self.extractVersion
+            size = 0
         header = struct.pack(
-            b'<4s2B4HLLL2H', b'PK\003\004', self.extractVersion, 0, 0x8,
-            self.compressType, dostime, dosdate, 0, 0, 0, len(self.filename), 0)
-        return header + self.filename
+            b'<4s2B4HLLL2H', b'PK\003\004', extractVersion, 0, 0x8,
+            self.compressType, dostime, dosdate, 0, size, size, len(self.filename),
+            len(extraData))
+        return header + self.filename + extraData
 
 
 class ZipGenerator(object):
@@ -143,24 +167,19 @@ class ZipGenerator(object):
         self.offset += len(data)
         return data
 
-    def addFile(self, generator, path):
-        """
-        Generates data to add a file at the given path in the archive.
-        :param generator: Generator function that will yield the file contents.
-        :type generator: function
-        :param path: The path within the archive for this entry.
-        :type path: str
-        """
+    def _entryHeader(self, path):
         fullpath = os.path.join(self.rootPath, path)
         header = ZipInfo(fullpath, time.localtime()[0:6])
         header.externalAttr = (0o100644 & 0xFFFF) << 16
         header.compressType = self.compression
-        header.headerOffset = self.offset
+        return header
 
-        header.crc = crc = 0
-        header.compressSize = compressSize = 0
-        header.fileSize = fileSize = 0
-        yield self._advanceOffset(header.fileHeader())
+    def _entryData(self, generator, header):
+        """
+        Generates the stored data of a file, recording its size and CRC in the
+        given header as it goes.
+        """
+        crc = compressSize = fileSize = 0
         if header.compressType == DEFLATE:
             compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
                                           zlib.DEFLATED, -15)
@@ -178,88 +197,384 @@ class ZipGenerator(object):
             if compressor:
                 buf = compressor.compress(buf)
                 compressSize += len(buf)
-            yield self._advanceOffset(buf)
+            yield buf
 
         if compressor:
             buf = compressor.flush()
             compressSize += len(buf)
-            yield self._advanceOffset(buf)
+            yield buf
             header.compressSize = compressSize
         else:
             header.compressSize = fileSize
         header.crc = crc
         header.fileSize = fileSize
-        yield self._advanceOffset(header.dataDescriptor())
+
+    def _finishEntry(self, header):
+        data = self._advanceOffset(header.dataDescriptor())
         self.files.append(header)
+        return data
+
+    def addFile(self, generator, path):
+        """
+        Generates data to add a file at the given path in the archive.
+        :param generator: Generator function that will yield the file contents.
+        :type generator: function
+        :param path: The path within the archive for this entry.
+        :type path: str
+        """
+        header = self._entryHeader(path)
+        header.headerOffset = self.offset
+        yield self._advanceOffset(header.fileHeader())
+        for buf in self._entryData(generator, header):
+            yield self._advanceOffset(buf)
+        yield self._finishEntry(header)
+
+    def _prepareFile(self, generator, path, bufferSize):
+        """
+        Read and compress the start of a file ahead of time. This runs in a
+        worker thread.
+
+        :returns: A tuple of the header, the list of data read so far, and
+            the generator of the rest of the data, which is None if the whole
+            file has been read.
+        """
+        header = self._entryHeader(path)
+        data = self._entryData(generator, header)
+        buffered = []
+        size = 0
+        for buf in data:
+            buffered.append(buf)
+            size += len(buf)
+            if size >= bufferSize:
+                return header, buffered, data
+        return header, buffered, None
+
+    def addFiles(self, files, workers=None, prefetch=None, bufferSize=4 * 1024 * 1024):
+        """
+        Generates data to add many files to the archive. Upcoming files are
+        read from their generators, CRC'd, and compressed in a pool of worker
+        threads, while the archive is still generated in the order of the
+        files.
+
+        Since files that fit in ``bufferSize`` are read to their end by a
+        worker, anything their generators do once exhausted also runs in that
+        worker thread. In particular, the ``model.file.download.complete``
+        event of such files is triggered outside of the request thread, so its
+        handlers must not rely on request state such as the current user.
+
+        :param files: Iterable of (path, generator function) tuples, as
+            returned by the fileList methods of the models.
+        :param workers: The number of worker threads. If this is 0, files are
+            added one after the other in the calling thread. Defaults to the
+            ``zip_download_workers`` option of the ``[server]`` configuration
+            section.
+        :type workers: int
+        :param prefetch: The number of files that are prepared ahead of the one
+            being generated. Defaults to twice the number of workers.
+        :type prefetch: int
+        :param bufferSize: How much data of each prepared file is held in
+            memory. The remainder of larger files is read once the file is
+            reached.
+        :type bufferSize: int
+        """
+        if workers is None:
+            from girder.utility import config
+            workers = config.getConfig()['server'].get('zip_download_workers', 4)
+        if not workers:
+            for path, generator in files:
+                for data in self.addFile(generator, path):
+                    yield data
+            return
+
+        prefetch = prefetch or workers * 2
+        pool = ThreadPool(workers)
+        pending = collections.deque()
+        files = iter(files)
+        try:
+            while True:
+                while len(pending) < prefetch:
+                    entry = next(files, None)
+                    if entry is None:
+                        break
+                    pending.append(pool.apply_async(
+                        self._prepareFile, (entry[1], entry[0], bufferSize)))
+                if not pending:
+                    break
+                header, buffered, rest = pending.popleft().get()
+                header.headerOffset = self.offset
+                yield self._advanceOffset(header.fileHeader())
+                for buf in buffered:
+                    yield self._advanceOffset(buf)
+                if rest is not None:
+                    for buf in rest:
+                        yield self._advanceOffset(buf)
+                yield self._finishEntry(header)
+        finally:
+            pool.terminate()
 
     def footer(self):
         """
         Once all zip files have been added with addFile, you must call this
         to get the footer of the archive.
         """
-        data = []
-        count = 0
-        pos1 = self.offset
-        for header in self.files:
-            count += 1
-            dt = header.timestamp
-            dosdate = (dt[0] - 1980) << 9 | dt[1] << 5 | dt[2]
-            dostime = dt[3] << 11 | dt[4] << 5 | (dt[5] // 2)
-            extra = []
-            if header.fileSize > Z64_LIMIT or header.compressSize > Z64_LIMIT:
-                extra.append(header.fileSize)
-                extra.append(header.compressSize)
-                fileSize = compressSize = 0xffffffff
-            else:
-                fileSize = header.fileSize
-                compressSize = header.compressSize
-
-            if header.headerOffset > Z64_LIMIT:
-                extra.append(header.headerOffset)
-                headerOffset = 0xffffffff
-            else:
-                headerOffset = header.headerOffset
-
-            if extra:
-                extraData = struct.pack(
-                    b'<hh' + b'q'*len(extra), 1, 8*len(extra), *extra)
-                extractVersion = max(45, header.extractVersion)
-                createVersion = max(45, header.createVersion)
-            else:
-                extraData = b''
-                extractVersion = header.extractVersion
-                createVersion = header.createVersion
-
-            centdir = struct.pack(
-                b'<4s4B4HLLL5HLL', b'PK\001\002', createVersion,
-                header.createSystem, extractVersion, 0, 0x8,
-                header.compressType, dostime, dosdate, header.crc, compressSize,
-                fileSize, len(header.filename), len(extraData), 0, 0, 0,
-                header.externalAttr, headerOffset)
-
-            data.append(self._advanceOffset(centdir))
-            data.append(self._advanceOffset(header.filename))
-            data.append(self._advanceOffset(extraData))
-
-        pos2 = self.offset
-        offsetVal = pos1
-        size = pos2 - pos1
-
-        if pos1 > Z64_LIMIT or size > Z64_LIMIT or count >= Z_FILECOUNT_LIMIT:
-            zip64endrec = struct.pack(
-                b'<4sqhhLLqqqq', b'PK\x06\x06', 44, 45, 45, 0, 0, count, count,
-                size, pos1)
-            data.append(self._advanceOffset(zip64endrec))
-
-            zip64locrec = struct.pack(b'<4sLqL', b'PK\x06\x07', 0, pos2, 1)
-            data.append(self._advanceOffset(zip64locrec))
-
-            count = min(count, 0xFFFF)
-            size = min(size, 0xFFFFFFFF)
-            offsetVal = min(offsetVal, 0xFFFFFFFF)
-
-        endrec = struct.pack(b'<4s4H2LH', b'PK\005\006', 0, 0, count, count,
-                             size, offsetVal, 0)
-        data.append(self._advanceOffset(endrec))
-
-        return b''.join(data)
+        return self._advanceOffset(_centralDirectory(self.files, self.offset))
+
+
+class SeekableZipGenerator(object):
+    """
+    This class generates an uncompressed zip archive whose layout is computed
+    from the sizes of its entries before any of their data is read. The length
+    of the archive is therefore known ahead of time, and any byte range of it
+    can be generated on its own, which allows serving HTTP Range requests.
+
+    The CRC32 of an entry is only needed for its data descriptor and the
+    central directory. If it is not given, it is computed while the data of
+    the entry is generated, or by reading the whole entry when a range that
+    starts after its data needs it.
+    """
+    def __init__(self, rootPath=''):
+        """
+        :param rootPath: The root path for all files within this archive.
+        :type rootPath: str
+        """
+        self.rootPath = rootPath
+        self.entries = []
+        self._segments = None
+        self._centralDirectoryData = None
+
+    def addEntry(self, path, size, read, timestamp, crc=None, onCrc=None, crcRead=None):
+        """
+        Add an entry to the archive.
+
+        :param path: The path within the archive for this entry.
+        :type path: str
+        :param size: The size of the entry in bytes.
+        :type size: int
+        :param read: A function taking a start and a (non-inclusive) end byte
+            and returning an iterable of the data of the entry in that range.
+        :type read: function
+        :param timestamp: The modification time of the entry, as a (year,
+            month, day, hour, minute, second) tuple.
+        :type timestamp: tuple
+        :param crc: The CRC32 of the data of the entry, if it is known.
+        :type crc: int or None
+        :param onCrc: A function called with the CRC32 of the entry when it is
+            computed, so that it can be stored for later archives.
+        :type onCrc: function or None
+        :param crcRead: A function like ``read`` that is used instead of it
+            when the whole entry is read only to compute its CRC32, rather than
+            to be sent. Defaults to ``read``.
+        :type crcRead: function or None
+        """
+        header = ZipInfo(os.path.join(self.rootPath, path), timestamp)
+        header.externalAttr = (0o100644 & 0xFFFF) << 16
+        header.compressType = STORE
+        header.fileSize = header.compressSize = size
+        header.crc = crc
+        self.entries.append((header, read, onCrc, crcRead or read))
+        self._segments = None
+
+    def addData(self, path, data, timestamp):
+        """
+        Add an entry whose data is held in memory.
+
+        :param path: The path within the archive for this entry.
+        :type path: str
+        :param data: The data of the entry.
+        :type data: bytes or str
+        :param timestamp: The modification time of the entry.
+        :type timestamp: tuple
+        """
+        if isinstance(data, six.text_type):
+            data = data.encode('utf8')
+        self.addEntry(
+            path, len(data), lambda offset, endByte: [data[offset:endByte]], timestamp,
+            crc=binascii.crc32(data) & 0xFFFFFFFF)
+
+    @property
+    def size(self):
+        """
+        The length of the archive in bytes.
+        """
+        start, length, _ = self._layout()[-1]
+        return start + length
+
+    def _layout(self):
+        """
+        Compute the segments of the archive. Each segment is a tuple of its
+        offset, its length, and a function generating the data of a range
+        within it.
+        """
+        if self._segments is not None:
+            return self._segments
+        segments = []
+        offset = 0
+        for entry in self.entries:
+            header = entry[0]
+            zip64 = header.fileSize > Z64_LIMIT
+            header.headerOffset = offset
+            localHeader = header.fileHeader(zip64=zip64)
+            segments.append((offset, len(localHeader), self._bytesReader(localHeader)))
+            offset += len(localHeader)
+            segments.append((offset, header.fileSize, functools.partial(self._entryData, entry)))
+            offset += header.fileSize
+            length = 24 if zip64 else 16
+            segments.append((offset, length, functools.partial(self._dataDescriptor, entry)))
+            offset += length
+        length = len(_centralDirectory(
+            [entry[0] for entry in self.entries], offset, crc=lambda header: 0))
+        segments.append((offset, length, self._centralDirectory))
+        self._segments = segments
+        self._centralDirectoryData = None
+        return segments
+
+    def _bytesReader(self, data):
+        return lambda offset, endByte: [data[offset:endByte]]
+
+    def _setCrc(self, entry, crc):
+        header, _, onCrc, _ = entry
+        header.crc = crc
+        if onCrc:
+            onCrc(crc)
+
+    def _crc(self, entry):
+        header, _, _, crcRead = entry
+        if header.crc is None:
+            crc = 0
+            for buf in crcRead(0, header.fileSize) if header.fileSize else ():
+                if isinstance(buf, six.text_type):
+                    buf = buf.encode('utf8')
+                crc = binascii.crc32(buf, crc) & 0xFFFFFFFF
+            self._setCrc(entry, crc)
+        return header.crc
+
+    def _entryData(self, entry, offset, endByte):
+        header, read, _, _ = entry
+        computeCrc = header.crc is None and offset == 0 and endByte == header.fileSize
+        crc = 0
+        for buf in read(offset, endByte):
+            if isinstance(buf, six.text_type):
+                buf = buf.encode('utf8')
+            if computeCrc:
+                crc = binascii.crc32(buf, crc) & 0xFFFFFFFF
+            yield buf
+        if computeCrc:
+            self._setCrc(entry, crc)
+
+    def _dataDescriptor(self, entry, offset, endByte):
+        header = entry[0]
+        self._crc(entry)
+        return [header.dataDescriptor()[offset:endByte]]
+
+    def _centralDirectory(self, offset, endByte):
+        if self._centralDirectoryData is None:
+            for entry in self.entries:
+                self._crc(entry)
+            self._centralDirectoryData = _centralDirectory(
+                [entry[0] for entry in self.entries], self._layout()[-1][0])
+        return [self._centralDirectoryData[offset:endByte]]
+
+    def generate(self, offset=0, endByte=None):
+        """
+        Generate the data of a range of the archive.
+
+        :param offset: The first byte of the range.
+        :type offset: int
+        :param endByte: The end of the range (non-inclusive). Defaults to the
+            end of the archive.
+        :type endByte: int or None
+        """
+        segments = self._layout()
+        size = self.size
+        endByte = size if endByte is None else min(endByte, size)
+        index = max(bisect.bisect_right([segment[0] for segment in segments], offset) - 1, 0)
+        for start, length, reader in segments[index:]:
+            if start >= endByte:
+                break
+            segmentOffset = max(offset - start, 0)
+            segmentEnd = min(endByte - start, length)
+            if segmentOffset < segmentEnd:
+                for buf in reader(segmentOffset, segmentEnd):
+                    yield buf
+
+
+def _centralDirectory(headers, offset, crc=None):
+    """
+    Generate the central directory and end records of an archive.
+
+    :param headers: The ZipInfo headers of the entries of the archive.
+    :param offset: The offset in the archive where the central directory
+        starts.
+    :type offset: int
+    :param crc: A function returning the CRC32 of the entry of a header. By
+        default the crc of the header is used.
+    :returns: The binary central directory.
+    """
+    crc = crc or (lambda header: header.crc)
+    data = []
+    count = 0
+    pos1 = offset
+    for header in headers:
+        count += 1
+        dt = header.timestamp
+        dosdate = (dt[0] - 1980) << 9 | dt[1] << 5 | dt[2]
+        dostime = dt[3] << 11 | dt[4] << 5 | (dt[5] // 2)
+        extra = []
+        if header.fileSize > Z64_LIMIT or header.compressSize > Z64_LIMIT:
+            extra.append(header.fileSize)
+            extra.append(header.compressSize)
+            fileSize = compressSize = 0xffffffff
+        else:
+            fileSize = header.fileSize
+            compressSize = header.compressSize
+
+        if header.headerOffset > Z64_LIMIT:
+            extra.append(header.headerOffset)
+            headerOffset = 0xffffffff
+        else:
+            headerOffset = header.headerOffset
+
+        if extra:
+            extraData = struct.pack(
+                b'<hh' + b'q'*len(extra), 1, 8*len(extra), *extra)
+            extractVersion = max(45, header.extractVersion)
+            createVersion = max(45, header.createVersion)
+        else:
+            extraData = b''
+            extractVersion = header.extractVersion
+            createVersion = header.createVersion
+
+        centdir = struct.pack(
+            b'<4s4B4HLLL5HLL', b'PK\001\002', createVersion,
+            header.createSystem, extractVersion, 0, 0x8,
+            header.compressType, dostime, dosdate, crc(header), compressSize,
+            fileSize, len(header.filename), len(extraData), 0, 0, 0,
+            header.externalAttr, headerOffset)
+
+        data.append(centdir)
+        data.append(header.filename)
+        data.append(extraData)
+        offset += len(centdir) + len(header.filename) + len(extraData)
+
+    pos2 = offset
+    offsetVal = pos1
+    size = pos2 - pos1
+
+    if pos1 > Z64_LIMIT or size > Z64_LIMIT or count >= Z_FILECOUNT_LIMIT:
+        zip64endrec = struct.pack(
+            b'<4sqhhLLqqqq', b'PK\x06\x06', 44, 45, 45, 0, 0, count, count,
+            size, pos1)
+        data.append(zip64endrec)
+
+        zip64locrec = struct.pack(b'<4sLqL', b'PK\x06\x07', 0, pos2, 1)
+        data.append(zip64locrec)
+
+        count = min(count, 0xFFFF)
+        size = min(size, 0xFFFFFFFF)
+        offsetVal = min(offsetVal, 0xFFFFFFFF)
+
+    endrec = struct.pack(b'<4s4H2LH', b'PK\005\006', 0, 0, count, count,
+                         size, offsetVal, 0)
+    data.append(endrec)
+
+    return b''.join(data)
@@ -1,10 +1,14 @@
 import cherrypy
+import collections
 import datetime
 import logging
-from girder import auditLogger
+import threading
+import time
+from girder import auditLogger, logger
 from girder.models.model_base import Model
 from girder.api.rest import getCurrentUser
 from girder.plugin import GirderPlugin
+from girder.utility import config
 
 
 class Record(Model):
@@ -16,19 +20,177 @@ class Record(Model):
 
 
 class _AuditLogDatabaseHandler(logging.Handler):
+    """
+    Buffers audit log records in memory and writes them to the database in
+    batches from a background thread, so that requests do not wait on a
+    database write for each record.
+
+    The buffer is tuned by the ``[audit_logs]`` section of the configuration
+    file:
+
+    ``buffer_size``
+        The most records held in memory (default 10000).
+    ``batch_size``
+        Records are written as soon as this many are buffered (default 100).
+    ``flush_interval``
+        The longest time in seconds a record waits to be written (default 1).
+    ``overflow``
+        What to do with new records when the buffer is full: ``drop`` them
+        (the default), or ``block`` the request until there is room.
+    """
+    OVERFLOW_POLICIES = ('drop', 'block')
+
+    def __init__(self, bufferSize=None, batchSize=None, flushInterval=None, overflow=None):
+        super(_AuditLogDatabaseHandler, self).__init__()
+        settings = config.getConfig().get('audit_logs', {})
+        self.bufferSize = int(
+            bufferSize if bufferSize is not None else settings.get('buffer_size', 10000))
+        self.batchSize = int(
+            batchSize if batchSize is not None else settings.get('batch_size', 100))
+        self.flushInterval = float(
+            flushInterval if flushInterval is not None else settings.get('flush_interval', 1))
+        self.overflow = overflow or settings.get('overflow', 'drop')
+        if self.overflow not in self.OVERFLOW_POLICIES:
+            logger.warning('Unknown audit_logs overflow policy %r, using "drop".', self.overflow)
+            self.overflow = 'drop'
+
+        self._buffer = collections.deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._writing = 0
+        self._stats = {
+            'flushed': 0,
+            'dropped': 0,
+            'failed': 0
+        }
+
     def handle(self, record):
         user = getCurrentUser()
-        Record().save({
+        doc = {
             'type': record.msg,
             'details': record.details,
             'ip': cherrypy.request.remote.ip,
             'userId': user and user['_id'],
             'when': datetime.datetime.utcnow()
-        }, triggerEvents=False)
+        }
+        with self._condition:
+            closed = self._closed
+        if closed:
+            # Records emitted after shutdown are written directly.
+            self._write([doc])
+            return
+        with self._condition:
+            while len(self._buffer) >= self.bufferSize:
+                if self.overflow == 'drop':
+                    self._stats['dropped'] += 1
+                    if self._stats['dropped'] == 1:
+                        logger.warning(
+                            'The audit log buffer is full, dropping records.')
+                    return
+                self._condition.wait()
+            self._buffer.append(doc)
+            self._start()
+            if len(self._buffer) >= self.batchSize:
+                self._condition.notify_all()
+
+    def _start(self):
+        """
+        Start the writer thread if it is not running. This is called with the
+        condition held.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='AuditLogWriter')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                deadline = time.time() + self.flushInterval
+                while not self._closed and len(self._buffer) < self.batchSize:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._closed:
+                    self._thread = None
+                    return
+                docs = self._take()
+            self._write(docs)
+            with self._condition:
+                self._writing -= 1
+                self._condition.notify_all()
+
+    def _take(self):
+        """
+        Remove up to one batch of records from the buffer. This is called with
+        the condition held, and the caller must decrement ``_writing`` once the
+        records are written.
+        """
+        docs = [self._buffer.popleft() for _ in range(min(self.batchSize, len(self._buffer)))]
+        self._writing += 1
+        # Make room for requests blocked on a full buffer.
+        self._condition.notify_all()
+        return docs
+
+    def _write(self, docs):
+        if not docs:
+            return
+        try:
+            Record().collection.insert_many(docs)
+        except Exception:
+            logger.exception('Failed to write %d audit log records.', len(docs))
+            with self._condition:
+                self._stats['failed'] += len(docs)
+        else:
+            with self._condition:
+                self._stats['flushed'] += len(docs)
+
+    def flush(self):
+        """
+        Write all buffered records, and wait for writes in progress.
+        """
+        while True:
+            with self._condition:
+                if not self._buffer:
+                    while self._writing:
+                        self._condition.wait()
+                    return
+                docs = self._take()
+            self._write(docs)
+            with self._condition:
+                self._writing -= 1
+                self._condition.notify_all()
+
+    def close(self):
+        """
+        Stop the writer thread and write the remaining records.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self.flush()
+        super(_AuditLogDatabaseHandler, self).close()
+
+    def stats(self):
+        """
+        Return the number of records written, dropped because the buffer was
+        full, or lost to a failed write, and the number currently buffered.
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats['buffered'] = len(self._buffer)
+        return stats
 
 
 class AuditLogsPlugin(GirderPlugin):
     DISPLAY_NAME = 'Audit logging'
 
     def load(self, info):
-        auditLogger.addHandler(_AuditLogDatabaseHandler())
+        handler = _AuditLogDatabaseHandler()
+        auditLogger.addHandler(handler)
+        cherrypy.engine.subscribe('stop', handler.close)
@@ -18,38 +18,49 @@
 ###############################################################################
 
 
+import cherrypy
+
 from girder import events
 from girder.constants import AccessType
 from girder.models.file import File
 from girder.plugin import GirderPlugin
 
+from .counter import DownloadCounter
+from .models import DailyDownloadStatistics
+from .rest import getDownloadStatistics
+
+counter = None
+
 
 def _onDownloadFileRequest(event):
-    if event.info['startByte'] == 0:
-        File().increment(
-            query={'_id': event.info['file']['_id']},
-            field='downloadStatistics.started',
-            amount=1)
-    File().increment(
-        query={'_id': event.info['file']['_id']},
-        field='downloadStatistics.requested',
-        amount=1)
+    counter.add(
+        event.info['file']['_id'], started=int(event.info['startByte'] == 0), requested=1)
 
 
 def _onDownloadFileComplete(event):
-    File().increment(
-        query={'_id': event.info['file']['_id']},
-        field='downloadStatistics.completed',
-        amount=1)
+    counter.add(event.info['file']['_id'], completed=1)
+
+
+def _onFileRemove(event):
+    DailyDownloadStatistics().removeWithQuery({'fileId': event.info['_id']})
 
 
 class DownloadStatisticsPlugin(GirderPlugin):
     DISPLAY_NAME = 'Download Statistics'
 
     def load(self, info):
+        global counter
+        # Counts are written to the database in the background
+        counter = DownloadCounter()
+        cherrypy.engine.subscribe('stop', counter.stop)
+
         # Bind REST events
         events.bind('model.file.download.request', 'download_statistics', _onDownloadFileRequest)
         events.bind('model.file.download.complete', 'download_statistics', _onDownloadFileComplete)
+        events.bind('model.file.remove', 'download_statistics', _onFileRemove)
 
         # Add download count fields to file model
         File().exposeFields(level=AccessType.READ, fields='downloadStatistics')
+
+        info['apiRoot'].file.route(
+            'GET', (':id', 'download_statistics'), getDownloadStatistics)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+
+import collections
+import datetime
+import threading
+from pymongo import UpdateOne
+
+from girder import logger
+from girder.models.file import File
+from girder.utility import config
+
+from .models import DailyDownloadStatistics
+
+
+class DownloadCounter(object):
+    """
+    Accumulates the download statistics of files in memory and periodically
+    adds them to the file documents, and optionally to per-day counts, with
+    one bulk write each. Repeated range requests for the same file only
+    change a counter in memory.
+
+    The counter is tuned by the ``[download_statistics]`` section of the
+    configuration file:
+
+    ``flush_interval``
+        The time in seconds between writes (default 5). If 0, every download
+        event is written immediately.
+    ``daily``
+        Whether to also count downloads per file and UTC day (default false).
+    """
+    def __init__(self, flushInterval=None, daily=None):
+        settings = config.getConfig().get('download_statistics', {})
+        self.flushInterval = float(
+            flushInterval if flushInterval is not None else settings.get('flush_interval', 5))
+        self.daily = bool(daily if daily is not None else settings.get('daily', False))
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._flushLock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+        self._resetCounts()
+        self._stats = {
+            'events': 0,
+            'flushes': 0,
+            'fileUpdates': 0,
+            'dailyUpdates': 0,
+            'failed': 0
+        }
+
+    def _resetCounts(self):
+        self._counts = collections.defaultdict(collections.Counter)
+        self._dailyCounts = collections.defaultdict(collections.Counter)
+
+    def add(self, fileId, **amounts):
+        """
+        Count download events of a file.
+
+        :param fileId: The ID of the file.
+        :param amounts: The amounts to add to the 'started', 'requested',
+            and 'completed' counts.
+        """
+        amounts = {field: amount for field, amount in amounts.items() if amount}
+        if not amounts:
+            return
+        day = DailyDownloadStatistics.day(datetime.datetime.utcnow())
+        with self._lock:
+            self._counts[fileId].update(amounts)
+            if self.daily:
+                self._dailyCounts[(fileId, day)].update(amounts)
+            self._stats['events'] += 1
+            if self.flushInterval > 0 and self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run, name='DownloadCounter')
+                self._thread.daemon = True
+                self._thread.start()
+        if self.flushInterval <= 0 or self._stopped:
+            self.flush()
+
+    def _run(self):
+        while not self._event.wait(self.flushInterval):
+            self.flush()
+
+    def flush(self):
+        """
+        Write the accumulated counts to the database.
+        """
+        with self._flushLock:
+            with self._lock:
+                counts, dailyCounts = self._counts, self._dailyCounts
+                self._resetCounts()
+            if not counts and not dailyCounts:
+                return
+            stats = collections.Counter()
+            try:
+                if counts:
+                    File().collection.bulk_write([
+                        UpdateOne({'_id': fileId}, {'$inc': {
+                            'downloadStatistics.%s' % field: amount
+                            for field, amount in amounts.items()}})
+                        for fileId, amounts in counts.items()
+                    ])
+                stats['fileUpdates'] += len(counts)
+            except Exception:
+                logger.exception('Failed to write download statistics.')
+                stats['failed'] += len(counts)
+            try:
+                DailyDownloadStatistics().increment(
+                    {key: dict(amounts) for key, amounts in dailyCounts.items()})
+                stats['dailyUpdates'] += len(dailyCounts)
+            except Exception:
+                logger.exception('Failed to write daily download statistics.')
+                stats['failed'] += len(dailyCounts)
+            stats['flushes'] += 1
+            with self._lock:
+                for key, value in stats.items():
+                    self._stats[key] += value
+
+    def stop(self):
+        """
+        Stop the writer thread and write the remaining counts. Counts added
+        afterwards are written immediately.
+        """
+        with self._lock:
+            self._stopped = True
+            thread = self._thread
+        self._event.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        """
+        Return the number of download events counted, of flushes, of file and
+        daily documents updated, and of updates lost to failed writes, and the
+        number of files with counts waiting to be written.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pendingFiles'] = len(self._counts)
+        return stats
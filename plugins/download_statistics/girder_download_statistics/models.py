@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+
+import datetime
+from pymongo import UpdateOne
+
+from girder.constants import SortDir
+from girder.models.model_base import Model
+
+FIELDS = ('started', 'requested', 'completed')
+INTERVALS = ('day', 'month', 'year')
+
+
+class DailyDownloadStatistics(Model):
+    """
+    The download statistics of files, counted per day. Each document holds the
+    counts of one file on one UTC day.
+    """
+    def initialize(self):
+        self.name = 'download_statistics_daily'
+        self.ensureIndices([
+            ((('fileId', SortDir.ASCENDING), ('date', SortDir.ASCENDING)), {'unique': True}),
+            'date'
+        ])
+
+    def validate(self, doc):
+        return doc
+
+    @staticmethod
+    def day(when):
+        """
+        Return the start of the UTC day of a date or datetime.
+        """
+        return datetime.datetime(when.year, when.month, when.day)
+
+    def increment(self, counts):
+        """
+        Add to the daily counts of several files in one bulk write.
+
+        :param counts: A dict mapping (fileId, day) tuples to dicts of the
+            amounts to add to each field.
+        :type counts: dict
+        """
+        if not counts:
+            return
+        self.collection.bulk_write([
+            UpdateOne({'fileId': fileId, 'date': day}, {'$inc': amounts}, upsert=True)
+            for (fileId, day), amounts in counts.items()
+        ])
+
+    def aggregate(self, fileId, start=None, end=None, interval='day'):
+        """
+        Sum the daily counts of a file over days, months, or years.
+
+        :param fileId: The ID of the file.
+        :param start: If set, only count days starting from this date.
+        :type start: datetime.date or None
+        :param end: If set, only count days before this date.
+        :type end: datetime.date or None
+        :param interval: One of 'day', 'month', or 'year'.
+        :returns: A list of dicts with the start date of each interval that
+            has downloads, and the sum of each field, in chronological order.
+        """
+        query = {'fileId': fileId}
+        if start is not None or end is not None:
+            query['date'] = {}
+            if start is not None:
+                query['date']['$gte'] = self.day(start)
+            if end is not None:
+                query['date']['$lt'] = self.day(end)
+        group = {'year': {'$year': '$date'}}
+        if interval in ('day', 'month'):
+            group['month'] = {'$month': '$date'}
+        if interval == 'day':
+            group['day'] = {'$dayOfMonth': '$date'}
+        grouping = {'_id': group}
+        grouping.update({field: {'$sum': '$' + field} for field in FIELDS})
+
+        results = []
+        for doc in self.collection.aggregate([
+            {'$match': query},
+            {'$group': grouping},
+            {'$sort': {'_id.year': 1, '_id.month': 1, '_id.day': 1}}
+        ]):
+            key = doc.pop('_id')
+            doc['date'] = datetime.datetime(key['year'], key.get('month', 1), key.get('day', 1))
+            results.append(doc)
+        return results
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+
+from girder.api import access
+from girder.api.describe import Description, autoDescribeRoute
+from girder.api.rest import boundHandler
+from girder.constants import AccessType
+from girder.models.file import File
+
+from .models import DailyDownloadStatistics, INTERVALS
+
+
+@access.public
+@boundHandler
+@autoDescribeRoute(
+    Description('Get the download statistics of a file per day, month, or year.')
+    .notes('Downloads are only counted per day when the "daily" option of the '
+           '[download_statistics] configuration section is set. Intervals without '
+           'downloads are omitted.')
+    .modelParam('id', model=File, level=AccessType.READ)
+    .param('start', 'Only count downloads from this date on.', required=False,
+           dataType='date')
+    .param('end', 'Only count downloads before this date.', required=False,
+           dataType='date')
+    .param('interval', 'The period to sum downloads over.', required=False,
+           enum=INTERVALS, default='day')
+    .errorResponse()
+    .errorResponse('Read access was denied on the file.', 403)
+)
+def getDownloadStatistics(self, file, start, end, interval):
+    return DailyDownloadStatistics().aggregate(
+        file['_id'], start=start, end=end, interval=interval)
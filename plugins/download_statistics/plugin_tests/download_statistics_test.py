@@ -18,16 +18,22 @@
 ###############################################################################
 
 
-import os
+import datetime
 import json
+import mock
+import os
 
 from tests import base
 from girder.constants import ROOT_DIR
+import girder_download_statistics
+from girder_download_statistics.counter import DownloadCounter
+from girder_download_statistics.models import DailyDownloadStatistics
 from girder.models.collection import Collection
 from girder.models.folder import Folder
 from girder.models.item import Item
 from girder.models.upload import Upload
 from girder.models.user import User
+from girder.models.file import File
 
 
 def setUpModule():
@@ -88,6 +94,7 @@ class DownloadStatisticsTestCase(base.TestCase):
 
     def _checkDownloadsCount(self, fileId, started, requested, completed):
         # Downloads file info and asserts download statistics are accurate
+        girder_download_statistics.counter.flush()
         path = '/file/%s' % str(fileId)
         resp = self.request(path, isJson=True)
         self.assertStatusOk(resp)
@@ -194,3 +201,60 @@ class DownloadStatisticsTestCase(base.TestCase):
 
         self._checkDownloadsCount(file1['_id'], 14, 18, 13)
         self._checkDownloadsCount(file2['_id'], 15, 19, 14)
+
+    def testRangeRequestsAreCombined(self):
+        folder = Folder().createFolder(self.admin, 'folder1', parentType='user', public=True)
+        with open(os.path.join(self.filesDir, 'txt1.txt'), 'rb') as fp:
+            file = Upload().uploadFromFile(
+                fp, 5, 'txt1.txt', parentType='folder', parent=folder, user=self.admin)
+        counter = DownloadCounter(flushInterval=3600)
+
+        collection = File().collection
+        with mock.patch.object(girder_download_statistics, 'counter', counter), \
+                mock.patch.object(collection, 'bulk_write',
+                                  side_effect=collection.bulk_write) as bulkWrite:
+            self._downloadPartialFile(file['_id'])
+            self._downloadFileInTwoChunks(file['_id'])
+            # Nothing is written until the counts are flushed
+            self.assertEqual(bulkWrite.call_count, 0)
+            counter.stop()
+        self.assertEqual(bulkWrite.call_count, 1)
+        self.assertEqual(len(bulkWrite.call_args[0][0]), 1)
+        self.assertEqual(counter.stats()['fileUpdates'], 1)
+        self._checkDownloadsCount(file['_id'], 2, 6, 1)
+
+    def testDailyStatistics(self):
+        folder = Folder().createFolder(self.admin, 'folder1', parentType='user', public=True)
+        with open(os.path.join(self.filesDir, 'txt1.txt'), 'rb') as fp:
+            file = Upload().uploadFromFile(
+                fp, 5, 'txt1.txt', parentType='folder', parent=folder, user=self.admin)
+        counter = DownloadCounter(flushInterval=3600, daily=True)
+        with mock.patch.object(girder_download_statistics, 'counter', counter):
+            self._downloadFile(file['_id'])
+            self._downloadPartialFile(file['_id'])
+        counter.stop()
+
+        today = datetime.datetime.utcnow()
+        path = '/file/%s/download_statistics' % file['_id']
+        resp = self.request(path)
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json, [{
+            'date': datetime.datetime(today.year, today.month, today.day).isoformat() + '+00:00',
+            'started': 2,
+            'requested': 5,
+            'completed': 1
+        }])
+
+        resp = self.request(path, params={'interval': 'year'})
+        self.assertStatusOk(resp)
+        self.assertEqual(len(resp.json), 1)
+        self.assertEqual(resp.json[0]['date'][:10], '%d-01-01' % today.year)
+
+        tomorrow = today + datetime.timedelta(days=1)
+        resp = self.request(path, params={'start': tomorrow.strftime('%Y-%m-%d')})
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json, [])
+
+        # Removing the file removes its statistics
+        File().remove(file)
+        self.assertEqual(DailyDownloadStatistics().find().count(), 0)
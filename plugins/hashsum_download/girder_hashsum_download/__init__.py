@@ -31,25 +31,39 @@ from girder.constants import AccessType, TokenScope
 from girder.exceptions import ValidationException, RestException
 from girder.models.file import File as FileModel
 from girder.models.setting import Setting
-from girder.plugin import GirderPlugin
-from girder.utility import setting_utilities
+from girder.plugin import getPlugin, GirderPlugin
+from girder.utility import hash_state, setting_utilities
 from girder.utility.progress import ProgressContext, noProgress
+from girder_jobs.models.job import Job
 
-SUPPORTED_ALGORITHMS = {'sha512'}
+# The algorithms that can be enabled with the ALGORITHMS setting. These are the
+# ones whose state girder.utility.hash_state can save between chunks.
+AVAILABLE_ALGORITHMS = frozenset({'md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512'})
 _CHUNK_LEN = 65536
 
 
 class PluginSettings(object):
+    ALGORITHMS = 'hashsum_download.algorithms'
     AUTO_COMPUTE = 'hashsum_download.auto_compute'
 
 
+def getSupportedAlgorithms():
+    """
+    Return the checksum algorithms enabled by the ALGORITHMS setting.
+
+    :returns: The names of the algorithms.
+    :rtype: set
+    """
+    return set(Setting().get(PluginSettings.ALGORITHMS))
+
+
 class HashedFile(File):
     @property
     def supportedAlgorithms(self):
         girder.logger.warning(
             'HashedFile.supportedAlgorithms is deprecated, use the module-level '
-            'SUPPORTED_ALGORITHMS instead.')
-        return SUPPORTED_ALGORITHMS
+            'getSupportedAlgorithms() instead.')
+        return getSupportedAlgorithms()
 
     def __init__(self, node):
         super(HashedFile, self).__init__()
@@ -58,6 +72,7 @@ class HashedFile(File):
         node.route('GET', ('hashsum', ':algo', ':hash', 'download'), self.downloadWithHash)
         node.route('GET', (':id', 'hashsum_file', ':algo'), self.downloadKeyFile)
         node.route('POST', (':id', 'hashsum'), self.computeHashes)
+        node.route('POST', ('hashsum', 'backfill'), self.backfillHashes)
 
     @access.cookie
     @access.public(scope=TokenScope.DATA_READ)
@@ -65,7 +80,7 @@ class HashedFile(File):
         Description('Download the hashsum key file for a given file.')
         .modelParam('id', 'The ID of the file.', model=FileModel, level=AccessType.READ)
         .param('algo', 'The hashsum algorithm.', paramType='path', lower=True,
-               enum=SUPPORTED_ALGORITHMS)
+               enum=sorted(AVAILABLE_ALGORITHMS))
         .notes('This is meant to be used in conjunction with CMake\'s ExternalData module.')
         .produces('text/plain')
         .errorResponse()
@@ -91,7 +106,7 @@ class HashedFile(File):
     @autoDescribeRoute(
         Description('Download a file by its hashsum.')
         .param('algo', 'The type of the given hashsum (case insensitive).',
-               paramType='path', lower=True, enum=SUPPORTED_ALGORITHMS)
+               paramType='path', lower=True, enum=sorted(AVAILABLE_ALGORITHMS))
         .param('hash', 'The hexadecimal hashsum of the file to download (case insensitive).',
                paramType='path', lower=True)
         .errorResponse('No file with the given hash exists.')
@@ -109,7 +124,7 @@ class HashedFile(File):
     @autoDescribeRoute(
         Description('Return a list of files matching a hashsum.')
         .param('algo', 'The type of the given hashsum (case insensitive).',
-               paramType='path', lower=True, enum=SUPPORTED_ALGORITHMS)
+               paramType='path', lower=True, enum=sorted(AVAILABLE_ALGORITHMS))
         .param('hash', 'The hexadecimal hashsum of the file to download (case insensitive).',
                paramType='path', lower=True)
     )
@@ -136,13 +151,35 @@ class HashedFile(File):
                 user=self.getCurrentUser()) as pc:
             return _computeHash(file, progress=pc)
 
+    @access.admin(scope=TokenScope.DATA_WRITE)
+    @filtermodel(model=Job)
+    @autoDescribeRoute(
+        Description('Compute the missing checksums of all files in a background job.')
+        .notes('Files are read by several threads at once. The job reports its '
+               'progress and throughput.')
+        .param('workers', 'The number of files to hash at the same time.',
+               dataType='integer', default=4, required=False)
+        .errorResponse()
+        .errorResponse('Admin access was denied.', 403)
+    )
+    def backfillHashes(self, workers):
+        if workers < 1:
+            raise RestException('The number of workers must be at least 1.')
+        job = Job().createLocalJob(
+            title='Compute missing file checksums', user=self.getCurrentUser(),
+            type='hashsum_download.backfill', public=False,
+            module='girder_hashsum_download.backfill', kwargs={'workers': workers})
+        Job().scheduleJob(job)
+        return job
+
     def _validateAlgo(self, algo):
         """
         Print an exception if a user requests an invalid checksum algorithm.
         """
-        if algo not in SUPPORTED_ALGORITHMS:
+        algorithms = getSupportedAlgorithms()
+        if algo not in algorithms:
             msg = 'Invalid algorithm "%s". Supported algorithms: %s.' % (
-                algo, ', '.join(SUPPORTED_ALGORITHMS))
+                algo, ', '.join(sorted(algorithms)))
             raise RestException(msg, code=400)
 
     def _getFirstFileByHash(self, algo, hash, user=None):
@@ -172,6 +209,34 @@ class HashedFile(File):
         return None
 
 
+def _initUploadHashes(event):
+    """
+    Event hook that asks the assetstore adapter to compute the supported
+    checksums while the upload is received, so that they need not be computed
+    from the stored file afterward. The sha512 is always computed.
+    """
+    algorithms = getSupportedAlgorithms() - {'sha512'}
+    if algorithms:
+        event.info['hashStates'] = {
+            alg: hash_state.serializeHex(hashlib.new(alg)) for alg in algorithms}
+
+
+def _clearReplacedHashes(event):
+    """
+    Event hook that removes outdated checksums when the contents of a file
+    are replaced. Checksums that the assetstore did not compute for the new
+    contents still have their previous values.
+    """
+    file, upload = event.info['file'], event.info['upload']
+    if 'fileId' not in upload:
+        return
+    algorithms = getSupportedAlgorithms()
+    previous = FileModel().load(file['_id'], force=True, fields=list(algorithms))
+    for alg in algorithms:
+        if alg in file and file[alg] == previous.get(alg):
+            del file[alg]
+
+
 def _computeHashHook(event):
     """
     Event hook that computes the file hashes in the background after
@@ -187,11 +252,11 @@ def _computeHash(file, progress=noProgress):
     file data and stream-computes all required hashes on it, saving
     the results in the file document.
 
-    In the case of assetstore impls that already compute the sha512,
-    and when sha512 is the only supported algorithm, we will not download
-    the file to the server.
+    In the case of assetstore impls that already computed the supported
+    algorithms while the file was uploaded, we will not download the file
+    to the server.
     """
-    toCompute = SUPPORTED_ALGORITHMS - set(file)
+    toCompute = getSupportedAlgorithms() - set(file)
     toCompute = {alg: getattr(hashlib, alg)() for alg in toCompute}
 
     if not toCompute:
@@ -215,6 +280,27 @@ def _computeHash(file, progress=noProgress):
     return digests
 
 
+@setting_utilities.default(PluginSettings.ALGORITHMS)
+def _defaultAlgorithms():
+    return ['sha512']
+
+
+@setting_utilities.validator(PluginSettings.ALGORITHMS)
+def _validateAlgorithms(doc):
+    value = doc['value']
+    if not isinstance(value, list) or not all(
+            isinstance(alg, six.string_types) for alg in value):
+        raise ValidationException('Hash algorithms setting must be a list of strings.', 'value')
+    value = sorted({alg.strip().lower() for alg in value})
+    invalid = set(value) - AVAILABLE_ALGORITHMS
+    if invalid:
+        raise ValidationException('Unsupported hash algorithms: %s. Available algorithms: %s.' % (
+            ', '.join(sorted(invalid)), ', '.join(sorted(AVAILABLE_ALGORITHMS))), 'value')
+    if 'sha512' not in value:
+        raise ValidationException('Hash algorithms setting must include sha512.', 'value')
+    doc['value'] = value
+
+
 @setting_utilities.validator(PluginSettings.AUTO_COMPUTE)
 def _validateAutoCompute(doc):
     if not isinstance(doc['value'], bool):
@@ -226,7 +312,12 @@ class HashsumDownloadPlugin(GirderPlugin):
     CLIENT_SOURCE_PATH = 'web_client'
 
     def load(self, info):
+        getPlugin('jobs').load(info)
+
         HashedFile(info['apiRoot'].file)
-        FileModel().exposeFields(level=AccessType.READ, fields=SUPPORTED_ALGORITHMS)
+        FileModel().exposeFields(level=AccessType.READ, fields=AVAILABLE_ALGORITHMS)
 
+        events.bind('model.upload.init', 'hashsum_download', _initUploadHashes)
+        events.bind(
+            'model.file.finalizeUpload.before', 'hashsum_download', _clearReplacedHashes)
         events.bind('data.process', 'hashsum_download', _computeHashHook)
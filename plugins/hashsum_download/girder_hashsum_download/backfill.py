@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+
+import collections
+import sys
+import time
+import traceback
+from multiprocessing.pool import ThreadPool
+
+from girder.models.file import File
+from girder_jobs.constants import JobStatus
+from girder_jobs.models.job import Job
+
+import girder_hashsum_download
+
+# How often the job progress is updated, in seconds.
+_PROGRESS_INTERVAL = 1
+
+
+def _hashFile(file):
+    try:
+        girder_hashsum_download._computeHash(file)
+    except Exception as exc:
+        return file, exc
+    return file, None
+
+
+def _formatRate(files, size, elapsed):
+    elapsed = max(elapsed, 1e-6)
+    return '%d files (%.1f files/s, %.1f MB/s)' % (
+        files, files / elapsed, size / elapsed / 1024 ** 2)
+
+
+def run(job):
+    """
+    Compute the missing supported checksums of every file stored in an
+    assetstore, hashing several files at the same time.
+    """
+    jobModel = Job()
+    job = jobModel.updateJob(job, status=JobStatus.RUNNING)
+
+    try:
+        log, status = backfill(job, **job['kwargs'])
+        jobModel.updateJob(job, status=status, log=log)
+    except Exception:
+        t, val, tb = sys.exc_info()
+        log = '%s: %s\n%s' % (t.__name__, repr(val), traceback.extract_tb(tb))
+        jobModel.updateJob(job, status=JobStatus.ERROR, log=log)
+        raise
+
+
+def backfill(job, workers=4):
+    """
+    Hash the files that lack any of the supported checksums with a pool of
+    threads. At most a few files per thread are loaded ahead of the ones being
+    hashed.
+
+    :param job: The job to report progress to.
+    :type job: dict
+    :param workers: The number of files to hash at the same time.
+    :type workers: int
+    :returns: The job log and final status. The status is an error if any
+        file could not be hashed.
+    """
+    jobModel = Job()
+    fileModel = File()
+    query = {
+        'assetstoreId': {'$exists': True},
+        '$or': [{alg: {'$exists': False}}
+                for alg in sorted(girder_hashsum_download.getSupportedAlgorithms())]
+    }
+    total = fileModel.find(query).count()
+    job = jobModel.updateJob(job, progressTotal=total, progressCurrent=0)
+
+    done = size = 0
+    failed = []
+    start = lastUpdate = time.time()
+    pool = ThreadPool(workers)
+    pending = collections.deque()
+    files = fileModel.find(query, sort=[('_id', 1)])
+    try:
+        while True:
+            while len(pending) < workers * 2:
+                file = next(files, None)
+                if file is None:
+                    break
+                pending.append(pool.apply_async(_hashFile, (file,)))
+            if not pending:
+                break
+            file, exc = pending.popleft().get()
+            done += 1
+            size += file['size']
+            if exc is not None:
+                failed.append('%s (%s): %r' % (file['name'], file['_id'], exc))
+            now = time.time()
+            if now - lastUpdate >= _PROGRESS_INTERVAL:
+                lastUpdate = now
+                job = jobModel.updateJob(
+                    job, progressCurrent=done,
+                    progressMessage=_formatRate(done, size, now - start))
+    finally:
+        pool.terminate()
+
+    job = jobModel.updateJob(
+        job, progressCurrent=done, progressMessage=_formatRate(done, size, time.time() - start))
+    log = 'Hashed %s.' % _formatRate(done - len(failed), size, time.time() - start)
+    if failed:
+        log += '\nFailed files:\n' + '\n'.join(failed)
+    return log, JobStatus.ERROR if failed else JobStatus.SUCCESS
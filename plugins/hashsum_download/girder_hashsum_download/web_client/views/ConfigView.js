@@ -14,6 +14,10 @@ var ConfigView = View.extend({
             this._saveSettings([{
                 key: 'hashsum_download.auto_compute',
                 value: this.$('#g-hashsum-download-auto-compute').is(':checked')
+            }, {
+                key: 'hashsum_download.algorithms',
+                value: this.$('#g-hashsum-download-algorithms').val().split(',').map(
+                    (alg) => alg.trim()).filter((alg) => alg)
             }]);
         }
     },
@@ -29,7 +33,8 @@ var ConfigView = View.extend({
             url: 'system/setting',
             data: {
                 list: JSON.stringify([
-                    'hashsum_download.auto_compute'
+                    'hashsum_download.auto_compute',
+                    'hashsum_download.algorithms'
                 ])
             }
         }).done((resp) => {
@@ -18,6 +18,7 @@
 ###############################################################################
 
 import hashlib
+import mock
 import six
 import time
 
@@ -27,6 +28,7 @@ from girder.models.folder import Folder
 from girder.models.setting import Setting
 from girder.models.upload import Upload
 from girder.models.user import User
+from girder_jobs.constants import JobStatus
 from tests import base
 
 import girder_hashsum_download as hashsum_download
@@ -269,12 +271,33 @@ class HashsumDownloadTest(base.TestCase):
         self.assertStatus(resp, 401)
         six.assertRegex(self, resp.json['message'], '^Read access denied')
 
+    def testAlgorithmsSetting(self):
+        key = hashsum_download.PluginSettings.ALGORITHMS
+        self.assertEqual(Setting().get(key), ['sha512'])
+        for value in ('sha512', ['sha512', 'crc32'], ['sha256'], [1]):
+            with self.assertRaises(ValidationException):
+                Setting().set(key, value)
+
+        # Algorithms that are available but not enabled are rejected
+        template = '/file/%s/hashsum_file/%s'
+        resp = self.request(template % (self.publicFile['_id'], 'sha256'))
+        self.assertStatus(resp, 400)
+        six.assertRegex(self, resp.json['message'], '^Invalid algorithm "sha256"')
+
+        Setting().set(key, ['SHA256', 'sha512', 'sha256'])
+        self.assertEqual(Setting().get(key), ['sha256', 'sha512'])
+        resp = self.request(
+            '/file/%s/hashsum' % self.publicFile['_id'], method='POST', user=self.user)
+        self.assertStatusOk(resp)
+        resp = self.request(template % (self.publicFile['_id'], 'sha256'), isJson=False)
+        self.assertStatusOk(resp)
+        self.assertEqual(self.getBody(resp), '%s\n' % self._hashSum(self.userData, 'sha256'))
+
     def testAutoComputeHashes(self):
         with self.assertRaises(ValidationException):
             Setting().set(hashsum_download.PluginSettings.AUTO_COMPUTE, 'bad')
 
-        old = hashsum_download.SUPPORTED_ALGORITHMS
-        hashsum_download.SUPPORTED_ALGORITHMS = {'sha512', 'sha256'}
+        Setting().set(hashsum_download.PluginSettings.ALGORITHMS, ['sha512', 'sha256'])
         Setting().set(hashsum_download.PluginSettings.AUTO_COMPUTE, True)
 
         file = Upload().uploadFromFile(
@@ -298,12 +321,9 @@ class HashsumDownloadTest(base.TestCase):
         self.assertIn('sha512', file)
         self.assertEqual(file['sha512'], expected.hexdigest())
 
-        hashsum_download.SUPPORTED_ALGORITHMS = old
-
     def testManualComputeHashes(self):
         Setting().set(hashsum_download.PluginSettings.AUTO_COMPUTE, False)
-        old = hashsum_download.SUPPORTED_ALGORITHMS
-        hashsum_download.SUPPORTED_ALGORITHMS = {'sha512', 'sha256'}
+        Setting().set(hashsum_download.PluginSettings.ALGORITHMS, ['sha512', 'sha256'])
 
         self.assertNotIn('sha256', self.privateFile)
 
@@ -327,8 +347,6 @@ class HashsumDownloadTest(base.TestCase):
         file = File().load(self.privateFile['_id'], force=True)
         self.assertEqual(file['sha256'], expected.hexdigest())
 
-        hashsum_download.SUPPORTED_ALGORITHMS = old
-
     def testGetByHash(self):
         hashAlgorithm = 'sha512'
         publicDataHash = self._hashSum(self.userData, hashAlgorithm)
@@ -364,3 +382,63 @@ class HashsumDownloadTest(base.TestCase):
             '/file/hashsum/%s/%s' % (hashAlgorithm, privateDataHash), user=self.otherUser)
         self.assertStatusOk(resp)
         self.assertEqual(len(resp.json), 0)
+
+    def testHashesComputedDuringUpload(self):
+        Setting().set(hashsum_download.PluginSettings.ALGORITHMS, ['sha512', 'sha256', 'md5'])
+        resp = self.request(
+            path='/file', method='POST', user=self.user, params={
+                'parentType': 'folder',
+                'parentId': self.privateFolder['_id'],
+                'name': 'chunked',
+                'size': len(self.userData)
+            })
+        self.assertStatusOk(resp)
+        upload = resp.json
+        # The state of each digest is kept in the upload between chunks
+        for offset, chunk in ((0, self.userData[:10]), (10, self.userData[10:])):
+            resp = self.request(
+                path='/file/chunk', method='POST', user=self.user, body=chunk,
+                params={'offset': offset, 'uploadId': upload['_id']},
+                type='application/octet-stream')
+            self.assertStatusOk(resp)
+        file = File().load(resp.json['_id'], force=True)
+
+        for alg in ('sha512', 'sha256', 'md5'):
+            self.assertEqual(file[alg], self._hashSum(self.userData, alg))
+
+        # Nothing is left to compute, so the file is not read again
+        with mock.patch.object(File, 'open', side_effect=AssertionError('File read')):
+            self.assertIsNone(hashsum_download._computeHash(file))
+
+        # Replacing the contents replaces the checksums
+        upload = Upload().createUploadToFile(file, self.user, len(self.privateOnlyData))
+        file = Upload().handleChunk(upload, six.BytesIO(self.privateOnlyData))
+        file = File().load(file['_id'], force=True)
+        for alg in ('sha512', 'sha256', 'md5'):
+            self.assertEqual(file[alg], self._hashSum(self.privateOnlyData, alg))
+
+    def testBackfillHashes(self):
+        Setting().set(hashsum_download.PluginSettings.ALGORITHMS, ['sha512', 'sha256'])
+        resp = self.request(
+            '/file/hashsum/backfill', method='POST', user=self.otherUser)
+        self.assertStatus(resp, 403)
+
+        resp = self.request(
+            '/file/hashsum/backfill', method='POST', user=self.user, params={'workers': 2})
+        self.assertStatusOk(resp)
+        job = resp.json
+        self.assertEqual(job['status'], JobStatus.SUCCESS)
+        self.assertEqual(job['progress']['total'], 4)
+        self.assertEqual(job['progress']['current'], 4)
+        self.assertIn('files/s', job['progress']['message'])
+
+        for file in (self.privateFile, self.publicFile, self.duplicatePublicFile):
+            file = File().load(file['_id'], force=True)
+            self.assertEqual(file['sha256'], self._hashSum(self.userData, 'sha256'))
+        file = File().load(self.privateOnlyFile['_id'], force=True)
+        self.assertEqual(file['sha256'], self._hashSum(self.privateOnlyData, 'sha256'))
+
+        # All files have their checksums now
+        resp = self.request('/file/hashsum/backfill', method='POST', user=self.user)
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json['progress']['total'], 0)
@@ -43,7 +43,10 @@ setup(
     include_package_data=True,
     packages=find_packages(exclude=['plugin_tests']),
     zip_safe=False,
-    install_requires=['girder>=3.0.0a1'],
+    install_requires=[
+        'girder>=3.0.0a1',
+        'girder-jobs>=3.0.0a1'
+    ],
     entry_points={
         'girder.plugin': [
             'hashsum_download = girder_hashsum_download:HashsumDownloadPlugin'
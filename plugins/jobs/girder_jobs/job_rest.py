@@ -17,13 +17,25 @@
 #  limitations under the License.
 ###############################################################################
 
+import cherrypy
+import time
+
 from girder.api import access
 from girder.api.describe import Description, autoDescribeRoute
-from girder.api.rest import Resource, filtermodel
+from girder.api.rest import Resource, filtermodel, setResponseHeader
+from girder.api.v1.notification import sseMessage
 from girder.constants import AccessType, SortDir
 from girder.models.user import User
 from .models.job import Job as JobModel
 from . import constants
+from .constants import JobStatus
+
+# If no timeout param is passed to the log stream, we default to this value
+DEFAULT_LOG_STREAM_TIMEOUT = 300
+# How often the log stream checks for new log entries, in seconds
+LOG_STREAM_INTERVAL = 1
+# The number of entries at the end of the log that are included with a job
+JOB_LOG_TAIL = 1000
 
 
 class Job(Resource):
@@ -37,6 +49,8 @@ class Job(Resource):
         self.route('POST', (), self.createJob)
         self.route('GET', ('all',), self.listAllJobs)
         self.route('GET', (':id',), self.getJob)
+        self.route('GET', (':id', 'log'), self.getJobLog)
+        self.route('GET', (':id', 'log', 'stream'), self.streamJobLog)
         self.route('PUT', (':id',), self.updateJob)
         self.route('PUT', (':id', 'cancel'), self.cancelJob)
         self.route('DELETE', (':id',), self.deleteJob)
@@ -122,11 +136,18 @@ class Job(Resource):
     @filtermodel(JobModel)
     @autoDescribeRoute(
         Description('Get a job by ID.')
-        .modelParam('id', 'The ID of the job.', model=JobModel, force=True, includeLog=True)
+        .notes('The <b>log</b> of the job only has its last %d entries; use '
+               '<code>GET /job/{id}/log</code> to page through the rest of it.' % JOB_LOG_TAIL)
+        .modelParam('id', 'The ID of the job.', model=JobModel, force=True)
         .errorResponse('ID was invalid.')
         .errorResponse('Read access was denied for the job.', 403)
     )
     def getJob(self, job):
+        self._requireReadAccess(job)
+        _, _, job['log'] = self._model.getLog(job, offset=-JOB_LOG_TAIL)
+        return job
+
+    def _requireReadAccess(self, job):
         user = self.getCurrentUser()
 
         # If the job is not public check access
@@ -136,7 +157,73 @@ class Job(Resource):
             else:
                 self.ensureTokenScopes('jobs.job_' + str(job['_id']))
 
-        return job
+    @access.public
+    @autoDescribeRoute(
+        Description('Get a range of the log of a job.')
+        .notes('The response has the list of log <b>entries</b>, the <b>offset</b> of the '
+               'first of them, and the <b>total</b> number of entries in the log.')
+        .modelParam('id', 'The ID of the job.', model=JobModel, force=True)
+        .param('offset', 'The index of the first log entry to return.  A negative offset '
+               'counts back from the end of the log, so -100 returns the last 100 entries.',
+               dataType='integer', required=False, default=0)
+        .param('limit', 'The most log entries to return, or 0 for all of them.',
+               dataType='integer', required=False, default=1000)
+        .errorResponse('ID was invalid.')
+        .errorResponse('Read access was denied for the job.', 403)
+    )
+    def getJobLog(self, job, offset, limit):
+        self._requireReadAccess(job)
+        offset, total, entries = self._model.getLog(job, offset=offset, limit=max(limit, 0))
+        return {
+            'offset': offset,
+            'total': total,
+            'entries': entries
+        }
+
+    @access.cookie
+    @access.public
+    @autoDescribeRoute(
+        Description('Follow the log of a job via the SSE protocol.')
+        .notes('Each event has the new log <b>entries</b> and the <b>offset</b> of the first '
+               'of them.  The stream is closed once the job has finished and its whole log '
+               'was sent, or when no entries were added for the timeout duration.')
+        .modelParam('id', 'The ID of the job.', model=JobModel, force=True)
+        .param('offset', 'The index of the first log entry to send.  A negative offset '
+               'counts back from the end of the log.',
+               dataType='integer', required=False, default=0)
+        .param('timeout', 'The duration without new log entries before the stream is closed.',
+               dataType='integer', required=False, default=DEFAULT_LOG_STREAM_TIMEOUT)
+        .produces('text/event-stream')
+        .errorResponse('ID was invalid.')
+        .errorResponse('Read access was denied for the job.', 403)
+    )
+    def streamJobLog(self, job, offset, timeout):
+        self._requireReadAccess(job)
+        setResponseHeader('Content-Type', 'text/event-stream')
+        setResponseHeader('Cache-Control', 'no-cache')
+        finished = (JobStatus.SUCCESS, JobStatus.ERROR, JobStatus.CANCELED)
+
+        def streamGen():
+            start = time.time()
+            nextOffset = offset
+            while cherrypy.engine.state == cherrypy.engine.states.STARTED:
+                # Check the status first so that no entries are missed after
+                # the job finishes.
+                current = self._model.load(job['_id'], force=True, fields=['status'])
+                first, _, entries = self._model.getLog(job, offset=nextOffset)
+                if entries:
+                    start = time.time()
+                    nextOffset = first + len(entries)
+                    yield sseMessage({
+                        'type': 'job_log',
+                        'data': {'_id': str(job['_id']), 'offset': first, 'entries': entries}
+                    })
+                if current is None or current['status'] in finished:
+                    break
+                if time.time() - start >= timeout:
+                    break
+                time.sleep(LOG_STREAM_INTERVAL)
+        return streamGen
 
     @access.token
     @filtermodel(JobModel)
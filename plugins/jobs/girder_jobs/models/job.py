@@ -30,6 +30,7 @@ from girder.models.token import Token
 from girder.models.user import User
 
 from ..constants import JobStatus, JOB_HANDLER_LOCAL
+from .job_log import JobLog
 
 
 class Job(AccessControlledModel):
@@ -262,7 +263,6 @@ class Job(AccessControlledModel):
             'interval': interval,
             'status': JobStatus.INACTIVE,
             'progress': None,
-            'log': [],
             'meta': {},
             'handler': handler,
             'async': async,
@@ -308,6 +308,9 @@ class Job(AccessControlledModel):
     def find(self, *args, **kwargs):
         """
         Overrides the default find behavior to exclude the log by default.
+        Job logs are stored separately, so only the log that older versions
+        stored in the job documents is included; use :py:meth:`getLog` to get
+        the whole log of a job.
 
         :param includeLog: Whether to include the log field in the documents.
         :type includeLog: bool
@@ -321,20 +324,54 @@ class Job(AccessControlledModel):
         serialized them on the way into the database.
 
         :param includeLog: Whether to include the log field in the document.
+            The log is read from the job log collection.
         :type includeLog: bool
         """
+        includeLog = kwargs.get('includeLog', False) and kwargs.get('fields') is None
         kwargs['fields'] = self._computeFields(kwargs)
         job = super(Job, self).load(*args, **kwargs)
 
         if job and isinstance(job.get('kwargs'), six.string_types):
             job['kwargs'] = json_util.loads(job['kwargs'])
-        if job and isinstance(job.get('log'), six.string_types):
-            # Legacy support: log used to be just a string, but we want to
-            # consistently return a list of strings now.
-            job['log'] = [job['log']]
+        if job and includeLog:
+            job['log'] = JobLog().getLog(job, self._legacyLog(job.get('log')))
 
         return job
 
+    def remove(self, job, *args, **kwargs):
+        """
+        Delete a job and its log.
+        """
+        JobLog().removeLog(job)
+        return super(Job, self).remove(job, *args, **kwargs)
+
+    def _legacyLog(self, log):
+        """
+        Older versions stored the log in the job document, first as a string
+        and then as a list of strings.  This returns such a log as a list.
+        """
+        if isinstance(log, six.string_types):
+            return [log]
+        return log or []
+
+    def getLog(self, job, offset=0, limit=0):
+        """
+        Get a range of the log entries of a job without loading the rest of the
+        log.
+
+        :param job: The job document.
+        :param offset: The index of the first entry to return.  A negative
+            offset counts back from the end of the log.
+        :type offset: int
+        :param limit: The most entries to return, or 0 for all of them.
+        :type limit: int
+        :returns: A tuple of the index of the first returned entry, the total
+            number of entries, and the list of entries.
+        """
+        doc = self.collection.find_one({'_id': job['_id']}, projection={'log': True})
+        return JobLog().getEntries(
+            job, offset, limit, self._legacyLog(doc.get('log') if doc else None))
+
     def scheduleJob(self, job):
         """
         Trigger the event to schedule this job. Other plugins are in charge of
@@ -402,7 +439,8 @@ class Job(AccessControlledModel):
 
         updates = {
             '$push': {},
-            '$set': {}
+            '$set': {},
+            '$unset': {}
         }
 
         statusChanged = False
@@ -424,11 +462,10 @@ class Job(AccessControlledModel):
             job[k] = v
             updates['$set'][k] = v
 
-        if updates['$set'] or updates['$push']:
-            if not updates['$push']:
-                del updates['$push']
+        if updates['$set'] or updates['$push'] or log is not None:
             job['updated'] = now
             updates['$set']['updated'] = now
+            updates = {operator: value for operator, value in six.viewitems(updates) if value}
 
             updateResult = self.update(query, update=updates, multi=False)
             # If our query didn't match anything then our state transition
@@ -439,6 +476,8 @@ class Job(AccessControlledModel):
                     status, job['status'])
                 raise ValidationException(msg, field='status')
 
+            self._writeLog(job, log, overwrite)
+
             events.trigger('jobs.job.update.after', {
                 'job': job
             })
@@ -450,11 +489,13 @@ class Job(AccessControlledModel):
         return job
 
     def _updateLog(self, job, log, overwrite, now, notify, user, updates):
-        """Helper for updating a job's log."""
+        """
+        Helper for updating a job's log.  The log itself is written to the job
+        log collection once the job update succeeds; here, a log stored in the
+        job document by an older version is dropped if it is overwritten.
+        """
         if overwrite:
-            updates['$set']['log'] = [log]
-        else:
-            updates['$push']['log'] = log
+            updates['$unset']['log'] = True
         if notify and user:
             expires = now + datetime.timedelta(seconds=30)
             Notification().createNotification(
@@ -464,6 +505,15 @@ class Job(AccessControlledModel):
                     'text': log
                 }, user=user, expires=expires)
 
+    def _writeLog(self, job, log, overwrite):
+        """Helper for writing a message to the job log collection."""
+        if log is None:
+            return
+        if overwrite:
+            JobLog().overwrite(job, [log])
+        else:
+            JobLog().append(job, [log])
+
     def _createUpdateStatusNotification(self, now, user, job):
         expires = now + datetime.timedelta(seconds=30)
         filtered = self.filter(job, user)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import datetime
+import pymongo
+
+from girder.constants import SortDir
+from girder.models.model_base import Model
+
+
+class JobLog(Model):
+    """
+    Stores the log of each job as a series of chunk documents, so the job
+    document stays small no matter how much a job logs.  New entries are
+    pushed onto the last chunk of the job until it holds ``CHUNK_SIZE``
+    characters, after which a new chunk is started.  Chunks are never
+    rewritten, except when the whole log is overwritten.
+
+    Each chunk has the ID of its job, a sequence number, the list of its
+    ``entries``, their ``count``, and their total ``size`` in characters.
+    """
+    # The number of characters after which a chunk is closed
+    CHUNK_SIZE = 256 * 1024
+
+    def initialize(self):
+        self.name = 'job_log'
+        self.ensureIndices([
+            ([('jobId', SortDir.ASCENDING), ('seq', SortDir.ASCENDING)], {'unique': True})
+        ])
+
+    def validate(self, doc):
+        return doc
+
+    def append(self, job, entries):
+        """
+        Append entries to the log of a job.  This usually takes a single
+        database update.
+
+        :param job: The job document.
+        :param entries: The log messages to append.
+        :type entries: list of str
+        """
+        if not entries:
+            return
+        size = sum(len(entry) for entry in entries)
+        while True:
+            chunk = self.collection.find_one_and_update(
+                {'jobId': job['_id'], 'closed': False},
+                {'$push': {'entries': {'$each': entries}},
+                 '$inc': {'count': len(entries), 'size': size}},
+                sort=[('seq', SortDir.DESCENDING)],
+                projection={'size': True},
+                return_document=pymongo.ReturnDocument.AFTER)
+            if chunk is not None:
+                if chunk['size'] >= self.CHUNK_SIZE:
+                    self.collection.update_one({'_id': chunk['_id']}, {'$set': {'closed': True}})
+                return
+            last = self.collection.find_one(
+                {'jobId': job['_id']}, sort=[('seq', SortDir.DESCENDING)],
+                projection={'seq': True})
+            try:
+                self.collection.insert_one({
+                    'jobId': job['_id'],
+                    'seq': last['seq'] + 1 if last else 0,
+                    'created': datetime.datetime.utcnow(),
+                    'entries': entries,
+                    'count': len(entries),
+                    'size': size,
+                    'closed': size >= self.CHUNK_SIZE
+                })
+                return
+            except pymongo.errors.DuplicateKeyError:
+                # Another process started the same chunk; append to it instead
+                continue
+
+    def overwrite(self, job, entries):
+        """
+        Replace the log of a job.
+
+        :param job: The job document.
+        :param entries: The new log messages.
+        :type entries: list of str
+        """
+        self.removeLog(job)
+        self.append(job, entries)
+
+    def removeLog(self, job):
+        """
+        Delete the log of a job.
+
+        :param job: The job document.
+        """
+        self.collection.delete_many({'jobId': job['_id']})
+
+    def getEntries(self, job, offset=0, limit=0, legacyLog=None):
+        """
+        Get a range of the log entries of a job.  Only the chunks that overlap
+        the range are loaded, and each chunk is at most about ``CHUNK_SIZE``
+        characters.
+
+        :param job: The job document.
+        :param offset: The index of the first entry to return.  A negative
+            offset counts from the end of the log.
+        :type offset: int
+        :param limit: The most entries to return, or 0 for all of them.
+        :type limit: int
+        :param legacyLog: Entries stored in the job document by older versions,
+            which precede the chunks.
+        :type legacyLog: list of str or None
+        :returns: A tuple of the index of the first returned entry, the total
+            number of entries, and the list of entries.
+        """
+        legacyLog = legacyLog or []
+        chunks = list(self.collection.find(
+            {'jobId': job['_id']}, sort=[('seq', SortDir.ASCENDING)],
+            projection={'count': True}))
+        total = len(legacyLog) + sum(chunk['count'] for chunk in chunks)
+        if offset < 0:
+            offset = max(total + offset, 0)
+        offset = min(offset, total)
+        end = min(offset + limit, total) if limit else total
+        entries = legacyLog[offset:end]
+        start = len(legacyLog)
+        for chunk in chunks:
+            chunkEnd = start + chunk['count']
+            if chunkEnd > offset and start < end:
+                doc = self.collection.find_one({'_id': chunk['_id']}, projection={'entries': True})
+                entries.extend(doc['entries'][max(offset - start, 0):end - start])
+            start = chunkEnd
+        return offset, total, entries
+
+    def getLog(self, job, legacyLog=None):
+        """
+        Get the whole log of a job.
+
+        :param job: The job document.
+        :param legacyLog: Entries stored in the job document by older versions,
+            which precede the chunks.
+        :type legacyLog: list of str or None
+        :returns: The list of log entries.
+        """
+        entries = list(legacyLog or [])
+        for chunk in self.collection.find(
+                {'jobId': job['_id']}, sort=[('seq', SortDir.ASCENDING)],
+                projection={'entries': True}):
+            entries.extend(chunk['entries'])
+        return entries
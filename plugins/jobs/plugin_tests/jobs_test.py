@@ -18,6 +18,7 @@
 ###############################################################################
 
 import json
+import mock
 import time
 from bson import json_util
 
@@ -28,8 +29,10 @@ from girder.exceptions import ValidationException
 from girder.models.user import User
 from girder.models.token import Token
 
+from girder_jobs import job_rest
 from girder_jobs.constants import JobStatus, REST_CREATE_JOB_TOKEN_SCOPE
 from girder_jobs.models.job import Job
+from girder_jobs.models.job_log import JobLog
 
 
 def setUpModule():
@@ -149,6 +152,67 @@ class JobsTestCase(base.TestCase):
         job = self.jobModel.load(job['_id'], force=True, includeLog=True)
         self.assertEqual(job['log'], ['legacy log'])
 
+    def testLogChunks(self):
+        job = self.jobModel.createJob(title='test', type='x', user=self.users[0])
+        self.assertNotIn('log', job)
+        with mock.patch.object(JobLog, 'CHUNK_SIZE', 10):
+            for n in range(10):
+                job = self.jobModel.updateJob(job, log='entry %d\n' % n)
+        # The log is kept out of the job document
+        self.assertNotIn('log', Job().collection.find_one({'_id': job['_id']}))
+        chunks = list(JobLog().find({'jobId': job['_id']}, sort=[('seq', 1)]))
+        self.assertEqual([chunk['count'] for chunk in chunks], [2, 2, 2, 2, 2])
+
+        log = ['entry %d\n' % n for n in range(10)]
+        job = self.jobModel.load(job['_id'], force=True, includeLog=True)
+        self.assertEqual(job['log'], log)
+        self.assertEqual(self.jobModel.getLog(job, offset=3, limit=4), (3, 10, log[3:7]))
+        self.assertEqual(self.jobModel.getLog(job, offset=-3), (7, 10, log[7:]))
+        self.assertEqual(self.jobModel.getLog(job, offset=12), (10, 10, []))
+
+        resp = self.request('/job/%s/log' % job['_id'], user=self.users[0], params={
+            'offset': -2})
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json, {'offset': 8, 'total': 10, 'entries': log[8:]})
+        resp = self.request('/job/%s/log' % job['_id'], user=self.users[1])
+        self.assertStatus(resp, 403)
+
+        # Getting the job only includes the end of its log
+        with mock.patch.object(job_rest, 'JOB_LOG_TAIL', 3):
+            resp = self.request('/job/%s' % job['_id'], user=self.users[0])
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json['log'], log[7:])
+
+        # Overwriting replaces every chunk, and deleting the job deletes them
+        job = self.jobModel.updateJob(job, log='new log', overwrite=True)
+        self.assertEqual(self.jobModel.getLog(job), (0, 1, ['new log']))
+        self.jobModel.remove(job)
+        self.assertEqual(JobLog().find({'jobId': job['_id']}).count(), 0)
+
+    def testLegacyLogIsPaged(self):
+        job = self.jobModel.createJob(
+            title='legacy', type='legacy', user=self.users[1], save=False)
+        job['log'] = ['old 1', 'old 2']
+        job = self.jobModel.save(job, validate=False)
+        job = self.jobModel.updateJob(job, log='new')
+        self.assertEqual(self.jobModel.getLog(job, offset=1), (1, 3, ['old 2', 'new']))
+        job = self.jobModel.load(job['_id'], force=True, includeLog=True)
+        self.assertEqual(job['log'], ['old 1', 'old 2', 'new'])
+
+    def testLogStream(self):
+        job = self.jobModel.createJob(title='test', type='x', user=self.users[0])
+        job = self.jobModel.updateJob(job, log='first', status=JobStatus.RUNNING)
+        job = self.jobModel.updateJob(job, log='second', status=JobStatus.SUCCESS)
+        # The job is finished, so the stream ends once the log was sent
+        resp = self.request('/job/%s/log/stream' % job['_id'], user=self.users[0],
+                            isJson=False, params={'offset': 1})
+        self.assertStatusOk(resp)
+        messages = self.getSseMessages(resp)
+        for message in messages:
+            message.pop('_girderTime')
+        self.assertEqual(messages, [{'type': 'job_log', 'data': {
+            '_id': str(job['_id']), 'offset': 1, 'entries': ['second']}}])
+
     def testListJobs(self):
         job = self.jobModel.createJob(title='A job', type='t', user=self.users[1], public=False)
         anonJob = self.jobModel.createJob(title='Anon job', type='t')
@@ -17,6 +17,7 @@
 #  limitations under the License.
 ###############################################################################
 
+import cherrypy
 import json
 from girder import events
 from girder.constants import AccessType
@@ -27,7 +28,7 @@ from girder.models.item import Item
 from girder.models.user import User
 from girder.plugin import getPlugin, GirderPlugin
 from girder.utility.model_importer import ModelImporter
-from . import rest, utils
+from . import rest, utils, worker
 
 
 def removeThumbnails(event):
@@ -118,3 +119,5 @@ class ThumbnailsPlugin(GirderPlugin):
 
         events.bind('model.file.remove', name, removeThumbnailLink)
         events.bind('data.process', name, _onUpload)
+
+        cherrypy.engine.subscribe('stop', worker.closePool)
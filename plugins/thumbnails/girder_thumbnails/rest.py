@@ -23,6 +23,7 @@ from girder.api.rest import filtermodel, Resource
 from girder.constants import AccessType
 from girder.exceptions import RestException
 from girder.models.file import File
+from girder.models.folder import Folder
 from girder_jobs.models.job import Job
 from . import utils
 
@@ -32,6 +33,7 @@ class Thumbnail(Resource):
         super(Thumbnail, self).__init__()
         self.resourceName = 'thumbnail'
         self.route('POST', (), self.createThumbnail)
+        self.route('POST', ('folder',), self.createFolderThumbnails)
 
     @access.user
     @filtermodel(model=Job)
@@ -66,3 +68,30 @@ class Thumbnail(Resource):
             raise RestException('You must specify a valid width, height, or both.')
 
         return utils.scheduleThumbnailJob(file, attachToType, attachToId, user, width, height, crop)
+
+    @access.user
+    @filtermodel(model=Job)
+    @autoDescribeRoute(
+        Description('Create thumbnails of all image files in a folder in a single job.')
+        .notes('Each thumbnail is attached to the item containing its image. '
+               'Subfolders are not included. Setting a width or height parameter '
+               'of 0 will preserve the original aspect ratio.')
+        .modelParam('folderId', 'The ID of the folder.', model=Folder, paramType='formData',
+                    level=AccessType.WRITE)
+        .param('width', 'The desired width.', required=False, dataType='integer', default=0)
+        .param('height', 'The desired height.', required=False, dataType='integer', default=0)
+        .param('crop', 'Whether to crop the images to preserve aspect ratio. '
+               'Only used if both width and height parameters are nonzero.',
+               dataType='boolean', required=False, default=True)
+        .errorResponse()
+        .errorResponse('Write access was denied on the folder.', 403)
+    )
+    def createFolderThumbnails(self, folder, width, height, crop):
+        width = max(width, 0)
+        height = max(height, 0)
+
+        if not width and not height:
+            raise RestException('You must specify a valid width, height, or both.')
+
+        return utils.scheduleFolderThumbnailJob(
+            folder, self.getCurrentUser(), width, height, crop)
@@ -17,3 +17,21 @@ def scheduleThumbnailJob(file, attachToType, attachToId, user, width=0, height=0
         })
     Job().scheduleJob(job)
     return job
+
+
+def scheduleFolderThumbnailJob(folder, user, width=0, height=0, crop=True):
+    """
+    Schedule a local job that creates a thumbnail of every image file in the
+    items of a folder, and return it.
+    """
+    job = Job().createLocalJob(
+        title='Generate thumbnails for %s' % folder['name'], user=user,
+        type='thumbnails.create_folder', public=False, module='girder_thumbnails.worker',
+        kwargs={
+            'folderId': str(folder['_id']),
+            'width': width,
+            'height': height,
+            'crop': crop
+        })
+    Job().scheduleJob(job)
+    return job
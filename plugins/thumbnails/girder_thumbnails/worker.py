@@ -18,30 +18,45 @@
 ###############################################################################
 
 from bson.objectid import ObjectId
+import contextlib
 import functools
+import multiprocessing
+import os
 import six
 import sys
+import tempfile
+import threading
 import traceback
 import pydicom
 import numpy as np
 
 from girder import events
+from girder.exceptions import FilePathException
 from girder.models.file import File
+from girder.models.folder import Folder
 from girder.models.upload import Upload
+from girder.utility import config
 from girder_jobs.constants import JobStatus
 from girder_jobs.models.job import Job
 from girder.utility.model_importer import ModelImporter
 from PIL import Image
 
+_pool = None
+_poolLock = threading.Lock()
+
 
 def run(job):
     jobModel = Job()
     jobModel.updateJob(job, status=JobStatus.RUNNING)
 
     try:
-        newFile = createThumbnail(**job['kwargs'])
-        log = 'Created thumbnail file %s.' % newFile['_id']
-        jobModel.updateJob(job, status=JobStatus.SUCCESS, log=log)
+        if job['type'] == 'thumbnails.create_folder':
+            log, status = createFolderThumbnails(job, **job['kwargs'])
+        else:
+            newFile = createThumbnail(**job['kwargs'])
+            log = 'Created thumbnail file %s.' % newFile['_id']
+            status = JobStatus.SUCCESS
+        jobModel.updateJob(job, status=status, log=log)
     except Exception:
         t, val, tb = sys.exc_info()
         log = '%s: %s\n%s' % (t.__name__, repr(val), traceback.extract_tb(tb))
@@ -49,6 +64,52 @@ def run(job):
         raise
 
 
+def isImage(file):
+    """
+    Whether a file is an image that thumbnails can be created from.
+    """
+    exts = file.get('exts')
+    return bool(
+        'assetstoreId' in file and (
+            (file.get('mimeType') or '').startswith('image/') or
+            file.get('mimeType') == 'application/dicom' or
+            (exts and exts[-1] == 'dcm')))
+
+
+def createFolderThumbnails(job, width, height, crop, folderId):
+    """
+    Create a thumbnail of every image file in the items of a folder, and
+    attach each thumbnail to its item. Validation and access control must be
+    done prior to the invocation of this method.
+
+    :param job: The job to report progress to.
+    :type job: dict
+    :returns: The job log and final status. The status is an error if any
+        thumbnail could not be created.
+    """
+    jobModel = Job()
+    folder = Folder().load(folderId, force=True)
+    items = list(Folder().childItems(folder, fields=['_id']))
+    files = [
+        file for file in File().find(
+            {'itemId': {'$in': [item['_id'] for item in items]}}, sort=[('_id', 1)])
+        if isImage(file)]
+
+    jobModel.updateJob(job, progressTotal=len(files), progressCurrent=0)
+    failed = []
+    for index, file in enumerate(files):
+        try:
+            createThumbnail(width, height, crop, file['_id'], 'item', file['itemId'])
+        except Exception as exc:
+            failed.append('%s: %r' % (file['name'], exc))
+        jobModel.updateJob(job, progressCurrent=index + 1)
+
+    log = 'Created %d of %d thumbnails.' % (len(files) - len(failed), len(files))
+    if failed:
+        log += '\nFailed files:\n' + '\n'.join(failed)
+    return log, JobStatus.ERROR if failed else JobStatus.SUCCESS
+
+
 def createThumbnail(width, height, crop, fileId, attachToType, attachToId):
     """
     Creates the thumbnail. Validation and access control must be done prior
@@ -78,42 +139,17 @@ def createThumbnail(width, height, crop, fileId, attachToType, attachToId):
             return newFile
         else:
             file = newFile
-            streamFn = functools.partial(
-                fileModel.download, file, headers=False)
 
     if 'assetstoreId' not in file:
         # TODO we could thumbnail link files if we really wanted.
         raise Exception('File %s has no assetstore.' % fileId)
 
-    stream = streamFn()
-    data = b''.join(stream())
+    with _localPath(file) as path:
+        data, width, height = _resize(
+            path, file['mimeType'], file['exts'], width, height, crop)
 
-    image = _getImage(file['mimeType'], file['exts'], data)
-
-    if not width:
-        width = int(height * image.size[0] / image.size[1])
-    elif not height:
-        height = int(width * image.size[1] / image.size[0])
-    elif crop:
-        x1 = y1 = 0
-        x2, y2 = image.size
-        wr = float(image.size[0]) / width
-        hr = float(image.size[1]) / height
-
-        if hr > wr:
-            y1 = int(y2 / 2 - height * wr / 2)
-            y2 = int(y2 / 2 + height * wr / 2)
-        else:
-            x1 = int(x2 / 2 - width * hr / 2)
-            x2 = int(x2 / 2 + width * hr / 2)
-        image = image.crop((x1, y1, x2, y2))
-
-    image.thumbnail((width, height), Image.ANTIALIAS)
-
-    out = six.BytesIO()
-    image.convert('RGB').save(out, 'JPEG', quality=85)
-    size = out.tell()
-    out.seek(0)
+    out = six.BytesIO(data)
+    size = len(data)
 
     thumbnail = Upload().uploadFromFile(
         out, size=size, name='_thumb.jpg', parentType=attachToType,
@@ -162,20 +198,125 @@ def attachThumbnail(file, thumbnail, attachToType, attachToId, width, height):
     return File().save(thumbnail)
 
 
-def _getImage(mimeType, extension, data):
+@contextlib.contextmanager
+def _localPath(file):
+    """
+    Provide a path to the contents of a file on the local file system. Files
+    that are not stored locally are copied to a temporary file one chunk at a
+    time, so that they never have to fit in memory.
+
+    :param file: The file document.
+    :type file: dict
+    """
+    try:
+        path = File().getLocalFilePath(file)
+    except FilePathException:
+        path = None
+    if path:
+        yield path
+        return
+
+    fd, path = tempfile.mkstemp(prefix='girder_thumbnail_')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in File().download(file, headers=False)():
+                out.write(chunk)
+        yield path
+    finally:
+        os.remove(path)
+
+
+def _getPool():
+    """
+    Return the pool of processes that resize images, or None if images are
+    resized in the calling process. Its size is set by the ``processes``
+    option of the ``[thumbnails]`` section of the configuration file.
+    """
+    global _pool
+
+    processes = int(config.getConfig().get('thumbnails', {}).get('processes', 0))
+    if processes <= 0:
+        return None
+    with _poolLock:
+        if _pool is None:
+            _pool = multiprocessing.Pool(processes)
+        return _pool
+
+
+def closePool():
+    """
+    Stop the processes that resize images.
+    """
+    global _pool
+
+    with _poolLock:
+        if _pool is not None:
+            _pool.terminate()
+            _pool = None
+
+
+def _resize(path, mimeType, extension, width, height, crop):
+    pool = _getPool()
+    if pool is None:
+        return _resizeImage(path, mimeType, extension, width, height, crop)
+    return pool.apply(_resizeImage, (path, mimeType, extension, width, height, crop))
+
+
+def _resizeImage(path, mimeType, extension, width, height, crop):
+    """
+    Create a JPEG thumbnail of an image file. This may run in another process.
+
+    :param path: The path of the image file.
+    :returns: The JPEG data and the width and height of the thumbnail.
+    """
+    image = _getImage(mimeType, extension, path)
+
+    # Only crop if both the width and height are specified
+    crop = crop and width and height
+    if not width:
+        width = int(height * image.size[0] / image.size[1])
+    elif not height:
+        height = int(width * image.size[1] / image.size[0])
+
+    # Formats that support it, like JPEG, are decoded at the smallest scale
+    # that is at least the size of the thumbnail.
+    image.draft(image.mode, (width, height))
+
+    if crop:
+        x1 = y1 = 0
+        x2, y2 = image.size
+        wr = float(image.size[0]) / width
+        hr = float(image.size[1]) / height
+
+        if hr > wr:
+            y1 = int(y2 / 2 - height * wr / 2)
+            y2 = int(y2 / 2 + height * wr / 2)
+        else:
+            x1 = int(x2 / 2 - width * hr / 2)
+            x2 = int(x2 / 2 + width * hr / 2)
+        image = image.crop((x1, y1, x2, y2))
+
+    image.thumbnail((width, height), Image.ANTIALIAS)
+
+    out = six.BytesIO()
+    image.convert('RGB').save(out, 'JPEG', quality=85)
+    return out.getvalue(), width, height
+
+
+def _getImage(mimeType, extension, path):
     """
     Check extension of image and opens it.
 
     :param extension: The extension of the image that needs to be opened.
-    :param data: The image file stream.
+    :param path: The path of the image file.
     """
     if (extension and extension[-1] == 'dcm') or mimeType == 'application/dicom':
         # Open the dicom image
-        dicomData = pydicom.dcmread(six.BytesIO(data))
+        dicomData = pydicom.dcmread(path)
         return scaleDicomLevels(dicomData)
     else:
-        # Open other types of images
-        return Image.open(six.BytesIO(data))
+        # Open other types of images. Their data is only decoded when needed.
+        return Image.open(path)
 
 
 def scaleDicomLevels(dicomData):
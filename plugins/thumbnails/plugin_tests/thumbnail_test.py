@@ -18,6 +18,7 @@
 ###############################################################################
 
 import json
+import mock
 import os
 import six
 import time
@@ -25,11 +26,14 @@ import time
 from tests import base
 from girder import events
 from girder.constants import ROOT_DIR
+from girder.exceptions import FilePathException
 from girder.models.file import File
 from girder.models.folder import Folder
 from girder.models.item import Item
 from girder.models.upload import Upload
 from girder.models.user import User
+from girder.utility import config
+from girder_thumbnails import worker
 from girder_jobs.constants import JobStatus
 from PIL import Image
 
@@ -369,3 +373,77 @@ class ThumbnailsTestCase(base.TestCase):
         file = File().load(item['_thumbnails'][0], force=True)
         with File().open(file) as fh:
             self.assertEqual(fh.read(2), b'\xff\xd8')  # jpeg magic number
+
+    def _uploadImage(self, name, parent, data=None):
+        return Upload().uploadFromFile(
+            six.BytesIO(data or self.image), len(data or self.image), name,
+            parentType='folder', parent=parent, user=self.admin, mimeType='image/png')
+
+    def testFolderThumbnails(self):
+        files = [self._uploadImage('a.png', self.privateFolder),
+                 self._uploadImage('b.png', self.privateFolder)]
+        Upload().uploadFromFile(
+            six.BytesIO(b'text'), 4, 'c.txt', parentType='folder', parent=self.privateFolder,
+            user=self.admin, mimeType='text/plain')
+
+        params = {'folderId': str(self.privateFolder['_id']), 'width': 32}
+        resp = self.request('/thumbnail/folder', method='POST', user=self.user, params=params)
+        self.assertStatus(resp, 403)
+
+        resp = self.request('/thumbnail/folder', method='POST', user=self.admin, params=params)
+        self.assertStatusOk(resp)
+        self.assertEqual(resp.json['status'], JobStatus.SUCCESS)
+        self.assertEqual(resp.json['progress']['current'], 2)
+        self.assertEqual(resp.json['progress']['total'], 2)
+
+        for file in files:
+            item = Item().load(file['itemId'], force=True)
+            self.assertEqual(len(item['_thumbnails']), 1)
+            thumbnail = File().load(item['_thumbnails'][0], force=True)
+            self.assertEqual(thumbnail['derivedFrom']['id'], file['_id'])
+            with File().open(thumbnail) as fh:
+                self.assertEqual(Image.open(fh).size, (32, 32))
+        item = Item().findOne({'name': 'c.txt'})
+        self.assertNotIn('_thumbnails', item)
+
+    def testThumbnailProcessPool(self):
+        file = self._uploadImage('a.png', self.privateFolder)
+        with mock.patch.dict(config.getConfig(), {'thumbnails': {'processes': 1}}):
+            try:
+                thumbnail = worker.createThumbnail(
+                    64, 32, True, file['_id'], 'item', file['itemId'])
+                self.assertIsNotNone(worker._pool)
+            finally:
+                worker.closePool()
+        with File().open(thumbnail) as fh:
+            self.assertEqual(Image.open(fh).size, (64, 32))
+
+    def testRemoteFilesAreCopied(self):
+        file = self._uploadImage('a.png', self.privateFolder)
+        with mock.patch.object(
+                File, 'getLocalFilePath', side_effect=FilePathException('Not local')):
+            with worker._localPath(file) as path:
+                with open(path, 'rb') as fh:
+                    self.assertEqual(fh.read(), self.image)
+        self.assertFalse(os.path.exists(path))
+
+    def testDraftDecoding(self):
+        out = six.BytesIO()
+        Image.new('RGB', (2000, 1000), (255, 0, 0)).save(out, 'JPEG')
+        file = self._uploadImage('large.jpg', self.privateFolder, out.getvalue())
+
+        sizes = []
+        thumbnail = Image.Image.thumbnail
+
+        def recordSize(image, *args, **kwargs):
+            sizes.append(image.size)
+            return thumbnail(image, *args, **kwargs)
+
+        with worker._localPath(file) as path:
+            with mock.patch.object(Image.Image, 'thumbnail', recordSize):
+                data, width, height = worker._resizeImage(
+                    path, 'image/jpeg', ['jpg'], 100, 100, True)
+        self.assertEqual((width, height), (100, 100))
+        self.assertEqual(Image.open(six.BytesIO(data)).size, (100, 100))
+        # The JPEG was decoded at 1/8 scale and cropped to a square
+        self.assertEqual(sizes, [(125, 125)])
@@ -53,3 +53,6 @@ class UserQuotaPlugin(GirderPlugin):
         events.bind('model.upload.assetstore', 'userQuota', quota.getUploadAssetstore)
         events.bind('model.upload.save', 'userQuota', quota.checkUploadStart)
         events.bind('model.upload.finalize', 'userQuota', quota.checkUploadFinalize)
+        events.bind('model.file.finalizeUpload.before', 'userQuota',
+                    quota.releaseFinalizedReservation)
+        events.bind('model.upload.remove', 'userQuota', quota.releaseUploadReservation)
@@ -17,6 +17,7 @@
 #  limitations under the License.
 ###############################################################################
 
+import cherrypy
 import six
 
 from bson.objectid import ObjectId, InvalidId
@@ -39,6 +40,29 @@ from . import constants
 
 
 QUOTA_FIELD = 'quota'
+# The number of bytes of a user or collection set aside for uploads in
+# progress.
+RESERVED_FIELD = 'quotaReserved'
+# The reservation that an upload holds, so it can be released when the upload
+# is finalized or discarded.
+RESERVATION_FIELD = 'quotaReservation'
+# How often a reservation is retried when the size or the reservations of the
+# base resource change while it is being made, before the upload is refused
+# with an error that asks the client to try again.
+RESERVATION_ATTEMPTS = 100
+
+
+def _requestCache():
+    """
+    Get a dictionary that lasts for the current request.  Outside of a request,
+    a new dictionary is returned each time so nothing is cached.
+    """
+    request = cherrypy.request
+    if getattr(request, 'app', None) is None:
+        return {}
+    if not hasattr(request, 'girderQuotaCache'):
+        request.girderQuotaCache = {}
+    return request.girderQuotaCache
 
 
 def ValidateSizeQuota(value):
@@ -262,7 +286,9 @@ class QuotaPolicy(Resource):
     def _getBaseResource(self, model, resource):
         """
         Get the base resource for something pertaining to quota policies.  If
-        the base resource has no quota policy, return (None, None).
+        the base resource has no quota policy, return (None, None).  The result
+        is remembered for the rest of the request, so that the events of a
+        single upload only look up the base resource once.
 
         :param model: the initial model type.  Could be file, item, folder,
                       user, or collection.
@@ -271,6 +297,23 @@ class QuotaPolicy(Resource):
                  type, either 'user' or 'collection'., and 'resource' is the
                  base resource document or the id of that document.
         """
+        if isinstance(resource, six.string_types + (ObjectId,)):
+            resourceId = resource
+        else:
+            resourceId = resource.get('_id')
+        if resourceId is None:
+            return self._loadBaseResource(model, resource)
+        cache = _requestCache()
+        key = (model, str(resourceId))
+        if key not in cache:
+            cache[key] = self._loadBaseResource(model, resource)
+        return cache[key]
+
+    def _loadBaseResource(self, model, resource):
+        """
+        Load the base resource for something pertaining to quota policies.
+        See _getBaseResource for the parameters and return value.
+        """
         if isinstance(resource, six.string_types + (ObjectId,)):
             try:
                 resource = self.model(model).load(id=resource, force=True)
@@ -351,11 +394,15 @@ class QuotaPolicy(Resource):
             return None
         return quota
 
-    def _checkUploadSize(self, upload):
+    def _checkUploadSize(self, upload, reserve=False):
         """
         Check if an upload will fit within a quota restriction.
 
         :param upload: an upload document.
+        :param reserve: if True, atomically reserve the space the upload needs
+            in its base resource, and record the reservation in the upload
+            document.  The upload must be saved afterwards.
+        :type reserve: bool
         :returns: None if the upload is allowed, otherwise a dictionary of
                   information about the quota restriction.
         """
@@ -371,29 +418,91 @@ class QuotaPolicy(Resource):
         fileSizeQuota = self._getFileSizeQuota(model, resource)
         if not fileSizeQuota:
             return None
-        newSize = resource['size'] + upload['size'] - origSize
+        sizeNeeded = upload['size'] - origSize
         # always allow replacement with a smaller object
-        if newSize <= fileSizeQuota or upload['size'] < origSize:
+        if sizeNeeded <= 0:
             return None
-        left = fileSizeQuota - resource['size']
-        if left < 0:
-            left = 0
+        if reserve:
+            return self._reserve(upload, model, resource, fileSizeQuota, sizeNeeded)
+        newSize = resource['size'] + sizeNeeded
+        if newSize <= fileSizeQuota:
+            return None
+        return self._quotaInfo(fileSizeQuota, sizeNeeded, resource['size'])
+
+    def _quotaInfo(self, fileSizeQuota, sizeNeeded, quotaUsed):
+        """
+        Describe why an upload does not fit within a quota restriction.
+
+        :param fileSizeQuota: the quota of the base resource.
+        :param sizeNeeded: the number of bytes the upload needs.
+        :param quotaUsed: the number of bytes already used or reserved.
+        :returns: a dictionary of information about the quota restriction.
+        """
         return {'fileSizeQuota': fileSizeQuota,
-                'sizeNeeded': upload['size'] - origSize,
-                'quotaLeft': left,
-                'quotaUsed': resource['size']}
+                'sizeNeeded': sizeNeeded,
+                'quotaLeft': max(fileSizeQuota - quotaUsed, 0),
+                'quotaUsed': quotaUsed}
+
+    def _reserve(self, upload, model, resource, fileSizeQuota, sizeNeeded):
+        """
+        Reserve space for an upload in its base resource.  The reserved bytes
+        are only incremented if the size of the base resource is still the one
+        the limit was computed from and there is room for the upload, so
+        concurrent uploads cannot together exceed the quota.
+
+        :param upload: the upload document.  On success, the reservation is
+            recorded in it.
+        :param model: the base model type, either 'user' or 'collection'.
+        :param resource: the base resource document.
+        :param fileSizeQuota: the quota of the base resource.
+        :param sizeNeeded: the number of bytes to reserve.
+        :returns: None if the space was reserved, otherwise a dictionary of
+                  information about the quota restriction.
+        :raises RestException: if other uploads kept changing the base resource
+            so that the reservation could not be made.
+        """
+        collection = self.model(model).collection
+        size = resource['size']
+        for _attempt in range(RESERVATION_ATTEMPTS):
+            available = fileSizeQuota - size - sizeNeeded
+            if available < 0:
+                return self._quotaInfo(fileSizeQuota, sizeNeeded, size)
+            result = collection.update_one({
+                '_id': resource['_id'],
+                'size': size,
+                '$or': [{RESERVED_FIELD: {'$exists': False}},
+                        {RESERVED_FIELD: {'$lte': available}}]
+            }, {'$inc': {RESERVED_FIELD: sizeNeeded}})
+            if result.modified_count:
+                upload[RESERVATION_FIELD] = {
+                    'model': model, 'id': resource['_id'], 'size': sizeNeeded}
+                return None
+            current = collection.find_one(
+                {'_id': resource['_id']}, {'size': True, RESERVED_FIELD: True})
+            if current is None:
+                return None
+            reserved = current.get(RESERVED_FIELD, 0)
+            if current['size'] == size and reserved > available:
+                return self._quotaInfo(fileSizeQuota, sizeNeeded, size + reserved)
+            # Files were added or removed, or other reservations were released
+            # meanwhile, so the quota does not decide yet; try again
+            size = resource['size'] = current['size']
+        raise RestException(
+            'Too many uploads are changing the quota of this %s at once, please try '
+            'again.' % model, code=503)
 
     def checkUploadStart(self, event):
         """
-        Check if an upload will fit within a quota restriction.  This is before
-        the upload occurs, but since multiple uploads can be started
-        concurrently, we also have to check when the upload is being completed.
+        Check if an upload will fit within a quota restriction, and reserve
+        the space it needs.  This is before the upload occurs; the reservation
+        keeps uploads that are started concurrently from exceeding the quota
+        together.
 
         :param event: event record.
         """
         if '_id' in event.info:
             return
-        quotaInfo = self._checkUploadSize(event.info)
+        quotaInfo = self._checkUploadSize(event.info, reserve=True)
         if quotaInfo:
             raise ValidationException(
                 'Upload would exceed file storage quota (need %s, only %s '
@@ -407,11 +516,14 @@ class QuotaPolicy(Resource):
     def checkUploadFinalize(self, event):
         """
         Check if an upload will fit within a quota restriction before
-        finalizing it.  If it doesn't, discard it.
+        finalizing it.  If it doesn't, discard it.  Uploads that reserved
+        their space when they started are not checked again.
 
         :param event: event record.
         """
         upload = event.info
+        if RESERVATION_FIELD in upload:
+            return
         quotaInfo = self._checkUploadSize(upload)
         if quotaInfo:
             # Delete the upload
@@ -424,3 +536,38 @@ class QuotaPolicy(Resource):
                  formatSize(quotaInfo['quotaUsed']),
                  formatSize(quotaInfo['fileSizeQuota'])),
                 field='size')
+
+    def _releaseReservation(self, upload):
+        """
+        Release the space an upload reserved in its base resource, if any.
+
+        :param upload: the upload document.  The reservation is removed from
+            it, so it is only released once.
+        """
+        reservation = upload.pop(RESERVATION_FIELD, None)
+        if not reservation:
+            return
+        self.model(reservation['model']).collection.update_one(
+            {'_id': reservation['id']},
+            {'$inc': {RESERVED_FIELD: -reservation['size']}})
+
+    def releaseFinalizedReservation(self, event):
+        """
+        Handle the model.file.finalizeUpload.before event.  Saving the file
+        adds its size to the size of its base resource, so the space reserved
+        for it is released just before; otherwise the bytes would count twice
+        until the upload is removed.
+
+        :param event: event record.
+        """
+        self._releaseReservation(event.info['upload'])
+
+    def releaseUploadReservation(self, event):
+        """
+        Handle the model.upload.remove event.  Finalized uploads have already
+        released their reservation, so this releases the space of uploads that
+        are discarded.
+
+        :param event: event record.
+        """
+        self._releaseReservation(event.info)
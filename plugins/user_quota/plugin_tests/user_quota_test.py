@@ -19,19 +19,23 @@
 
 import datetime
 import json
+import mock
 import os
 
 from tests import base
+from girder import events
 from girder.constants import AssetstoreType, SettingKey
-from girder.exceptions import ValidationException
+from girder.exceptions import RestException, ValidationException
 from girder.models.assetstore import Assetstore
 from girder.models.collection import Collection
 from girder.models.folder import Folder
 from girder.models.setting import Setting
+from girder.models.upload import Upload
 from girder.models.user import User
 from girder.utility.system import formatSize
 
 from girder_user_quota import constants
+from girder_user_quota.quota import QuotaPolicy
 
 
 def setUpModule():
@@ -281,18 +285,14 @@ class QuotaTestCase(base.TestCase):
         # And a second 2 kb file will fail
         self._uploadFile('File too large', folder, size=2048,
                          validationError='Upload would exceed file storage quota')
-        # If we start uploading two files, only one should complete
+        # If we start uploading two files, the first reserves the space, so
+        # the second can't start
         file1kwargs = self._uploadFile('First partial', folder, size=768,
                                        partial=True)
-        file2kwargs = self._uploadFile('Second partial', folder, size=768,
-                                       partial=True)
+        self._uploadFile('Second partial', folder, size=768,
+                         validationError='Upload would exceed file storage quota')
         resp = self.multipartRequest(**file1kwargs)
         self.assertStatusOk(resp)
-        try:
-            resp = self.multipartRequest(**file2kwargs)
-            self.assertStatus(resp, 400)
-        except AssertionError as exc:
-            self.assertTrue('Upload exceeded' in exc.args[0])
         # Shrink the quota to smaller than all of our files.  Replacing an
         # existing file should still work, though
         self._setPolicy({'fileSizeQuota': 2048}, model, resource, user)
@@ -365,6 +365,105 @@ class QuotaTestCase(base.TestCase):
         self._testQuota('user', self.user, self.admin)
         self._testQuota('collection', self.collection, self.admin)
 
+    def testQuotaReservation(self):
+        """
+        Test that uploads reserve space in their base resource until they are
+        finalized or canceled.
+        """
+        Setting().set(SettingKey.UPLOAD_MINIMUM_CHUNK_SIZE, 0)
+        folder = Folder().findOne({'parentId': self.collection['_id']})
+        self._setPolicy({'fileSizeQuota': 4096, 'useQuotaDefault': False},
+                        'collection', self.collection, self.admin)
+
+        def reserved():
+            return Collection().load(self.collection['_id'], force=True).get(
+                'quotaReserved', 0)
+
+        # Starting an upload reserves its size, and finishing it releases it
+        kwargs = self._uploadFile('Partial', folder, size=2048, partial=True)
+        self.assertEqual(reserved(), 2048)
+        self.assertEqual(Upload().findOne()['quotaReservation']['size'], 2048)
+        self._uploadFile('Too large', folder, size=3072,
+                         validationError='Upload would exceed file storage quota (need 3072 B, '
+                         'only 2048 B available - used 2048 B out of 4096 B)')
+        # The reservation is released before the file is counted in the size
+        # of the collection, so the bytes are never counted twice
+        counted = []
+
+        def countFile(event):
+            collection = Collection().load(self.collection['_id'], force=True)
+            counted.append((collection['size'], collection.get('quotaReserved', 0)))
+
+        with events.bound('model.file.finalizeUpload.after', 'quotaTest', countFile):
+            resp = self.multipartRequest(**kwargs)
+        self.assertStatusOk(resp)
+        self.assertEqual(counted, [(2048, 0)])
+        self.assertEqual(reserved(), 0)
+        self.assertEqual(Collection().load(self.collection['_id'], force=True)['size'], 2048)
+
+        # Canceling an upload releases its reservation
+        kwargs = self._uploadFile('Canceled', folder, size=1024, partial=True)
+        self.assertEqual(reserved(), 1024)
+        resp = self.request(
+            path='/file/upload/%s' % kwargs['fields'][1][1], method='DELETE', user=self.admin)
+        self.assertStatusOk(resp)
+        self.assertEqual(reserved(), 0)
+
+        # The space is only reserved if the size of the collection is the one
+        # the quota was checked against
+        quota = QuotaPolicy()
+        collection = Collection().load(self.collection['_id'], force=True)
+        collection['size'] -= 1024
+        upload = {'size': 1024}
+        self.assertIsNone(quota._reserve(upload, 'collection', collection, 4096, 1024))
+        self.assertEqual(collection['size'], 2048)
+        self.assertEqual(upload['quotaReservation']['size'], 1024)
+        self.assertIsNotNone(quota._reserve({}, 'collection', collection, 4096, 2048))
+        self.assertEqual(reserved(), 1024)
+
+        # A reservation that fails because another one was released meanwhile
+        # is tried again rather than refused
+        updateOne = Collection().collection.update_one
+        released = []
+
+        def releaseFirst(*args, **kwargs):
+            if not released:
+                released.append(True)
+                updateOne({'_id': collection['_id']}, {'$inc': {'quotaReserved': -1024}})
+                return mock.Mock(modified_count=0)
+            return updateOne(*args, **kwargs)
+
+        upload = {'size': 2048}
+        with mock.patch.object(Collection().collection, 'update_one', side_effect=releaseFirst):
+            self.assertIsNone(quota._reserve(upload, 'collection', collection, 4096, 2048))
+        self.assertEqual(upload['quotaReservation']['size'], 2048)
+        self.assertEqual(reserved(), 2048)
+
+        # If other uploads keep changing the collection, the upload can be retried
+        def sizeChanged(*args, **kwargs):
+            updateOne({'_id': collection['_id']}, {'$inc': {'size': 1}})
+            return mock.Mock(modified_count=0)
+
+        with mock.patch.object(Collection().collection, 'update_one', side_effect=sizeChanged):
+            with self.assertRaises(RestException) as cm:
+                quota._reserve({}, 'collection', collection, 1 << 20, 1)
+        self.assertEqual(cm.exception.code, 503)
+
+    def testBaseResourceIsCached(self):
+        """
+        Test that the base resource of an upload is only looked up once per
+        request.
+        """
+        Setting().set(SettingKey.UPLOAD_MINIMUM_CHUNK_SIZE, 0)
+        folder = Folder().findOne({'parentId': self.collection['_id']})
+        self._setPolicy({'fileSizeQuota': 4096, 'useQuotaDefault': False},
+                        'collection', self.collection, self.admin)
+        with mock.patch.object(
+                QuotaPolicy, '_loadBaseResource', autospec=True,
+                side_effect=QuotaPolicy._loadBaseResource) as loadBaseResource:
+            self._uploadFile('Partial', folder, size=1024, partial=True)
+        self.assertEqual(loadBaseResource.call_count, 1)
+
     def testPolicySettings(self):
         """
         Test validation of policy settings.
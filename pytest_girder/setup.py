@@ -13,7 +13,7 @@ setup(
     packages=find_packages(),
     install_requires=[
         'girder>=3.0.0a1',
-        'mongomock',
+        'mongomock>=3.15.0',
         'pytest>=3.6',
         'pytest-cov<2.6',
         'pymongo'
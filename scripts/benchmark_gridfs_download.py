@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+Measure the download throughput of the GridFS assetstore.
+
+This writes a file into a scratch GridFS database, then streams it with the
+GridFS assetstore adapter from several threads at once, the way concurrent
+requests would, and reports the throughput for each number of prefetch
+threads. The scratch database is dropped afterwards. It requires a MongoDB
+server.
+
+Example::
+
+    python scripts/benchmark_gridfs_download.py --size 64 --downloads 8 \\
+        --prefetch-workers 0 4 16
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+import uuid
+
+from girder import logger
+from girder.models import getDbConnection
+from girder.utility import config, gridfs_assetstore_adapter
+from girder.utility.gridfs_assetstore_adapter import CHUNK_SIZE, GridFsAssetstoreAdapter
+
+
+def createFile(adapter, size):
+    """
+    Write a file of random data directly as GridFS chunks.
+
+    :param adapter: the adapter of the scratch assetstore.
+    :param size: the size of the file in bytes.
+    :returns: a file document that the adapter can download.
+    """
+    chunkUuid = uuid.uuid4().hex
+    for n, start in enumerate(range(0, size, CHUNK_SIZE)):
+        adapter.chunkColl.insert_one({
+            'uuid': chunkUuid,
+            'n': n,
+            'data': os.urandom(min(CHUNK_SIZE, size - start))
+        })
+    return {'size': size, 'chunkUuid': chunkUuid, 'chunkSize': CHUNK_SIZE}
+
+
+def download(adapter, file, sizes):
+    """
+    Stream a whole file, recording the number of bytes received.
+    """
+    size = 0
+    for data in adapter.downloadFile(file, headers=False)():
+        size += len(data)
+    sizes.append(size)
+
+
+def run(adapter, file, downloads):
+    """
+    Download a file from several threads at once.
+
+    :returns: the number of seconds it took.
+    """
+    sizes = []
+    threads = [threading.Thread(target=download, args=(adapter, file, sizes))
+               for _ in range(downloads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    if sizes != [file['size']] * downloads:
+        raise Exception('Downloads returned the wrong amount of data.')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure GridFS download throughput.')
+    parser.add_argument('--uri', default='mongodb://localhost:27017',
+                        help='MongoDB server to write the scratch database to')
+    parser.add_argument('--db', default='girder_benchmark_gridfs',
+                        help='name of the scratch database, which is dropped afterwards')
+    parser.add_argument('--size', type=int, default=64, help='size of the file in MB')
+    parser.add_argument('--downloads', type=int, default=8,
+                        help='number of downloads running at the same time')
+    parser.add_argument('--batch-size', type=int, default=4,
+                        help='number of chunks read per query')
+    parser.add_argument('--prefetch-workers', type=int, nargs='+', default=[0, 4],
+                        help='numbers of prefetch threads to compare')
+    parser.add_argument('--repeat', type=int, default=3, help='number of repeats')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.ERROR)
+
+    adapter = GridFsAssetstoreAdapter({'db': args.db, 'mongohost': args.uri})
+    if getattr(adapter, 'unavailable', False):
+        raise Exception('Could not connect to %s.' % args.uri)
+    serverConf = config.getConfig()['server']
+    serverConf['gridfs_download_batch_size'] = args.batch_size
+    try:
+        file = createFile(adapter, args.size * 1024 * 1024)
+        total = float(file['size'] * args.downloads) / 1024 / 1024
+        for workers in args.prefetch_workers:
+            # The pool is sized when it is created
+            gridfs_assetstore_adapter.closePrefetchPool()
+            serverConf['gridfs_download_prefetch_workers'] = workers
+            best = min(run(adapter, file, args.downloads) for _ in range(args.repeat))
+            print('%d prefetch workers: %d downloads of %d MB in %.3f s: %.1f MB/s' % (
+                workers, args.downloads, args.size, best, total / best))
+    finally:
+        gridfs_assetstore_adapter.closePrefetchPool()
+        getDbConnection(args.uri).drop_database(args.db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+"""
+Measure the routing throughput of REST resources.
+
+This matches a mix of request paths against resources with the same routes as
+the core item and file resources, padded with extra routes of the kind plugins
+add, and reports the number of route matches per second. It does not require a
+database.
+
+Example::
+
+    python scripts/benchmark_routing.py --extra-routes 50
+"""
+
+import argparse
+import logging
+import timeit
+
+from girder import logger
+from girder.api import access
+from girder.api.rest import Resource
+
+ROUTES = {
+    'item': [
+        ('DELETE', (':id',)),
+        ('GET', ()),
+        ('GET', (':id',)),
+        ('GET', (':id', 'files')),
+        ('GET', (':id', 'download')),
+        ('GET', (':id', 'rootpath')),
+        ('POST', ()),
+        ('PUT', (':id',)),
+        ('POST', (':id', 'copy')),
+        ('PUT', (':id', 'metadata')),
+        ('DELETE', (':id', 'metadata')),
+    ],
+    'file': [
+        ('DELETE', (':id',)),
+        ('DELETE', ('upload', ':id')),
+        ('GET', ('offset',)),
+        ('GET', (':id',)),
+        ('GET', (':id', 'download')),
+        ('GET', (':id', 'download', ':name')),
+        ('POST', ()),
+        ('POST', ('chunk',)),
+        ('POST', ('completion',)),
+        ('POST', (':id', 'copy')),
+        ('PUT', (':id',)),
+        ('PUT', (':id', 'contents')),
+        ('PUT', (':id', 'move')),
+    ]
+}
+
+PATHS = {
+    'item': [
+        ('get', ()),
+        ('get', ('5b4f2a1e0640fd0b2f7e1a10',)),
+        ('get', ('5b4f2a1e0640fd0b2f7e1a10', 'files')),
+        ('get', ('5b4f2a1e0640fd0b2f7e1a10', 'download')),
+        ('put', ('5b4f2a1e0640fd0b2f7e1a10', 'metadata')),
+        ('get', ('5b4f2a1e0640fd0b2f7e1a10', 'rootpath')),
+    ],
+    'file': [
+        ('get', ('5b4f2a1e0640fd0b2f7e1a11',)),
+        ('get', ('5b4f2a1e0640fd0b2f7e1a11', 'download')),
+        ('get', ('5b4f2a1e0640fd0b2f7e1a11', 'download', 'name.txt')),
+        ('post', ('chunk',)),
+        ('put', ('5b4f2a1e0640fd0b2f7e1a11', 'contents')),
+    ]
+}
+
+
+@access.public
+def _handler(**kwargs):
+    return kwargs
+
+
+def createResource(name, extraRoutes):
+    """
+    Create a resource with the routes of a core resource, followed by routes
+    shaped like those added by plugins, e.g. ``GET item/:id/plugin3`` and
+    ``PUT item/plugin3/:id``.
+    """
+    resource = Resource()
+    resource.resourceName = name
+    for method, route in ROUTES[name]:
+        resource.route(method, route, _handler, nodoc=True)
+    for i in range(extraRoutes):
+        plugin = 'plugin%d' % i
+        resource.route('GET', (':id', plugin), _handler, nodoc=True)
+        resource.route('PUT', (plugin, ':id'), _handler, nodoc=True)
+        resource.route('GET', (':id', plugin, ':key'), _handler, nodoc=True)
+    return resource
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure REST routing throughput.')
+    parser.add_argument('--extra-routes', type=int, default=20,
+                        help='number of plugin-style route groups to add to each resource')
+    parser.add_argument('--number', type=int, default=20000,
+                        help='number of passes over the request paths per repeat')
+    parser.add_argument('--repeat', type=int, default=5, help='number of repeats')
+    args = parser.parse_args()
+
+    # Route registration warns about undocumented routes; keep the output readable
+    logger.setLevel(logging.ERROR)
+
+    resources = {name: createResource(name, args.extra_routes) for name in ROUTES}
+
+    requests = [(resources[name], method, path)
+                for name, paths in PATHS.items() for method, path in paths]
+
+    def run():
+        for resource, method, path in requests:
+            resource._matchCompiledRoute(method, path)
+
+    best = min(timeit.repeat(run, number=args.number, repeat=args.repeat))
+    matches = args.number * len(requests)
+    print('%d route matches in %.3f s: %.0f matches/s, %.2f us/match' % (
+        matches, best, matches / best, best / matches * 1e6))
+
+
+if __name__ == '__main__':
+    main()
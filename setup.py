@@ -135,7 +135,8 @@ setup(
             'mount = girder.cli.mount:main',
             'shell = girder.cli.shell:main',
             'sftpd = girder.cli.sftpd:main',
-            'build = girder.cli.build:main'
+            'build = girder.cli.build:main',
+            'check-sizes = girder.cli.check_sizes:main'
         ]
     }
 )
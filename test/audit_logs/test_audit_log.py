@@ -1,12 +1,16 @@
+import cherrypy
 import datetime
+import logging
+import mock
 import pytest
 import six
+import threading
 from girder import auditLogger
 from girder.models.file import File
 from girder.models.folder import Folder
 from girder.models.upload import Upload
 from girder.models.user import User
-from girder_audit_logs import Record
+from girder_audit_logs import Record, _AuditLogDatabaseHandler
 
 
 @pytest.fixture
@@ -18,15 +22,30 @@ def recordModel():
 def freshLog():
     yield auditLogger
 
-    for handler in auditLogger.handlers:
+    for handler in list(auditLogger.handlers):
         auditLogger.removeHandler(handler)
+        cherrypy.engine.unsubscribe('stop', handler.close)
+        handler.close()
+
+
+def _flush(logger):
+    for handler in logger.handlers:
+        handler.flush()
+
+
+def _logRecord(index):
+    record = logging.LogRecord('girder_audit', logging.INFO, __file__, 0, 'test', (), None)
+    record.details = {'index': index}
+    return record
 
 
 @pytest.mark.plugin('audit_logs')
 def testAnonymousRestRequestLogging(server, recordModel, freshLog):
+    _flush(freshLog)
     recordModel.collection.remove({})  # Clear existing records
     server.request('/user/me')
 
+    _flush(freshLog)
     records = recordModel.find()
     assert records.count() == 1
     record = records[0]
@@ -43,11 +62,13 @@ def testAnonymousRestRequestLogging(server, recordModel, freshLog):
 
 @pytest.mark.plugin('audit_logs')
 def testFailedRestRequestLogging(server, recordModel, freshLog):
+    _flush(freshLog)
     recordModel.collection.remove({})  # Clear existing records
     server.request('/folder', method='POST', params={
         'name': 'Foo',
         'parentId': 'foo'
     })
+    _flush(freshLog)
     records = recordModel.find()
 
     assert records.count() == 1
@@ -64,8 +85,10 @@ def testFailedRestRequestLogging(server, recordModel, freshLog):
 
 @pytest.mark.plugin('audit_logs')
 def testAuthenticatedRestRequestLogging(server, recordModel, freshLog, admin):
+    _flush(freshLog)
     recordModel.collection.remove({})  # Clear existing records
     server.request('/user/me', user=admin)
+    _flush(freshLog)
     records = recordModel.find()
     assert records.count() == 1
     record = records[0]
@@ -74,6 +97,7 @@ def testAuthenticatedRestRequestLogging(server, recordModel, freshLog, admin):
 
 @pytest.mark.plugin('audit_logs')
 def testDownloadLogging(server, recordModel, freshLog, admin, fsAssetstore):
+    _flush(freshLog)
     recordModel.collection.remove({})  # Clear existing records
     folder = Folder().find({
         'parentId': admin['_id'],
@@ -83,10 +107,12 @@ def testDownloadLogging(server, recordModel, freshLog, admin, fsAssetstore):
         six.BytesIO(b'hello'), size=5, name='test', parentType='folder', parent=folder,
         user=admin, assetstore=fsAssetstore)
 
+    _flush(freshLog)
     recordModel.collection.remove({})  # Clear existing records
 
     File().download(file, headers=False, offset=2, endByte=4)
 
+    _flush(freshLog)
     records = recordModel.find()
 
     assert records.count() == 1
@@ -101,8 +127,10 @@ def testDownloadLogging(server, recordModel, freshLog, admin, fsAssetstore):
 
 @pytest.mark.plugin('audit_logs')
 def testDocumentCreationLogging(server, recordModel, freshLog):
+    _flush(freshLog)
     recordModel.collection.remove({})  # Clear existing records
     user = User().createUser('admin', 'password', 'first', 'last', 'a@a.com')
+    _flush(freshLog)
     records = recordModel.find(sort=[('when', 1)])
     assert records.count() == 3
 
@@ -110,3 +138,58 @@ def testDocumentCreationLogging(server, recordModel, freshLog):
     assert records[0]['details']['id'] == user['_id']
     assert records[1]['details']['collection'] == 'folder'
     assert records[2]['details']['collection'] == 'folder'
+
+
+@pytest.mark.plugin('audit_logs')
+def testRecordsAreWrittenInBatches(server, recordModel):
+    recordModel.collection.remove({})
+    handler = _AuditLogDatabaseHandler(batchSize=10, flushInterval=30)
+    insertMany = mock.MagicMock(side_effect=recordModel.collection.insert_many)
+    with mock.patch.object(Record, 'collection', mock.PropertyMock(), create=True) as collection:
+        collection.return_value.insert_many = insertMany
+        for i in range(25):
+            handler.handle(_logRecord(i))
+        handler.close()
+
+    # Two full batches, and the remainder when the handler is closed
+    assert [len(call[0][0]) for call in insertMany.call_args_list] == [10, 10, 5]
+    assert [r['details']['index'] for r in recordModel.find(sort=[('details.index', 1)])] == \
+        list(range(25))
+    assert handler.stats() == {'flushed': 25, 'dropped': 0, 'failed': 0, 'buffered': 0}
+
+
+@pytest.mark.plugin('audit_logs')
+def testRecordsAreWrittenAfterInterval(server, recordModel):
+    recordModel.collection.remove({})
+    handler = _AuditLogDatabaseHandler(batchSize=100, flushInterval=0.05)
+    handler.handle(_logRecord(0))
+    for _ in range(100):
+        if handler.stats()['flushed']:
+            break
+        threading.Event().wait(0.05)
+    assert recordModel.find().count() == 1
+    handler.close()
+
+
+@pytest.mark.plugin('audit_logs')
+def testFullBufferDropsRecords(server, recordModel):
+    recordModel.collection.remove({})
+    handler = _AuditLogDatabaseHandler(bufferSize=5, batchSize=100, flushInterval=30)
+    for i in range(8):
+        handler.handle(_logRecord(i))
+    assert handler.stats() == {'flushed': 0, 'dropped': 3, 'failed': 0, 'buffered': 5}
+    handler.close()
+    assert recordModel.find().count() == 5
+    assert handler.stats()['flushed'] == 5
+
+
+@pytest.mark.plugin('audit_logs')
+def testFullBufferBlocksRecords(server, recordModel):
+    recordModel.collection.remove({})
+    handler = _AuditLogDatabaseHandler(
+        bufferSize=2, batchSize=2, flushInterval=30, overflow='block')
+    for i in range(9):
+        handler.handle(_logRecord(i))
+    handler.close()
+    assert recordModel.find().count() == 9
+    assert handler.stats() == {'flushed': 9, 'dropped': 0, 'failed': 0, 'buffered': 0}
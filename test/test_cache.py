@@ -16,14 +16,25 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 ###############################################################################
+import cherrypy
+import io
 import mock
+import os
 import pytest
 
+from bson.objectid import ObjectId
 from girder import _setupCache
-from girder.constants import SettingKey
+from girder.constants import AccessType, SettingKey
+from girder.exceptions import AccessException
+from girder.models.file import File
+from girder.models.folder import Folder
+from girder.models.item import Item
 from girder.models.setting import Setting
+from girder.models.upload import Upload
+from girder.models.user import User
 from girder.utility import config
-from girder.utility._cache import cache, requestCache
+from girder.utility._cache import accessCache, blockCache, BlockCache, cache, requestCache
+from girder.utility.filesystem_assetstore_adapter import FilesystemAssetstoreAdapter
 
 
 @pytest.fixture
@@ -41,6 +52,66 @@ def enabledCache():
     _setupCache()
 
 
+@pytest.fixture
+def sharedAccessCache():
+    """
+    Side effect fixture which enables the cross-request access decision cache.
+    """
+    cfg = config.getConfig()
+    cfg['cache']['enabled'] = True
+    cfg['cache']['cache.access.size'] = 100
+    _setupCache()
+    accessCache.resetStats()
+
+    yield accessCache
+
+    cfg['cache']['enabled'] = False
+    del cfg['cache']['cache.access.size']
+    _setupCache()
+
+
+@pytest.fixture
+def smallBlockCache():
+    """
+    Side effect fixture which enables the block cache with small blocks.
+    """
+    cfg = config.getConfig()
+    cfg['cache']['enabled'] = True
+    cfg['cache']['cache.block.size'] = 1000
+    cfg['cache']['cache.block.block_size'] = 10
+    cfg['cache']['cache.block.read_ahead'] = 2
+    _setupCache()
+    blockCache.resetStats()
+
+    yield blockCache
+
+    cfg['cache']['enabled'] = False
+    for key in ('cache.block.size', 'cache.block.block_size', 'cache.block.read_ahead'):
+        del cfg['cache'][key]
+    _setupCache()
+
+
+@pytest.fixture
+def activeRequest():
+    """
+    Side effect fixture which makes the current thread appear to be serving a request.
+    """
+    cherrypy.request.app = cherrypy.tree.apps.get('', object())
+    accessCache.resetStats()
+
+    yield cherrypy.request
+
+    cherrypy.request.app = None
+    if hasattr(cherrypy.request, '_girderAccessCache'):
+        del cherrypy.request._girderAccessCache
+
+
+@pytest.fixture
+def privateItem(user):
+    folder = Folder().createFolder(user, 'private', parentType='user', public=False, creator=user)
+    yield folder, Item().createItem('item', user, folder)
+
+
 def testCachesAreAlwaysConfigured():
     assert cache.is_configured is True
     assert requestCache.is_configured is True
@@ -77,3 +148,128 @@ def testSettingsCache(db, enabledCache):
         setting.get(SettingKey.BRAND_NAME)
 
         findOneMock.assert_called_once()
+
+
+def testAccessCacheAcrossRequests(db, user, privateItem, sharedAccessCache):
+    folder, item = privateItem
+
+    with mock.patch.object(Folder(), 'load', wraps=Folder().load) as loadMock:
+        assert Item().hasAccess(item, user) is True
+        assert Item().hasAccess(item, user) is True
+        assert Item().hasAccess(item, None) is False
+        assert Item().hasAccess(item, None) is False
+        assert loadMock.call_count == 2
+    assert sharedAccessCache.stats()['hits'] == 2
+    assert sharedAccessCache.stats()['misses'] == 2
+
+    # Saving the folder drops the decisions made about it
+    Folder().setPublic(folder, True, save=True)
+    assert Item().hasAccess(item, None) is True
+
+    # Changes to the user's groups or admin status never reuse a decision
+    user['groups'] = [ObjectId()]
+    with mock.patch.object(Folder(), 'load', wraps=Folder().load) as loadMock:
+        assert Item().hasAccess(item, user, AccessType.ADMIN) is True
+        loadMock.assert_called_once()
+
+
+def testAccessCacheDropsDecisionsResolvedThroughParent(db, user, privateItem, sharedAccessCache):
+    folder, item = privateItem
+    file = File().createLinkFile('link', item, 'item', 'http://example.com', user)
+    other = User().createUser('reader', 'password', 'Re', 'Ader', 'reader@girder.test')
+    folder = Folder().setUserAccess(folder, other, AccessType.READ, save=True)
+
+    # The decision about the file is cached under its item
+    assert File().load(file['_id'], user=other, level=AccessType.READ) is not None
+    assert File().hasAccess(file, other) is True
+
+    # Revoking access on the folder drops the decisions resolved through it
+    Folder().setUserAccess(folder, other, None, save=True)
+    with pytest.raises(AccessException):
+        File().load(file['_id'], user=other, level=AccessType.READ)
+    assert File().hasAccess(file, other) is False
+
+
+def testAccessCacheWithinRequest(db, user, privateItem, activeRequest):
+    folder, item = privateItem
+    assert accessCache.maxSize == 0
+
+    with mock.patch.object(Folder(), 'load', wraps=Folder().load) as loadMock:
+        Item().load(item['_id'], user=user, level=AccessType.READ)
+        Item().load(item['_id'], user=user, level=AccessType.READ)
+        assert Item().hasAccess(item, user, AccessType.WRITE) is True
+        assert Item().hasAccess(item, user, AccessType.WRITE) is True
+        assert loadMock.call_count == 2
+    assert accessCache.stats()['hits'] == 2
+
+    Folder().setUserAccess(folder, user, AccessType.READ, save=True)
+    assert Item().hasAccess(item, user, AccessType.WRITE) is False
+
+    # Without a request and a shared store, nothing is cached
+    del activeRequest._girderAccessCache
+    activeRequest.app = None
+    with mock.patch.object(Folder(), 'load', wraps=Folder().load) as loadMock:
+        Item().hasAccess(item, user)
+        Item().hasAccess(item, user)
+        assert loadMock.call_count == 2
+
+
+def testBlockCacheEvictsLeastRecentlyUsed():
+    blocks = BlockCache(maxSize=25, blockSize=10)
+    blocks.set('a', 0, b'0' * 10)
+    blocks.set('a', 1, b'1' * 10)
+    assert blocks.get('a', 0) == b'0' * 10
+    blocks.set('b', 0, b'2' * 10)
+    assert blocks.get('a', 1) is None
+    assert blocks.get('a', 0) == b'0' * 10
+    assert blocks.stats() == {
+        'hits': 2, 'misses': 1, 'hitRate': 2.0 / 3, 'blocks': 2, 'size': 20, 'maxSize': 25,
+        'blockSize': 10}
+
+    # A disabled cache keeps nothing
+    blocks.configure(0)
+    blocks.set('a', 0, b'0')
+    assert blocks.stats()['blocks'] == 0
+
+
+def testFileHandleUsesBlockCache(user, fsAssetstore, smallBlockCache):
+    contents = os.urandom(95)
+    folder = Folder().createFolder(user, 'blocks', parentType='user', creator=user)
+    file = Upload().uploadFromFile(
+        io.BytesIO(contents), len(contents), 'blocks.bin', 'folder', folder, user)
+
+    downloadFile = FilesystemAssetstoreAdapter.downloadFile
+    with mock.patch.object(
+            FilesystemAssetstoreAdapter, 'downloadFile', autospec=True,
+            side_effect=downloadFile) as download:
+        with File().open(file) as handle:
+            # The first read fetches one block, then sequential reads fetch ahead
+            assert handle.read(5) == contents[:5]
+            assert download.call_count == 1
+            assert handle.read(10) == contents[5:15]
+            assert download.call_count == 2
+            assert download.call_args[1]['offset'] == 10
+            assert download.call_args[1]['endByte'] == 40
+            assert handle.read(20) == contents[15:35]
+            assert download.call_count == 2
+
+            handle.seek(-3, os.SEEK_END)
+            assert handle.read() == contents[-3:]
+            assert handle.read() == b''
+
+        # Another handle of the same file shares the blocks
+        with File().open(file) as handle:
+            handle.seek(12)
+            assert handle.read(20) == contents[12:32]
+        assert download.call_count == 3
+
+    stats = smallBlockCache.stats()
+    assert stats['blocks'] == 5
+    assert stats['hits'] > stats['misses']
+
+    # Replacing the contents of the file does not reuse its blocks
+    newContents = os.urandom(30)
+    upload = Upload().createUploadToFile(file, user, len(newContents))
+    file = Upload().handleChunk(upload, io.BytesIO(newContents))
+    with File().open(file) as handle:
+        assert handle.read() == newContents
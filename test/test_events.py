@@ -19,6 +19,7 @@
 
 import mock
 import pytest
+import threading
 import time
 
 from girder import events
@@ -110,13 +111,13 @@ def testAsyncEvents(eventsHelper):
             events.bound(name, handlerName, eventsHelper._incrementWithResponse):
         # Make sure an async handler that fails does not break the event
         # loop and that its callback is not triggered.
-        assert events.daemon.eventQueue.qsize() == 0
+        assert events.daemon.stats()['queueSize'] == 0
         events.daemon.trigger(failname, handlerName, callback)
 
         # Triggering the event before the daemon starts should do nothing
-        assert events.daemon.eventQueue.qsize() == 1
+        assert events.daemon.stats()['queueSize'] == 1
         events.daemon.trigger(name, {'amount': 2}, callback)
-        assert events.daemon.eventQueue.qsize() == 2
+        assert events.daemon.stats()['queueSize'] == 2
         assert eventsHelper.ctr == 0
 
         # Now run the asynchronous event handler, which should eventually
@@ -128,13 +129,13 @@ def testAsyncEvents(eventsHelper):
         # finished.
         startTime = time.time()
         while True:
-            if events.daemon.eventQueue.qsize() == 0:
+            if events.daemon.stats()['queueSize'] == 0:
                 if eventsHelper.ctr == 3:
                     break
             if time.time() - startTime > 15:
                 break
             time.sleep(0.1)
-        assert events.daemon.eventQueue.qsize() == 0
+        assert events.daemon.stats()['queueSize'] == 0
         assert eventsHelper.ctr == 3
         assert eventsHelper.responses == ['foo']
         events.daemon.stop()
@@ -162,3 +163,216 @@ def testForegroundDaemon(eventsHelper):
     assert eventsHelper.responses == ['foo']
 
     events.daemon.stop()
+
+
+def testWildcardEvents(eventsHelper):
+    assert not events.hasListeners('_test.wild.event')
+
+    with events.bound('_test.wild.*', '_test.wildcard', eventsHelper._incrementWithResponse):
+        assert events.hasListeners('_test.wild.event')
+        assert events.hasListeners('_test.wild.other.event')
+        assert not events.hasListeners('_test.wilder.event')
+        assert not events.hasListeners('_test.wild')
+
+        with events.bound('_test.wild.event', '_test.exact', eventsHelper._increment):
+            event = events.trigger('_test.wild.event', {'amount': 2})
+            assert eventsHelper.ctr == 4
+            assert event.responses == ['foo']
+            # Exact bindings are called before wildcard bindings
+            assert event.currentHandlerName == '_test.wildcard'
+
+        # Regular expression characters in the pattern are literal
+        events.trigger('_test_wild_event', {'amount': 1})
+        assert eventsHelper.ctr == 4
+
+    assert not events.hasListeners('_test.wild.event')
+    events.trigger('_test.wild.event', {'amount': 1})
+    assert eventsHelper.ctr == 4
+
+
+def testHandlerTimes(eventsHelper):
+    events.resetHandlerTimes()
+    events.trigger('_test.event', {'amount': 1})
+    assert '_test.event' not in events.getHandlerTimes()
+
+    with events.bound('_test.event', '_test.handler', eventsHelper._increment):
+        events.trigger('_test.event', {'amount': 1})
+        events.trigger('_test.event', {'amount': 1})
+    with events.bound('_test.event', '_test.handler', eventsHelper._raiseException):
+        with pytest.raises(Exception, match='^Failure condition$'):
+            events.trigger('_test.event')
+
+    times = events.getHandlerTimes()['_test.event']
+    assert times['calls'] == 3
+    assert 0 <= times['maxTime'] <= times['totalTime']
+
+    events.resetHandlerTimes()
+    assert events.getHandlerTimes() == {}
+
+
+def testHandlerTimesAreBounded(eventsHelper):
+    events.resetHandlerTimes()
+    with mock.patch.object(events, '_MAX_RESOLVED', 2), \
+            events.bound('_test.*', '_test.handler', eventsHelper._increment):
+        for i in range(3):
+            events.trigger('_test.event%d' % i, {'amount': 1})
+        assert len(events.getHandlerTimes()) <= 2
+        assert '_test.event2' in events.getHandlerTimes()
+    events.resetHandlerTimes()
+
+
+def testResolvingHandlersDuringBind(eventsHelper):
+    resolving = threading.Event()
+    proceed = threading.Event()
+
+    class SlowPattern(object):
+        def match(self, eventName):
+            resolving.set()
+            proceed.wait(15)
+            return None
+
+    with events.bound('_test.*', '_test.wildcard', eventsHelper._increment), \
+            mock.patch.dict(events._wildcards, {'_test.*': SlowPattern()}):
+        resolver = threading.Thread(target=events.hasListeners, args=('_test.event', ))
+        resolver.start()
+        assert resolving.wait(15)
+        # A binding made while the handlers are being resolved is not lost
+        binder = threading.Thread(target=events.bind, args=(
+            '_test.event', '_test.handler', eventsHelper._increment))
+        binder.start()
+        time.sleep(0.1)
+        proceed.set()
+        resolver.join(15)
+        binder.join(15)
+        try:
+            assert [name for name, _ in events._handlers('_test.event')] == ['_test.handler']
+        finally:
+            events.unbind('_test.event', '_test.handler')
+
+
+def _waitFor(condition, timeout=15):
+    startTime = time.time()
+    while not condition() and time.time() - startTime < timeout:
+        time.sleep(0.05)
+    return condition()
+
+
+def testAsyncEventsConcurrencyLimit():
+    daemon = events.AsyncEventsThread(workers=3, concurrency={'_test.slow': 1})
+    release = threading.Event()
+    active = []
+    maxActive = []
+    handled = []
+
+    def slowHandler(event):
+        active.append(event.info)
+        maxActive.append(len(active))
+        release.wait(15)
+        active.remove(event.info)
+        handled.append(event.info)
+
+    def fastHandler(event):
+        handled.append(event.info)
+
+    with events.bound('_test.slow', '_test.handler', slowHandler), \
+            events.bound('_test.fast', '_test.handler', fastHandler):
+        daemon.start()
+        try:
+            for i in range(3):
+                daemon.trigger('_test.slow', 'slow%d' % i)
+            assert _waitFor(lambda: daemon.stats()['deferred'] == {'_test.slow': 2})
+            # Deferred events do not occupy workers, so other events still proceed
+            daemon.trigger('_test.fast', 'fast')
+            assert _waitFor(lambda: 'fast' in handled)
+            assert daemon.stats()['running'] == {'_test.slow': 1}
+
+            release.set()
+            assert _waitFor(lambda: len(handled) == 4)
+            assert max(maxActive) == 1
+            stats = daemon.stats()
+            assert stats['processed'] == 4
+            assert stats['triggered'] == 4
+            assert stats['deferred'] == {}
+            assert stats['maxWaitTime'] >= stats['meanWaitTime'] >= 0
+        finally:
+            release.set()
+            daemon.stop()
+
+
+def testAsyncEventsDeferredEventsCountTowardsQueueSize():
+    daemon = events.AsyncEventsThread(
+        workers=2, maxQueueSize=2, overflow='block', concurrency={'_test.slow': 1})
+    release = threading.Event()
+    handled = []
+
+    def slowHandler(event):
+        release.wait(15)
+        handled.append(event.info)
+
+    with events.bound('_test.slow', '_test.handler', slowHandler):
+        daemon.start()
+        try:
+            daemon.trigger('_test.slow', 0)
+            assert _waitFor(lambda: daemon.stats()['running'] == {'_test.slow': 1})
+            daemon.trigger('_test.slow', 1)
+            daemon.trigger('_test.slow', 2)
+            assert _waitFor(lambda: daemon.stats()['deferred'] == {'_test.slow': 2})
+
+            # The deferred events fill the queue, so the producer blocks
+            producer = threading.Thread(target=daemon.trigger, args=('_test.slow', 3))
+            producer.start()
+            time.sleep(0.2)
+            assert producer.is_alive()
+
+            release.set()
+            producer.join(15)
+            assert not producer.is_alive()
+            assert _waitFor(lambda: len(handled) == 4)
+            assert handled == [0, 1, 2, 3]
+        finally:
+            release.set()
+            daemon.stop()
+
+
+def testAsyncEventsStopLogsDiscardedEvents():
+    daemon = events.AsyncEventsThread()
+    daemon.trigger('_test.event', 'first')
+    daemon.trigger('_test.other', 'second')
+
+    with mock.patch('girder.logger.warning') as warning:
+        daemon.stop()
+        warning.assert_called_once_with(
+            'Stopped the event daemon with 2 asynchronous events not handled: '
+            '_test.event, _test.other')
+        daemon.trigger('_test.event', 'third')
+        assert warning.call_count == 2
+    assert daemon.stats()['dropped'] == 3
+    assert daemon.stats()['queueSize'] == 0
+
+
+@pytest.mark.parametrize('overflow,handled,dropped', [
+    ('drop', ['first'], 1),
+    ('foreground', ['second', 'first'], 0)
+])
+def testAsyncEventsOverflow(overflow, handled, dropped):
+    daemon = events.AsyncEventsThread(maxQueueSize=1, overflow=overflow)
+    seen = []
+
+    with events.bound('_test.event', '_test.handler', lambda event: seen.append(event.info)):
+        # The daemon is not started, so the first event fills the queue
+        daemon.trigger('_test.event', 'first')
+        daemon.trigger('_test.event', 'second')
+        assert daemon.stats()['dropped'] == dropped
+        assert daemon.stats()['queueSize'] == 1
+
+        daemon.start()
+        try:
+            assert _waitFor(lambda: len(seen) == len(handled))
+            assert seen == handled
+        finally:
+            daemon.stop()
+
+
+def testAsyncEventsInvalidOverflow():
+    with pytest.raises(ValueError, match='overflow policy'):
+        events.AsyncEventsThread(overflow='explode')
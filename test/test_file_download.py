@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import io
+import os
+import pytest
+
+from girder import events
+from girder.models.folder import Folder
+from girder.models.upload import Upload
+from girder.utility import config
+from pytest_girder.assertions import assertStatus, assertStatusOk
+from pytest_girder.utils import getResponseBody
+
+CONTENTS = b'hello world, this is a file'
+
+
+@pytest.fixture
+def fsFile(user, fsAssetstore):
+    folder = Folder().childFolders(user, 'user', user=user).next()
+    yield Upload().uploadFromFile(
+        io.BytesIO(CONTENTS), len(CONTENTS), 'hello.txt', 'folder', folder, user,
+        mimeType='text/plain')
+
+
+@pytest.fixture
+def downloadOffload():
+    serverConfig = config.getConfig()['server']
+
+    def setMode(mode):
+        serverConfig['file_download_offload'] = mode
+
+    yield setMode
+
+    serverConfig.pop('file_download_offload', None)
+
+
+def testDownloadStreamsByDefault(server, user, fsFile):
+    resp = server.request('/file/%s/download' % fsFile['_id'], user=user, isJson=False)
+    assertStatusOk(resp)
+    assert getResponseBody(resp) == CONTENTS.decode()
+    assert 'X-Accel-Redirect' not in resp.headers
+    assert 'X-Sendfile' not in resp.headers
+
+
+def testDownloadOffloadXSendfile(server, user, fsAssetstore, fsFile, downloadOffload):
+    downloadOffload('X-Sendfile')
+    completed = []
+    with events.bound('model.file.download.complete', 'test', completed.append):
+        resp = server.request('/file/%s/download' % fsFile['_id'], user=user, isJson=False)
+        assertStatusOk(resp)
+        assert getResponseBody(resp) == ''
+    assert resp.headers['X-Sendfile'] == os.path.join(fsAssetstore['root'], fsFile['path'])
+    assert resp.headers['Content-Type'].startswith('text/plain')
+    assert 'filename="hello.txt"' in resp.headers['Content-Disposition']
+    assert 'Content-Range' not in resp.headers
+    assert len(completed) == 1
+
+
+def testDownloadOffloadXAccelRedirect(server, user, fsAssetstore, fsFile, downloadOffload):
+    downloadOffload('X-Accel-Redirect')
+    resp = server.request('/file/%s/download' % fsFile['_id'], user=user, isJson=False)
+    assertStatusOk(resp)
+    assert resp.headers['X-Accel-Redirect'] == '/girder_assetstore/%s/%s' % (
+        fsAssetstore['_id'], fsFile['path'])
+
+    # Ranges in the Range header are left to the web server
+    resp = server.request('/file/%s/download' % fsFile['_id'], user=user, isJson=False,
+                          additionalHeaders=[('Range', 'bytes=2-5')])
+    assertStatusOk(resp)
+    assert 'X-Accel-Redirect' in resp.headers
+
+    # Ranges in query parameters are not known to the web server
+    resp = server.request('/file/%s/download' % fsFile['_id'], user=user, isJson=False,
+                          params={'offset': 2, 'endByte': 6})
+    assertStatus(resp, 206)
+    assert 'X-Accel-Redirect' not in resp.headers
+    assert getResponseBody(resp) == CONTENTS[2:6].decode()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import mock
+import os
+import pytest
+
+from girder import events
+from girder.exceptions import ValidationException
+from girder.models.assetstore import Assetstore
+from girder.models.file import File
+from girder.models.folder import Folder
+from girder.models.import_checkpoint import ImportCheckpoint
+from girder.models.item import Item
+from girder.utility.filesystem_assetstore_adapter import FilesystemAssetstoreAdapter
+from girder.utility.progress import noProgress
+
+TREE = {
+    'a.txt': b'aaaa',
+    'sub1': {'b.txt': b'bb', 'c.txt': b'ccc'},
+    'sub2': {'d.txt': b'd', 'deeper': {'e.txt': b'eeeee'}},
+}
+
+
+def _makeTree(root, tree):
+    for name, value in tree.items():
+        path = os.path.join(root, name)
+        if isinstance(value, dict):
+            os.mkdir(path)
+            _makeTree(path, value)
+        else:
+            with open(path, 'wb') as f:
+                f.write(value)
+
+
+@pytest.fixture
+def tree(tmpdir):
+    _makeTree(str(tmpdir), TREE)
+    yield str(tmpdir)
+
+
+@pytest.fixture
+def destination(user):
+    yield Folder().createFolder(user, 'import', parentType='user', creator=user)
+
+
+class RecordingProgress(object):
+    def __init__(self):
+        self.messages = []
+
+    def update(self, **kwargs):
+        if 'message' in kwargs:
+            self.messages.append(kwargs['message'])
+
+
+def _import(assetstore, destination, user, path, progress=noProgress, leafFoldersAsItems=False):
+    Assetstore().importData(
+        assetstore, parent=destination, parentType='folder', params={'importPath': path},
+        progress=progress, user=user, leafFoldersAsItems=leafFoldersAsItems)
+
+
+def _listing(folder):
+    result = {}
+    for item in Folder().childItems(folder):
+        result[item['name']] = {f['name']: f['size'] for f in Item().childFiles(item)}
+    for child in Folder().find({'parentId': folder['_id'], 'parentCollection': 'folder'}):
+        result[child['name']] = _listing(child)
+    return result
+
+
+def testImportTree(fsAssetstore, user, destination, tree):
+    imported = []
+    progress = RecordingProgress()
+    with events.bound('filesystem_assetstore_imported', 'test', lambda e: imported.append(e.info)):
+        _import(fsAssetstore, destination, user, tree, progress)
+
+    assert _listing(destination) == {
+        'a.txt': {'a.txt': 4},
+        'sub1': {'b.txt': {'b.txt': 2}, 'c.txt': {'c.txt': 3}},
+        'sub2': {'d.txt': {'d.txt': 1}, 'deeper': {'e.txt': {'e.txt': 5}}},
+    }
+    assert sorted(info['type'] for info in imported) == ['folder'] * 3 + ['item'] * 5
+    file = File().findOne({'name': 'e.txt'})
+    assert file['imported'] is True
+    assert file['path'] == os.path.join(tree, 'sub2', 'deeper', 'e.txt')
+    assert Item().load(file['itemId'], force=True)['size'] == 5
+    assert Folder().load(destination['_id'], force=True)['size'] == 4
+    assert any('files/s' in message for message in progress.messages)
+    assert ImportCheckpoint().find().count() == 0
+
+    # Importing again reuses what exists
+    _import(fsAssetstore, destination, user, tree)
+    assert File().find().count() == 5
+    assert Item().find().count() == 5
+
+
+def testImportLeafFoldersAsItems(fsAssetstore, user, destination, tree):
+    _import(fsAssetstore, destination, user, tree, leafFoldersAsItems=True)
+
+    assert _listing(destination) == {
+        'a.txt': {'a.txt': 4},
+        'sub1': {'b.txt': 2, 'c.txt': 3},
+        'sub2': {'d.txt': {'d.txt': 1}, 'deeper': {'e.txt': 5}},
+    }
+
+
+def testImportFilesUnderUser(fsAssetstore, user, tree):
+    with pytest.raises(ValidationException, match='directly underneath a user'):
+        Assetstore().importData(
+            fsAssetstore, parent=user, parentType='user', params={'importPath': tree},
+            progress=noProgress, user=user, leafFoldersAsItems=False)
+
+
+def testImportResumesFromCheckpoint(fsAssetstore, user, destination, tree):
+    failing = os.path.join(tree, 'sub2', 'deeper', 'e.txt')
+    checked = []
+    failures = [True]
+
+    def shouldImportFile(self, path, params):
+        checked.append(path)
+        if path == failing and failures:
+            failures.pop()
+            raise ValidationException('Simulated failure')
+        return True
+
+    with mock.patch.object(FilesystemAssetstoreAdapter, 'shouldImportFile', shouldImportFile):
+        with pytest.raises(ValidationException, match='Simulated failure'):
+            _import(fsAssetstore, destination, user, tree)
+        assert {doc['path'] for doc in ImportCheckpoint().find()} == {os.path.join(tree, 'sub1')}
+
+        del checked[:]
+        _import(fsAssetstore, destination, user, tree)
+
+    # The completed directory was not imported again
+    assert not any(path.startswith(os.path.join(tree, 'sub1')) for path in checked)
+    assert failing in checked
+    assert File().find().count() == 5
+    assert ImportCheckpoint().find().count() == 0
+
+
+def testInsertMany(user, destination):
+    created = []
+    with events.bound('model.item.save.created', 'test', lambda e: created.append(e.info)):
+        items = Item().insertMany([{
+            'name': ' name%d ' % i, 'folderId': destination['_id'], 'creatorId': user['_id']
+        } for i in range(3)])
+
+    assert [item['name'] for item in items] == ['name0', 'name1', 'name2']
+    assert [item['_id'] for item in created] == [item['_id'] for item in items]
+    assert Item().find({'folderId': destination['_id']}).count() == 3
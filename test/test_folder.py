@@ -17,11 +17,15 @@
 #  limitations under the License.
 ###############################################################################
 
+import mock
 import pytest
 from bson.objectid import ObjectId
 
-from girder.exceptions import AccessException
+from girder.constants import AccessType
+from girder.exceptions import AccessException, ValidationException
+from girder.models.collection import Collection
 from girder.models.folder import Folder
+from girder.models.item import Item
 from pytest_girder.assertions import assertStatus, assertStatusOk
 
 
@@ -149,3 +153,116 @@ def testGetResourcePathForNoneUser(server, parentChain):
                           method='GET', user=None,
                           params={'type': 'folder'})
     assertStatus(resp, 401)
+
+
+@pytest.fixture
+def tree(admin):
+    c1 = Collection().createCollection(name='C1', creator=admin)
+    c2 = Collection().createCollection(name='C2', creator=admin)
+    f1 = Folder().createFolder(parent=c1, parentType='collection', creator=admin, name='F1')
+    f2 = Folder().createFolder(parent=f1, parentType='folder', creator=admin, name='F2')
+    f3 = Folder().createFolder(parent=f2, parentType='folder', creator=admin, name='F3')
+    item = Item().createItem(name='I1', creator=admin, folder=f3)
+    yield {'c1': c1, 'c2': c2, 'f1': f1, 'f2': f2, 'f3': f3, 'item': item}
+
+
+def testAncestorIdsOnCreate(tree):
+    assert tree['f1']['ancestorIds'] == []
+    assert tree['f2']['ancestorIds'] == [tree['f1']['_id']]
+    assert tree['f3']['ancestorIds'] == [tree['f1']['_id'], tree['f2']['_id']]
+    assert tree['item']['ancestorIds'] == [
+        tree['f1']['_id'], tree['f2']['_id'], tree['f3']['_id']]
+
+
+def testMoveFolderUpdatesDescendantAncestors(tree, admin):
+    newParent = Folder().createFolder(
+        parent=tree['c2'], parentType='collection', creator=admin, name='Target')
+    Folder().move(tree['f2'], newParent, 'folder')
+
+    f3 = Folder().load(tree['f3']['_id'], force=True)
+    item = Item().load(tree['item']['_id'], force=True)
+    assert f3['ancestorIds'] == [newParent['_id'], tree['f2']['_id']]
+    assert f3['baseParentId'] == tree['c2']['_id']
+    assert item['ancestorIds'] == [newParent['_id'], tree['f2']['_id'], tree['f3']['_id']]
+    assert item['baseParentId'] == tree['c2']['_id']
+
+    parents = Folder().parentsToRoot(f3, force=True)
+    assert [p['object']['_id'] for p in parents] == [
+        tree['c2']['_id'], newParent['_id'], tree['f2']['_id']]
+
+    with pytest.raises(ValidationException, match='underneath itself'):
+        Folder().move(newParent, f3, 'folder')
+
+
+def testSubtreeOperationsWithoutAncestorIds(tree, admin):
+    # Documents created before the field existed are only fixed on load or by
+    # the consistency check, so subtree operations must not rely on them.
+    Folder().update({'_id': {'$in': [tree['f2']['_id'], tree['f3']['_id']]}},
+                    {'$unset': {'ancestorIds': True}})
+    Item().update({'_id': tree['item']['_id']}, {'$unset': {'ancestorIds': True}})
+    Item().update({'_id': tree['item']['_id']}, {'$set': {'size': 5}})
+    Folder().update({'_id': tree['f3']['_id']}, {'$set': {'size': 5}})
+    Folder().resetAncestorIdsCache()
+    assert not Folder().hasAncestorIds()
+
+    f1 = Folder().load(tree['f1']['_id'], force=True)
+    assert Folder().getSizeRecursive(f1) == 5
+    assert Folder().subtreeCount(f1) == 4
+
+    Folder().move(f1, tree['c2'], 'collection')
+    f3 = Folder().findOne({'_id': tree['f3']['_id']})
+    item = Item().findOne({'_id': tree['item']['_id']})
+    assert f3['baseParentId'] == tree['c2']['_id']
+    assert item['baseParentId'] == tree['c2']['_id']
+
+    newParent = Folder().createFolder(
+        parent=tree['c1'], parentType='collection', creator=admin, name='Target')
+    Folder().move(Folder().findOne({'_id': tree['f2']['_id']}), newParent, 'folder')
+    assert Folder().hasAncestorIds()
+    assert Folder().findOne({'_id': tree['f3']['_id']})['ancestorIds'] == [
+        newParent['_id'], tree['f2']['_id']]
+    assert Item().findOne({'_id': tree['item']['_id']})['ancestorIds'] == [
+        newParent['_id'], tree['f2']['_id'], tree['f3']['_id']]
+    assert Folder().findOne({'_id': tree['f3']['_id']})['baseParentId'] == tree['c1']['_id']
+
+
+def testSubtreeCount(tree, admin, user):
+    assert Folder().subtreeCount(tree['f1']) == 4
+    assert Folder().subtreeCount(tree['f1'], includeItems=False) == 3
+
+    Folder().setPublic(tree['f1'], True, save=True)
+    Folder().setPublic(tree['f2'], True, save=True)
+    f3 = Folder().setPublic(tree['f3'], False, save=True)
+    assert Folder().subtreeCount(tree['f1'], user=user, level=AccessType.READ) == 2
+
+    Folder().setUserAccess(f3, user, AccessType.READ, save=True)
+    assert Folder().subtreeCount(tree['f1'], user=user, level=AccessType.READ) == 4
+
+
+def testConsistencyCheckFixesAncestors(server, tree, admin):
+    Folder().update({'_id': tree['f3']['_id']}, {'$set': {'ancestorIds': []}})
+    Item().update({'_id': tree['item']['_id']}, {'$set': {'ancestorIds': []}})
+
+    resp = server.request(path='/system/check', method='PUT', user=admin)
+    assertStatusOk(resp)
+    assert resp.json['ancestorsFixed'] == 2
+    assert Item().load(tree['item']['_id'], force=True)['ancestorIds'] == [
+        tree['f1']['_id'], tree['f2']['_id'], tree['f3']['_id']]
+
+
+def testHasAncestorIdsIsCached(server, tree, admin):
+    assert Folder().hasAncestorIds()
+    Folder().update({'_id': tree['f3']['_id']}, {'$unset': {'ancestorIds': True}})
+    with mock.patch.object(Folder(), 'findOne') as findOne:
+        assert Folder().hasAncestorIds()
+    assert not findOne.called
+
+    # The consistency check backfills the field and checks for it again
+    with mock.patch.object(Folder(), 'findOne', side_effect=Folder().findOne) as findOne:
+        resp = server.request(path='/system/check', method='PUT', user=admin)
+    assertStatusOk(resp)
+    assert mock.call({'ancestorIds': {'$exists': False}}, fields=['_id']) in \
+        findOne.call_args_list
+    assert Folder().hasAncestorIds()
+    assert Folder().load(tree['f3']['_id'], force=True)['ancestorIds'] == [
+        tree['f1']['_id'], tree['f2']['_id']]
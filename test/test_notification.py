@@ -18,9 +18,18 @@
 ###############################################################################
 
 import datetime
+import json
+import mock
 import pytest
+import threading
+import time
 from pytest_girder.assertions import assertStatus, assertStatusOk
+from pytest_girder.utils import getResponseBody
+from girder.constants import SettingKey
 from girder.models.notification import Notification
+from girder.models.setting import Setting
+from girder.utility import config
+from girder.utility.notification_broker import broker
 
 OLD_TIME = datetime.datetime.utcnow() - datetime.timedelta(days=3)
 SINCE = OLD_TIME + datetime.timedelta(days=1)
@@ -56,3 +65,119 @@ def testListNotificationsSinceTime(server, user, notifications):
 def testListNotificationsAuthError(server):
     resp = server.request(path='/notification')
     assertStatus(resp, 401)
+
+
+@pytest.fixture
+def notificationSource():
+    serverConfig = config.getConfig()['server']
+
+    def setSource(source):
+        broker.stop()
+        serverConfig['notification_source'] = source
+        serverConfig['notification_poll_interval'] = 0.05
+
+    yield setSource
+
+    broker.stop()
+    serverConfig.pop('notification_source', None)
+    serverConfig.pop('notification_poll_interval', None)
+
+
+def testBrokerPushesSavedNotifications(user, admin, notificationSource):
+    notificationSource('local')
+    subscription = broker.subscribe(user)
+    other = broker.subscribe(admin)
+    try:
+        doc = Notification().createNotification('type', {'value': 1}, user)
+        assert [event['_id'] for event in subscription.wait(1)] == [doc['_id']]
+        assert other.wait(0) == []
+
+        # Updates are delivered again, but repeats of the same update are not
+        doc['data']['value'] = 2
+        doc['updated'] = datetime.datetime.utcnow()
+        Notification().save(doc)
+        broker.publish(doc)
+        events = subscription.wait(1)
+        assert [event['data']['value'] for event in events] == [2]
+        assert subscription.wait(0) == []
+
+        stats = broker.stats()
+        assert stats['source'] == 'local'
+        assert stats['streams'] == 2
+        assert stats['delivered'] == 2
+        assert stats['polls'] == 0
+    finally:
+        subscription.close()
+        other.close()
+    assert broker.stats()['streams'] == 0
+
+
+# Without a replica set, the change stream source falls back to polling
+@pytest.mark.parametrize('source', ['poll', 'change_stream'])
+def testBrokerPollsForNotifications(user, notificationSource, source):
+    notificationSource(source)
+    subscription = broker.subscribe(user)
+    try:
+        # Notifications saved by another process don't trigger local events
+        now = datetime.datetime.utcnow()
+        Notification().collection.insert_one({
+            'type': 'type', 'data': {}, 'userId': user['_id'], 'time': now, 'updated': now,
+            'updatedTime': time.time()})
+        deadline = time.time() + 5
+        events = []
+        while not events and time.time() < deadline:
+            events = subscription.wait(0.1)
+        assert len(events) == 1
+    finally:
+        subscription.close()
+
+
+def testBrokerPollPublishesEachUpdateOnce(user, notificationSource):
+    notificationSource('poll')
+    subscription = broker.subscribe(user)
+    try:
+        # Saved notifications are pushed, and polling finds them again
+        doc = Notification().createNotification('type', {'value': 1}, user)
+        now = datetime.datetime.utcnow()
+        other = Notification().collection.insert_one({
+            'type': 'type', 'data': {}, 'userId': user['_id'], 'time': now, 'updated': now,
+            'updatedTime': time.time()}).inserted_id
+        deadline = time.time() + 5
+        while broker.stats()['polls'] < 5 and time.time() < deadline:
+            time.sleep(0.05)
+        assert sorted(event['_id'] for event in subscription.wait(0)) == sorted([doc['_id'], other])
+        assert broker.stats()['published'] == 2
+
+        # A new update is published once more
+        Notification().collection.update_one(
+            {'_id': other}, {'$set': {'updated': datetime.datetime.utcnow()}})
+        polls = broker.stats()['polls']
+        while broker.stats()['polls'] < polls + 5 and time.time() < deadline:
+            time.sleep(0.05)
+        assert [event['_id'] for event in subscription.wait(0)] == [other]
+        assert broker.stats()['published'] == 3
+    finally:
+        subscription.close()
+
+
+def testStreamWaitsForPushedNotifications(server, user, notificationSource):
+    notificationSource('local')
+    Setting().set(SettingKey.ENABLE_NOTIFICATION_STREAM, True)
+
+    def notify():
+        time.sleep(0.3)
+        Notification().createNotification('type', {'pushed': True}, user)
+
+    thread = threading.Thread(target=notify)
+    thread.start()
+    get = Notification.get
+    with mock.patch.object(Notification, 'get', autospec=True, side_effect=get) as queries:
+        resp = server.request(
+            path='/notification/stream', user=user, isJson=False, params={'timeout': 1})
+        assertStatusOk(resp)
+        body = getResponseBody(resp)
+    thread.join()
+    messages = [json.loads(m[len('data: '):]) for m in body.strip().split('\n\n')]
+    assert [message['data'] for message in messages] == [{'pushed': True}]
+    # The stream queried the database once, rather than polling
+    assert queries.call_count == 1
@@ -1,5 +1,13 @@
+import mock
 import pytest
+
+from girder.exceptions import AccessException, ResourcePathNotFound
+from girder.models.collection import Collection
+from girder.models.file import File
+from girder.models.folder import Folder
+from girder.models.item import Item
 from girder.utility import path
+from girder.utility._cache import pathCache
 
 
 @pytest.mark.parametrize('raw,encoded', [
@@ -33,3 +41,98 @@ def testCodec(raw, encoded):
 def testSplitAndJoin(pth, tokens):
     assert path.split(pth) == tokens
     assert path.join(tokens) == pth
+
+
+@pytest.fixture
+def pathCacheEnabled():
+    pathCache.configure(1000)
+    yield pathCache
+    pathCache.configure(0)
+
+
+@pytest.fixture
+def hierarchy(admin):
+    collection = Collection().createCollection('coll', creator=admin, public=False)
+    parent, parentType = collection, 'collection'
+    folders = []
+    for name in ('a', 'b', 'c', 'd'):
+        parent = Folder().createFolder(parent, name, parentType=parentType, creator=admin)
+        parentType = 'folder'
+        folders.append(parent)
+    item = Item().createItem('item', admin, parent)
+    file = File().createLinkFile('file', item, 'item', 'http://example.com', admin)
+    yield collection, folders, item, file
+
+
+PATH = '/collection/coll/a/b/c/d/item/file'
+
+
+@pytest.mark.parametrize('cacheSize', [0, 1000])
+def testLookUpPathResolvesFolderRunsTogether(admin, hierarchy, cacheSize):
+    collection, folders, item, file = hierarchy
+    pathCache.configure(cacheSize)
+    try:
+        with mock.patch.object(path, 'lookUpToken', wraps=path.lookUpToken) as lookUpToken:
+            assert path.lookUpPath(PATH, admin)['document']['_id'] == file['_id']
+            # Only the item and file are looked up by themselves
+            assert lookUpToken.call_count == 2
+
+            lookUpToken.reset_mock()
+            assert path.lookUpPath(PATH[:-len('/item/file')], admin)['model'] == 'folder'
+            assert lookUpToken.call_count == 0
+    finally:
+        pathCache.configure(0)
+
+
+def testLookUpPathCache(admin, hierarchy, pathCacheEnabled):
+    collection, folders, item, file = hierarchy
+    path.lookUpPath(PATH, admin)
+    with mock.patch.object(path, '_lookUpFolderChain') as chain, \
+            mock.patch.object(path, 'lookUpToken') as lookUpToken:
+        assert path.lookUpPath(PATH, admin)['document']['_id'] == file['_id']
+    assert not chain.called and not lookUpToken.called
+
+    # Renames and moves are seen
+    Folder().updateFolder(dict(folders[1], name='renamed'))
+    assert path.lookUpPath(PATH, admin, test=True)['document'] is None
+    assert path.lookUpPath(PATH.replace('/b/', '/renamed/'), admin)['model'] == 'file'
+    Item().move(item, folders[0])
+    assert path.lookUpPath('/collection/coll/a/item/file', admin)['model'] == 'file'
+
+    # Changes that bypass events are caught when the cached entries are used
+    path.lookUpPath('/collection/coll/a/item', admin)
+    Item().update({'_id': item['_id']}, {'$set': {'name': 'other'}})
+    assert path.lookUpPath('/collection/coll/a/item', admin, test=True)['document'] is None
+    assert path.lookUpPath('/collection/coll/a/other', admin)['model'] == 'item'
+
+    # Removals are seen
+    Item().remove(Item().load(item['_id'], force=True))
+    assert path.lookUpPath('/collection/coll/a/other', admin, test=True)['document'] is None
+
+
+def testLookUpPathAccess(user, hierarchy, pathCacheEnabled):
+    with pytest.raises(ResourcePathNotFound):
+        path.lookUpPath(PATH, user)
+    assert path.lookUpPath(PATH, user, force=True)['model'] == 'file'
+    # Cached resolutions still check access
+    with pytest.raises(ResourcePathNotFound):
+        path.lookUpPath(PATH, user)
+
+
+def testGetResourcePaths(admin, user, hierarchy):
+    collection, folders, item, file = hierarchy
+    other = Item().createItem('other', admin, folders[1])
+    assert path.getResourcePaths('item', [item, other], admin) == [
+        '/collection/coll/a/b/c/d/item', '/collection/coll/a/b/other']
+    assert path.getResourcePath('file', file, admin) == PATH
+    assert path.getResourcePaths('folder', folders[:2], force=True) == [
+        '/collection/coll/a', '/collection/coll/a/b']
+    assert path.getResourcePaths('collection', [collection]) == ['/collection/coll']
+
+    # Ancestors are not loaded one at a time
+    with mock.patch.object(Folder, 'load') as load:
+        assert path.getResourcePaths('file', [file], force=True) == [PATH]
+    assert not load.called
+
+    with pytest.raises(AccessException):
+        path.getResourcePaths('item', [item], user)
@@ -17,13 +17,19 @@
 #  limitations under the License.
 ###############################################################################
 
+import cherrypy
 import datetime
 import json
+import mock
 import pytest
 import pytz
+import types
 
-from girder.api import rest
+from bson.objectid import ObjectId
+
+from girder.api import access, rest
 from girder.exceptions import GirderException
+from girder.utility import config, dumpJson
 import girder.events
 
 date = datetime.datetime.now()
@@ -42,6 +48,16 @@ class TestResource(object):
     def returnsInf(self, *args, **kwargs):
         return {'value': float('inf')}
 
+    @rest.endpoint
+    def returnsGenerator(self, *args, **kwargs):
+        for i in range(3):
+            yield {'b': i, 'a': date}
+
+    @rest.endpoint
+    def raisesInGenerator(self, *args, **kwargs):
+        raise rest.RestException('Bad generator')
+        yield
+
 
 @pytest.mark.parametrize('input,expected', [
     ('TRUE', True),
@@ -110,6 +126,144 @@ def testCustomJsonEncoderEvent():
         assert json.loads(resp) == {'key': date.replace(tzinfo=pytz.UTC).isoformat()}
 
 
+def testDumpJson():
+    oid = ObjectId()
+    value = {'b': {oid}, 'a': date, 'c': oid}
+    assert json.loads(dumpJson(value).decode('utf8')) == {
+        'a': date.replace(tzinfo=pytz.UTC).isoformat(), 'b': [str(oid)], 'c': str(oid)}
+    assert dumpJson(value).index(b'"a"') < dumpJson(value).index(b'"b"')
+    assert dumpJson(value, indent=4).startswith(b'{\n    "a": ')
+
+
+def testDumpJsonOrjson():
+    pytest.importorskip('orjson')
+    serverConfig = config.getConfig()['server']
+    try:
+        serverConfig['json_encoder'] = 'orjson'
+        assert dumpJson({'b': {1}, 'a': date}) == (
+            '{"a":"%s","b":[1]}' % date.replace(tzinfo=pytz.UTC).isoformat()).encode('utf8')
+        # Values orjson cannot encode fall back to the standard encoder
+        assert dumpJson({'a': 2 ** 70}) == b'{"a": 1180591620717411303424}'
+    finally:
+        serverConfig.pop('json_encoder', None)
+
+
+def testJsonKeysUnsortedInProduction():
+    serverConfig = config.getConfig()['server']
+    mode = serverConfig['mode']
+    try:
+        serverConfig['mode'] = 'production'
+        with mock.patch.object(rest, 'dumpJson', wraps=rest.dumpJson) as dumpJsonSpy:
+            TestResource().returnsDate()
+        dumpJsonSpy.assert_called_once_with({'key': date}, sortKeys=False)
+    finally:
+        serverConfig['mode'] = mode
+
+
+def testGeneratorResponseIsStreamed():
+    chunks = list(TestResource().returnsGenerator())
+    assert json.loads(b''.join(chunks).decode('utf8')) == [
+        {'a': date.replace(tzinfo=pytz.UTC).isoformat(), 'b': i} for i in range(3)]
+
+    # Errors raised before the first value are reported normally
+    resp = TestResource().raisesInGenerator()
+    assert json.loads(resp.decode('utf8')) == {'message': 'Bad generator', 'type': 'rest'}
+
+
+def testJsonArrayStreamChunks():
+    values = [{'value': 'x' * 1000} for _ in range(200)]
+    chunks = list(rest._jsonArrayStream(values, sortKeys=True))
+    assert len(chunks) > 1
+    assert json.loads(b''.join(chunks).decode('utf8')) == values
+    assert list(rest._jsonArrayStream([], sortKeys=True)) == [b'[]']
+
+
+class FakeCursor(object):
+    def __init__(self, docs):
+        self.docs = docs
+        self.consumed = 0
+        self.counted = False
+
+    def count(self):
+        self.counted = True
+        return len(self.docs)
+
+    def __iter__(self):
+        for doc in self.docs:
+            self.consumed += 1
+            yield doc
+
+
+class FilteringModel(object):
+    def filter(self, doc, user, additionalKeys=None):
+        return {'name': doc['name']}
+
+
+class CursorResource(rest.Resource):
+    def __init__(self, cursor):
+        super(CursorResource, self).__init__()
+        self.resourceName = 'cursor'
+        self.cursor = cursor
+        self.route('GET', ('raw',), self.returnsCursor)
+        self.route('GET', ('filtered',), self.returnsFilteredCursor)
+        self.route('GET', ('nested',), self.countsFilteredCursor)
+
+    @access.public
+    def returnsCursor(self, **kwargs):
+        return self.cursor
+
+    @access.public
+    @rest.filtermodel(FilteringModel)
+    def returnsFilteredCursor(self, **kwargs):
+        return self.cursor
+
+    @access.public
+    def countsFilteredCursor(self, **kwargs):
+        return {'count': len(self.returnsFilteredCursor())}
+
+
+@pytest.fixture
+def fakeCursor():
+    cursor = FakeCursor([{'name': 'doc%d' % i + 'x' * 200, 'secret': i} for i in range(1000)])
+    with mock.patch.object(rest, '_MONGO_CURSOR_TYPES', (FakeCursor, )), \
+            mock.patch.object(rest, 'getCurrentUser', return_value=None):
+        yield cursor
+    cherrypy.response.headers.pop('Girder-Total-Count', None)
+    cherrypy.request.params = {}
+
+
+@pytest.mark.parametrize('route,expected', [
+    ('raw', [{'name': 'doc%d' % i + 'x' * 200, 'secret': i} for i in range(1000)]),
+    ('filtered', [{'name': 'doc%d' % i + 'x' * 200} for i in range(1000)])
+])
+def testCursorResponseIsStreamed(fakeCursor, route, expected):
+    stream = CursorResource(fakeCursor).GET(route)
+    assert cherrypy.response.headers['Girder-Total-Count'] == 1000
+    # Documents are read from the cursor as the response is streamed
+    first = next(stream)
+    assert fakeCursor.consumed < 1000
+    assert json.loads((first + b''.join(stream)).decode('utf8')) == expected
+    assert fakeCursor.consumed == 1000
+
+
+def testCursorResponseWithoutTotalCount(fakeCursor):
+    cherrypy.request.params = {'totalCount': 'false'}
+    stream = CursorResource(fakeCursor).GET('filtered')
+    assert len(json.loads(b''.join(stream).decode('utf8'))) == 1000
+    assert 'Girder-Total-Count' not in cherrypy.response.headers
+    assert not fakeCursor.counted
+
+
+def testFilteredCursorOutsideDispatchIsList(fakeCursor):
+    resource = CursorResource(fakeCursor)
+    # Direct callers, and handlers calling other filtered methods, get a list
+    docs = resource.returnsFilteredCursor()
+    assert isinstance(docs, list)
+    assert docs[0] == {'name': 'doc0' + 'x' * 200}
+    fakeCursor.consumed = 0
+    assert json.loads(resource.GET('nested').decode('utf8')) == {'count': 1000}
+
+
 @pytest.mark.parametrize('params', [
     {'hello': 'world'},
     {'hello': None}
@@ -150,3 +304,96 @@ def testSetContentDisposition(name, disp, expected):
         assert rest.setContentDisposition(name, setHeader=False) == expected
     else:
         assert rest.setContentDisposition(name, disp, setHeader=False) == expected
+
+
+class RoutedResource(rest.Resource):
+    def __init__(self):
+        super(RoutedResource, self).__init__()
+        self.resourceName = 'routed'
+        self.route('GET', (), self.handler)
+        self.route('GET', (':id',), self.handler)
+        self.route('GET', (':id', 'literal'), self.handler)
+        self.route('GET', ('static', ':name'), self.handler)
+        self.route('GET', ('static', 'exact'), self.handler)
+        self.route('PUT', (':id', ':other'), self.handler)
+
+    @access.public
+    def handler(self, **kwargs):
+        return kwargs
+
+
+@pytest.mark.parametrize('method,path,route,wildcards', [
+    ('get', (), (), {}),
+    ('get', ('abc',), (':id',), {'id': 'abc'}),
+    ('get', ('static',), (':id',), {'id': 'static'}),
+    ('get', ('static', 'exact'), ('static', 'exact'), {}),
+    ('get', ('static', 'other'), ('static', ':name'), {'name': 'other'}),
+    # Literal components are preferred, but a failed literal branch falls back to a wildcard
+    ('get', ('static', 'literal'), ('static', ':name'), {'name': 'literal'}),
+    ('get', ('abc', 'literal'), (':id', 'literal'), {'id': 'abc'}),
+    ('put', ('a', 'b'), (':id', ':other'), {'id': 'a', 'other': 'b'})
+])
+def testMatchRoute(method, path, route, wildcards):
+    resource = RoutedResource()
+    matchedRoute, handler, matchedWildcards = resource._matchRoute(method, path)
+    assert matchedRoute == route
+    assert matchedWildcards == wildcards
+
+
+@pytest.mark.parametrize('method,path', [
+    ('get', ('abc', 'def')),
+    ('get', ('a', 'b', 'c')),
+    ('post', ()),
+    ('put', ('a',))
+])
+def testMatchRouteFailure(method, path):
+    resource = RoutedResource()
+    with pytest.raises(rest.RestException, match='^No matching route'):
+        resource._matchRoute(method, path)
+
+
+def testRemoveRoute():
+    resource = RoutedResource()
+    resource.removeRoute('GET', ('static', 'exact'))
+    assert resource._matchRoute('get', ('static', 'exact'))[0] == ('static', ':name')
+    resource.removeRoute('GET', ('static', ':name'))
+    with pytest.raises(rest.RestException):
+        resource._matchRoute('get', ('static', 'exact'))
+
+
+def testHandleRouteEvents():
+    resource = RoutedResource()
+    seen = []
+
+    @access.public
+    def listener(event):
+        seen.append(event)
+
+    with girder.events.bound('rest.get.routed/:id/literal.before', 'test', listener), \
+            girder.events.bound('rest.get.routed.after', 'test', listener):
+        assert resource.handleRoute('GET', ('abc', 'literal'), {})['id'] == 'abc'
+        resource.handleRoute('GET', (), {'a': 'b'})
+    assert [event.name for event in seen] == [
+        'rest.get.routed/:id/literal.before', 'rest.get.routed.after']
+
+    # Renaming the resource renames the events of its existing routes
+    resource.resourceName = 'renamed'
+    del seen[:]
+    with girder.events.bound('rest.get.renamed/:id.before', 'test', listener):
+        resource.handleRoute('GET', ('abc',), {})
+    assert len(seen) == 1
+
+
+def testAfterEventSeesGeneratedResults():
+    resource = RoutedResource()
+    resource.route('GET', ('generated',), access.public(lambda **kwargs: (i for i in range(3))))
+    seen = []
+
+    @access.public
+    def listener(event):
+        seen.append(event.info['returnVal'])
+
+    assert isinstance(resource.handleRoute('GET', ('generated',), {}), types.GeneratorType)
+    with girder.events.bound('rest.get.routed/generated.after', 'test', listener):
+        assert resource.handleRoute('GET', ('generated',), {}) == [0, 1, 2]
+    assert seen == [[0, 1, 2]]
@@ -18,13 +18,17 @@
 ###############################################################################
 
 import collections
+import mock
 import pytest
 
+from click.testing import CliRunner
+from girder.cli import check_sizes
 from girder.models.collection import Collection
 from girder.models.file import File
 from girder.models.folder import Folder
 from girder.models.item import Item
 from girder.models.user import User
+from girder.utility.size_propagation import batchSizeChanges, recalculateSizes
 from pytest_girder.assertions import assertStatus, assertStatusOk
 
 Hierarchy = collections.namedtuple('Hierarchy', ['collections', 'folders', 'items', 'files'])
@@ -124,3 +128,66 @@ def testDeleteFolderUpdatesSize(server, admin, hierarchy):
         path='/folder/%s' % hierarchy.folders[1]['_id'], method='DELETE', user=admin)
     assertStatusOk(resp)
     assertNodeSize(hierarchy.collections[0], Collection, 1)
+
+
+def testBatchSizeChanges(admin, hierarchy, fsAssetstore):
+    c1, _ = hierarchy.collections
+    f1, _ = hierarchy.folders
+    i1, _ = hierarchy.items
+
+    with mock.patch.object(Folder(), 'increment') as folderIncrement, \
+            mock.patch.object(Collection(), 'increment') as collectionIncrement:
+        with batchSizeChanges():
+            for i in range(5):
+                File().createFile(
+                    name='Batch%d' % i, creator=admin, item=i1, size=100,
+                    assetstore=fsAssetstore)
+            with batchSizeChanges():
+                # Nested blocks join the outer one
+                File().createFile(
+                    name='Nested', creator=admin, item=i1, size=100, assetstore=fsAssetstore)
+            # Items are updated immediately; their parents are not
+            assertNodeSize(i1, Item, 601)
+            assertNodeSize(f1, Folder, 1)
+            assertNodeSize(c1, Collection, 11)
+        folderIncrement.assert_not_called()
+        collectionIncrement.assert_not_called()
+
+    assertNodeSize(f1, Folder, 601)
+    assertNodeSize(c1, Collection, 611)
+
+
+def testBatchSizeChangesFlushesWhenFull(admin, hierarchy):
+    c1, c2 = hierarchy.collections
+    with batchSizeChanges(maxTargets=2) as accumulator:
+        accumulator.add(Collection(), c1['_id'], 5)
+        assertNodeSize(c1, Collection, 11)
+        accumulator.add(Collection(), c2['_id'], 7)
+        assertNodeSize(c1, Collection, 16)
+        assertNodeSize(c2, Collection, 7)
+        accumulator.add(Collection(), c1['_id'], 1)
+    assertNodeSize(c1, Collection, 17)
+
+
+def testRecalculateSizes(admin, hierarchy):
+    c1, _ = hierarchy.collections
+    f1, f2 = hierarchy.folders
+    Folder().update({'_id': f2['_id']}, {'$set': {'size': 1000}})
+    Collection().update({'_id': c1['_id']}, {'$set': {'size': 0}})
+
+    assert recalculateSizes() == 2
+    assertNodeSize(f2, Folder, 10)
+    assertNodeSize(c1, Collection, 11)
+    assert recalculateSizes() == 0
+
+
+def testCheckSizesCommand(admin, hierarchy):
+    c1, _ = hierarchy.collections
+    Collection().update({'_id': c1['_id']}, {'$set': {'size': 0}})
+
+    with mock.patch('girder.cli.check_sizes.configureServer') as configureServer:
+        result = CliRunner().invoke(check_sizes.main, [])
+    assert result.exit_code == 0
+    assert result.output == 'Corrected 1 size.\n'
+    configureServer.assert_called_once()
+    assertNodeSize(c1, Collection, 11)
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+###############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import hashlib
+import io
+import json
+import mock
+import pytest
+import zipfile
+
+from girder import events
+from girder.models.file import File
+from girder.models.folder import Folder
+from girder.models.item import Item
+from girder.models.upload import Upload
+from girder.utility import ziputil
+from pytest_girder.assertions import assertStatus, assertStatusOk
+from pytest_girder.utils import getResponseBody
+
+
+def _stream(*chunks):
+    def stream():
+        for chunk in chunks:
+            yield chunk
+    return stream
+
+
+ENTRIES = [
+    ('a.txt', b'a' * 10),
+    ('dir/b.txt', b'b' * 1000),
+    ('dir/empty.txt', b''),
+    ('c.bin', bytes(bytearray(range(256))) * 100),
+]
+
+
+def _archive(zip, files):
+    return b''.join(zip.addFiles(files)) + zip.footer()
+
+
+@pytest.mark.parametrize('compression', [ziputil.STORE, ziputil.DEFLATE])
+@pytest.mark.parametrize('workers', [0, 3])
+def testAddFiles(compression, workers):
+    zip = ziputil.ZipGenerator('root', compression=compression)
+    # A small buffer makes the larger files finish in the request thread
+    data = b''.join(zip.addFiles([
+        (path, _stream(contents[:50], contents[50:])) for path, contents in ENTRIES
+    ], workers=workers, bufferSize=64)) + zip.footer()
+
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None
+    assert archive.namelist() == ['root/' + path for path, _ in ENTRIES]
+    for path, contents in ENTRIES:
+        assert archive.read('root/' + path) == contents
+
+
+def testAddFilesRaisesErrors():
+    def failing():
+        yield b'partial'
+        raise IOError('Disk failure')
+
+    zip = ziputil.ZipGenerator()
+    with pytest.raises(IOError, match='Disk failure'):
+        _archive(zip, [('a.txt', _stream(b'a')), ('b.txt', failing)])
+
+
+@pytest.fixture
+def tree(user, fsAssetstore):
+    def upload(parent, name, contents):
+        return Upload().uploadFromFile(
+            io.BytesIO(contents), len(contents), name, 'folder', parent, user)
+
+    root = Folder().createFolder(user, 'root', parentType='user', creator=user)
+    sub1 = Folder().createFolder(root, 'sub1', creator=user)
+    sub2 = Folder().createFolder(root, 'sub2', creator=user)
+    deeper = Folder().createFolder(sub1, 'deeper', creator=user)
+    Folder().setMetadata(sub2, {'key': 'value'})
+    upload(root, 'top.txt', b'top')
+    upload(sub1, 'one.txt', b'one')
+    upload(deeper, 'deep.txt', b'deep')
+    upload(sub2, 'two.txt', b'two')
+    yield root
+
+
+def testFolderFileList(user, tree):
+    paths = [path for path, _ in Folder().fileList(tree, user=user, includeMetadata=True)]
+    assert paths == [
+        'root/sub1/deeper/deep.txt',
+        'root/sub1/one.txt',
+        'root/sub2/two.txt',
+        'root/sub2/girder-folder-metadata.json',
+        'root/top.txt',
+    ]
+
+
+def testFolderFileListBatchesQueries(user, tree):
+    for i in range(5):
+        Folder().createFolder(tree, 'extra%d' % i, creator=user)
+    find = Item.find
+    with mock.patch.object(Item, 'find', autospec=True, side_effect=find) as itemFind:
+        files = list(Folder().fileList(tree, user=user, data=False))
+    assert len(files) == 4
+    assert itemFind.call_count == 1
+
+
+def testFolderFileListStreamsItemBatches(user, tree):
+    sub2 = Folder().findOne({'name': 'sub2'})
+    for i in range(4):
+        File().createLinkFile('link%d' % i, sub2, 'folder', 'http://girder.test/%d' % i, user)
+    find = File.find
+    with mock.patch('girder.models.folder.FILE_LIST_BATCH_SIZE', 2), \
+            mock.patch.object(File, 'find', autospec=True, side_effect=find) as fileFind:
+        files = Folder().fileList(tree, user=user, data=False, subpath=False)
+        # The first file is listed before the items of later folders are read
+        assert next(files)[0] == 'sub1/deeper/deep.txt'
+        assert fileFind.call_count == 1
+        paths = [path for path, _ in files]
+    assert paths == ['sub1/one.txt', 'sub2/two.txt'] + [
+        'sub2/link%d' % i for i in range(4)] + ['top.txt']
+    # sub1 and deeper share a batch, and the items of sub2 are split in three
+    assert fileFind.call_count == 5
+
+
+def testFolderFileListWithoutAncestorIds(user, tree):
+    # Databases that have not been backfilled yet still list every subfolder
+    Folder().update({}, {'$unset': {'ancestorIds': True}})
+    Item().update({}, {'$unset': {'ancestorIds': True}})
+    Folder().resetAncestorIdsCache()
+    paths = [path for path, _ in Folder().fileList(tree, user=user, subpath=False)]
+    assert paths == ['sub1/deeper/deep.txt', 'sub1/one.txt', 'sub2/two.txt', 'top.txt']
+
+
+def testFolderFileListHidesPrivateSubtrees(admin, user, tree):
+    sub1 = Folder().findOne({'name': 'sub1'})
+    Folder().setUserAccess(sub1, user, level=None, save=True)
+    # Folders below a hidden folder are hidden even when they are readable
+    paths = [path for path, _ in Folder().fileList(tree, user=user, subpath=False)]
+    assert paths == ['sub2/two.txt', 'top.txt']
+
+
+def testFolderDownload(server, user, tree):
+    resp = server.request(
+        '/folder/%s/download' % tree['_id'], user=user, isJson=False,
+        params={'mimeFilter': json.dumps(['application/octet-stream'])})
+    assertStatusOk(resp)
+    archive = zipfile.ZipFile(io.BytesIO(getResponseBody(resp, text=False)))
+    assert archive.namelist() == [
+        'root/sub1/deeper/deep.txt', 'root/sub1/one.txt', 'root/sub2/two.txt', 'root/top.txt']
+    assert archive.read('root/sub1/deeper/deep.txt') == b'deep'
+
+
+def testFolderManifest(server, user, tree):
+    resp = server.request('/folder/%s/manifest' % tree['_id'], user=user)
+    assertStatusOk(resp)
+    assert [entry['path'] for entry in resp.json] == [
+        'sub1/deeper/deep.txt', 'sub1/one.txt', 'sub2/two.txt', 'top.txt']
+    top = File().findOne({'name': 'top.txt'})
+    assert resp.json[-1]['_id'] == str(top['_id'])
+    assert resp.json[-1]['itemId'] == str(top['itemId'])
+    assert resp.json[-1]['size'] == 3
+    assert resp.json[-1]['sha512'] == hashlib.sha512(b'top').hexdigest()
+    # Internal fields are filtered out
+    assert 'assetstoreId' not in resp.json[-1]
+
+    resp = server.request('/folder/%s/manifest' % tree['_id'])
+    assertStatus(resp, 401)
+
+
+def _seekableZip(reads=None):
+    zip = ziputil.SeekableZipGenerator('root')
+    timestamp = (2018, 1, 2, 3, 4, 6)
+    for path, contents in ENTRIES:
+        def read(offset, endByte, contents=contents, path=path):
+            if reads is not None:
+                reads.append((path, offset, endByte))
+            return [contents[offset:endByte]]
+        zip.addEntry(path, len(contents), read, timestamp)
+    zip.addData('meta.json', u'{"key": "value"}', timestamp)
+    return zip
+
+
+@pytest.mark.parametrize('z64Limit', [ziputil.Z64_LIMIT, 100])
+def testSeekableZipGenerator(z64Limit):
+    with mock.patch.object(ziputil, 'Z64_LIMIT', z64Limit):
+        data = b''.join(_seekableZip().generate())
+        assert len(data) == _seekableZip().size
+
+        # Any set of ranges reproduces the archive
+        zip = _seekableZip()
+        assert b''.join(
+            b''.join(zip.generate(offset, offset + 97)) for offset in range(0, zip.size, 97)
+        ) == data
+
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None
+    assert archive.namelist() == ['root/' + path for path, _ in ENTRIES] + ['root/meta.json']
+    for path, contents in ENTRIES:
+        assert archive.read('root/' + path) == contents
+
+
+def testSeekableZipGeneratorComputesCrcs():
+    reads = []
+    zip = _seekableZip(reads)
+    crcs = []
+    zip.entries[1] = zip.entries[1][:2] + (crcs.append,) + zip.entries[1][3:]
+    # The tail of the archive needs every CRC, so the files are read
+    tail = b''.join(zip.generate(zip.size - 10))
+    assert len(tail) == 10
+    assert [path for path, _, _ in reads] == ['a.txt', 'dir/b.txt', 'c.bin']
+    assert crcs == [zipfile.crc32(ENTRIES[1][1]) & 0xFFFFFFFF]
+
+    # Once known, they are not computed again
+    del reads[:]
+    b''.join(zip.generate())
+    assert reads == [(path, 0, len(contents)) for path, contents in ENTRIES if contents]
+
+
+def testSeekableFolderDownload(server, user, tree):
+    resp = server.request(
+        '/folder/%s/download' % tree['_id'], user=user, isJson=False,
+        params={'seekable': 'true'})
+    assertStatusOk(resp)
+    data = getResponseBody(resp, text=False)
+    assert int(resp.headers['Content-Length']) == len(data)
+    assert resp.headers['Accept-Ranges'] == 'bytes'
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.namelist() == [
+        'root/sub1/deeper/deep.txt', 'root/sub1/one.txt', 'root/sub2/two.txt', 'root/top.txt']
+    assert archive.read('root/top.txt') == b'top'
+    # Streaming the archive recorded the CRCs of the files
+    assert File().findOne({'name': 'top.txt'})['crc32'] == zipfile.crc32(b'top') & 0xFFFFFFFF
+
+    resp = server.request(
+        '/folder/%s/download' % tree['_id'], user=user, isJson=False,
+        params={'seekable': 'true'}, additionalHeaders=[('Range', 'bytes=10-99')])
+    assertStatus(resp, 206)
+    assert resp.headers['Content-Range'] == 'bytes 10-99/%d' % len(data)
+    assert getResponseBody(resp, text=False) == data[10:100]
+
+
+def testSeekableDownloadVersion(server, user, tree):
+    def download(*headers):
+        return server.request(
+            '/folder/%s/download' % tree['_id'], user=user, isJson=False,
+            params={'seekable': 'true'}, additionalHeaders=list(headers))
+
+    resp = download()
+    assertStatusOk(resp)
+    etag = resp.headers['ETag']
+    size = len(getResponseBody(resp, text=False))
+    assert download().headers['ETag'] == etag
+
+    resp = download(('Range', 'bytes=10-19'), ('If-Range', etag))
+    assertStatus(resp, 206)
+    assert len(getResponseBody(resp, text=False)) == 10
+
+    # Ranges that start past the end of the archive cannot be satisfied
+    resp = download(('Range', 'bytes=%d-' % size))
+    assertStatus(resp, 416)
+    assert resp.headers['Content-Range'] == 'bytes */%d' % size
+
+    # Adding a file changes the version, and entries are listed by path
+    Upload().uploadFromFile(io.BytesIO(b'a'), 1, 'a.txt', 'folder', tree, user)
+    resp = download(('Range', 'bytes=10-19'), ('If-Range', etag))
+    assertStatusOk(resp)
+    assert resp.headers['ETag'] != etag
+    data = getResponseBody(resp, text=False)
+    assert len(data) == int(resp.headers['Content-Length']) > size
+    names = zipfile.ZipFile(io.BytesIO(data)).namelist()
+    assert names[0] == 'root/a.txt'
+    assert names == sorted(names)
+
+
+def testSeekableDownloadTailDoesNotTriggerDownloadEvents(server, user, tree):
+    requested = []
+    with events.bound('model.file.download.request', '_test', requested.append):
+        resp = server.request(
+            '/folder/%s/download' % tree['_id'], user=user, isJson=False,
+            params={'seekable': 'true'}, additionalHeaders=[('Range', 'bytes=-10')])
+        assertStatus(resp, 206)
+        assert len(getResponseBody(resp, text=False)) == 10
+        # The files were only read to compute their CRCs, not sent
+        assert requested == []
+    assert File().findOne({'name': 'top.txt'})['crc32'] == zipfile.crc32(b'top') & 0xFFFFFFFF
@@ -21,6 +21,7 @@ import boto3
 import httmock
 import io
 import json
+import mock
 import moto
 import os
 import shutil
@@ -39,7 +40,7 @@ from girder.models.file import File
 from girder.models.folder import Folder
 from girder.models.setting import Setting
 from girder.models.user import User
-from girder.utility import gridfs_assetstore_adapter
+from girder.utility import config, gridfs_assetstore_adapter
 from girder.utility.filesystem_assetstore_adapter import DEFAULT_PERMS
 from girder.utility.s3_assetstore_adapter import makeBotoConnectParams, S3AssetstoreAdapter
 from six.moves import urllib
@@ -848,6 +849,44 @@ class FileTestCase(base.TestCase):
 
         self._testDownloadFile(file, chunk1 + chunk2)
 
+        # Ranges should be read correctly in batches of chunks, with and
+        # without reading the next batch in the background
+        adapter = File().getAssetstoreAdapter(file)
+        serverConf = config.getConfig()['server']
+        oldConf = serverConf.copy()
+        try:
+            for batchSize, workers in ((1, 0), (1, 2), (4, 2)):
+                serverConf['gridfs_download_batch_size'] = batchSize
+                serverConf['gridfs_download_prefetch_workers'] = workers
+                for offset, endByte in ((0, None), (0, 6), (2, 5), (4, 9), (6, 11), (7, 8)):
+                    data = b''.join(adapter.downloadFile(
+                        file, offset=offset, endByte=endByte, headers=False)())
+                    self.assertEqual(data, chunkData[offset:endByte])
+
+            # Batches are read inline while every prefetch thread is busy
+            serverConf['gridfs_download_batch_size'] = 1
+            gridfs_assetstore_adapter.closePrefetchPool()
+            pool, slots = gridfs_assetstore_adapter._getPrefetchPool()
+            for _ in range(workers):
+                slots.acquire()
+            try:
+                with mock.patch.object(pool, 'apply_async', side_effect=AssertionError):
+                    data = b''.join(adapter.downloadFile(file, headers=False)())
+                self.assertEqual(data, chunkData)
+            finally:
+                for _ in range(workers):
+                    slots.release()
+
+            # The pool is stopped with the server, and started again when needed
+            gridfs_assetstore_adapter.closePrefetchPool()
+            self.assertIsNone(gridfs_assetstore_adapter._prefetchPool)
+            data = b''.join(adapter.downloadFile(file, headers=False)())
+            self.assertEqual(data, chunkData)
+            self.assertIsNotNone(gridfs_assetstore_adapter._prefetchPool)
+        finally:
+            serverConf.clear()
+            serverConf.update(oldConf)
+
         # Reset chunk size so the large file testing isn't horribly slow
         gridfs_assetstore_adapter.CHUNK_SIZE = old
 
@@ -11,6 +11,7 @@ import tempfile
 import threading
 import time
 
+from girder import events
 from girder.cli import mount
 from girder.constants import SettingKey
 from girder.exceptions import ValidationException
@@ -380,9 +381,13 @@ class ServerFuseTestCase(base.TestCase):
         op = mount.ServerFuse()
         path = os.path.dirname(self.publicFileName)
         data = op.readdir(path, 0)
-        self.assertIn(os.path.basename(self.publicFileName), data)
+        entries = {entry[0]: entry[1] for entry in data if isinstance(entry, tuple)}
+        self.assertIn(os.path.basename(self.publicFileName), entries)
+        # The attributes of each entry are listed along with its name
+        self.assertEqual(
+            entries[os.path.basename(self.publicFileName)], op.getattr(self.publicFileName))
         data = op.readdir('/user', 0)
-        self.assertIn('admin', data)
+        self.assertIn('admin', [entry[0] for entry in data if isinstance(entry, tuple)])
         data = op.readdir('', 0)
         self.assertIn('user', data)
         self.assertIn('collection', data)
@@ -391,6 +396,49 @@ class ServerFuseTestCase(base.TestCase):
         data = op.readdir('/collection', 0)
         self.assertEqual(len(data), 3)
 
+    def testMetadataCache(self):
+        op = mount.ServerFuse()
+        op.init('/')
+        path = os.path.dirname(self.publicFileName)
+        with mock.patch('girder.utility.path.lookUpPath', wraps=mount.path_util.lookUpPath) \
+                as lookUpPath:
+            op.readdir(path, 0)
+            self.assertEqual(lookUpPath.call_count, 1)
+            # Listing a directory caches its children, and paths are cached
+            op.getattr(self.publicFileName)
+            op.getattr(path)
+            op.readdir(path, 0)
+            self.assertEqual(lookUpPath.call_count, 1)
+            self.assertGreater(op.cache.stats()['hits'], 0)
+
+            # Renaming a resource drops it, its listing, and the paths below it
+            file = File().load(op._getPath(self.publicFileName)['document']['_id'], force=True)
+            file['name'] = 'Renamed'
+            File().save(file)
+            newPath = os.path.join(path, 'Renamed')
+            self.assertIn('Renamed', [
+                entry[0] for entry in op.readdir(path, 0) if isinstance(entry, tuple)])
+            with self.assertRaises(fuse.FuseOSError):
+                op.getattr(self.publicFileName)
+            self.assertEqual(op.getattr(newPath)['st_mode'], 0o400 | stat.S_IFREG)
+
+            item = op._getPath(path)['document']
+            item['name'] = 'Renamed Item'
+            mount.Item().save(item)
+            with self.assertRaises(fuse.FuseOSError):
+                op.getattr(newPath)
+
+        # Entries expire
+        op.cache.ttl = 0.01
+        op.cache.invalidate()
+        op.getattr(os.path.dirname(path))
+        time.sleep(0.02)
+        with mock.patch('girder.utility.path.lookUpPath', wraps=mount.path_util.lookUpPath) \
+                as lookUpPath:
+            op.getattr(os.path.dirname(path))
+            self.assertEqual(lookUpPath.call_count, 1)
+        op.destroy('/')
+
     def testFunctionOpen(self):
         op = mount.ServerFuse()
         fh = op.open(self.publicFileName, os.O_RDONLY)
@@ -430,3 +478,14 @@ class ServerFuseTestCase(base.TestCase):
     def testFunctionDestroy(self):
         op = mount.ServerFuse()
         self.assertIsNone(op.destroy('/'))
+
+    def testCacheEventsBoundWhileMounted(self):
+        def handlerNames():
+            return {name for handlers in events._mapping.values() for name in handlers}
+
+        op = mount.ServerFuse()
+        self.assertNotIn(op._cacheHandlerName, handlerNames())
+        op.init('/')
+        self.assertIn(op._cacheHandlerName, handlerNames())
+        op.destroy('/')
+        self.assertNotIn(op._cacheHandlerName, handlerNames())
@@ -436,6 +436,25 @@ class PythonCliTestCase(base.TestCase):
         self.assertEqual(ret['exitVal'], 0)
         self.assertIn('File hello.txt already exists in parent Item', ret['stdout'])
 
+    def testUploadWithJobs(self):
+        localDir = os.path.join(os.path.dirname(__file__), 'testdata')
+        args = ['upload', str(self.publicFolder['_id']), localDir, '--parent-type=folder']
+
+        ret = invokeCli(args + ['--jobs=0'], username='mylogin', password='password')
+        self.assertNotEqual(ret['exitVal'], 0)
+
+        ret = invokeCli(args + ['--jobs=4'], username='mylogin', password='password')
+        self.assertEqual(ret['exitVal'], 0)
+        self.assertIn('Uploading Item from hello.txt', ret['stdout'])
+        six.assertRegex(
+            self, ret['stdout'], r'Uploaded %d files, .*B in [0-9.]+ seconds \(.*B/s\)' %
+            len(os.listdir(localDir)))
+
+        subfolder = six.next(Folder().childFolders(
+            parent=self.publicFolder, parentType='folder', limit=1))
+        items = list(Folder().childItems(folder=subfolder))
+        self.assertEqual(len(items), len(os.listdir(localDir)))
+
     def testVerboseLoggingLevel0(self):
         args = ['localsync', '--help']
         ret = invokeCli(args, username='mylogin', password='password')
@@ -25,6 +25,8 @@ import os
 import requests
 import shutil
 import six
+import threading
+import time
 from six import StringIO
 import hashlib
 import httmock
@@ -366,6 +368,127 @@ class PythonClientTestCase(base.TestCase):
                 size=size, parentType='folder')
             self.assertEqual(file['mimeType'], 'text/plain')
 
+    def testUploadWithJobs(self):
+        folderCallbacks = []
+        itemCallbacks = []
+
+        def folderCallback(folder, filepath):
+            # All files of a folder have been uploaded before its callback
+            folderCallbacks.append(filepath)
+            self.assertEqual(
+                len([path for path in itemCallbacks if os.path.dirname(path) == filepath]), 2)
+
+        self.client.addFolderUploadCallback(folderCallback)
+        self.client.addItemUploadCallback(lambda item, filepath: itemCallbacks.append(filepath))
+        stats = self.client.upload(self.libTestDir, self.publicFolder['_id'], jobs=3)
+
+        size = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, dirs, files in os.walk(self.libTestDir) for name in files)
+        self.assertEqual(stats['files'], 8)
+        self.assertEqual(stats['bytes'], size)
+        self.assertGreater(stats['seconds'], 0)
+        self.assertEqual(len(itemCallbacks), 8)
+        self.assertEqual(len(folderCallbacks), 4)
+        self.assertEqual(folderCallbacks[-1], self.libTestDir)
+        self.assertIsNone(self.client._transfer)
+
+        folder = six.next(Folder().childFolders(
+            parent=self.publicFolder, parentType='folder', limit=1))
+        self.assertEqual(sorted(item['name'] for item in Folder().childItems(folder)), [
+            'f', 'f1'])
+
+        # An error in a worker thread is raised by upload
+        def failingUpload(*args, **kwargs):
+            raise girder_client.HttpError(500, 'failed', '', 'POST')
+
+        with mock.patch.object(self.client, 'uploadFileToItem', side_effect=failingUpload):
+            with self.assertRaises(girder_client.HttpError):
+                self.client.upload(self.libTestDir, self.publicFolder['_id'], jobs=2)
+        self.assertIsNone(self.client._transfer)
+
+    def testUploadS3PartsWithJobs(self):
+        data = b''.join(six.int2byte(i) for i in range(25))
+        path = os.path.join(self.libTestDir, 's3.bin')
+        with open(path, 'wb') as fh:
+            fh.write(data)
+        s3Url = 'https://bucket.s3.amazonaws.com/key'
+        calls = []
+        lock = threading.Lock()
+
+        def record(*args):
+            with lock:
+                calls.append(args)
+
+        @httmock.urlmatch(path=r'.*/file$', method='POST')
+        def initUpload(url, request):
+            return httmock.response(200, {
+                '_id': 'upload', 'name': 's3.bin', 'behavior': 's3', 's3': {
+                    'chunked': True, 'chunkLength': 10,
+                    'request': {'method': 'POST', 'url': s3Url + '?uploads'}}
+            }, request=request)
+
+        @httmock.urlmatch(path=r'.*/file/chunk$', method='POST')
+        def signPart(url, request):
+            params = dict(six.moves.urllib.parse.parse_qsl(url.query))
+            chunk = json.loads(params['chunk'])
+            record('sign', params['uploadId'], params['offset'], chunk)
+            return httmock.response(200, {'s3': {'request': {
+                'method': 'PUT',
+                'url': s3Url + '?partNumber=%d&uploadId=s3upload' % chunk['partNumber']
+            }}}, request=request)
+
+        @httmock.urlmatch(path=r'.*/file/completion$', method='POST')
+        def complete(url, request):
+            record('complete')
+            return httmock.response(200, {
+                '_id': 'file', 'name': 's3.bin', 's3FinalizeRequest': {
+                    'method': 'POST', 'url': s3Url + '?uploadId=s3upload'}
+            }, request=request)
+
+        @httmock.urlmatch(netloc=r'bucket\.s3\.amazonaws\.com$')
+        def s3(url, request):
+            if url.query == 'uploads':
+                return httmock.response(
+                    200, '<UploadId>s3upload</UploadId>', request=request)
+            params = dict(six.moves.urllib.parse.parse_qsl(url.query))
+            if 'partNumber' in params:
+                partNumber = int(params['partNumber'])
+                # The first part finishes last
+                if partNumber == 1:
+                    time.sleep(0.2)
+                record('part', partNumber, request.body)
+                return httmock.response(
+                    200, '', {'ETag': '"etag%d"' % partNumber}, request=request)
+            record('finalize', request.body)
+            return httmock.response(200, '', request=request)
+
+        with httmock.HTTMock(initUpload, signPart, complete, s3):
+            stats = self.client.upload(path, self.publicFolder['_id'], jobs=3)
+        self.assertEqual(stats['files'], 1)
+        self.assertEqual(stats['bytes'], 25)
+
+        # Each part is signed and sent, in any order
+        signed = sorted(
+            (args[1:] for args in calls if args[0] == 'sign'),
+            key=lambda args: args[2]['partNumber'])
+        self.assertEqual(signed, [
+            ('upload', '0', {'partNumber': n, 's3UploadId': 's3upload', 'contentLength': length})
+            for n, length in ((1, 10), (2, 10), (3, 5))])
+        parts = sorted(args[1:] for args in calls if args[0] == 'part')
+        self.assertEqual(parts, [(1, data[:10]), (2, data[10:20]), (3, data[20:])])
+
+        # The upload is completed after every part was sent, listing the ETags
+        # of the parts in order
+        self.assertEqual([args[0] for args in calls[-2:]], ['complete', 'finalize'])
+        self.assertEqual(len(calls), 8)
+        self.assertEqual(calls[-1][1], (
+            '<CompleteMultipartUpload>'
+            '<Part><PartNumber>1</PartNumber><ETag>"etag1"</ETag></Part>'
+            '<Part><PartNumber>2</PartNumber><ETag>"etag2"</ETag></Part>'
+            '<Part><PartNumber>3</PartNumber><ETag>"etag3"</ETag></Part>'
+            '</CompleteMultipartUpload>'))
+
     def testUploadNonMultipartVersionGreaterOrEqual22(self):
         for version in ['2.2.0', '2.2.1', '2.3', '3.0', '3.1']:
             with mock.patch.object(
@@ -639,6 +762,74 @@ class PythonClientTestCase(base.TestCase):
             self.assertTrue(obj.getvalue().endswith(expected))
             self.assertEqual(len(hits), 2)
 
+    def testDownloadFolderWithJobs(self):
+        self.client.upload(self.libTestDir, self.publicFolder['_id'])
+        folder = six.next(Folder().childFolders(
+            parent=self.publicFolder, parentType='folder', limit=1))
+        downloadDir = os.path.join(self.libTestDir, '_download')
+
+        manifest = self.client.getFolderManifest(folder['_id'])
+        self.assertEqual(sorted(file['path'] for file in manifest), [
+            'f', 'f1', 'sub0/f', 'sub0/f1', 'sub1/f', 'sub1/f1', 'sub2/f', 'sub2/f1'])
+        for file in manifest:
+            with open(os.path.join(self.libTestDir, file['path']), 'rb') as fh:
+                self.assertEqual(file['sha512'], hashlib.sha512(fh.read()).hexdigest())
+
+        stats = self.client.downloadFolderRecursive(folder['_id'], downloadDir, jobs=3)
+        self.assertEqual(stats['files'], 8)
+        self.assertEqual(stats['skipped'], 0)
+        self.assertIsNone(self.client._transfer)
+        for file in manifest:
+            with open(os.path.join(self.libTestDir, file['path']), 'rb') as src, \
+                    open(os.path.join(downloadDir, file['path']), 'rb') as dst:
+                self.assertEqual(src.read(), dst.read())
+
+        # Files whose size and checksum match are skipped
+        with open(os.path.join(downloadDir, 'f'), 'wb') as fh:
+            fh.write(b'x' * os.path.getsize(os.path.join(self.libTestDir, 'f')))
+        stats = self.client.downloadFolderRecursive(folder['_id'], downloadDir, jobs=2)
+        self.assertEqual(stats['files'], 1)
+        self.assertEqual(stats['skipped'], 7)
+
+        # A partial download is resumed
+        path = os.path.join(downloadDir, 'sub0', 'f')
+        with open(path, 'rb') as fh:
+            contents = fh.read()
+        os.remove(path)
+        with open(path + girder_client.PARTIAL_DOWNLOAD_SUFFIX, 'wb') as fh:
+            fh.write(contents[:10])
+        ranges = []
+
+        @httmock.urlmatch(path=r'.*/file/.+/download$')
+        def mock(url, request):
+            ranges.append(request.headers.get('Range'))
+
+        with httmock.HTTMock(mock):
+            stats = self.client.downloadResource(folder['_id'], downloadDir, jobs=1)
+        self.assertEqual(ranges, ['bytes=10-'])
+        self.assertFalse(os.path.exists(path + girder_client.PARTIAL_DOWNLOAD_SUFFIX))
+        with open(path, 'rb') as fh:
+            self.assertEqual(fh.read(), contents)
+
+        # A resumed download that does not match the checksum is started over
+        os.remove(path)
+        with open(path + girder_client.PARTIAL_DOWNLOAD_SUFFIX, 'wb') as fh:
+            fh.write(b'x' * 10)
+        del ranges[:]
+        with httmock.HTTMock(mock):
+            self.client.downloadResource(folder['_id'], downloadDir, jobs=1)
+        self.assertEqual(ranges, ['bytes=10-', None])
+        with open(path, 'rb') as fh:
+            self.assertEqual(fh.read(), contents)
+
+        # A file that does not match its checksum at all is an error
+        path = os.path.join(downloadDir, 'f')
+        File().update({'name': 'f', 'itemId': {'$in': [
+            item['_id'] for item in Folder().childItems(folder)]}}, {'$set': {'sha512': '0'}})
+        with self.assertRaises(girder_client.IncorrectDownloadChecksumError):
+            self.client.downloadFolderRecursive(folder['_id'], downloadDir, jobs=1)
+        self.assertFalse(os.path.exists(path + girder_client.PARTIAL_DOWNLOAD_SUFFIX))
+
     def testDownloadFail(self):
         # Create item
         item = self.client.createItem(self.publicFolder['_id'],